@@ -7,6 +7,7 @@ from .settings import DATA_DIR
 
 def table_dir(name: str) -> Path: return DATA_DIR / name
 def table_meta_path(name: str) -> Path: return table_dir(name) / f"{name}.dat"
+def table_counts_path(name: str) -> Path: return table_dir(name) / f"{name}.cnt"
 
 TABLES_FILE = DATA_DIR / "tables.dat"
 
@@ -47,4 +48,26 @@ def load_tables() -> dict:
 def save_tables(catalog: dict) -> None:
     TABLES_FILE.parent.mkdir(parents=True, exist_ok=True)
     with TABLES_FILE.open("wb") as f:
-        pickle.dump(catalog, f)
\ No newline at end of file
+        pickle.dump(catalog, f)
+
+def get_stats(table: str) -> dict:
+    """Estadísticas de la tabla (tercer bloque del metadato, lo escribe ANALYZE); {} si no hay."""
+    try:
+        meta = get_json(str(table_meta_path(table)), 3)
+    except OSError:
+        return {}
+    return meta[2] if len(meta) > 2 and isinstance(meta[2], dict) else {}
+
+def get_counts(table: str) -> dict | None:
+    """
+    Conteos vivos de la tabla (<tabla>.cnt, los mantiene File en insert/remove/build):
+    {"rows": filas, "indexes": {col: entradas del secundario}}. None si la tabla no los tiene.
+    """
+    try:
+        counts = get_json(str(table_counts_path(table)))
+    except OSError:
+        return None
+    return counts[0] if counts and isinstance(counts[0], dict) else None
+
+def put_counts(table: str, counts: dict) -> None:
+    put_json(str(table_counts_path(table)), [counts])
@@ -2,7 +2,7 @@ from pathlib import Path
 from typing import List, Dict, Optional
 
 from backend.catalog.settings import DATA_DIR
-from backend.catalog.catalog import load_tables, save_tables, put_json, table_meta_path, get_json
+from backend.catalog.catalog import load_tables, save_tables, put_json, table_meta_path, get_json, get_counts, put_counts
 import shutil
 
 
@@ -11,6 +11,9 @@ from backend.storage.indexes.heap import HeapFile
 from backend.storage.indexes.sequential import SeqFile
 from backend.storage.indexes.isam import IsamFile
 from backend.storage.indexes.bplus import BPlusFile
+from backend.storage.indexes.rtree import VARIANTS as RTREE_VARIANTS
+from backend.storage.indexes.pkmap import remove_pkmap
+from backend.storage.indexes.grid import remove_grid
 from backend.storage.file import File
 
 
@@ -83,37 +86,56 @@ def backfill_secondary(table: str, column: str, relation: dict, indexes: dict):
             data_dir = _os.path.dirname(_os.path.dirname(sec_file))
             idx_dir = _P(data_dir) / table
             idx_path = idx_dir / f"{table}_rtree_{column}.idx"
-            map_path = idx_dir / f"{table}_rtree_{column}.map.json"
             idx_path.unlink(missing_ok=True)
-            map_path.unlink(missing_ok=True)
+            remove_pkmap(str(idx_dir / f"{table}_rtree_{column}"))
         except Exception:
             pass
 
         file_inst = File(table)
         rt = file_inst._make_rtree(column, heap_ok=(prim_kind=="heap"), reuse_cached=True)
+        in_recs = []
         if prim_kind == "heap":
             for row_dict, pos in records:
                 if column not in row_dict: continue
                 ok, pt = file_inst._as_point(row_dict[column])
                 if not ok: continue
-                in_rec = {"pos": pos, column: pt, "deleted": False}
-                rt.insert(in_rec)
+                in_recs.append({"pos": pos, column: pt, "deleted": False})
         else:
             for row_dict in records:
                 if column not in row_dict: continue
                 ok, pt = file_inst._as_point(row_dict[column])
                 if not ok: continue
-                in_rec = {"pk": row_dict[pk_name], column: pt, "deleted": False}
-                rt.insert(in_rec)
+                in_recs.append({"pk": row_dict[pk_name], column: pt, "deleted": False})
+        # carga masiva STR (archivo recién borrado arriba)
+        rt.bulk_load(in_recs)
         # Close cached rtrees to persist headers
         file_inst._close_cached_rtrees()
 
+    elif sec_kind == "grid":
+        records = get_physical_records(main, prim_kind, True)
+        base = str(Path(sec_file).with_suffix(""))  # <tabla>_grid_<col>
+        remove_grid(base)
+        remove_pkmap(base)
+
+        file_inst = File(table)
+        in_recs = []
+        for rec in records:
+            row_dict, pos = rec if prim_kind == "heap" else (rec, None)
+            ok, pt = file_inst._as_point(row_dict.get(column))
+            if not ok: continue
+            in_recs.append({"pos": pos, column: pt} if prim_kind == "heap"
+                           else {"pk": row_dict[pk_name], column: pt})
+        # agrupado por celda: ~una escritura por página llena
+        file_inst._make_grid(column).insert_many(in_recs)
+
 def _canon_index_kind(method: str) -> str:
     m = (method or "").strip().lower().replace(" ", "")
     if m in ("b+", "bplus", "btree", "b-tree"):
         return "bplus"
     if m in ("r-tree", "rtree", "r+tree", "rplus"):
         return "rtree"
+    if m in ("grid",):
+        return "grid"
     if m in ("seq", "sequential"):
         return "sequential"
     if m in ("isam",):
@@ -132,6 +154,14 @@ def _filename_token(method: str) -> str:
     return k
 
 
+def _check_point_column(name: str, method: Optional[str], primary: bool = False):
+    """Una columna POINT no puede ser PK y solo admite índices espaciales (rtree, grid)."""
+    if primary:
+        raise ValueError(f"La columna POINT '{name}' no puede ser PRIMARY KEY")
+    if method and _canon_index_kind(method) not in ("rtree", "grid"):
+        raise ValueError(f"La columna POINT '{name}' solo admite índices rtree o grid")
+
+
 def create_table(table: str, fields: List[Dict]):
     # 1) carpeta bajo DATA_DIR
     (DATA_DIR / table).mkdir(parents=True, exist_ok=True)
@@ -159,6 +189,9 @@ def create_table(table: str, fields: List[Dict]):
         if field.get("key") == "primary":
             pk_name = name
 
+        if field["type"] == "point":
+            _check_point_column(name, field.get("index"), primary=field.get("key") == "primary")
+
         # índices declarados inline (PRIMARY KEY USING ..., INDEX USING ...)
         if "index" in field:
             method_raw = field["index"]
@@ -227,7 +260,11 @@ def create_table(table: str, fields: List[Dict]):
                 put_json(info["filename"], [idx_schema])
                 break
 
-    # 8) registrar la tabla
+    # 8) conteos vivos (filas y entradas por secundario), los mantiene File
+    put_counts(table, {"rows": 0, "indexes": {col: 0 for col, info in indexes.items()
+                                              if col != "primary" and info["filename"] != mainfilename}})
+
+    # 9) registrar la tabla
     tables[table] = str(table_file)
     save_tables(tables)
 
@@ -296,20 +333,23 @@ def delete_index(fields: list[dict], column: str):
     return fields
 
 
-def create_index(table: str, column: str, method: str):
+def create_index(table: str, column: str, method: str, options: Optional[dict] = None):
     """
     Crea un índice secundario en DATA_DIR/<table>/<table>-<methodToken>-<column>.dat
     y actualiza el metadato <table>.dat (indexes[column]).
-    No recrea si ya existe.
+    No recrea si ya existe. 'options' (WITH (...)) aplica a rtree (variant, M) y grid (cell).
     """
     meta = table_meta_path(table)
-    relation, indexes = get_json(str(meta), 2)
+    relation, indexes, *extra = get_json(str(meta), 3)  # extra: stats de ANALYZE
 
     if not table or column in indexes:
         return
+
+    if (relation.get(column) or {}).get("type") == "point":
+        _check_point_column(column, method, primary=relation[column].get("key") == "primary")
     
     if "key" in relation[column] and relation[column]["key"] == "primary":
-        if method == "hash" or method == "rtree":
+        if _canon_index_kind(method) in ("hash", "rtree", "grid"):
             return
 
         mainfilename = indexes["primary"]["filename"]
@@ -360,11 +400,48 @@ def create_index(table: str, column: str, method: str):
 
         put_json(idx_file, [idx_schema])
         indexes[column] = {"index": kind, "filename": idx_file}
-        put_json(str(meta), [relation, indexes])
+        if kind == "rtree":
+            indexes[column].update(_rtree_options(options))
+        elif kind == "grid":
+            indexes[column].update(_grid_options(options))
+        put_json(str(meta), [relation, indexes, *extra])
         try:
             backfill_secondary(table, column, relation, indexes)
         except Exception as e:
             pass
+        if get_counts(table) is not None:
+            File(table).recount()
+
+def _rtree_options(options: Optional[dict]) -> dict:
+    """Valida WITH (variant=..., M=...) de un índice rtree; devuelve lo que se guarda en el metadato."""
+    out = {}
+    for k, v in (options or {}).items():
+        k = k.lower()
+        if k == "variant":
+            v = str(v).lower()
+            if v not in RTREE_VARIANTS:
+                raise ValueError(f"variant inválida {v!r} (usa {', '.join(RTREE_VARIANTS)})")
+            out["variant"] = v
+        elif k == "m":
+            out["M"] = int(v)
+            if out["M"] < 4:
+                raise ValueError("M debe ser >= 4")
+        else:
+            raise ValueError(f"Opción de índice desconocida: {k}")
+    return out
+
+def _grid_options(options: Optional[dict]) -> dict:
+    """Valida WITH (cell=...) de un índice grid (lado de celda; por defecto BD2_GRID_CELL)."""
+    out = {}
+    for k, v in (options or {}).items():
+        k = k.lower()
+        if k == "cell":
+            out["cell"] = float(v)
+            if out["cell"] <= 0:
+                raise ValueError("cell debe ser > 0")
+        else:
+            raise ValueError(f"Opción de índice desconocida: {k}")
+    return out
 
 def drop_index(table: Optional[str], column_or_name: Optional[str]):
     """
@@ -375,7 +452,7 @@ def drop_index(table: Optional[str], column_or_name: Optional[str]):
         return
     
     meta = table_meta_path(table)
-    relation, indexes = get_json(str(meta), 2)
+    relation, indexes, *extra = get_json(str(meta), 3)  # extra: stats de ANALYZE
 
     col = column_or_name
     
@@ -404,8 +481,16 @@ def drop_index(table: Optional[str], column_or_name: Optional[str]):
     else:
         try:
             Path(indexes[col]["filename"]).unlink(missing_ok=True)
+            if indexes[col]["index"] == "grid":
+                base = str(Path(indexes[col]["filename"]).with_suffix(""))
+                remove_grid(base)
+                remove_pkmap(base)
         except Exception:
             pass
 
         del indexes[col]
-        put_json(str(meta), [relation, indexes])
\ No newline at end of file
+        put_json(str(meta), [relation, indexes, *extra])
+        counts = get_counts(table)
+        if counts is not None and col in counts["indexes"]:
+            del counts["indexes"][col]
+            put_counts(table, counts)
\ No newline at end of file
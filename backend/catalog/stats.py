@@ -0,0 +1,224 @@
+# stats.py
+# Estadísticas por tabla para el planner (ANALYZE t [(cols)]).
+#
+# Se guardan como tercer bloque del metadato <table>.dat, después de relation/indexes:
+#   {"rows": N, "columns": {col: {"nulls": fracción, "min": v, "max": v, "ndv": n, "hist": [bordes]}}}
+#   - min/max de una columna POINT son las esquinas del rectángulo envolvente ([x, y])
+#   - hist: histograma equi-depth (B+1 bordes, cada cubeta con ~N/B filas) sobre una muestra
+#   - ndv: distintos estimados con HyperLogLog sobre todas las filas
+#
+# Refresco incremental: insert/delete suman en <table>.mod (filas al analizar, insertadas,
+# borradas). El planner ajusta 'rows' con esos contadores y, cuando los cambios superan
+# BD2_ANALYZE_BASE + BD2_ANALYZE_SCALE * filas (como el autoanalyze de PostgreSQL), las
+# estadísticas quedan viejas: la escritura que cruza el umbral no paga el recorrido; la tabla se
+# vuelve a analizar con las mismas columnas la próxima vez que el planner la estima
+# (refresh_if_stale), y esa consulta paga un recorrido completo del primario.
+import hashlib
+import math
+import os
+import random
+import struct
+
+from backend.catalog.catalog import get_json, put_json, table_meta_path, table_dir, get_stats
+
+HIST_BUCKETS = int(os.getenv("BD2_ANALYZE_BUCKETS", "16") or 16)
+SAMPLE_ROWS = int(os.getenv("BD2_ANALYZE_SAMPLE", "30000") or 30000)
+AUTO_BASE = int(os.getenv("BD2_ANALYZE_BASE", "50") or 50)
+AUTO_SCALE = float(os.getenv("BD2_ANALYZE_SCALE", "0.1") or 0.1)
+AUTO = os.getenv("BD2_ANALYZE_AUTO", "1").lower() in ("1", "true", "yes")
+HLL_P = 12   # 4096 registros: error típico ~1.6 %
+
+MOD_FMT = "<qqq"   # filas al analizar, insertadas, borradas
+MOD_SIZE = struct.calcsize(MOD_FMT)
+
+
+# ------------------------------ HyperLogLog ------------------------------ #
+
+class HyperLogLog:
+    """Contador de distintos de Flajolet et al.; el hash es estable entre procesos (blake2b)."""
+
+    def __init__(self, p: int = HLL_P, registers: bytes | None = None):
+        self.p = p
+        self.m = 1 << p
+        self.reg = bytearray(registers) if registers else bytearray(self.m)
+
+    def add(self, value):
+        h = int.from_bytes(hashlib.blake2b(repr(value).encode("utf-8"), digest_size=8).digest(), "big")
+        idx = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.reg[idx]:
+            self.reg[idx] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        self.reg = bytearray(max(a, b) for a, b in zip(self.reg, other.reg))
+
+    def count(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        est = alpha * m * m / sum(2.0 ** -r for r in self.reg)
+        zeros = self.reg.count(0)
+        if est <= 2.5 * m and zeros:
+            est = m * math.log(m / zeros)   # linear counting para cardinalidades chicas
+        return int(round(est))
+
+
+# ------------------------------ histogramas ------------------------------ #
+
+def equi_depth(values: list, buckets: int = HIST_BUCKETS) -> list:
+    """Bordes de un histograma equi-depth sobre valores ordenables (lista vacía si no aplica)."""
+    if not values:
+        return []
+    try:
+        vals = sorted(values)
+    except TypeError:
+        return []
+    n = len(vals)
+    b = max(1, min(buckets, n))
+    return [vals[min(n - 1, (i * n) // b)] for i in range(b)] + [vals[-1]]
+
+
+def _column_stats(kind: str, n: int, nulls: int, hll: HyperLogLog, lo, hi, sample: list) -> dict:
+    ndv = min(hll.count(), n - nulls)
+    if isinstance(lo, int) and isinstance(hi, int) and not isinstance(lo, bool):
+        ndv = min(ndv, hi - lo + 1)   # enteros: no puede haber más distintos que el rango
+    out = {"nulls": round(nulls / n, 6) if n else 0.0, "ndv": ndv, "min": lo, "max": hi}
+    if kind != "point":
+        hist = equi_depth(sample)
+        if hist:
+            out["hist"] = hist
+    return out
+
+
+# ------------------------------ ANALYZE ------------------------------ #
+
+def analyze(table: str, columns: list | None = None, io_file=None) -> dict:
+    """
+    Recorre el primario una vez y guarda las estadísticas de 'columns' (todas si None).
+    Las filas y null/min/max/ndv salen del recorrido completo; el histograma, de una muestra
+    reservoir de BD2_ANALYZE_SAMPLE valores no nulos por columna. 'io_file' (File) recibe las
+    lecturas del recorrido.
+    """
+    from backend.storage.file import File
+    from backend.core.utils import parse_point
+
+    F = io_file or File(table)
+    relation = F.relation
+    cols = list(columns) if columns else [c for c in relation]
+    for c in cols:
+        if c not in relation:
+            raise KeyError(f"Columna '{c}' no existe en '{table}'")
+    kinds = {c: (relation[c].get("type") or "").lower() for c in cols}
+
+    hll = {c: HyperLogLog() for c in cols}
+    nulls = {c: 0 for c in cols}
+    lo, hi = {c: None for c in cols}, {c: None for c in cols}
+    sample = {c: [] for c in cols}
+    seen = {c: 0 for c in cols}   # no nulos vistos: cada columna lleva su propio reservoir
+    rng = random.Random(0)
+    n = 0
+    for row in F.iter_all():
+        n += 1
+        for c in cols:
+            v = row.get(c)
+            if v is None or v == "":
+                nulls[c] += 1
+                continue
+            if kinds[c] == "point":
+                pt = parse_point(v)
+                if pt is None:
+                    nulls[c] += 1
+                    continue
+                hll[c].add(pt)
+                lo[c] = list(pt) if lo[c] is None else [min(lo[c][0], pt[0]), min(lo[c][1], pt[1])]
+                hi[c] = list(pt) if hi[c] is None else [max(hi[c][0], pt[0]), max(hi[c][1], pt[1])]
+                continue
+            hll[c].add(v)
+            try:
+                lo[c] = v if lo[c] is None or v < lo[c] else lo[c]
+                hi[c] = v if hi[c] is None or v > hi[c] else hi[c]
+            except TypeError:
+                pass
+            seen[c] += 1   # reservoir (algoritmo R) sobre los valores no nulos
+            if seen[c] <= SAMPLE_ROWS:
+                sample[c].append(v)
+            else:
+                slot = rng.randrange(seen[c])
+                if slot < SAMPLE_ROWS:
+                    sample[c][slot] = v
+
+    meta = str(table_meta_path(table))
+    blocks = get_json(meta, 3)
+    old = blocks[2] if len(blocks) > 2 and isinstance(blocks[2], dict) else {}
+    colstats = dict(old.get("columns") or {}) if columns else {}
+    for c in cols:
+        colstats[c] = _column_stats(kinds[c], n, nulls[c], hll[c], lo[c], hi[c], sample[c])
+    stats = {"rows": n, "columns": colstats}
+    put_json(meta, [blocks[0], blocks[1], stats])
+    _write_mod(table, n, 0, 0)
+    return stats
+
+
+# ------------------------------ contadores de cambios ------------------------------ #
+
+def _mod_path(table: str) -> str:
+    return str(table_dir(table) / f"{table}.mod")
+
+
+def _read_mod(table: str):
+    try:
+        with open(_mod_path(table), "rb") as f:
+            return struct.unpack(MOD_FMT, f.read(MOD_SIZE))
+    except (OSError, struct.error):
+        return None
+
+
+def _write_mod(table: str, rows: int, ins: int, dels: int):
+    with open(_mod_path(table), "wb") as f:
+        f.write(struct.pack(MOD_FMT, rows, ins, dels))
+
+
+def _stale(rows: int, ins: int, dels: int) -> bool:
+    return AUTO and ins + dels > AUTO_BASE + AUTO_SCALE * rows
+
+
+def note_modified(table: str, inserted: int = 0, deleted: int = 0) -> bool:
+    """
+    Suma filas insertadas/borradas desde el último ANALYZE (solo tablas analizadas).
+    No re-analiza: devuelve True si con esto las estadísticas quedaron viejas (pasaron el umbral).
+    """
+    if not (inserted or deleted):
+        return False
+    cur = _read_mod(table)
+    if cur is None:
+        return False
+    rows, ins, dels = cur[0], cur[1] + int(inserted), cur[2] + int(deleted)
+    _write_mod(table, rows, ins, dels)
+    return _stale(rows, ins, dels)
+
+
+def refresh_if_stale(table: str) -> bool:
+    """
+    Re-analiza las mismas columnas si los cambios desde el último ANALYZE pasaron el umbral.
+    Lo llama el planner al estimar la tabla; devuelve True si re-analizó (recorrido completo).
+    """
+    cur = _read_mod(table)
+    if cur is None or not _stale(*cur):
+        return False
+    cols = list((get_stats(table).get("columns") or {}).keys()) or None
+    analyze(table, cols)
+    return True
+
+
+def current_stats(table: str) -> dict:
+    """Estadísticas guardadas con 'rows' ajustado por los cambios desde el último ANALYZE."""
+    stats = get_stats(table)
+    if not stats:
+        return stats
+    cur = _read_mod(table)
+    if cur is not None:
+        stats = dict(stats)
+        stats["rows"] = max(0, cur[0] + cur[1] - cur[2])
+        stats["modified"] = cur[1] + cur[2]
+        stats["stale"] = _stale(*cur)
+    return stats
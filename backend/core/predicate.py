@@ -0,0 +1,285 @@
+"""
+Predicados de WHERE compilados una vez a closures.
+
+El árbol que deja el parser (Comparison / Between / InList / GeoWithin / BoolExpr, ya como dicts)
+se compila contra la relación de la tabla:
+  - los literales se convierten al tipo de la columna una sola vez (no por fila)
+  - pred(row) evalúa sobre filas ya decodificadas (dict)
+  - pred.raw(schema) devuelve la versión sobre la tupla de struct.unpack del registro: los
+    archivos descartan la fila antes de armar el Record/dict y solo decodifican las columnas usadas
+
+NULL (None o POINT vacío) no cumple ninguna comparación, como en SQL.
+"""
+import math
+import operator
+
+from backend.core.utils import parse_point
+
+_CMP = {
+    "=": operator.eq, "==": operator.eq,
+    "!=": operator.ne, "<>": operator.ne,
+    "<": operator.lt, "<=": operator.le,
+    ">": operator.gt, ">=": operator.ge,
+}
+RANGE_OPS = ("<", "<=", ">", ">=")
+
+_INT = ("i", "int", "integer", "h", "smallint", "q", "bigint")
+_FLOAT = ("f", "float", "real", "d", "double", "double precision")
+_TEXT = ("c", "char", "s", "varchar", "string", "date", "datetime")
+_BOOL = ("b", "bool", "boolean", "?")
+
+
+# ------------------------------ forma del árbol ------------------------------ #
+
+def node_kind(node) -> str | None:
+    """'bool' | 'cmp' | 'between' | 'in' | 'geo' | 'knn' | None."""
+    if not isinstance(node, dict):
+        return None
+    keys = set(node.keys())
+    if "items" in keys and "left" not in keys and "ident" not in keys:
+        return "bool"
+    if {"left", "op", "right"} <= keys:
+        return "cmp"
+    if {"ident", "lo", "hi"} <= keys:
+        return "between"
+    if {"ident", "center", "radius"} <= keys:
+        return "geo"
+    if {"ident", "point", "k"} <= keys:
+        return "knn"
+    if {"ident", "items"} <= keys:
+        return "in"
+    return None
+
+
+def conjuncts(where) -> list:
+    """Aplana los AND anidados: a AND (b AND c) -> [a, b, c]."""
+    if where is None:
+        return []
+    if node_kind(where) == "bool" and (where.get("op") or "").upper() == "AND":
+        out = []
+        for w in where.get("items") or []:
+            out.extend(conjuncts(w))
+        return out
+    return [where]
+
+
+def disjuncts(where) -> list:
+    """Aplana los OR anidados: a OR (b OR c) -> [a, b, c]."""
+    if node_kind(where) == "bool" and (where.get("op") or "").upper() == "OR":
+        out = []
+        for w in where.get("items") or []:
+            out.extend(disjuncts(w))
+        return out
+    return [where]
+
+
+def conjoin(items: list):
+    """Inverso de conjuncts: None, el único conjunto, o un AND."""
+    if not items:
+        return None
+    if len(items) == 1:
+        return items[0]
+    return {"op": "AND", "items": list(items)}
+
+
+def columns_of(where) -> set:
+    kind = node_kind(where)
+    if kind == "bool":
+        out = set()
+        for w in where.get("items") or []:
+            out |= columns_of(w)
+        return out
+    if kind == "cmp":
+        return {where["left"]}
+    if kind is not None:
+        return {where["ident"]}
+    return set()
+
+
+def rename_columns(where, fn):
+    """Copia del árbol con cada columna reemplazada por fn(col) (p. ej. 'a.x' -> 'x')."""
+    kind = node_kind(where)
+    if kind == "bool":
+        return {**where, "items": [rename_columns(w, fn) for w in where.get("items") or []]}
+    if kind == "cmp":
+        return {**where, "left": fn(where["left"])}
+    if kind is not None:
+        return {**where, "ident": fn(where["ident"])}
+    return where
+
+
+# ------------------------------ literales ------------------------------ #
+
+NO_MATCH = object()   # literal que no puede igualar a ningún valor de la columna
+
+
+def coerce(value, ctype: str):
+    if value is None:
+        return None
+    if ctype == "point":
+        pt = parse_point(value)
+        return NO_MATCH if pt is None else [pt[0], pt[1]]
+    try:
+        if ctype in _INT:
+            f = float(value)
+            return int(f) if f == int(f) else f
+        if ctype in _FLOAT:
+            return float(value)
+        if ctype in _BOOL:
+            return value if isinstance(value, bool) else str(value).strip().lower() in ("1", "true", "t", "yes", "y")
+        if ctype in _TEXT:
+            return str(value)
+    except (TypeError, ValueError, OverflowError):
+        return NO_MATCH
+    return value
+
+
+def type_family(ctype: str) -> str:
+    """'num' | 'text' | 'bool' | el tipo tal cual: columnas de la misma familia se comparan con < y =."""
+    t = str(ctype or "").lower()
+    if t in _INT or t in _FLOAT:
+        return "num"
+    if t in _TEXT:
+        return "text"
+    if t in _BOOL:
+        return "bool"
+    return t
+
+
+def _hashable(v):
+    return tuple(v) if isinstance(v, list) else v
+
+
+# ------------------------------ compilación ------------------------------ #
+
+class Predicate:
+    """WHERE compilado para una relación ({col: {"type": ...}}); se llama como pred(row)."""
+
+    def __init__(self, where, relation: dict):
+        self.where = where
+        self.types = {c: str((spec or {}).get("type") or "").lower() for c, spec in relation.items()}
+        for c in columns_of(where):
+            if c not in self.types:
+                raise KeyError(f"Columna '{c}' no existe")
+        self._row = self._compile(where, lambda col: (lambda r: r.get(col)))
+        self._raw = {}
+
+    def __call__(self, row: dict) -> bool:
+        return self._row(row)
+
+    def raw(self, schema: list):
+        """Versión sobre la tupla de struct.unpack(format) de un registro con este 'schema'."""
+        key = id(schema)
+        fn = self._raw.get(key)
+        if fn is None:
+            fn = self._raw[key] = self._compile(self.where, _raw_getters(schema))
+        return fn
+
+    # --------------------------------------------------------------------- #
+
+    def _compile(self, node, getter):
+        kind = node_kind(node)
+        if kind == "bool":
+            parts = [self._compile(w, getter) for w in node.get("items") or []]
+            if (node.get("op") or "").upper() == "AND":
+                return lambda r: all(f(r) for f in parts)
+            return lambda r: any(f(r) for f in parts)
+
+        if kind == "cmp":
+            col, op = node["left"], node["op"]
+            fn = _CMP.get(op)
+            if fn is None:
+                raise ValueError(f"Operador no soportado en WHERE: {op}")
+            get, lit = getter(col), coerce(node["right"], self.types[col])
+            if lit is NO_MATCH or lit is None:
+                # el literal no es del tipo de la columna (o es NULL): solo '!=' puede cumplirse
+                if fn is operator.ne and lit is NO_MATCH:
+                    return lambda r: get(r) is not None
+                return lambda r: False
+
+            def cmp(r):
+                v = get(r)
+                if v is None:
+                    return False
+                try:
+                    return fn(v, lit)
+                except TypeError:
+                    return False
+            return cmp
+
+        if kind == "between":
+            col = node["ident"]
+            get = getter(col)
+            lo, hi = coerce(node["lo"], self.types[col]), coerce(node["hi"], self.types[col])
+            if lo in (None, NO_MATCH) or hi in (None, NO_MATCH):
+                return lambda r: False
+
+            def between(r):
+                v = get(r)
+                if v is None:
+                    return False
+                try:
+                    return lo <= v <= hi
+                except TypeError:
+                    return False
+            return between
+
+        if kind == "in":
+            col = node["ident"]
+            get = getter(col)
+            items = {_hashable(v) for v in (coerce(x, self.types[col]) for x in node.get("items") or [])
+                     if v is not None and v is not NO_MATCH}
+
+            def inlist(r):
+                v = get(r)
+                return v is not None and _hashable(v) in items
+            return inlist
+
+        if kind == "geo":
+            col = node["ident"]
+            get = getter(col)
+            center = parse_point(node["center"])
+            if center is None:
+                raise ValueError("IN (POINT(x, y), r) necesita un punto como centro")
+            cx, cy = center
+            r2 = float(node["radius"]) ** 2
+
+            def within(r):
+                pt = parse_point(get(r))
+                return pt is not None and (pt[0] - cx) ** 2 + (pt[1] - cy) ** 2 <= r2
+            return within
+
+        if kind == "knn":
+            raise ValueError("KNN no se puede combinar con otras condiciones")
+        raise ValueError(f"Condición WHERE no soportada: {node!r}")
+
+
+def raw_index(schema: list, name: str) -> int:
+    """Posición de 'name' en la tupla de struct.unpack (POINT ocupa dos)."""
+    i = 0
+    for f in schema:
+        if f["name"] == name:
+            return i
+        i += 2 if str(f.get("type") or "").lower() == "point" else 1
+    raise KeyError(name)
+
+
+def _raw_getters(schema: list):
+    """Lectores por columna sobre la tupla cruda: decodifican igual que Record.unpack."""
+    pos, types = {}, {}
+    i = 0
+    for f in schema:
+        t = str(f.get("type") or "").lower()
+        pos[f["name"]], types[f["name"]] = i, t
+        i += 2 if t == "point" else 1
+
+    def getter(col):
+        i, t = pos[col], types[col]
+        if t == "point":
+            return lambda tup: None if math.isnan(tup[i]) else [tup[i], tup[i + 1]]
+        if t in _TEXT:
+            return lambda tup: tup[i].decode("utf-8").rstrip("\x00 ")
+        if t in _BOOL:
+            return lambda tup: bool(tup[i])
+        return lambda tup: tup[i]
+    return getter
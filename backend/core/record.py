@@ -1,5 +1,9 @@
 import struct
 
+from backend.core.utils import parse_point
+
+NULL_POINT = (float("nan"), float("nan"))
+
 class Record:
     def __init__(self, schema: list, format: str, values):
         self.schema = schema
@@ -47,18 +51,28 @@ class Record:
                 val = (
                     val or b"" if isinstance(val, bytes) else str(val or "").encode("utf-8")
                 ).ljust(length, b"\x00")
+            elif t == "point":
+                # dos 'd'; NULL se guarda como (nan, nan)
+                pt = parse_point(val)
+                if pt is None and val not in (None, ""):
+                    raise ValueError(f"Valor POINT inválido en '{name}': {val!r}")
+                values.extend(pt or NULL_POINT)
+                continue
             values.append(val)
         return struct.pack(self.format, *values)
 
     @classmethod
     def unpack(cls, data, format, schema):
-        unpacked = struct.unpack(format, data)
+        unpacked = iter(struct.unpack(format, data))
         values = {}
         for field, raw in zip(schema, unpacked):
             name = field["name"]
             ftype = field["type"]
             t = ftype.lower()
-            if t in ("i", "int", "integer"):
+            if t == "point":
+                y = next(unpacked)
+                values[name] = None if raw != raw else [raw, y]  # nan -> NULL
+            elif t in ("i", "int", "integer"):
                 values[name] = int(raw)
             elif t in ("h", "smallint"):
                 values[name] = int(raw)
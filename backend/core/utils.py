@@ -1,3 +1,30 @@
+import math
+
+
+def parse_point(v):
+    """
+    (x, y) en float de un valor de punto o None si no lo es.
+    Acepta lista/tupla, {"x", "y"} (literal POINT del parser) y texto '[x, y]' o 'x,y'.
+    """
+    if v is None:
+        return None
+    if isinstance(v, dict):
+        v = (v.get("x"), v.get("y"))
+    elif isinstance(v, bytes):
+        v = v.decode("utf-8", "ignore")
+    if isinstance(v, str):
+        v = v.strip().strip("[]() \x00").split(",")
+    if not isinstance(v, (list, tuple)) or len(v) < 2:
+        return None
+    try:
+        x, y = float(v[0]), float(v[1])
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(x) or math.isnan(y):
+        return None
+    return x, y
+
+
 def build_format(schema):
     # Normaliza schema -> lista de dicts de campo
     if isinstance(schema, dict):
@@ -33,6 +60,8 @@ def build_format(schema):
             fmt += "d"
         elif t in ("b", "bool", "boolean", "?"):
             fmt += "?"
+        elif t == "point":
+            fmt += "dd"  # x, y
         elif t in ("c", "char", "s", "varchar", "string", "text", "blob", "binary", "date", "datetime"):
             if length <= 0:
                 length = 1
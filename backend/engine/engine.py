@@ -98,3 +98,21 @@ class Engine:
         stats["time_ms"] = parse_ms + plan_ms + exec_ms
 
         return env
+
+    def stream(self, sql: str):
+        """
+        Como run, pero como generador de eventos (ver Executor.stream): las filas de un SELECT
+        salen a medida que se producen. Un error de parseo o planificación es un único {"result": ...}.
+        """
+        try:
+            ast = self.parser.parse(sql)
+        except Exception as ex:
+            yield {"result": err_result(action="parse", code="SYNTAX_ERROR", message=str(ex),
+                                        where="parser", detail={"sql": sql})}
+            return
+        try:
+            plans = self.planner.plan(ast)
+        except Exception as ex:
+            yield {"result": err_result(action="plan", code="PLAN_ERROR", message=str(ex), where="planner")}
+            return
+        yield from self.exec.stream(plans)
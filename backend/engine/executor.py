@@ -1,15 +1,15 @@
 from typing import Any, Dict, List
 from time import perf_counter
-import json as _json
-import struct
 import csv as _csv
 import os
 from backend.catalog.ddl import create_table, create_index, drop_table, drop_index
 from backend.storage.file import File
 from backend.catalog.catalog import table_meta_path, get_json
-from backend.core.utils import build_format
-from backend.core.record import Record
-from backend.storage.indexes.heap import HeapFile
+from backend.catalog.stats import analyze as analyze_table, note_modified
+from backend.engine.joins import spatial_join, equi_join, project_join_row
+from backend.core.predicate import Predicate, type_family
+from backend.engine.operators import (PIPELINE_ACTIONS, Scan, IndexScan, Filter, Sort, Limit, Project,
+                                      HashAggregate, IndexAggregate)
 
 INTERNAL_FIELDS = {"deleted", "pos", "slot"}
 
@@ -23,6 +23,7 @@ def ZERO_IO():
         "bplus": dict(z),
         "hash": dict(z),
         "rtree": dict(z),
+        "grid": dict(z),
         "total": dict(z),
     }
 
@@ -59,43 +60,6 @@ def _detect_pk_name(table: str) -> str | None:
         pass
     return None
 
-# --- Fallback: heap-scan geo dentro de un radio ---
-def _heap_geo_scan(table, field, center, radius):
-    meta = table_meta_path(table)
-    relation, indexes = get_json(str(meta), 2)
-    pidx = indexes.get("primary", {})
-    if pidx.get("index") != "heap":
-        return []
-    heap_file = pidx["filename"]
-    with open(heap_file, "rb") as hf:
-        slen = struct.unpack("<I", hf.read(4))[0]
-        schema = _json.loads(hf.read(slen).decode("utf-8"))
-        fmt = build_format(schema)
-        rec_size = struct.calcsize(fmt)
-        cx, cy, rr = float(center["x"]), float(center["y"]), float(radius)
-        end = hf.seek(0, 2); hf.seek(4 + slen)
-        out = []
-        while hf.tell() < end:
-            chunk = hf.read(rec_size)
-            if not chunk or len(chunk) < rec_size: break
-            rec = Record.unpack(chunk, fmt, schema).fields
-            if rec.get("deleted"):
-                continue
-            v = rec.get(field)
-            if isinstance(v, str) and v.startswith("[") and v.endswith("]"):
-                try: v = _json.loads(v)
-                except Exception: continue
-            if isinstance(v, (list, tuple)) and len(v) >= 2:
-                px, py = float(v[0]), float(v[1])
-            elif isinstance(v, dict):
-                px, py = float(v.get("x")), float(v.get("y"))
-            else:
-                continue
-            dx, dy = px - cx, py - cy
-            if dx*dx + dy*dy <= rr*rr:
-                out.append(rec)
-        return out
-
 def _sanitize_rows(rows):
     if not isinstance(rows, list):
         return [], 0
@@ -109,29 +73,15 @@ def _sanitize_rows(rows):
 
 def _kind_for(action: str) -> str:
     # DDL
-    if action in ("create_table", "drop_table", "create_index", "drop_index", "create_table_from_file"):
+    if action in ("create_table", "drop_table", "create_index", "drop_index", "create_table_from_file",
+                  "reorganize", "vacuum_index", "analyze"):
         return "ddl"
     # DML (incluye consultas/selects)
-    if action in ("insert", "remove", "search", "range_search", "knn", "search_in", "geo_within", "select"):
+    if action in ("insert", "remove", "search", "range_search", "knn", "search_in", "geo_within", "select", "index_merge",
+                  "spatial_join", "equi_join", "knn_batch", "geo_within_batch", "index_aggregate"):
         return "dml"
     return "query"
 
-def _project_row(row, cols):
-    if cols is None:
-        return {k: v for k, v in row.items() if k not in INTERNAL_FIELDS}
-    return {k: row.get(k) for k in cols if k not in INTERNAL_FIELDS}
-
-def _as_point(v):
-    if isinstance(v, dict): return (float(v.get("x")), float(v.get("y")))
-    if isinstance(v, (list, tuple)) and len(v) >= 2: return (float(v[0]), float(v[1]))
-    if isinstance(v, str) and v.startswith("[") and v.endswith("]"):
-        try:
-            j = _json.loads(v)
-            if isinstance(j, (list, tuple)) and len(j) >= 2:
-                return (float(j[0]), float(j[1]))
-        except Exception: pass
-    return None
-
 def _infer_type(values):
     """Inferencia simple: int > float > bool > varchar."""
     saw_float = saw_int = saw_bool = False
@@ -203,35 +153,54 @@ def _infer_fields_from_csv(path, index_column=None, index_method=None, sample_ro
 
     return fields
 
-def _eval_where(where, row):
-    if not where: return True
-    if "items" in where and "left" not in where:
-        op = (where.get("op") or "").upper()
-        vals = [_eval_where(w, row) for w in (where.get("items") or [])]
-        return all(vals) if op == "AND" else any(vals)
-    if {"left","op","right"} <= set(where.keys()):
-        l = row.get(where["left"]); r = where["right"]; op = where["op"]
-        if op in ("=", "=="): return l == r
-        if op in ("!=", "<>"): return l != r
-        try: lf, rf = float(l), float(r)
-        except Exception: return False
-        return (op == "<" and lf < rf) or (op == "<=" and lf <= rf) or \
-               (op == ">" and lf > rf) or (op == ">=" and lf >= rf)
-    if {"ident","lo","hi"} <= set(where.keys()):
-        try:
-            v = float(row.get(where["ident"]))
-            return float(where["lo"]) <= v <= float(where["hi"])
-        except Exception: return False
-    if {"ident","items"} <= set(where.keys()):
-        return row.get(where["ident"]) in (where.get("items") or [])
-    if {"ident","center","radius"} <= set(where.keys()):
-        p = _as_point(row.get(where["ident"]))
-        if p is None: return False
-        cx, cy = float(where["center"]["x"]), float(where["center"]["y"])
-        rr = float(where["radius"])
-        dx, dy = p[0]-cx, p[1]-cy
-        return (dx*dx + dy*dy) ** 0.5 <= rr
-    return False
+def _check_aggregates(p, F):
+    """Columnas de GROUP BY y de las agregaciones contra la relación; SUM / AVG solo numéricas."""
+    for c in p.get("group_by") or []:
+        if c not in F.relation:
+            raise KeyError(f"Columna '{c}' no existe")
+    for a in p.get("aggregates") or []:
+        c = a["column"]
+        if c is None:
+            continue
+        if c not in F.relation:
+            raise KeyError(f"Columna '{c}' no existe")
+        if a["func"] in ("SUM", "AVG") and type_family(F.relation[c].get("type")) != "num":
+            raise ValueError(f"{a['func']} requiere una columna numérica ('{c}')")
+
+def _pipeline(p, F):
+    """
+    Árbol de iteradores de un plan de SELECT: acceso -> filtro residual -> agregación -> orden ->
+    límite -> proyección.
+    """
+    action = p["action"]
+    _check_aggregates(p, F)
+    if action == "index_aggregate":
+        root = IndexAggregate(F, p["aggregates"])
+    elif action == "select":
+        # WHERE compilado una vez y evaluado dentro del recorrido del primario
+        where = p.get("where")
+        root = Scan(F, Predicate(where, F.relation) if where is not None else None)
+    else:
+        payload = {k: v for k, v in p.items()
+                   if k not in ("action", "table", "filter", "columns", "order_by", "limit",
+                                "group_by", "aggregates")}
+        payload["op"] = action
+        root = IndexScan(F, payload)
+    if p.get("filter") is not None:
+        root = Filter(root, Predicate(p["filter"], F.relation))
+    if "group_by" in p:
+        root = HashAggregate(root, p["group_by"], p["aggregates"])
+    # después de agregar solo quedan las columnas de salida (grupos y agregaciones)
+    known = F.relation if "aggregates" not in p else set(p.get("group_by") or []) | {a["name"] for a in p["aggregates"]}
+    order = p.get("order_by") or []
+    for o in order:
+        if o["column"] not in known:
+            raise KeyError(f"Columna '{o['column']}' no existe")
+    if order:
+        root = Sort(root, [(o["column"], o["desc"]) for o in order], limit=p.get("limit"))
+    if p.get("limit") is not None:
+        root = Limit(root, p["limit"])
+    return Project(root, p.get("columns"))
 
 # ---------------- mensajes consistentes en DML ---------------- #
 def _fmt_rows(n: int) -> str:
@@ -240,13 +209,18 @@ def _fmt_rows(n: int) -> str:
 def _fmt_vecinos(n: int) -> str:
     return f"{n} vecino" if n == 1 else f"{n} vecinos"
 
-def _msg_for(action: str, *, count: int | None = None, affected: int | None = None) -> str:
+def _msg_for(action: str, *, count: int | None = None, affected: int | None = None, points: int = 0) -> str:
     if action == "insert": return f"Insertadas {_fmt_rows(int(affected or 0))}."
     if action == "remove": return f"Eliminadas {_fmt_rows(int(affected or 0))}."
-    if action in ("search", "select"): return f"Encontradas {_fmt_rows(int(count or 0))}."
+    if action in ("search", "select", "index_aggregate"): return f"Encontradas {_fmt_rows(int(count or 0))}."
     if action == "range_search": return f"Encontradas {_fmt_rows(int(count or 0))} (rango)."
     if action == "geo_within": return f"Encontradas {_fmt_rows(int(count or 0))} (geo)."
+    if action == "index_merge": return f"Encontradas {_fmt_rows(int(count or 0))} (índices combinados)."
     if action == "knn": return f"Encontrados {_fmt_vecinos(int(count or 0))} (kNN)."
+    if action == "knn_batch": return f"Encontrados {_fmt_vecinos(int(count or 0))} para {points} puntos (kNN)."
+    if action == "geo_within_batch": return f"Encontradas {_fmt_rows(int(count or 0))} para {points} puntos (geo)."
+    if action == "spatial_join": return f"Encontrados {count or 0} pares (join espacial)."
+    if action == "equi_join": return f"Encontradas {_fmt_rows(int(count or 0))} (join)."
     return ""
 
 def ok_result(action, table=None, data=None, meta=None, message=None, t_ms: float = 0.0, plan=None):
@@ -300,7 +274,8 @@ class Executor:
                                              t_ms=(perf_counter()-t0)*1000, plan=plan_safe))
 
                 elif action == "create_index":
-                    create_index(p["table"], p["column"], method=p.get("method") or "bplus")
+                    create_index(p["table"], p["column"], method=p.get("method") or "bplus",
+                                 options=p.get("options"))
                     results.append(ok_result(action, table, message="Índice creado.",
                                              meta={"io": ZERO_IO(), "index_usage": []},
                                              t_ms=(perf_counter() - t0) * 1000, plan=plan_safe))
@@ -369,6 +344,7 @@ class Executor:
                         F.io_reset()
                         F.index_reset()
                         F.execute({"op": "build", "records": recs})
+                        note_modified(table, inserted=len(recs))
                         io = F.io_get()
                         idx = F.index_get()
                         results.append(ok_result(action, table, meta={"io": io, "index_usage": idx},
@@ -378,7 +354,9 @@ class Executor:
                         # heap / sequential / bplus / hash: import CSV
                         F.io_reset()
                         F.index_reset()
-                        F.execute({"op": "import_csv", "path": path})
+                        res = F.execute({"op": "import_csv", "path": path}) or {}
+                        if isinstance(res, dict):
+                            note_modified(table, inserted=int(res.get("count", 0)))
                         io = F.io_get()
                         idx = F.index_get()
                         results.append(ok_result(action, table, meta={"io": io, "index_usage": idx},
@@ -397,100 +375,83 @@ class Executor:
                                              meta={"io": ZERO_IO(), "index_usage": []},
                                              t_ms=(perf_counter()-t0)*1000, plan=plan_safe))
 
-                # ------------------------------- DML ------------------------------- #
-                elif action in ("insert","remove","search","range_search","knn","search_in","geo_within","select"):
+                elif action == "reorganize":
                     F = File(table)
+                    F.io_reset(); F.index_reset()
+                    res = F.execute({"op": "reorganize"})
+                    io = F.io_get(); idx = F.index_get()
+                    results.append(ok_result(action, table, message="Tabla reorganizada.",
+                                             meta={"io": io, "index_usage": idx, "isam": res},
+                                             t_ms=(perf_counter()-t0)*1000, plan=plan_safe))
 
-                    if action == "search_in":
-                        field = p["field"]; items = list(p.get("items") or [])
-                        acc: List[Dict[str, Any]] = []
-                        F.io_reset(); F.index_reset()
-                        for v in items:
-                            rr = F.execute({"op": "search", "field": field, "value": v})
-                            if isinstance(rr, list):
-                                acc.extend(rr)
-                        pk_name = _detect_pk_name(table)
-                        seen = set(); merged = []
-                        for r in acc:
-                            if isinstance(r, dict) and pk_name:
-                                k = r.get(pk_name, None)
-                                if k is not None:
-                                    if k in seen: continue
-                                    seen.add(k)
-                            merged.append(r)
-                        io = F.io_get(); idx = F.index_get()
-                        data, cnt = _sanitize_rows(merged)
-                        results.append(ok_result("search", table, data=data,
-                                                 meta={"io": io, "index_usage": idx},
-                                                 message=_msg_for("search", count=cnt),
-                                                 t_ms=(perf_counter()-t0)*1000, plan=plan_safe))
-
-                    elif action == "geo_within":
-                        field = p["field"]; center = p["center"]; radius = p["radius"]
-
-                        def _bbox(c, r):
-                            cx, cy = float(c["x"]), float(c["y"])
-                            rr = float(r)
-                            return {"xmin": cx - rr, "ymin": cy - rr, "xmax": cx + rr, "ymax": cy + rr}
-
-                        F.io_reset(); F.index_reset()
-                        rows = None
+                elif action == "vacuum_index":
+                    F = File(table)
+                    F.io_reset(); F.index_reset()
+                    res = F.execute({"op": "vacuum_index", "field": p.get("column"), "force": p.get("full")})
+                    io = F.io_get(); idx = F.index_get()
+                    n = sum(1 for r in res.values() if r["rebuilt"])
+                    results.append(ok_result(action, table, message=f"Índices rtree reconstruidos: {n}/{len(res)}.",
+                                             meta={"io": io, "index_usage": idx, "rtree": res},
+                                             t_ms=(perf_counter()-t0)*1000, plan=plan_safe))
 
-                        try:
-                            r1 = F.execute({"op": "rtree_within_circle", "field": field,
-                                            "center": center, "radius": radius})
-                            rows = r1 if r1 else None
-                        except Exception:
-                            rows = None
+                elif action == "analyze":
+                    F = File(table)
+                    F.io_reset(); F.index_reset()
+                    stats = analyze_table(table, p.get("columns"), io_file=F)
+                    io = F.io_get(); idx = F.index_get()
+                    cols = p.get("columns") or list(stats["columns"].keys())
+                    data = [{"column": c, **{k: v for k, v in stats["columns"][c].items() if k != "hist"},
+                             "buckets": max(0, len(stats["columns"][c].get("hist") or []) - 1)} for c in cols]
+                    results.append(ok_result(action, table, data=data,
+                                             message=f"Tabla analizada: {_fmt_rows(stats['rows'])}.",
+                                             meta={"io": io, "index_usage": idx, "rows": stats["rows"]},
+                                             t_ms=(perf_counter()-t0)*1000, plan=plan_safe))
 
-                        if not rows:
-                            try:
-                                rect = _bbox(center, radius)
-                                candidates = F.execute({"op": "rtree_range", "field": field, "rect": rect}) or []
-                                if candidates:
-                                    cx, cy, rr = float(center["x"]), float(center["y"]), float(radius)
-                                    filt = []
-                                    for r in candidates:
-                                        if isinstance(r, dict):
-                                            v = r.get(field)
-                                            if isinstance(v, str) and v.startswith("[") and v.endswith("]"):
-                                                try: v = _json.loads(v)
-                                                except Exception: pass
-                                            if isinstance(v, dict):
-                                                px, py = float(v.get("x")), float(v.get("y"))
-                                            elif isinstance(v, (list, tuple)) and len(v) >= 2:
-                                                px, py = float(v[0]), float(v[1])
-                                            else:
-                                                continue
-                                            dx, dy = (px - cx), (py - cy)
-                                            if (dx*dx + dy*dy) ** 0.5 <= rr:
-                                                filt.append(r)
-                                    rows = filt if filt else None
-                            except Exception:
-                                rows = rows or None
+                # ------------------------------- JOIN ------------------------------ #
+                elif action in ("spatial_join", "equi_join"):
+                    rows, meta = (spatial_join if action == "spatial_join" else equi_join)(p)
+                    aliases = [p["left"]["alias"], p["right"]["alias"]]
+                    data = [project_join_row(r, p.get("columns"), aliases) for r in rows]
+                    results.append(ok_result(action, table, data=data, meta=meta,
+                                             message=_msg_for(action, count=len(data)),
+                                             t_ms=(perf_counter()-t0)*1000, plan=plan_safe))
 
-                        if not rows:
-                            try:
-                                r3 = F.execute({"op": "geo_within", "field": field,
-                                                "center": center, "radius": radius})
-                                rows = r3 if r3 else None
-                            except Exception:
-                                rows = None
+                # --------------------------- KNN / radio por lote ------------------------- #
+                elif action in ("knn_batch", "geo_within_batch"):
+                    # un grupo por punto consultado: [{"point": [x, y], "rows": [...]}]
+                    F = File(table)
+                    F.io_reset(); F.index_reset()
+                    op = "knn_batch" if action == "knn_batch" else "range_batch"
+                    groups = F.execute({"op": op, "field": p["field"], "points": p["points"],
+                                        "k": p.get("k"), "radius": p.get("radius")})
+                    data = []
+                    for g in groups:
+                        rows, cnt = _sanitize_rows(g["rows"])
+                        data.append({"point": g["point"], "count": cnt, "rows": rows})
+                    results.append(ok_result(action, table, data=data,
+                                             meta={"io": F.io_get(), "index_usage": F.index_get()},
+                                             message=_msg_for(action, count=sum(g["count"] for g in data),
+                                                              points=len(data)),
+                                             t_ms=(perf_counter()-t0)*1000, plan=plan_safe))
 
-                        if not rows:
-                            try:
-                                rows = _heap_geo_scan(table, field, center, radius) or []
-                            except Exception:
-                                rows = []
+                # ------------------------- SELECT (iteradores) ------------------------- #
+                elif action in PIPELINE_ACTIONS:
+                    F = File(table)
+                    F.io_reset(); F.index_reset()
+                    root = _pipeline(p, F)
+                    data = list(root)
+                    label = "search" if action == "search_in" else action
+                    results.append(ok_result(label, table, data=data,
+                                             meta={"io": F.io_get(), "index_usage": F.index_get(),
+                                                   "pipeline": root.explain()},
+                                             message=_msg_for(label, count=len(data)),
+                                             t_ms=(perf_counter()-t0)*1000, plan=plan_safe))
 
-                        io = F.io_get(); idx = F.index_get()
-                        data, cnt = _sanitize_rows(rows or [])
-                        results.append(ok_result("geo_within", table, data=data,
-                                                 meta={"io": io, "index_usage": idx},
-                                                 message=_msg_for("geo_within", count=cnt),
-                                                 t_ms=(perf_counter()-t0)*1000, plan=plan_safe))
+                # ------------------------------- DML ------------------------------- #
+                elif action in ("insert", "remove"):
+                    F = File(table)
 
-                    elif action == "insert":
+                    if action == "insert":
                         # ---- NUEVO: INSERT INTO t FROM FILE 'path' ----
                         if p.get("from_file"):
                             path = p.get("from_file")
@@ -498,6 +459,7 @@ class Executor:
                             res = F.execute({"op": "import_csv", "path": path}) or {}
                             affected = int(res.get("count", 0)) if isinstance(res, dict) else 0
                             io = F.io_get(); idx = F.index_get()
+                            note_modified(table, inserted=affected)
                             results.append(ok_result("insert", table,
                                                      meta={"affected": affected, "io": io, "index_usage": idx},
                                                      message=_msg_for("insert", affected=affected),
@@ -533,6 +495,7 @@ class Executor:
                                                           t_ms=(perf_counter()-t0)*1000))
                                 overall_ok = False
                             else:
+                                note_modified(table, inserted=affected)
                                 results.append(ok_result(action, table,
                                                          meta={"affected": affected, "io": io, "index_usage": idx},
                                                          message=_msg_for("insert", affected=affected),
@@ -565,68 +528,12 @@ class Executor:
                         if isinstance(res, list): affected = len(res)
                         elif isinstance(res, dict) and "affected" in res: affected = res["affected"]
                         io = F.io_get(); idx = F.index_get()
+                        note_modified(table, deleted=affected)
                         results.append(ok_result(action, table,
                                                  meta={"affected": affected, "io": io, "index_usage": idx},
                                                  message=_msg_for("remove", affected=affected),
                                                  t_ms=(perf_counter()-t0)*1000, plan=plan_safe))
 
-
-                    elif action == "select":
-                        F.io_reset()
-                        F.index_reset()
-                        where = p.get("where")
-                        cols = p.get("columns")
-
-                        def _emit_ok(rows):
-                            normalized = []
-                            for r in rows or []:
-                                if isinstance(r, tuple) and len(r) >= 1:
-                                    normalized.append(r[0])
-                                elif isinstance(r, dict):
-                                    normalized.append(r)
-                            projected = [_project_row(r, cols) for r in normalized if isinstance(r, dict)]
-                            data, cnt = _sanitize_rows(projected)
-                            io = F.io_get()
-                            idx = F.index_get()
-                            results.append(ok_result("select", table, data=data,
-                                                     meta={"io": io, "index_usage": idx},
-                                                     message=_msg_for("select", count=cnt),
-                                                     t_ms=(perf_counter() - t0) * 1000, plan=plan_safe))
-
-                        if where is None:
-                            rows = F.execute({"op": "get_all"}) or []
-                            _emit_ok(rows)
-                        elif {"left", "op", "right"} <= set(where.keys()) and where.get("op") in ("=", "=="):
-                            rows = F.execute({"op": "search", "field": where["left"], "value": where["right"]}) or []
-                            _emit_ok(rows)
-                        elif {"ident", "lo", "hi"} <= set(where.keys()):
-                            rows = F.execute({"op": "range_search", "field": where["ident"],
-                                              "min": where["lo"], "max": where["hi"]}) or []
-                            _emit_ok(rows)
-                        else:
-                            results.append(err_result("select", "UNSUPPORTED_SELECT",
-                                                      "Forma de SELECT no soportada (usa search/range).",
-                                                      detail={"plan": p}, plan=plan_safe,
-                                                      t_ms=(perf_counter() - t0) * 1000))
-                            overall_ok = False
-
-                    else:
-                        # search / range search / knn “directos”
-                        payload = {k: v for k, v in p.items() if k not in ("action", "table", "post_filter")}
-                        payload["op"] = action
-                        F.io_reset()
-                        F.index_reset()
-                        rows = F.execute(payload) or []
-                        pf = p.get("post_filter")
-                        if pf and isinstance(rows, list):
-                            rows = [r for r in rows if isinstance(r, dict) and r.get(pf["field"]) == pf["value"]]
-                        data, cnt = _sanitize_rows(rows)
-                        io = F.io_get();
-                        idx = F.index_get()
-                        results.append(ok_result(action, table, data=data,
-                                                 meta={"io": io, "index_usage": idx},
-                                                 message=_msg_for(action, count=cnt),
-                                                 t_ms=(perf_counter() - t0) * 1000, plan=plan_safe))
                 else:
                     results.append(err_result(action, "UNSUPPORTED_ACTION",
                                               f"Acción no soportada: {action}",
@@ -652,4 +559,48 @@ class Executor:
             "results": results,
             "warnings": [],
             "stats": {"time_ms": total_ms}
-        }
\ No newline at end of file
+        }
+
+    def stream(self, plans: List[Dict[str, Any]]):
+        """
+        Como run, pero como generador de eventos (POST /query/stream los manda como NDJSON).
+        Un SELECT (o un JOIN por igualdad) emite {"result": cabecera con el plan}, un {"row": fila}
+        por cada fila a medida que sale del árbol de iteradores y {"end": count/meta} al terminar;
+        si falla a mitad, el "end" trae el error. Los demás planes emiten su resultado completo
+        como {"result": ...}.
+        """
+        for p in plans:
+            action = p["action"]; table = p.get("table")
+            if action not in PIPELINE_ACTIONS and action != "equi_join":
+                yield {"result": self.run([p])["results"][0]}
+                continue
+
+            plan_safe = _safe_plan(p)
+            label = "search" if action == "search_in" else action
+            t0 = perf_counter()
+            started, n = False, 0
+            try:
+                if action == "equi_join":
+                    pairs, jmeta = equi_join(p)
+                    aliases = [p["left"]["alias"], p["right"]["alias"]]
+                    rows = (project_join_row(r, p.get("columns"), aliases) for r in pairs)
+                    head = {}
+                    meta_of = lambda: jmeta
+                else:
+                    F = File(table)
+                    F.io_reset(); F.index_reset()
+                    rows = _pipeline(p, F)
+                    head = {"pipeline": rows.explain()}
+                    meta_of = lambda: {"io": F.io_get(), "index_usage": F.index_get()}
+                yield {"result": {"ok": True, "kind": _kind_for(label), "action": label, "table": table,
+                                  "plan": plan_safe, **head}}
+                started = True
+                for row in rows:
+                    n += 1
+                    yield {"row": row}
+                yield {"end": {"ok": True, "count": n, "message": _msg_for(label, count=n),
+                               "meta": {**meta_of(), "time_ms": (perf_counter()-t0)*1000}}}
+            except Exception as ex:
+                err = err_result(action, "EXEC_ERROR", str(ex), detail={"plan": p}, plan=plan_safe,
+                                 t_ms=(perf_counter()-t0)*1000)
+                yield {"end": {**err, "count": n}} if started else {"result": err}
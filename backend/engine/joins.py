@@ -0,0 +1,437 @@
+# joins.py
+# Operadores de join entre dos tablas.
+#
+# Join espacial por distancia: SELECT ... FROM a JOIN b ON DISTANCE(a.p, b.p) <= r
+# Estrategias (la primera que aplique):
+#   rtree_sync  -> ambos lados con índice rtree en la columna: recorrido sincronizado de los dos árboles
+#   index_nl    -> solo un lado indexado: se recorre el otro y por cada fila se consulta el R-Tree (radio)
+#   nested_loop -> ninguno indexado: barrido por x sobre ambos lados en memoria
+# Los candidatos se filtran siempre con la distancia exacta en float64 sobre los valores de la fila.
+#
+# Join por igualdad: SELECT ... FROM a JOIN b ON a.x = b.y (estrategia elegida por el planner, cost.join)
+#   index_nl -> se recorre el lado externo y por cada fila se busca la clave en el interno
+#               (PK o secundario hash/bplus)
+#   hash     -> grace hash join: el lado build va a una tabla hash; si no entra en BD2_JOIN_BUFFER
+#               filas, ambos lados se reparten en particiones en disco (DATA_DIR) y se juntan de a una
+#   merge    -> sort-merge join: los lados cuyo primario ya entrega las filas en orden de la
+#               columna de join (PK sequential / isam / bplus) se consumen tal cual; los demás
+#               pasan por el sort externo (Sort) antes de mezclar
+# Los dos lados se leen con File.iter_all y con su parte del WHERE ya empujada al recorrido.
+# Columnas de familias distintas (número = texto) se comparan como números: el lado de texto trae
+# 'cast' en el plan y su valor se convierte antes de hashear / comparar (el que no es número no
+# iguala a nada), igual que la conversión que hace index_nl al buscar en el interno.
+import bisect
+import math
+import os
+from typing import Iterator, List, Tuple
+
+from backend.core.predicate import Predicate, coerce, NO_MATCH
+from backend.engine.operators import RunFile, Filter, Sort, Limit
+from backend.storage.file import File
+from backend.storage.indexes.rtree import f32_slack
+
+INTERNAL_FIELDS = {"deleted", "pos", "slot"}
+
+JOIN_BUFFER = int(os.getenv("BD2_JOIN_BUFFER", "10000") or 10000)        # filas del lado build en memoria
+JOIN_PARTITIONS = int(os.getenv("BD2_JOIN_PARTITIONS", "16") or 16)      # particiones del grace hash join
+
+
+def _rows_of(records) -> List[dict]:
+    """get_all devuelve dicts o (fields, pos) según el índice primario: normaliza a dicts."""
+    out = []
+    for r in records or []:
+        if isinstance(r, tuple) and r and isinstance(r[0], dict):
+            out.append(r[0])
+        elif isinstance(r, dict):
+            out.append(r)
+    return out
+
+
+def _point_of(F: File, row: dict, field: str):
+    ok, pt = F._as_point(row.get(field))
+    return (pt[0], pt[1]) if ok else None
+
+
+def _has_rtree(F: File, field: str) -> bool:
+    return field != "primary" and (F.indexes.get(field) or {}).get("index") == "rtree"
+
+
+def _rtree_of(F: File, field: str):
+    return F._make_rtree(field, heap_ok=(F.indexes["primary"]["index"] == "heap"))
+
+
+def _sweep_join(lpts, rpts, r: float):
+    """Nested loop con barrido por x: (i, j) con |xi - xj| <= r; el filtro exacto lo hace el llamador."""
+    right = sorted(range(len(rpts)), key=lambda j: rpts[j][0])
+    xs = [rpts[j][0] for j in right]
+    for i, (x, _) in enumerate(lpts):
+        lo = bisect.bisect_left(xs, x - r)
+        hi = bisect.bisect_right(xs, x + r)
+        for k in range(lo, hi):
+            yield i, right[k]
+
+
+def spatial_join(p: dict) -> Tuple[List[dict], dict]:
+    """
+    Ejecuta un plan 'spatial_join' y retorna (filas, meta).
+    Cada fila combina ambos lados con columnas calificadas 'alias.col'.
+    """
+    L, R = p["left"], p["right"]
+    r = float(p["radius"])
+    strict = bool(p.get("strict"))
+    FL, FR = File(L["table"]), File(R["table"])
+    for F in (FL, FR):
+        F.io_reset(); F.index_reset()
+    lf, rf = L["field"], R["field"]
+    for F, side, f in ((FL, L, lf), (FR, R, rf)):
+        if f not in F.relation:
+            raise KeyError(f"Columna '{f}' no existe en '{side['table']}'")
+
+    pairs: List[Tuple[dict, dict]] = []
+    l_idx, r_idx = _has_rtree(FL, lf), _has_rtree(FR, rf)
+
+    if l_idx and r_idx:
+        strategy = "rtree_sync"
+        rt_l, rt_r = _rtree_of(FL, lf), _rtree_of(FR, rf)
+        rid_pairs = rt_l.distance_join(rt_r, r)
+        FL.io_merge(rt_l, "rtree"); FR.io_merge(rt_r, "rtree")
+        FL.index_log("secondary", "rtree", lf, "distance_join", note="sync")
+        FR.index_log("secondary", "rtree", rf, "distance_join", note="sync")
+        lrows = FL._rows_by_rid([a for a, _ in rid_pairs])
+        rrows = FR._rows_by_rid([b for _, b in rid_pairs])
+        for a, b in rid_pairs:
+            if a in lrows and b in rrows:
+                pairs.append((lrows[a], rrows[b]))
+
+    elif l_idx or r_idx:
+        strategy = "index_nl"
+        # outer = lado sin índice (scan), inner = lado con rtree (consulta por radio)
+        Fo, of, Fi, inf = (FR, rf, FL, lf) if l_idx else (FL, lf, FR, rf)
+        outer = _rows_of(Fo.execute({"op": "get_all"}))
+        rt = _rtree_of(Fi, inf)
+        probes = []
+        for row in outer:
+            pt = _point_of(Fo, row, of)
+            if pt is None:
+                continue
+            # el radio se ensancha con el redondeo float32 del índice; el filtro exacto va al final
+            rr = r + f32_slack(pt[0], pt[1], r)
+            probes.append((row, rt.range_rids(pt[0], pt[1], rr)))
+        Fi.io_merge(rt, "rtree")
+        Fi.index_log("secondary", "rtree", inf, "distance_join", note=f"index_nl probes={len(probes)}")
+        inner = Fi._rows_by_rid([rid for _, rids in probes for rid in rids])
+        for row, rids in probes:
+            for rid in rids:
+                if rid in inner:
+                    pairs.append((inner[rid], row) if l_idx else (row, inner[rid]))
+
+    else:
+        strategy = "nested_loop"
+        lall = _rows_of(FL.execute({"op": "get_all"}))
+        rall = _rows_of(FR.execute({"op": "get_all"}))
+        lrows, lpts = [], []
+        for row in lall:
+            pt = _point_of(FL, row, lf)
+            if pt is not None:
+                lrows.append(row); lpts.append(pt)
+        rrows, rpts = [], []
+        for row in rall:
+            pt = _point_of(FR, row, rf)
+            if pt is not None:
+                rrows.append(row); rpts.append(pt)
+        pairs = [(lrows[i], rrows[j]) for i, j in _sweep_join(lpts, rpts, r)]
+
+    # filtro exacto (los índices trabajan con MBR float32)
+    out = []
+    for lrow, rrow in pairs:
+        pl, pr = _point_of(FL, lrow, lf), _point_of(FR, rrow, rf)
+        if pl is None or pr is None:
+            continue
+        d = math.hypot(pl[0] - pr[0], pl[1] - pr[1])
+        if d < r or (not strict and d == r):
+            out.append(_combine(L, R, lrow, rrow))
+
+    return out, _join_meta(FL, FR, L, R, {"strategy": strategy, "candidates": len(pairs), "pairs": len(out)})
+
+
+def _combine(L: dict, R: dict, lrow: dict, rrow: dict) -> dict:
+    row = {f"{L['alias']}.{k}": v for k, v in lrow.items() if k not in INTERNAL_FIELDS}
+    row.update({f"{R['alias']}.{k}": v for k, v in rrow.items() if k not in INTERNAL_FIELDS})
+    return row
+
+
+def _join_meta(FL: File, FR: File, L: dict, R: dict, info: dict) -> dict:
+    io = FL.io_get()
+    for kind, cnt in FR.io_get().items():
+        for k, v in cnt.items():
+            io[kind][k] = io[kind].get(k, 0) + v
+    return {
+        "io": io,
+        "index_usage": ([{**u, "table": L["table"]} for u in FL.index_get()]
+                        + [{**u, "table": R["table"]} for u in FR.index_get()]),
+        "join": info,
+    }
+
+
+# ------------------------------ join por igualdad ------------------------------ #
+
+def _join_key(v, cast: str | None = None):
+    """
+    Valor de la columna de join como clave de dict; None (NULL) no iguala a nada. Con 'cast'
+    (tipo de la comparación) el valor se convierte antes; si no se puede, None.
+    """
+    if cast is not None:
+        v = coerce(v, cast)
+        if v is NO_MATCH:
+            return None
+    return tuple(v) if isinstance(v, list) else v
+
+
+def _scan(F: File, where, ordered: bool = False):
+    return F.iter_all(Predicate(where, F.relation) if where is not None else None, ordered=ordered)
+
+
+class HashJoin:
+    """
+    Grace hash join; iterar produce pares (fila build, fila probe). El lado build se carga en una
+    tabla hash; si pasa de 'buffer' filas, lo que falta de build y todo probe se reparten en
+    'partitions' particiones por hash de la clave (RunFile) y se junta partición por partición.
+    Una partición de build que tampoco entra se procesa en bloques de 'buffer' filas, releyendo
+    su partición de probe por bloque. 'bcast' / 'pcast': tipo al que se convierte la clave de
+    cada lado antes de hashear (columnas de familias distintas).
+    """
+
+    def __init__(self, build, probe, bkey: str, pkey: str, buffer: int = JOIN_BUFFER,
+                 partitions: int = JOIN_PARTITIONS, bcast: str | None = None, pcast: str | None = None):
+        self.build, self.probe = build, probe
+        self.bkey, self.pkey = bkey, pkey
+        self.bcast, self.pcast = bcast, pcast
+        self.buffer = max(1, int(buffer))
+        self.partitions = max(1, int(partitions))
+        self.spilled = 0   # filas bajadas a disco (build + probe); 0 si todo entró en memoria
+
+    def __iter__(self):
+        table, n = {}, 0
+        build = iter(self.build)
+        for row in build:
+            k = _join_key(row.get(self.bkey), self.bcast)
+            if k is None:
+                continue
+            table.setdefault(k, []).append(row)
+            n += 1
+            if n >= self.buffer:
+                yield from self._grace(table, build)
+                return
+        yield from self._probe(table, self.probe)
+
+    def _probe(self, table: dict, probe):
+        for prow in probe:
+            k = _join_key(prow.get(self.pkey), self.pcast)
+            if k is None:
+                continue
+            for brow in table.get(k, ()):
+                yield brow, prow
+
+    def _grace(self, table: dict, rest):
+        P = self.partitions
+        bparts = [RunFile() for _ in range(P)]
+        pparts = [RunFile() for _ in range(P)]
+        try:
+            for k, rows in table.items():
+                for row in rows:
+                    bparts[hash(k) % P].write(row)
+            table.clear()
+            for row in rest:
+                k = _join_key(row.get(self.bkey), self.bcast)
+                if k is not None:
+                    bparts[hash(k) % P].write(row)
+            for row in self.probe:
+                k = _join_key(row.get(self.pkey), self.pcast)
+                if k is not None:
+                    pparts[hash(k) % P].write(row)
+            self.spilled = sum(f.rows for f in bparts + pparts)
+
+            for bp, pp in zip(bparts, pparts):
+                if not bp.rows or not pp.rows:
+                    continue
+                chunk, n = {}, 0
+                for row in bp:
+                    chunk.setdefault(_join_key(row.get(self.bkey), self.bcast), []).append(row)
+                    n += 1
+                    if n >= self.buffer:
+                        yield from self._probe(chunk, pp)
+                        chunk, n = {}, 0
+                if chunk:
+                    yield from self._probe(chunk, pp)
+        finally:
+            for f in bparts + pparts:
+                f.close()
+
+
+class MergeJoin:
+    """
+    Sort-merge join; iterar produce pares (fila izquierda, fila derecha). Ambos flujos deben venir
+    ordenados en forma ascendente por su clave (NULL, si hay, al final: se descarta). En memoria
+    queda solo el grupo de filas derechas con la clave actual (duplicados), no un lado entero.
+    'lcast' / 'rcast' como en HashJoin (el orden de cada flujo debe ser el de la clave convertida).
+    """
+
+    def __init__(self, left, right, lkey: str, rkey: str, lcast: str | None = None, rcast: str | None = None):
+        self.left, self.right = left, right
+        self.lkey, self.rkey = lkey, rkey
+        self.lcast, self.rcast = lcast, rcast
+        self.max_group = 0   # mayor grupo de claves iguales del lado derecho
+
+    def __iter__(self):
+        right = iter(self.right)
+        rrow = next(right, None)
+        group, gkey = [], None
+        for lrow in self.left:
+            k = _join_key(lrow.get(self.lkey), self.lcast)
+            if k is None:
+                continue
+            if group and k == gkey:
+                for r in group:
+                    yield lrow, r
+                continue
+            # avanza el lado derecho hasta la primera clave >= k
+            while rrow is not None:
+                rk = _join_key(rrow.get(self.rkey), self.rcast)
+                if rk is not None and not rk < k:
+                    break
+                rrow = next(right, None)
+            group, gkey = [], k
+            while rrow is not None and _join_key(rrow.get(self.rkey), self.rcast) == k:
+                group.append(rrow)
+                rrow = next(right, None)
+            self.max_group = max(self.max_group, len(group))
+            if not group and rrow is None:
+                break   # derecho agotado: lo que queda del izquierdo no tiene pareja
+            for r in group:
+                yield lrow, r
+
+
+def _index_nl(outer, okey: str, Fi: File, ikey: str, iwhere, info: dict):
+    """Pares (fila externa, fila interna): una búsqueda por igualdad en el interno por fila externa."""
+    ctype = str(Fi.relation[ikey].get("type") or "").lower()
+    ipred = Predicate(iwhere, Fi.relation) if iwhere is not None else None
+    for orow in outer:
+        v = coerce(orow.get(okey), ctype)
+        if v is None or v is NO_MATCH:
+            continue
+        info["probes"] += 1
+        for irow in _rows_of(Fi.execute({"op": "search", "field": ikey, "value": v})):
+            if ipred is None or ipred(irow):
+                yield orow, irow
+
+
+def _collapse_usage(F: File, probes: int):
+    """Una entrada de index_usage por índice usado (no una por búsqueda), con el total de búsquedas."""
+    seen = {}
+    for u in F.index_get():
+        seen.setdefault((u["where"], u["index"], u["field"], u["op"]), {**u, "note": f"index_nl probes={probes}"})
+    F._index_usage = list(seen.values())
+
+
+def equi_join(p: dict) -> Tuple[Iterator[dict], dict]:
+    """
+    Ejecuta un plan 'equi_join' y retorna (filas, meta) con columnas 'alias.col'. Las filas son
+    un generador (se leen los lados a medida que se consume); 'meta' se completa al agotarlo.
+    Aplica el filtro residual, ORDER BY y LIMIT del plan; la proyección la hace el llamador.
+    """
+    L, R = p["left"], p["right"]
+    FL, FR = File(L["table"]), File(R["table"])
+    for F in (FL, FR):
+        F.io_reset(); F.index_reset()
+    for F, side in ((FL, L), (FR, R)):
+        if side["field"] not in F.relation:
+            raise KeyError(f"Columna '{side['field']}' no existe en '{side['table']}'")
+
+    info = {"strategy": p["strategy"]}
+    if p["strategy"] == "index_nl":
+        inner_left = p.get("inner") == "left"
+        (Fo, O), (Fi, I) = ((FR, R), (FL, L)) if inner_left else ((FL, L), (FR, R))
+        info.update(inner=p.get("inner"), probes=0)
+        scans = [_scan(Fo, O.get("where"))]
+        pairs = _index_nl(scans[0], O["field"], Fi, I["field"], I.get("where"), info)
+        if inner_left:
+            pairs = ((lrow, rrow) for rrow, lrow in pairs)
+    elif p["strategy"] == "merge":
+        # los lados en 'sort' no vienen ordenados por la columna de join: sort externo antes de mezclar
+        to_sort = p.get("sort") or []
+        scans = [_scan(FL, L.get("where"), ordered="left" not in to_sort),
+                 _scan(FR, R.get("where"), ordered="right" not in to_sort)]
+        streams, sorts = [], []
+        for name, side, rows in (("left", L, scans[0]), ("right", R, scans[1])):
+            if name in to_sort:
+                rows = Sort(rows, [(side["field"], False)])
+                sorts.append(rows)
+            streams.append(rows)
+        mj = MergeJoin(streams[0], streams[1], L["field"], R["field"], L.get("cast"), R.get("cast"))
+        info["sorted"] = list(to_sort)
+        pairs = iter(mj)
+    else:
+        build_left = p.get("build", "left") == "left"
+        (Fb, B), (Fp, Q) = ((FL, L), (FR, R)) if build_left else ((FR, R), (FL, L))
+        scans = [_scan(Fb, B.get("where")), _scan(Fp, Q.get("where"))]
+        hj = HashJoin(scans[0], scans[1], B["field"], Q["field"], bcast=B.get("cast"), pcast=Q.get("cast"))
+        info["build"] = p.get("build", "left")
+        pairs = iter(hj) if build_left else ((lrow, rrow) for rrow, lrow in hj)
+
+    rows = (_combine(L, R, lrow, rrow) for lrow, rrow in pairs)
+    if p.get("filter") is not None:
+        relation = {f"{s['alias']}.{c}": spec for F, s in ((FL, L), (FR, R)) for c, spec in F.relation.items()}
+        rows = Filter(rows, Predicate(p["filter"], relation))
+    if p.get("order_by") and not _merge_ordered(p):
+        rows = Sort(rows, [(o["column"], o["desc"]) for o in p["order_by"]], limit=p.get("limit"))
+    if p.get("limit") is not None:
+        rows = Limit(rows, p["limit"])
+
+    meta = {}
+
+    def emit():
+        n = 0
+        try:
+            for row in rows:
+                n += 1
+                yield row
+        finally:
+            for s in scans:
+                s.close()   # recorridos que LIMIT dejó a medias: su IO se suma al cerrarse
+            if p["strategy"] == "index_nl":
+                _collapse_usage(Fi, info["probes"])
+            elif p["strategy"] == "merge":
+                info.update(sort_runs=sum(s.spilled for s in sorts), max_group=mj.max_group)
+            else:
+                info.update(partitions=hj.partitions if hj.spilled else 0, spilled=hj.spilled)
+            info["pairs"] = n
+            meta.update(_join_meta(FL, FR, L, R, info))
+
+    return emit(), meta
+
+
+def _merge_ordered(p: dict) -> bool:
+    """ORDER BY de la columna de join (ASC) sobre un merge join: los pares ya salen en ese orden."""
+    if p["strategy"] != "merge" or len(p.get("order_by") or []) != 1:
+        return False
+    o = p["order_by"][0]
+    return not o["desc"] and o["column"] in {f"{s['alias']}.{s['field']}" for s in (p["left"], p["right"])}
+
+
+def project_join_row(row: dict, cols, aliases: List[str]) -> dict:
+    """
+    Proyección sobre filas de join: 'alias.col' directo; 'col' sin calificar se resuelve
+    si existe en un solo lado (si está en ambos es ambiguo).
+    """
+    if cols is None:
+        return row
+    out = {}
+    for c in cols:
+        if c in row:
+            out[c] = row[c]
+            continue
+        hits = [f"{a}.{c}" for a in aliases if f"{a}.{c}" in row]
+        if len(hits) > 1:
+            raise ValueError(f"Columna ambigua en join: '{c}'")
+        out[c] = row[hits[0]] if hits else None
+    return out
@@ -0,0 +1,425 @@
+# operators.py
+# Ejecución de SELECT por iteradores (modelo Volcano): cada operador es un generador que pide
+# filas a su hijo de a una, así que las filas fluyen desde las páginas del primario hasta la
+# respuesta sin armar listas intermedias. La memoria queda acotada por los buffers de cada
+# operador (una página en Scan, el top-k o los runs en Sort).
+#
+#   Scan       -> recorrido del primario (File.iter_all) con el WHERE empujado a la tupla cruda
+#   IndexScan  -> camino de acceso por índice (search / range_search / knn / geo_within /
+#                 index_merge / search_in); las filas que devuelve el índice ya están en memoria
+#   Filter     -> conjuntos residuales del WHERE
+#   HashAggregate -> GROUP BY / COUNT / SUM / AVG / MIN / MAX: tabla hash de estados parciales que
+#                 se reparte en particiones a disco si pasa de BD2_AGG_BUFFER grupos
+#   IndexAggregate -> sin recorrido: COUNT(*) del conteo del catálogo (File.count), MIN / MAX de
+#                 los extremos de un índice ordenado (File.edge)
+#   Sort       -> ORDER BY: top-k con heap si hay LIMIT, si no sort externo (runs a disco + merge)
+#   Limit      -> corta el árbol al llegar a n filas (cierra a los hijos: el primario deja de leerse)
+#   Project    -> columnas pedidas, sin campos internos
+#
+# Orden de armado: Scan|IndexScan -> Filter -> [HashAggregate] -> Sort -> Limit -> Project.
+import heapq
+import os
+import pickle
+import tempfile
+
+from backend.catalog.settings import DATA_DIR
+from backend.core.predicate import Predicate
+
+INTERNAL_FIELDS = {"deleted", "pos", "slot"}
+
+# planes de SELECT que el executor corre como árbol de iteradores (admiten ORDER BY / LIMIT)
+PIPELINE_ACTIONS = ("select", "search", "range_search", "search_in", "geo_within", "index_merge", "knn",
+                    "index_aggregate")
+
+SORT_BUFFER = int(os.getenv("BD2_SORT_BUFFER", "10000") or 10000)   # filas en memoria por run
+AGG_BUFFER = int(os.getenv("BD2_AGG_BUFFER", "10000") or 10000)     # grupos en memoria
+AGG_PARTITIONS = int(os.getenv("BD2_AGG_PARTITIONS", "16") or 16)   # particiones al bajar grupos a disco
+AGG_MAX_DEPTH = 4   # re-particiones de una partición que sigue sin entrar (otra semilla de hash)
+
+
+class Operator:
+    """Nodo del árbol: iterar sobre él produce filas (dict)."""
+    child = None
+
+    def __iter__(self):
+        raise NotImplementedError
+
+    def describe(self) -> str:
+        return type(self).__name__.lower()
+
+    def explain(self) -> list:
+        """Operadores desde la raíz hasta la hoja, p. ej. ['project', 'limit(10)', 'scan(bplus)']."""
+        out, op = [], self
+        while op is not None:
+            out.append(op.describe())
+            op = op.child
+        return out
+
+
+def _close(it):
+    close = getattr(it, "close", None)
+    if close is not None:
+        close()
+
+
+# ------------------------------ hojas ------------------------------ #
+
+class Scan(Operator):
+    """Recorrido del primario; 'where' (Predicate) se evalúa dentro del archivo."""
+
+    def __init__(self, F, where: Predicate | None = None):
+        self.F = F
+        self.where = where
+
+    def __iter__(self):
+        rows = self.F.iter_all(self.where)
+        try:
+            yield from rows
+        finally:
+            _close(rows)
+
+    def describe(self) -> str:
+        kind = self.F.indexes["primary"]["index"]
+        return f"scan({kind}, where)" if self.where is not None else f"scan({kind})"
+
+
+class IndexScan(Operator):
+    """
+    Camino de acceso por índice: 'payload' es la operación de File (op + parámetros del plan).
+    search_in consulta valor por valor y descarta PKs repetidas.
+    """
+
+    def __init__(self, F, payload: dict):
+        self.F = F
+        self.payload = payload
+
+    def __iter__(self):
+        p = self.payload
+        if p["op"] == "search_in":
+            pk, seen = self.F.primary_key, set()
+            for v in p.get("items") or []:
+                rows = self.F.execute({"op": "search", "field": p["field"], "value": v,
+                                       "access": p.get("access")})
+                for r in _as_dicts(rows):
+                    k = r.get(pk) if pk else None
+                    if k is not None:
+                        if k in seen:
+                            continue
+                        seen.add(k)
+                    yield r
+            return
+        yield from _as_dicts(self.F.execute(p))
+
+    def describe(self) -> str:
+        p = self.payload
+        return f"{p['op']}({p.get('field') or ''})" if p.get("field") else p["op"]
+
+
+def _as_dicts(rows):
+    for r in rows or []:
+        if isinstance(r, tuple) and r and isinstance(r[0], dict):
+            yield r[0]
+        elif isinstance(r, dict):
+            yield r
+
+
+# ------------------------------ intermedios ------------------------------ #
+
+class Filter(Operator):
+    def __init__(self, child: Operator, pred: Predicate):
+        self.child = child
+        self.pred = pred
+
+    def __iter__(self):
+        pred = self.pred
+        for row in self.child:
+            if pred(row):
+                yield row
+
+
+class Project(Operator):
+    """Columnas pedidas (None => todas); siempre quita los campos internos."""
+
+    def __init__(self, child: Operator, columns: list | None):
+        self.child = child
+        self.columns = columns
+
+    def __iter__(self):
+        cols = self.columns
+        if cols is None:
+            for row in self.child:
+                yield {k: v for k, v in row.items() if k not in INTERNAL_FIELDS}
+        else:
+            cols = [c for c in cols if c not in INTERNAL_FIELDS]
+            for row in self.child:
+                yield {c: row.get(c) for c in cols}
+
+    def describe(self) -> str:
+        return "project" if self.columns is None else f"project({', '.join(self.columns)})"
+
+
+class Limit(Operator):
+    def __init__(self, child: Operator, n: int):
+        self.child = child
+        self.n = int(n)
+
+    def __iter__(self):
+        if self.n <= 0:
+            return
+        rows = iter(self.child)
+        try:
+            for i, row in enumerate(rows, 1):
+                yield row
+                if i >= self.n:
+                    break
+        finally:
+            _close(rows)
+
+    def describe(self) -> str:
+        return f"limit({self.n})"
+
+
+class IndexAggregate(Operator):
+    """
+    Una fila sin recorrido: COUNT(*) del conteo de filas del catálogo y MIN / MAX leídos de los
+    extremos de la PK ordenada o de un B+.
+    """
+
+    def __init__(self, F, aggregates: list):
+        self.F = F
+        self.aggregates = aggregates
+
+    def __iter__(self):
+        row = {}
+        for a in self.aggregates:
+            if a["func"] == "COUNT":
+                row[a["name"]] = self.F.execute({"op": "count"})["rows"]
+            else:
+                row[a["name"]] = self.F.execute({"op": "edge", "field": a["column"], "last": a["func"] == "MAX"})
+        yield row
+
+    def describe(self) -> str:
+        return f"index_aggregate({', '.join(a['name'] for a in self.aggregates)})"
+
+
+# ------------------------------ GROUP BY ------------------------------ #
+
+def _hashable(v):
+    return tuple(v) if isinstance(v, list) else v
+
+
+def _lift(func: str, v):
+    """Estado parcial de una fila: COUNT -> n, SUM/MIN/MAX -> valor, AVG -> [suma, n]. NULL no cuenta."""
+    if func == "COUNT":
+        return 0 if v is None else 1
+    if func == "AVG":
+        return [0, 0] if v is None else [v, 1]
+    return v
+
+
+def _combine(func: str, a, b):
+    if func == "COUNT":
+        return a + b
+    if func == "AVG":
+        return [a[0] + b[0], a[1] + b[1]]
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if func == "SUM":
+        return a + b
+    return min(a, b) if func == "MIN" else max(a, b)
+
+
+def _final(func: str, st):
+    if func == "AVG":
+        return st[0] / st[1] if st[1] else None
+    return st
+
+
+class HashAggregate(Operator):
+    """
+    GROUP BY con tabla hash {grupo: estados parciales}. Si pasa de 'buffer' grupos, la tabla se baja
+    a 'partitions' particiones en disco (RunFile, por hash del grupo) y se sigue; al final cada
+    partición se vuelve a agregar sola (los estados parciales se combinan), re-particionando con
+    otra semilla si todavía no entra. Sin GROUP BY y sin filas devuelve una fila (COUNT 0, el resto NULL).
+    'aggregates': [{func, column (None => COUNT(*)), name}].
+    """
+
+    def __init__(self, child: Operator, group_by: list, aggregates: list, buffer: int | None = None,
+                 partitions: int | None = None):
+        self.child = child
+        self.group_by = list(group_by)
+        self.aggregates = list(aggregates)
+        self.buffer = max(1, int(buffer or AGG_BUFFER))
+        self.partitions = max(2, int(partitions or AGG_PARTITIONS))
+        self.spilled = 0   # estados parciales escritos a disco en la última ejecución
+
+    def __iter__(self):
+        self.spilled = 0
+        funcs = [a["func"] for a in self.aggregates]
+        cols = [a["column"] for a in self.aggregates]
+        gcols = self.group_by
+
+        def items():
+            for row in self.child:
+                yield (tuple(_hashable(row.get(c)) for c in gcols),
+                       [_lift(f, 1 if c is None else row.get(c)) for f, c in zip(funcs, cols)])
+
+        empty = True
+        for key, states in self._aggregate(items(), funcs, 0):
+            empty = False
+            yield self._row(key, states, funcs)
+        if empty and not gcols:
+            yield self._row((), [_lift(f, None) for f in funcs], funcs)
+
+    def _row(self, key, states, funcs) -> dict:
+        row = {c: list(v) if isinstance(v, tuple) else v for c, v in zip(self.group_by, key)}
+        for a, f, st in zip(self.aggregates, funcs, states):
+            row[a["name"]] = _final(f, st)
+        return row
+
+    def _aggregate(self, items, funcs, depth: int):
+        table, parts = {}, None
+        try:
+            for key, states in items:
+                cur = table.get(key)
+                if cur is not None:
+                    table[key] = [_combine(f, a, b) for f, a, b in zip(funcs, cur, states)]
+                    continue
+                if len(table) >= self.buffer and depth < AGG_MAX_DEPTH:
+                    parts = parts or [RunFile() for _ in range(self.partitions)]
+                    self._flush(table, parts, depth)
+                table[key] = states
+            if parts is None:
+                yield from table.items()
+                return
+            self._flush(table, parts, depth)
+            for part in parts:
+                if part.rows:
+                    yield from self._aggregate(iter(part), funcs, depth + 1)
+        finally:
+            for part in parts or []:
+                part.close()
+
+    def _flush(self, table: dict, parts: list, depth: int):
+        for key, states in table.items():
+            parts[hash((depth, key)) % len(parts)].write((key, states))
+            self.spilled += 1
+        table.clear()
+
+    def describe(self) -> str:
+        aggs = ", ".join(a["name"] for a in self.aggregates)
+        if not self.group_by:
+            return f"aggregate({aggs})"
+        by = ", ".join(self.group_by)
+        return f"hash_aggregate({aggs} by {by})" if aggs else f"hash_aggregate(by {by})"
+
+
+# ------------------------------ ORDER BY ------------------------------ #
+
+class _Rev:
+    """Invierte el orden de una clave (DESC) sin asumir que sea numérica."""
+    __slots__ = ("k",)
+
+    def __init__(self, k):
+        self.k = k
+
+    def __lt__(self, other):
+        return other.k < self.k
+
+    def __eq__(self, other):
+        return self.k == other.k
+
+
+def sort_key(keys: list):
+    """
+    Clave de orden para [(col, desc)]. NULL va al final en ASC y al principio en DESC
+    (NULL es el mayor valor, como en PostgreSQL).
+    """
+    def key(row):
+        out = []
+        for col, desc in keys:
+            v = row.get(col)
+            k = (v is None or v == [], v)
+            out.append(_Rev(k) if desc else k)
+        return tuple(out)
+    return key
+
+
+class Sort(Operator):
+    """
+    ORDER BY estable. Con 'limit' guarda solo las mejores k filas (heap de tamaño k). Sin límite,
+    ordena runs de BD2_SORT_BUFFER filas, los baja a archivos temporales (RunFile) cuando no entra todo y
+    los mezcla con heapq.merge: en memoria hay un run mientras se arma y una fila por run al mezclar.
+    """
+
+    def __init__(self, child: Operator, keys: list, limit: int | None = None, buffer: int | None = None):
+        self.child = child
+        self.keys = [(c, bool(d)) for c, d in keys]
+        self.limit = limit
+        self.buffer = max(1, int(buffer or SORT_BUFFER))
+        self.spilled = 0   # runs escritos a disco en la última ejecución
+
+    def __iter__(self):
+        key = sort_key(self.keys)
+        if self.limit is not None:
+            yield from heapq.nsmallest(max(0, int(self.limit)), self.child, key=key)
+            return
+
+        runs, buf = [], []
+        self.spilled = 0
+        try:
+            for row in self.child:
+                buf.append(row)
+                if len(buf) >= self.buffer:
+                    buf.sort(key=key)
+                    runs.append(_spill(buf))
+                    self.spilled += 1
+                    buf = []
+            buf.sort(key=key)
+            if not runs:
+                yield from buf
+                return
+            yield from heapq.merge(*[iter(f) for f in runs], buf, key=key)
+        finally:
+            for f in runs:
+                f.close()
+
+    def describe(self) -> str:
+        cols = ", ".join(f"{c} desc" if d else c for c, d in self.keys)
+        return f"top{self.limit}({cols})" if self.limit is not None else f"sort({cols})"
+
+
+class RunFile:
+    """
+    Filas bajadas a disco (pickle una tras otra) en un archivo temporal dentro de DATA_DIR,
+    que se borra al cerrarlo. Lo usan Sort (runs) y el hash join (particiones).
+    """
+
+    def __init__(self):
+        self.f = tempfile.TemporaryFile(dir=DATA_DIR, prefix="run_")
+        self._pickler = pickle.Pickler(self.f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.rows = 0
+
+    def write(self, row):
+        self._pickler.dump(row)
+        self._pickler.clear_memo()
+        self.rows += 1
+
+    def __iter__(self):
+        self.f.flush()
+        self.f.seek(0)
+        unpickler = pickle.Unpickler(self.f)
+        for _ in range(self.rows):
+            yield unpickler.load()
+
+    def close(self):
+        self.f.close()
+
+
+def _spill(rows: list) -> RunFile:
+    run = RunFile()
+    for row in rows:
+        run.write(row)
+    return run
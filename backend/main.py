@@ -1,4 +1,7 @@
+import json
+
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from backend.catalog.ddl import load_tables
 from backend.engine.engine import Engine
@@ -40,4 +43,10 @@ def get_tables():
 #aca debe usarse el parser
 @app.post("/query")
 def do_query(query: Query):
-    return engine.run(query.content)
\ No newline at end of file
+    return engine.run(query.content)
+
+# misma consulta, pero las filas de los SELECT salen como NDJSON a medida que se leen
+@app.post("/query/stream")
+def do_query_stream(query: Query):
+    lines = (json.dumps(ev, ensure_ascii=False, default=str) + "\n" for ev in engine.stream(query.content))
+    return StreamingResponse(lines, media_type="application/x-ndjson")
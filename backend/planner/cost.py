@@ -0,0 +1,481 @@
+# cost.py
+# Modelo de costos del planner: estima cuántas lecturas hará cada camino de acceso para
+# search / range_search / geo_within / index_merge y elige el más barato. Para JOIN por igualdad
+# elige entre hash join, index nested-loop y sort-merge (join()).
+#
+# La unidad es la de meta.io: lecturas contadas por cada estructura (read_count). Así el
+# estimado que queda en plan["estimate"] se compara directo con meta.io.total.read_count.
+#
+# Entradas:
+#   - filas: conteo vivo del catálogo (<tabla>.cnt, exacto; también las entradas de cada
+#     secundario); si la tabla no lo tiene, stats de ANALYZE (filas al analizar ± cambios desde
+#     entonces; si los cambios pasaron el umbral se re-analiza antes de estimar) y si tampoco,
+#     tamaño del archivo primario
+#   - selectividad: histograma equi-depth / distintos / min-max de la columna; sin estadísticas,
+#     los valores por defecto de System R (1/10 para '=', 1/3 para rangos). Con esos valores el
+#     costo se informa pero no cambia el camino: se usa el secundario si existe.
+#   - alturas: header del índice (ISAM, R-Tree) o derivadas del número de páginas (B+)
+import math
+import os
+import struct
+
+from backend.catalog.catalog import get_json, get_filename, get_counts
+from backend.catalog.stats import current_stats, refresh_if_stale
+from backend.core import predicate
+from backend.core.utils import build_format, parse_point
+from backend.storage.indexes.bplus import Order as BPLUS_ORDER
+from backend.storage.indexes.hash import BUCKET_SIZE
+from backend.storage.indexes.grid import PAGE_CAP as GRID_PAGE_CAP
+from backend.storage.indexes.rtree import HEADER_FMT as RTREE_HEADER
+from backend.storage import pointscan
+
+DEFAULT_EQ_SEL = 0.1
+DEFAULT_RANGE_SEL = 1.0 / 3.0
+BPLUS_FILL = 0.75   # ocupación media de los nodos B+ (hojas y fanout interno)
+RTREE_FILL = 0.7
+SPILL_PAGE = 4096   # bytes por lectura/escritura de un archivo temporal (runs del sort, particiones del hash)
+
+
+def _num(v):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def _record_file(filename: str):
+    """(tamaño de registro, bytes de datos) de un archivo con header de esquema JSON."""
+    schema = get_json(filename)[0]
+    rec = struct.calcsize(build_format(schema))
+    with open(filename, "rb") as f:
+        schema_size = struct.unpack("I", f.read(4))[0]
+    return rec, max(0, os.path.getsize(filename) - 4 - schema_size)
+
+
+def _bplus_page_size(rec: int) -> int:
+    # mismo layout que BPlusFile.PAGE_SIZE
+    return struct.calcsize("i?") + 4 + BPLUS_ORDER * rec + 4 + (BPLUS_ORDER + 1) * 4 + 8
+
+
+class TableCost:
+    """Estadísticas y costos de una tabla para el planner (una instancia por consulta)."""
+
+    def __init__(self, table: str):
+        self.table = table
+        self.relation, self.indexes = get_json(get_filename(table), 2)[:2]
+        refresh_if_stale(table)   # estadísticas viejas (umbral de cambios): se re-analiza aquí, no en la escritura
+        self.stats = current_stats(table)
+        self.pk = next((c for c, s in self.relation.items() if s.get("key") == "primary"),
+                       next(iter(self.relation), None))
+        prim = self.indexes.get("primary") or {}
+        self.prim_kind = prim.get("index") or "heap"
+        self.prim_file = prim.get("filename")
+        counts = get_counts(table)
+        self.entries = (counts or {}).get("indexes") or {}
+        if counts is not None:
+            # la fuente dice si hay selectividades de ANALYZE; las filas salen del conteo
+            self.rows, self.source = float(counts["rows"]), "analyze" if "rows" in self.stats else "count"
+        elif "rows" in self.stats:
+            self.rows, self.source = float(self.stats["rows"]), "analyze"
+        else:
+            self.rows, self.source = float(self._rows_from_file()), "file"
+        self._prim_geom = None
+
+    # ------------------------------ geometría física ------------------------------ #
+
+    def _rows_from_file(self) -> int:
+        """Sin ANALYZE: registros que caben en el archivo primario (cota superior, incluye borrados)."""
+        try:
+            rec, data = _record_file(self.prim_file)
+        except (OSError, IndexError, struct.error):
+            return 0
+        if self.prim_kind == "bplus":
+            return int(data // _bplus_page_size(rec) * (BPLUS_ORDER - 1) * BPLUS_FILL)
+        return data // max(1, rec)
+
+    def _bplus_height(self, rows: float) -> int:
+        leaves = max(1.0, rows / ((BPLUS_ORDER - 1) * BPLUS_FILL))
+        return 1 + math.ceil(math.log(leaves) / math.log(BPLUS_ORDER * BPLUS_FILL))
+
+    def _isam_geom(self):
+        """(niveles, registros por página de datos) del header ISAM."""
+        if self._prim_geom is None:
+            from backend.storage.indexes.isam import IsamFile
+            try:
+                isf = IsamFile(self.prim_file)
+                self._prim_geom = (max(1, isf.levels), isf.PAGE_FACTOR)
+            except (OSError, IndexError, struct.error):
+                self._prim_geom = (1, 1)
+        return self._prim_geom
+
+    def _rtree_geom(self, col: str):
+        """(altura, M) del header del R-Tree de 'col'."""
+        path = os.path.join(os.path.dirname(self.indexes[col]["filename"]), f"{self.table}_rtree_{col}.idx")
+        try:
+            with open(path, "rb") as f:
+                _, _, M, _, _, height, *_ = struct.unpack(RTREE_HEADER, f.read(struct.calcsize(RTREE_HEADER)))
+            return max(1, height), max(2, M)
+        except (OSError, struct.error):
+            return 1, int(self.indexes[col].get("M", 32))
+
+    # ------------------------------ costos del primario ------------------------------ #
+
+    def pk_lookup(self) -> float:
+        """Una fila por PK en el índice primario."""
+        n = self.rows
+        if self.prim_kind == "heap":
+            return 1 + n / 2           # scan que corta en la primera coincidencia
+        if self.prim_kind == "sequential":
+            return 3                   # header, tamaño del main y búsqueda binaria (una lectura)
+        if self.prim_kind == "isam":
+            levels, _ = self._isam_geom()
+            return 2 + levels
+        if self.prim_kind == "bplus":
+            return self._bplus_height(n) + 1
+        return 1 + n
+
+    def primary_scan(self) -> float:
+        n = self.rows
+        if self.prim_kind == "heap":
+            return 1 + n
+        if self.prim_kind == "sequential":
+            return 3 + n
+        if self.prim_kind == "isam":
+            _, per_page = self._isam_geom()
+            return 1 + math.ceil(n / per_page)
+        if self.prim_kind == "bplus":
+            return self._bplus_height(n) + math.ceil(n / ((BPLUS_ORDER - 1) * BPLUS_FILL))
+        return 1 + n
+
+    def primary_range(self, m: float) -> float:
+        """Rango sobre la PK: bajar al inicio y leer las m filas en orden."""
+        if self.prim_kind == "sequential":
+            return 6 + m               # + área auxiliar (tamaño y bloque)
+        if self.prim_kind == "isam":
+            levels, per_page = self._isam_geom()
+            return 2 + levels + math.ceil(m / per_page)
+        if self.prim_kind == "bplus":
+            return self._bplus_height(self.rows) + 1 + math.ceil(m / ((BPLUS_ORDER - 1) * BPLUS_FILL))
+        return self.primary_scan()
+
+    def point_scan(self) -> float:
+        """Recorrido por bloques de una columna de puntos (pointscan)."""
+        if self.prim_kind == "heap":
+            return 1 + math.ceil(self.rows / pointscan.BLOCK_ROWS)
+        return self.primary_scan()
+
+    def resolve(self, m: float) -> float:
+        """Llevar m rids de un secundario a filas: por posición (heap) o una búsqueda por PK cada uno."""
+        return m if self.prim_kind == "heap" else m * self.pk_lookup()
+
+    # ------------------------------ costos de secundarios ------------------------------ #
+
+    def secondary(self, kind: str, col: str, m: float) -> float:
+        """Lectura del índice secundario 'kind' para m coincidencias + resolución en el primario."""
+        if kind == "hash":
+            probe = 2 + math.ceil(m / BUCKET_SIZE)
+        elif kind == "bplus":
+            entries = self.entries.get(col, self.rows)
+            probe = self._bplus_height(entries) + 1 + math.ceil(m / ((BPLUS_ORDER - 1) * BPLUS_FILL))
+        elif kind == "rtree":
+            height, M = self._rtree_geom(col)
+            probe = height + math.ceil(m / (M * RTREE_FILL))
+        elif kind == "grid":
+            probe = 1 + math.ceil(m / GRID_PAGE_CAP)
+        else:
+            return math.inf
+        return probe + self.resolve(m)
+
+    # ------------------------------ selectividad ------------------------------ #
+
+    def _col(self, col: str) -> dict:
+        return (self.stats.get("columns") or {}).get(col) or {}
+
+    def sel_eq(self, col: str, value) -> float:
+        if col == self.pk:
+            return 1.0 / max(1.0, self.rows)
+        st = self._col(col)
+        if not st:
+            return DEFAULT_EQ_SEL
+        lo, hi, v = st.get("min"), st.get("max"), value
+        try:
+            if lo is not None and hi is not None and not (lo <= v <= hi):
+                return 0.0
+        except TypeError:
+            pass
+        return (1.0 - float(st.get("nulls", 0.0))) / max(1.0, float(st.get("ndv") or 1))
+
+    def sel_range(self, col: str, lo, hi) -> float:
+        st = self._col(col)
+        if not st:
+            return DEFAULT_RANGE_SEL
+        notnull = 1.0 - float(st.get("nulls", 0.0))
+        hist = st.get("hist") or []
+        if len(hist) >= 2:
+            return notnull * _hist_fraction(hist, lo, hi)
+        a, b, x, y = _num(st.get("min")), _num(st.get("max")), _num(lo), _num(hi)
+        if None in (a, b, x, y):
+            return DEFAULT_RANGE_SEL
+        if b <= a:
+            return notnull if x <= a <= y else 0.0
+        return notnull * max(0.0, min(b, y) - max(a, x)) / (b - a)
+
+    def sel_geo(self, col: str, center, radius):
+        """Fracción del rectángulo envolvente de la columna que cubre el círculo; None sin ANALYZE."""
+        st = self._col(col)
+        lo, hi = parse_point(st.get("min")), parse_point(st.get("max"))
+        c = parse_point(center)
+        if lo is None or hi is None or c is None:
+            return None
+        r = float(radius)
+        w, h = max(hi[0] - lo[0], r), max(hi[1] - lo[1], r)
+        ix = max(0.0, min(hi[0], c[0] + r) - max(lo[0], c[0] - r))
+        iy = max(0.0, min(hi[1], c[1] + r) - max(lo[1], c[1] - r))
+        if ix == 0.0 and iy == 0.0 and not (lo[0] <= c[0] <= hi[0] and lo[1] <= c[1] <= hi[1]):
+            return 0.0
+        # el círculo ocupa pi/4 de su cuadrado envolvente
+        return (1.0 - float(st.get("nulls", 0.0))) * min(1.0, (ix * iy) * (math.pi / 4) / (w * h))
+
+    # ------------------------------ elección ------------------------------ #
+
+    def _choose(self, op: str, m: float, alternatives: dict) -> dict:
+        """
+        Camino más barato; ante empate gana el índice secundario (el primero de 'alternatives').
+        Sin ANALYZE la selectividad es un valor por defecto: se mantiene el índice (como antes) y
+        el estimado queda solo como referencia.
+        """
+        if self.source == "analyze" or len(alternatives) == 1:
+            best = min(alternatives, key=lambda k: (alternatives[k], k in ("primary", "scan")))
+        else:
+            best = next(iter(alternatives))
+        return {
+            "access": best,
+            "estimate": {
+                "op": op,
+                "rows": round(m, 1),
+                "cost": round(alternatives[best], 1),
+                "alternatives": {k: round(v, 1) for k, v in alternatives.items()},
+                "table_rows": int(self.rows),
+                "stats": self.source,
+            },
+        }
+
+    def _secondary_kind(self, col: str):
+        if col == self.pk:
+            return None
+        return (self.indexes.get(col) or {}).get("index")
+
+    def search(self, col: str, value) -> dict:
+        m = self.sel_eq(col, value) * self.rows
+        if col == self.pk:
+            return self._choose("search", m, {"primary": self.pk_lookup()})
+        alts = {}
+        kind = self._secondary_kind(col)
+        if kind in ("hash", "bplus", "rtree", "grid"):
+            alts[kind] = self.secondary(kind, col, m)
+        alts["primary"] = self.primary_scan()
+        return self._choose("search", m, alts)
+
+    def search_in(self, col: str, items: list) -> dict:
+        """IN (...): una búsqueda por valor con el mismo camino; se suman los costos."""
+        per = [self.search(col, v) for v in items] or [self.search(col, None)]
+        alts = {k: sum(p["estimate"]["alternatives"][k] for p in per) for k in per[0]["estimate"]["alternatives"]}
+        return self._choose("search_in", sum(p["estimate"]["rows"] for p in per), alts)
+
+    def range(self, col: str, lo, hi) -> dict:
+        m = self.sel_range(col, lo, hi) * self.rows
+        if col == self.pk:
+            return self._choose("range_search", m, {"primary": self.primary_range(m)})
+        alts = {}
+        kind = self._secondary_kind(col)
+        if kind in ("bplus", "rtree", "grid"):  # hash no sirve para rangos
+            alts[kind] = self.secondary(kind, col, m)
+        alts["primary"] = self.primary_scan()
+        return self._choose("range_search", m, alts)
+
+    def geo(self, col: str, center, radius, kind) -> dict | None:
+        """Índice espacial vs recorrido; None si no hay estadísticas de la columna para estimar."""
+        sel = self.sel_geo(col, center, radius)
+        if sel is None:
+            return None
+        m = sel * self.rows
+        alts = {}
+        if kind in ("rtree", "grid"):
+            alts[kind] = self.secondary(kind, col, m)
+        alts["scan"] = self.point_scan()
+        return self._choose("geo_within", m, alts)
+
+    def _leaf_sel(self, leaf: dict) -> float:
+        col, op = leaf["field"], leaf["op"]
+        if op == "search":
+            return self.sel_eq(col, leaf.get("value"))
+        if op == "search_in":
+            return min(1.0, sum(self.sel_eq(col, v) for v in leaf.get("items") or []))
+        if op == "range_search":
+            return self.sel_range(col, leaf.get("min"), leaf.get("max"))
+        sel = self.sel_geo(col, leaf.get("center"), leaf.get("radius"))
+        return DEFAULT_RANGE_SEL if sel is None else sel
+
+    def _rid_tree(self, node: dict):
+        """(selectividad, lecturas de índices) de un árbol AND/OR de hojas; columnas independientes."""
+        if "items" in node and "field" not in node:
+            parts = [self._rid_tree(n) for n in node["items"]]
+            probes = sum(p for _, p in parts)
+            if node.get("op") == "AND":
+                return math.prod(s for s, _ in parts), probes
+            return 1.0 - math.prod(1.0 - s for s, _ in parts), probes
+        sel = self._leaf_sel(node)
+        if node["field"] == self.pk:
+            return sel, 0.0   # el RID es la PK: no hay índice que leer
+        m = sel * self.rows
+        probe = self.secondary(self._secondary_kind(node["field"]), node["field"], m) - self.resolve(m)
+        return sel, probe
+
+    def sel_where(self, where) -> float:
+        """Selectividad de un WHERE de esta tabla: producto de sus conjuntos (columnas independientes)."""
+        sel = 1.0
+        for c in predicate.conjuncts(where):
+            kind = predicate.node_kind(c)
+            if kind == "cmp" and c["op"] in ("=", "=="):
+                sel *= self.sel_eq(c["left"], c["right"])
+            elif kind == "cmp" and c["op"] in predicate.RANGE_OPS:
+                lo, hi = (c["right"], math.inf) if c["op"].startswith(">") else (-math.inf, c["right"])
+                sel *= self.sel_range(c["left"], lo, hi)
+            elif kind == "between":
+                sel *= self.sel_range(c["ident"], c["lo"], c["hi"])
+            elif kind == "in":
+                sel *= min(1.0, sum(self.sel_eq(c["ident"], v) for v in c.get("items") or []))
+            else:
+                sel *= DEFAULT_RANGE_SEL
+        return sel
+
+    def probe(self, col: str) -> float:
+        """Una búsqueda por igualdad en 'col' (PK o secundario hash/bplus), con sus filas resueltas."""
+        if col == self.pk:
+            return self.pk_lookup()
+        return self.secondary(self._secondary_kind(col), col, self.sel_eq(col, None) * self.rows)
+
+    def spill(self, rows: float) -> float:
+        """Escribir y releer 'rows' filas de esta tabla en un archivo temporal, en páginas de SPILL_PAGE."""
+        try:
+            rec = _record_file(self.prim_file)[0]
+        except (OSError, IndexError, struct.error):
+            rec = SPILL_PAGE
+        return 2 * math.ceil(rows * rec / SPILL_PAGE)
+
+    def ndv(self, col: str) -> float:
+        if col == self.pk:
+            return max(1.0, self.rows)
+        ndv = self._col(col).get("ndv")
+        return float(ndv) if ndv else 1.0 / DEFAULT_EQ_SEL
+
+    def index_merge(self, tree: dict) -> dict:
+        """Índices combinados (intersección/unión de RIDs) + una lectura del primario por RID que queda."""
+        sel, probes = self._rid_tree(tree)
+        m = sel * self.rows
+        return self._choose("index_merge", m, {"index_merge": probes + self.resolve(m),
+                                               "primary": self.primary_scan()})
+
+
+def _hist_fraction(bounds: list, lo, hi) -> float:
+    """Fracción de filas en [lo, hi] según un histograma equi-depth (B+1 bordes, B cubetas iguales)."""
+    nb = len(bounds) - 1
+    total = 0.0
+    for i in range(nb):
+        a, b = bounds[i], bounds[i + 1]
+        try:
+            if hi < a or lo > b:
+                continue
+            if lo <= a and b <= hi:
+                total += 1.0
+                continue
+        except TypeError:
+            return DEFAULT_RANGE_SEL
+        fa, fb, x, y = _num(a), _num(b), _num(lo), _num(hi)
+        if None in (fa, fb, x, y) or fb <= fa:
+            total += 0.5   # cubeta parcial no numérica (o de un solo valor)
+        else:
+            total += max(0.0, min(fb, y) - max(fa, x)) / (fb - fa)
+    return total / nb if nb else DEFAULT_RANGE_SEL
+
+
+def estimate(table: str, op: str, **kw) -> dict | None:
+    """
+    {"access", "estimate"} para un plan de 'op' ('search', 'search_in', 'range_search', 'geo_within') o None
+    si no se puede estimar (tabla inexistente, columna desconocida, sin estadísticas espaciales).
+    """
+    try:
+        tc = TableCost(table)
+    except (OSError, ValueError, IndexError, struct.error):
+        return None
+    if op == "index_merge":
+        return tc.index_merge(kw["tree"])
+    field = kw.get("field")
+    if field not in tc.relation:
+        return None
+    if op == "search":
+        return tc.search(field, kw.get("value"))
+    if op == "search_in":
+        return tc.search_in(field, list(kw.get("items") or []))
+    if op == "range_search":
+        return tc.range(field, kw.get("lo"), kw.get("hi"))
+    if op == "geo_within":
+        return tc.geo(field, kw.get("center"), kw.get("radius"), kw.get("kind"))
+    return None
+
+
+def join(sides: list, inner_ok: list, buffer: int, ordered: list | None = None,
+         sort_buffer: int | None = None) -> dict | None:
+    """
+    Estrategia para 'a JOIN b ON a.x = b.y'. sides = [(tabla, col, where empujado), ...x2];
+    inner_ok[i] dice si el lado i puede ser interno de un index nested-loop (PK no heap o
+    secundario hash/bplus en col); ordered[i] si el lado i se lee ya ordenado por col (PK de un
+    primario sequential / isam / bplus). ordered=None: el merge no aplica (tipos no comparables).
+    Costos en lecturas:
+      hash          -> recorrido de ambos primarios; si el build no entra en 'buffer' filas, además
+                       escribir y releer ambos lados en particiones
+      index_nl:<i>  -> recorrido del otro lado + una búsqueda en 'i' por cada fila externa que
+                       pasa su WHERE
+      merge         -> recorrido de ambos primarios + sort externo de los lados no ordenados que
+                       no entran en 'sort_buffer' filas (runs escritos y releídos)
+    Los archivos temporales se cuentan en páginas de SPILL_PAGE bytes. Con costos iguales se
+    prefiere merge sin ordenar (memoria acotada), luego index_nl, hash y por último merge con sort.
+    El build del hash es el lado con menos filas después de su WHERE. None si alguna tabla no
+    se puede leer.
+    """
+    try:
+        tcs = [TableCost(t) for t, _, _ in sides]
+    except (OSError, ValueError, IndexError, struct.error):
+        return None
+    lt, rt = tcs
+    (_, lcol, _), (_, rcol, _) = sides
+    rows = [tc.rows * tc.sel_where(where) for tc, (_, _, where) in zip(tcs, sides)]
+    build = 0 if rows[0] <= rows[1] else 1
+    hash_spill = rows[build] > buffer
+    alternatives = {"hash": lt.primary_scan() + rt.primary_scan()
+                    + (lt.spill(rows[0]) + rt.spill(rows[1]) if hash_spill else 0)}
+    for i, ok in enumerate(inner_ok):
+        if ok:
+            outer, inner, icol = tcs[1 - i], tcs[i], sides[i][1]
+            alternatives[f"index_nl:{i}"] = outer.primary_scan() + rows[1 - i] * inner.probe(icol)
+    if ordered is not None:
+        sort_buffer = sort_buffer or buffer
+        alternatives["merge"] = lt.primary_scan() + rt.primary_scan() + sum(
+            tc.spill(n) for tc, n, o in zip(tcs, rows, ordered) if not o and n > sort_buffer)
+    rank = {"merge": 0 if ordered is not None and all(ordered) else 3, "hash": 2}
+    best = min(alternatives, key=lambda k: (alternatives[k], rank.get(k, 1)))
+    out_rows = rows[0] * rows[1] / max(lt.ndv(lcol), rt.ndv(rcol), 1.0)
+    return {
+        "strategy": best.split(":")[0],
+        "side": int(best.split(":")[1]) if ":" in best else build,
+        "estimate": {
+            "op": "join",
+            "rows": round(out_rows, 1),
+            "cost": round(alternatives[best], 1),
+            "alternatives": {k: round(v, 1) for k, v in alternatives.items()},
+            "table_rows": [int(lt.rows), int(rt.rows)],
+            "spill": (best == "hash" and hash_spill) or (best == "merge" and any(
+                not o and n > sort_buffer for n, o in zip(rows, ordered))),
+            "stats": min(lt.source, rt.source, key=("file", "count", "analyze").index),
+        },
+    }
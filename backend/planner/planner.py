@@ -1,5 +1,11 @@
+import math
 from dataclasses import asdict, is_dataclass
 from typing import Any, Dict, List, Union
+from backend.catalog.catalog import get_json, get_filename
+from backend.planner import cost
+from backend.core import predicate
+from backend.engine.operators import PIPELINE_ACTIONS, SORT_BUFFER
+from backend.engine.joins import JOIN_BUFFER
 
 Stmt = Union[dict, Any]
 
@@ -19,6 +25,7 @@ def _norm_type(b: str) -> str:
     if b in ("bool","boolean"): return "bool"
     if b in ("blob","binary"): return "blob"
     if b in ("date","datetime","timestamp"): return "date"
+    if b == "point": return "point"
     return b or "varchar"
 
 def _norm_method(m: Any) -> str | None:
@@ -28,21 +35,392 @@ def _norm_method(m: Any) -> str | None:
     # equivalencias comunes
     if s in {"b+", "bplus", "b+tree", "btree"}: return "bplus"
     if s in {"r-tree", "rtree", "r+tree", "rtree"}: return "rtree"
+    if s in {"grid"}: return "grid"
     if s in {"seq", "sequential"}: return "sequential"
     if s in {"isam"}: return "isam"
     if s in {"heap"}: return "heap"
     if s in {"hash", "hashing"}: return "hash"
     return s  # por si hay otros métodos válidos en tu backend
 
+def _index_kind(table: str, field: str) -> str | None:
+    """Índice secundario de 'field' según el catálogo (None si no hay o la tabla no existe)."""
+    try:
+        relation, indexes = get_json(get_filename(table), 2)
+    except Exception:
+        return None
+    if (relation.get(field) or {}).get("key") == "primary":
+        return None
+    return (indexes.get(field) or {}).get("index")
+
 def _is_between(node: Any) -> bool:
     return isinstance(node, dict) and {"ident","lo","hi"} <= set(node.keys())
 
 def _is_eq(node: Any) -> bool:
     return isinstance(node, dict) and node.get("op") in ("=","==") and {"left","right"} <= set(node.keys())
 
+def _primary_of(table: str):
+    """(columna PK, organización del primario) según el catálogo; (None, None) si la tabla no existe."""
+    try:
+        relation, indexes = get_json(get_filename(table), 2)
+    except Exception:
+        return None, None
+    pk = next((c for c, s in relation.items() if s.get("key") == "primary"), None)
+    return pk, (indexes.get("primary") or {}).get("index")
+
+# sin ANALYZE el conjunto que guía el acceso se elige por forma: igualdad > IN > rango > geo
+_DRIVER_RANK = {"search": 0, "search_in": 1, "range_search": 2, "geo_within": 3}
+
+def _strip_qualifiers(cols, names):
+    """SELECT t.col FROM t -> col (sin join las columnas calificadas son de la única tabla)."""
+    if cols is None:
+        return None
+    out = []
+    for c in cols:
+        q, dot, name = c.partition(".")
+        out.append(name if dot and q in names else c)
+    return out
+
+def _plan_aggregate(d: dict, names) -> Dict[str, Any] | None:
+    """
+    GROUP BY / agregaciones de un SELECT de una tabla: {"group_by": [...], "aggregates": [...]}
+    o None si no hay. Cada columna no agregada del SELECT tiene que estar en GROUP BY.
+    """
+    aggs, group_by = d.get("aggregates") or [], _strip_qualifiers(d.get("group_by") or [], names)
+    if not aggs and not group_by:
+        return None
+    if d.get("columns") is None:
+        raise ValueError("SELECT * no se puede combinar con GROUP BY ni con agregaciones")
+    out_aggs = [{"func": a["func"], "column": _strip_qualifiers([a["column"]], names)[0] if a["column"] else None,
+                 "name": a["name"]} for a in aggs]
+    agg_names = {a["name"] for a in out_aggs}
+    for c in _strip_qualifiers([c for c in d["columns"] if c not in agg_names], names):
+        if c not in group_by:
+            raise ValueError(f"La columna '{c}' debe estar en GROUP BY o dentro de una agregación")
+    return {"group_by": group_by, "aggregates": out_aggs}
+
 class Planner:
+    def _index_agg_ok(self, table: str, agg: Dict[str, Any]) -> bool:
+        """
+        Sin GROUP BY, cada agregación es COUNT(*) (conteo del catálogo) o MIN / MAX sobre la PK
+        de un primario ordenado o un secundario bplus.
+        """
+        if agg["group_by"] or not agg["aggregates"] or table in self._touched:
+            return False
+        pk, prim = _primary_of(table)
+        return all((a["func"] == "COUNT" and a["column"] is None)
+                   or (a["func"] in ("MIN", "MAX") and a["column"] is not None
+                       and ((a["column"] == pk and prim in ("sequential", "isam", "bplus"))
+                            or self._index_kind(table, a["column"]) == "bplus"))
+                   for a in agg["aggregates"])
+
+    def _plan_spatial_join(self, d: dict) -> Dict[str, Any]:
+        """FROM a JOIN b ON DISTANCE(a.p, b.p) <= r -> plan 'spatial_join'."""
+        j = d["join"]
+        if d.get("where") is not None:
+            raise NotImplementedError("JOIN espacial no admite WHERE adicional")
+        on = j.get("on") or {}
+        sides = [{"table": d["table"], "alias": d.get("alias") or d["table"]},
+                 {"table": j["table"], "alias": j.get("alias") or j["table"]}]
+        if sides[0]["alias"] == sides[1]["alias"]:
+            raise ValueError("JOIN de una tabla consigo misma requiere alias distintos")
+
+        def side_of(ref: str) -> int:
+            q, dot, col = ref.partition(".")
+            if not dot:
+                raise ValueError(f"DISTANCE(...) requiere columnas calificadas (alias.col): '{ref}'")
+            for i, s in enumerate(sides):
+                if q == s["alias"]:
+                    return i
+            raise ValueError(f"Alias desconocido en DISTANCE(...): '{q}'")
+
+        a, b = side_of(on["left"]), side_of(on["right"])
+        if a == b:
+            raise ValueError("DISTANCE(...) debe comparar una columna de cada tabla")
+        sides[a]["field"] = on["left"].split(".", 1)[1]
+        sides[b]["field"] = on["right"].split(".", 1)[1]
+        return {
+            "action": "spatial_join",
+            "table": d["table"],
+            "left": sides[0],
+            "right": sides[1],
+            "radius": on["radius"],
+            "strict": on.get("op") == "<",
+            "columns": d.get("columns"),
+        }
+
+    def _plan_equi_join(self, d: dict) -> Dict[str, Any]:
+        """
+        FROM a JOIN b ON a.x = b.y -> plan 'equi_join'. Los conjuntos del WHERE que usan columnas
+        de un solo lado se empujan a su recorrido ('where' del lado, sin calificar); el resto queda
+        en 'filter' sobre las filas combinadas ('alias.col'). La estrategia (index_nl / hash / merge)
+        la elige cost.join.
+        """
+        j = d["join"]
+        sides = [{"table": d["table"], "alias": d.get("alias") or d["table"]},
+                 {"table": j["table"], "alias": j.get("alias") or j["table"]}]
+        if sides[0]["alias"] == sides[1]["alias"]:
+            raise ValueError("JOIN de una tabla consigo misma requiere alias distintos")
+        rels = []
+        for s in sides:
+            try:
+                rels.append(get_json(get_filename(s["table"]), 2)[0])
+            except Exception:
+                raise ValueError(f"La tabla '{s['table']}' no existe")
+
+        def resolve(ref: str):
+            """(lado, columna) de 'alias.col' o de 'col' si está en un solo lado."""
+            q, dot, col = ref.partition(".")
+            if dot:
+                for i, s in enumerate(sides):
+                    if q == s["alias"]:
+                        if col not in rels[i]:
+                            raise KeyError(f"Columna '{ref}' no existe")
+                        return i, col
+                raise ValueError(f"Alias desconocido en JOIN: '{q}'")
+            hits = [i for i in (0, 1) if ref in rels[i]]
+            if len(hits) > 1:
+                raise ValueError(f"Columna ambigua en join: '{ref}'")
+            if not hits:
+                raise KeyError(f"Columna '{ref}' no existe")
+            return hits[0], ref
+
+        def qualify(ref: str) -> str:
+            i, col = resolve(ref)
+            return f"{sides[i]['alias']}.{col}"
+
+        on = j.get("on") or {}
+        (a, acol), (b, bcol) = resolve(on["left"]), resolve(on["right"])
+        if a == b:
+            raise ValueError("JOIN ... ON a.x = b.y debe comparar una columna de cada tabla")
+        sides[a]["field"], sides[b]["field"] = acol, bcol
+
+        pushed, residual = [[], []], []
+        for conj in predicate.conjuncts(d.get("where")):
+            owners = {resolve(c)[0] for c in predicate.columns_of(conj)}
+            if len(owners) == 1:
+                pushed[owners.pop()].append(predicate.rename_columns(conj, lambda c: resolve(c)[1]))
+            else:
+                residual.append(predicate.rename_columns(conj, qualify))
+        for s, conj in zip(sides, pushed):
+            s["where"] = predicate.conjoin(conj)
+
+        plan = {"action": "equi_join", "table": d["table"], "left": sides[0], "right": sides[1],
+                "filter": predicate.conjoin(residual), "columns": d.get("columns")}
+        if d.get("order_by"):
+            plan["order_by"] = [{"column": qualify(o["column"]), "desc": bool(o["desc"])} for o in d["order_by"]]
+        if d.get("limit") is not None:
+            plan["limit"] = int(d["limit"])
+
+        # interno de un index nested-loop: PK de un primario con búsqueda (no heap) o hash/bplus;
+        # entrada ordenada del merge: PK de un primario que guarda las filas en orden de clave
+        inner_ok, ordered = [], []
+        for s in sides:
+            pk, prim = _primary_of(s["table"])
+            col = s["field"]
+            inner_ok.append((col == pk and prim not in (None, "heap"))
+                            or self._index_kind(s["table"], col) in ("hash", "bplus"))
+            ordered.append(col == pk and prim in ("sequential", "isam", "bplus"))
+        types = [predicate.type_family(rels[i][s["field"]].get("type")) for i, s in enumerate(sides)]
+        if types[0] != types[1]:
+            if set(types) != {"num", "text"}:
+                raise ValueError(f"JOIN entre tipos incompatibles: {sides[0]['field']} ({types[0]}) = "
+                                 f"{sides[1]['field']} ({types[1]})")
+            # número = texto se compara como número: el lado de texto se convierte ('cast'); su
+            # índice no sirve de interno (buscar 5 no encuentra '05' ni '5.0')
+            for i, s in enumerate(sides):
+                if types[i] == "text":
+                    s["cast"] = "float"
+                    inner_ok[i] = False
+        if sides[0]["table"] in self._touched or sides[1]["table"] in self._touched:
+            est = None
+        else:
+            est = cost.join([(s["table"], s["field"], s["where"]) for s in sides], inner_ok, JOIN_BUFFER,
+                            ordered if types[0] == types[1] else None, SORT_BUFFER)
+        if est is None:
+            # sin estimar: index nested-loop si algún lado tiene índice (el derecho primero), si no hash
+            side = 1 if inner_ok[1] else 0 if inner_ok[0] else None
+            est = {"strategy": "hash", "side": 0} if side is None else {"strategy": "index_nl", "side": side}
+        plan["strategy"] = est["strategy"]
+        if est["strategy"] == "merge":
+            # 'sort': lados que pasan por el sort externo antes de mezclar
+            plan["sort"] = [name for name, o in zip(("left", "right"), ordered) if not o]
+        else:
+            # index_nl: 'inner' es el lado indexado; hash: 'build' es el lado que se carga en memoria
+            plan["inner" if est["strategy"] == "index_nl" else "build"] = ("left", "right")[est["side"]]
+        if "estimate" in est:
+            plan["estimate"] = est["estimate"]
+        return plan
+
+    def _index_kind(self, table: str, field: str) -> str | None:
+        """Como _index_kind, pero viendo los CREATE/DROP anteriores del mismo lote (aún no ejecutados)."""
+        if (table, field) in self._pending:
+            return self._pending[(table, field)]
+        if table in self._dropped:
+            return None
+        return _index_kind(table, field)
+
+    def _costed(self, plan: Dict[str, Any], op: str, **kw) -> Dict[str, Any]:
+        """
+        Agrega al plan el camino más barato ('access') y su estimado ('estimate') según cost.py.
+        Si la tabla cambió antes en el mismo lote, sus archivos no reflejan aún ese estado: no se
+        estima y File decide como antes.
+        """
+        if plan["table"] in self._touched:
+            return plan
+        est = cost.estimate(plan["table"], op, field=plan["field"], **kw)
+        if est:
+            plan.update(est)
+        return plan
+
+    def _drivers(self, table: str, conj: list) -> list:
+        """
+        Conjuntos del AND que un índice puede resolver: (plan, op, kw de costo, conjuntos cubiertos).
+        Las comparaciones <, <=, >, >= de una misma columna se juntan en un rango; quedan también en
+        el residual (el rango del índice es cerrado).
+        """
+        pk, prim = _primary_of(table) if table not in self._dropped else (None, None)
+
+        def eq_ok(col):
+            return col == pk or self._index_kind(table, col) in ("hash", "bplus")
+
+        def range_ok(col):
+            if col == pk:
+                return prim in ("sequential", "isam", "bplus")
+            return self._index_kind(table, col) == "bplus"
+
+        out, bounds = [], {}
+        for i, c in enumerate(conj):
+            kind = predicate.node_kind(c)
+            if kind == "cmp" and c["op"] in ("=", "==") and eq_ok(c["left"]):
+                out.append(({"action": "search", "table": table, "field": c["left"], "value": c["right"]},
+                            "search", {"value": c["right"]}, {i}))
+            elif kind == "in" and c.get("items") and eq_ok(c["ident"]):
+                out.append(({"action": "search_in", "table": table, "field": c["ident"], "items": c["items"]},
+                            "search_in", {"items": c["items"]}, {i}))
+            elif kind == "between" and range_ok(c["ident"]):
+                out.append(({"action": "range_search", "table": table, "field": c["ident"],
+                             "min": c["lo"], "max": c["hi"]},
+                            "range_search", {"lo": c["lo"], "hi": c["hi"]}, {i}))
+            elif kind == "cmp" and c["op"] in predicate.RANGE_OPS and range_ok(c["left"]) \
+                    and isinstance(c["right"], (int, float)) and not isinstance(c["right"], bool):
+                lo, hi = bounds.setdefault(c["left"], [-math.inf, math.inf])
+                if c["op"] in (">", ">="):
+                    bounds[c["left"]][0] = max(lo, c["right"])
+                else:
+                    bounds[c["left"]][1] = min(hi, c["right"])
+            elif kind == "geo" and isinstance(c["center"], dict) and c["center"].get("kind") == "point":
+                access = self._index_kind(table, c["ident"])
+                if access in ("rtree", "grid"):
+                    center = c["center"]
+                    out.append(({"action": "geo_within", "table": table, "field": c["ident"],
+                                 "center": {"x": center["x"], "y": center["y"]}, "radius": c["radius"],
+                                 "access": access},
+                                "geo_within", {"center": center, "radius": c["radius"], "kind": access}, {i}))
+        for col, (lo, hi) in bounds.items():
+            out.append(({"action": "range_search", "table": table, "field": col, "min": lo, "max": hi},
+                        "range_search", {"lo": lo, "hi": hi}, set()))
+        return out
+
+    def _leaves(self, table: str, conj: list) -> list:
+        """
+        Conjuntos que dan RIDs solo con su índice (para index_merge): secundarios, o =/IN sobre
+        la PK de un primario no heap (el RID es la PK). Uno por columna, el más selectivo por forma.
+        Devuelve (hoja, conjuntos que la hoja resuelve exacto).
+        """
+        pk, prim = _primary_of(table) if table not in self._dropped else (None, None)
+        out, seen = [], set()
+        for plan, op, kw, used in sorted(self._drivers(table, conj), key=lambda d: _DRIVER_RANK[d[1]]):
+            field = plan["field"]
+            if field in seen:
+                continue
+            if field == pk and (prim == "heap" or op not in ("search", "search_in")):
+                continue
+            seen.add(field)
+            leaf = {k: plan[k] for k in ("field", "value", "items", "min", "max", "center", "radius") if k in plan}
+            leaf["op"] = op
+            # el radio del rtree/grid devuelve candidatos por rectángulo: su conjunto queda en el filtro
+            out.append((leaf, set() if op == "geo_within" else used))
+        return out
+
+    def _merge_plan(self, table: str, cols, tree: dict) -> Dict[str, Any]:
+        plan = {"action": "index_merge", "table": table, "columns": cols, "tree": tree}
+        if table not in self._touched:
+            est = cost.estimate(table, "index_merge", tree=tree)
+            if est:
+                plan.update(est)
+        return plan
+
+    def _plan_or(self, table: str, cols, where) -> Dict[str, Any] | None:
+        """OR: unión de RIDs si cada término tiene al menos un conjunto indexable (si no, None)."""
+        items = []
+        for term in predicate.disjuncts(where):
+            leaves = [leaf for leaf, _ in self._leaves(table, predicate.conjuncts(term))]
+            if not leaves:
+                return None
+            items.append(leaves[0] if len(leaves) == 1 else {"op": "AND", "items": leaves})
+        plan = self._merge_plan(table, cols, {"op": "OR", "items": items})
+        plan["filter"] = where   # las hojas de cada término son un superconjunto: filtro completo
+        return plan
+
+    def _plan_where(self, table: str, cols, where) -> Dict[str, Any]:
+        """
+        WHERE general (AND/OR/comparaciones/IN). Caminos posibles:
+          - un conjunto del AND con índice guía el acceso y el resto va en 'filter'
+          - index_merge: intersección de los RIDs de varios índices (AND) o unión (OR)
+          - 'select' con el predicado empujado al recorrido del primario
+        Con ANALYZE gana el más barato; sin estadísticas, la PK, luego index_merge, luego un
+        índice por forma (igualdad > IN > rango > geo) y por último el recorrido.
+        """
+        scan = {"action": "select", "table": table, "columns": cols, "where": where}
+        pk = _primary_of(table)[0]
+        if predicate.node_kind(where) == "bool" and (where.get("op") or "").upper() == "OR":
+            plan = self._plan_or(table, cols, where)
+            if plan is None or plan.get("access") == "primary":
+                return scan
+            return plan
+
+        conj = predicate.conjuncts(where)
+        best = None
+        for plan, op, kw, used in self._drivers(table, conj):
+            plan = self._costed(plan, op, **kw)
+            est = plan.get("estimate") or {}
+            if est.get("stats") == "analyze" and plan.get("access") in ("primary", "scan") \
+                    and plan["field"] != pk:
+                continue   # con estadísticas el índice de este conjunto pierde contra recorrer
+            analyzed = est.get("stats") == "analyze"
+            key = (not analyzed, est["cost"] if analyzed else 0, _DRIVER_RANK[op])
+            if best is None or key < best[0]:
+                best = (key, plan, used)
+
+        leaves = self._leaves(table, conj)
+        if len(leaves) >= 2:
+            merge = self._merge_plan(table, cols, {"op": "AND", "items": [leaf for leaf, _ in leaves]})
+            est = merge.get("estimate") or {}
+            if est.get("stats") == "analyze":
+                better = merge["access"] == "index_merge" and (best is None or est["cost"] < best[0][1])
+            else:
+                better = best is None or best[1]["field"] != pk
+            if better:
+                covered = set().union(*(used for _, used in leaves))
+                residual = predicate.conjoin([c for i, c in enumerate(conj) if i not in covered])
+                if residual is not None:
+                    merge["filter"] = residual
+                return merge
+
+        if best is None:
+            return scan
+        _, plan, used = best
+        plan["columns"] = cols
+        residual = predicate.conjoin([c for i, c in enumerate(conj) if i not in used])
+        if residual is not None:
+            plan["filter"] = residual
+        return plan
+
     def plan(self, stmts: List[Stmt]) -> List[Dict[str, Any]]:
         plans: List[Dict[str, Any]] = []
+        self._pending = {}     # (tabla, col) -> método, de DDL anteriores en este lote
+        self._dropped = set()  # tablas borradas en este lote
+        self._touched = set()  # tablas con DDL/DML anterior en este lote (archivos aún sin cambiar)
         for s in stmts:
             d = _asdict(s)
             k = _kind(d)
@@ -75,19 +453,28 @@ class Planner:
                     fields.append(f)
 
                 plans.append({"action": "create_table", "table": d["name"], "fields": fields})
+                self._touched.add(d["name"])
+                self._dropped.discard(d["name"])
+                for f in fields:
+                    if f.get("key") != "primary":
+                        self._pending[(d["name"], f["name"])] = f.get("index")
 
             # ----------------- CREATE INDEX -----------------
             elif k == "create_index":
+                self._touched.add(d["table"])
+                self._pending[(d["table"], d["column"])] = _norm_method(d.get("method") or "bplus")
                 plans.append({
                     "action": "create_index",
                     "table": d["table"],
                     "column": d["column"],
                     "method": _norm_method(d.get("method") or "bplus"),
+                    "options": d.get("options") or {},
                     "if_not_exists": d.get("if_not_exists", False)
                 })
 
             # --------- CREATE TABLE FROM FILE (opcional) ----------
             elif k == "create_table_from_file":
+                self._touched.add(d["name"])
                 plans.append({
                     "action": "create_table_from_file",
                     "table": d["name"],
@@ -99,6 +486,7 @@ class Planner:
 
             # ----------------- INSERT -----------------
             elif k == "insert":
+                self._touched.add(d["table"])
                 cols = d.get("columns")
 
                 # INSERT FROM FILE (si lo usas más arriba)
@@ -136,106 +524,148 @@ class Planner:
 
             # ----------------- SELECT -----------------
             elif k == "select":
+                ordered = bool(d.get("order_by")) or d.get("limit") is not None
+                if d.get("join") and (d.get("aggregates") or d.get("group_by")):
+                    raise NotImplementedError("GROUP BY / agregaciones no soportados en JOIN")
+                if d.get("join"):
+                    if "radius" not in (d["join"].get("on") or {}):
+                        plans.append(self._plan_equi_join(d))
+                        continue
+                    if ordered:
+                        raise NotImplementedError("ORDER BY / LIMIT no soportado en JOIN espacial")
+                    plans.append(self._plan_spatial_join(d))
+                    continue
                 table = d["table"]
-                where = d.get("where")
-                cols = d.get("columns")  # None => *
+                names = {table, d.get("alias")}
+                where = predicate.rename_columns(d.get("where"), lambda c: _strip_qualifiers([c], names)[0])
+                cols = _strip_qualifiers(d.get("columns"), names)  # None => *
+                agg = _plan_aggregate(d, names)
+                first = len(plans)
+
+                # COUNT(*) del catálogo y MIN / MAX desde los extremos de un índice ordenado, sin recorrido
+                if agg is not None and where is None and self._index_agg_ok(table, agg):
+                    plans.append({"action": "index_aggregate", "table": table, "aggregates": agg["aggregates"]})
+                    agg = None
 
                 # sin WHERE -> select genérico
-                if where is None:
+                elif where is None:
                     plans.append({
                         "action": "select",
                         "table": table,
                         "columns": cols,
                         "where": None})
-                    continue
 
                 # WHERE como dict? (nuestro parser deja dataclasses->dict)
-                if isinstance(where, dict):
+                elif isinstance(where, dict):
                     # 1) BETWEEN
                     if _is_between(where):
-                        plans.append({
+                        plans.append(self._costed({
                             "action": "range_search",
                             "table": table,
                             "field": where["ident"],
                             "min": where["lo"],
                             "max": where["hi"]
-                        })
+                        }, "range_search", lo=where["lo"], hi=where["hi"]))
 
                     # 2) Igualdad (= o ==)
                     elif _is_eq(where):
-                        plans.append({
+                        plans.append(self._costed({
                             "action": "search",
                             "table": table,
                             "field": where["left"],
                             "value": where["right"]
-                        })
+                        }, "search", value=where["right"]))
 
                     # 3) IN lista
                     elif "ident" in where and "items" in where:
-                        plans.append({
+                        plans.append(self._costed({
                             "action": "search_in",
                             "table": table,
                             "field": where["ident"],
                             "items": where["items"]
-                        })
+                        }, "search_in", items=where["items"]))
 
                     # 4) GeoWithin (POINT, r)
                     elif {"ident","center","radius"} <= set(where.keys()):
                         center = where["center"]
-                        if isinstance(center, dict) and center.get("kind") == "point":
+                        if isinstance(center, dict) and center.get("kind") == "points":
                             plans.append({
-                                "action": "geo_within",
+                                "action": "geo_within_batch",
                                 "table": table,
                                 "field": where["ident"],
-                                "center": {"x": center["x"], "y": center["y"]},
+                                "points": [(c["x"], c["y"]) for c in center["points"]],
                                 "radius": where["radius"]
                             })
+                        elif isinstance(center, dict) and center.get("kind") == "point":
+                            # un solo camino: índice espacial (rtree/grid) si la columna lo tiene, si no scan;
+                            # con estadísticas de la columna (ANALYZE) gana el más barato de los dos
+                            access = self._index_kind(table, where["ident"])
+                            access = access if access in ("rtree", "grid") else "scan"
+                            plans.append(self._costed({
+                                "action": "geo_within",
+                                "table": table,
+                                "field": where["ident"],
+                                "center": {"x": center["x"], "y": center["y"]},
+                                "radius": where["radius"],
+                                "access": access
+                            }, "geo_within", center=center, radius=where["radius"], kind=access))
                         else:
                             # Si el centro no es POINT, dejamos que el executor filtre genérico
                             plans.append({"action": "select", "table": table, "columns": cols, "where": where})
 
                     elif {"ident", "point", "k"} <= set(where.keys()):
                         center = where["point"]
-                        if isinstance(center, dict) and center.get("kind") == "point":
+                        if isinstance(center, dict) and center.get("kind") == "points":
                             plans.append({
-                                "action": "knn",
+                                "action": "knn_batch",
                                 "table": table,
                                 "field": where["ident"],
-                                "point": (center["x"], center["y"]),
+                                "points": [(c["x"], c["y"]) for c in center["points"]],
                                 "k": int(where["k"])
                             })
-                        else:
-                            # fallback genérico (no debería ocurrir si parseamos POINT)
-                            plans.append({"action": "select", "table": table, "columns": cols, "where": where})
-
-                    # 5) AND entre (BETWEEN) y (=) en cualquier orden -> range + post_filter
-                    elif where.get("op") == "AND" and isinstance(where.get("items"), list) and len(where["items"]) == 2:
-                        a, b = where["items"]
-                        # normaliza orden
-                        left_between, right_eq = (a, b) if _is_between(a) and _is_eq(b) else ((b, a) if _is_between(b) and _is_eq(a) else (None, None))
-                        if left_between and right_eq:
+                        elif isinstance(center, dict) and center.get("kind") == "point":
                             plans.append({
-                                "action": "range_search",
+                                "action": "knn",
                                 "table": table,
-                                "field": left_between["ident"],
-                                "min": left_between["lo"],
-                                "max": left_between["hi"],
-                                "post_filter": {"field": right_eq["left"], "value": right_eq["right"]}
+                                "field": where["ident"],
+                                "point": (center["x"], center["y"]),
+                                "k": int(where["k"])
                             })
                         else:
-                            # AND general -> select y que el executor filtre
+                            # fallback genérico (no debería ocurrir si parseamos POINT)
                             plans.append({"action": "select", "table": table, "columns": cols, "where": where})
 
+                    # 5) WHERE general: conjunto indexable + residual, o recorrido filtrado
                     else:
-                        # Forma no optimizada: select genérico (el executor filtra)
-                        plans.append({"action": "select", "table": table, "columns": cols, "where": where})
+                        plans.append(self._plan_where(table, cols, where))
 
                 else:
                     # WHERE no-dict (por si viniera raro) -> select genérico
                     plans.append({"action": "select", "table": table, "columns": cols, "where": where})
 
+                # agregación, proyección, ORDER BY y LIMIT van sobre el árbol de iteradores del executor
+                for plan in plans[first:]:
+                    if plan["action"] not in PIPELINE_ACTIONS:
+                        if ordered or agg is not None:
+                            raise NotImplementedError("ORDER BY / LIMIT / GROUP BY no soportado con varios puntos (POINTS)")
+                        continue
+                    plan.setdefault("columns", cols)
+                    if agg is not None:
+                        plan.update(agg)
+                    if d.get("order_by"):
+                        # ORDER BY count(*) con el COUNT(*) renombrado: se ordena por su alias
+                        alias_of = {f"{a['func'].lower()}({a['column'] or '*'})": a["name"]
+                                    for a in d.get("aggregates") or []}
+                        ocols = _strip_qualifiers([alias_of.get(o["column"], o["column"]) for o in d["order_by"]],
+                                                  names)
+                        plan["order_by"] = [{"column": c, "desc": bool(o["desc"])}
+                                            for c, o in zip(ocols, d["order_by"])]
+                    if d.get("limit") is not None:
+                        plan["limit"] = int(d["limit"])
+
             # ----------------- DELETE -----------------
             elif k == "delete":
+                self._touched.add(d["table"])
                 w = d.get("where") or {}
                 if not (_is_eq(w)):
                     raise NotImplementedError("DELETE soporta igualdad simple (WHERE col = valor)")
@@ -243,9 +673,15 @@ class Planner:
 
             # ----------------- DROP -----------------
             elif k == "drop_table":
+                self._touched.add(d["name"])
+                self._dropped.add(d["name"])
+                self._pending = {tc: m for tc, m in self._pending.items() if tc[0] != d["name"]}
                 plans.append({"action": "drop_table", "table": d["name"], "if_exists": d.get("if_exists", False)})
 
             elif k == "drop_index":
+                self._touched.add(d.get("table"))
+                if d.get("table") and d.get("column"):
+                    self._pending[(d["table"], d["column"])] = None
                 plans.append({
                     "action": "drop_index",
                     "table": d.get("table"),
@@ -254,6 +690,20 @@ class Planner:
                     "if_exists": d.get("if_exists", False)
                 })
 
+            # ----------------- REORGANIZE -----------------
+            elif k == "reorganize":
+                plans.append({"action": "reorganize", "table": d["name"]})
+
+            # ----------------- VACUUM INDEX -----------------
+            elif k == "vacuum_index":
+                plans.append({"action": "vacuum_index", "table": d["table"],
+                              "column": d.get("column"), "full": d.get("full", False)})
+
+            # ----------------- ANALYZE -----------------
+            elif k == "analyze":
+                self._touched.add(d["table"])
+                plans.append({"action": "analyze", "table": d["table"], "columns": d.get("columns")})
+
             else:
                 raise NotImplementedError(f"No soportado en planner: {k}")
 
@@ -1,6 +1,6 @@
 # parser.py
 from dataclasses import dataclass, field, asdict
-from typing import List, Optional, Any, Tuple
+from typing import List, Optional, Any, Tuple, Union
 import re
 
 # ---------------------------
@@ -14,9 +14,13 @@ KEYWORDS = {
     "INT","INTEGER","SMALLINT","BIGINT","FLOAT","REAL","DOUBLE",
     "PRECISION","CHAR","VARCHAR","STRING","BOOL","BOOLEAN",
     "TRUE","FALSE","NULL","LIKE","IN","IS","AS",
-    "FILE","POINT", "KNN"
+    "FILE","POINT", "KNN", "REORGANIZE", "WITH", "VACUUM", "JOIN", "DISTANCE", "POINTS",
+    "ANALYZE", "ORDER", "BY", "LIMIT", "ASC", "DESC", "GROUP"
 }
 
+# funciones de agregación: se reconocen como IDENT seguido de '(' (siguen valiendo como nombres de columna)
+AGG_FUNCS = {"COUNT", "SUM", "AVG", "MIN", "MAX"}
+
 # operadores que necesitamos en este dialecto
 _TWO_CHAR_OPS = {"<=", ">=", "!=", "<>"}
 _SINGLE_OPS = set("=<>(),.;+-*")
@@ -133,6 +137,7 @@ class CreateIndex:
     table: str = ""
     column: str = ""
     method: Optional[str] = None
+    options: dict = field(default_factory=dict)
 
 @dataclass
 class DropTable:
@@ -148,6 +153,24 @@ class DropIndex:
     table: Optional[str] = None
     column: Optional[str] = None
 
+@dataclass
+class ReorganizeTable:
+    kind: str = "reorganize"
+    name: str = ""
+
+@dataclass
+class VacuumIndex:
+    kind: str = "vacuum_index"
+    table: str = ""
+    column: Optional[str] = None
+    full: bool = False
+
+@dataclass
+class Analyze:
+    kind: str = "analyze"
+    table: str = ""
+    columns: Optional[List[str]] = None   # None = todas
+
 @dataclass
 class Insert:
     kind: str = "insert"
@@ -174,12 +197,49 @@ class BoolExpr:
     op: str         # "AND" | "OR"
     items: List[Any]
 
+@dataclass
+class DistanceCond:
+    """DISTANCE(a.p, b.p) <= r"""
+    left: str               # columna calificada 'alias.col'
+    right: str
+    op: str                 # "<=" | "<"
+    radius: Any
+
+@dataclass
+class EquiCond:
+    """a.x = b.y"""
+    left: str               # columna calificada 'alias.col'
+    right: str
+
+@dataclass
+class Join:
+    table: str
+    alias: Optional[str] = None
+    on: Optional[Union[DistanceCond, EquiCond]] = None
+
+@dataclass
+class OrderItem:
+    column: str
+    desc: bool = False
+
+@dataclass
+class Aggregate:
+    func: str                       # COUNT | SUM | AVG | MIN | MAX
+    column: Optional[str] = None    # None => COUNT(*)
+    name: str = ""                  # columna de salida: alias o 'count(*)', 'avg(col)', ...
+
 @dataclass
 class Select:
     kind: str = "select"
     table: str = ""
-    columns: Optional[List[str]] = None   # None => "*"
+    columns: Optional[List[str]] = None   # None => "*"; las agregaciones aparecen por su 'name'
     where: Optional[Any] = None
+    alias: Optional[str] = None
+    join: Optional[Join] = None
+    order_by: List[OrderItem] = field(default_factory=list)
+    limit: Optional[int] = None
+    aggregates: List[Aggregate] = field(default_factory=list)
+    group_by: List[str] = field(default_factory=list)
 
 @dataclass
 class Delete:
@@ -203,7 +263,7 @@ class InList:
 
 @dataclass
 class GeoWithin:
-    """ubicacion IN (POINT(x,y), r)"""
+    """ubicacion IN (POINT(x,y), r) | ubicacion IN (POINTS(...), r)"""
     ident: str
     center: Any      # dict {"kind":"point","x":..,"y":..} o literal/ident
     radius: Any      # número o literal
@@ -211,7 +271,7 @@ class GeoWithin:
 @dataclass
 class Knn:
     ident: str              # columna (coords)
-    point: Any              # {"kind":"point","x":..,"y":..}
+    point: Any              # {"kind":"point","x":..,"y":..} o {"kind":"points","points":[...]}
     k: int
 
 # ---------------------------
@@ -274,6 +334,12 @@ class _Parser:
             return self._parse_select()
         if t.value == "DELETE":
             return self._parse_delete()
+        if t.value == "REORGANIZE":
+            return self._parse_reorganize()
+        if t.value == "VACUUM":
+            return self._parse_vacuum()
+        if t.value == "ANALYZE":
+            return self._parse_analyze()
         raise SyntaxError(f"Sentencia no soportada: {t.value}")
 
     # CREATE
@@ -307,7 +373,20 @@ class _Parser:
         method = None
         if self._accept("KW", "USING"):
             method = self._parse_method_token()
-        return CreateIndex(if_not_exists=if_not_exists, name=name, table=table, column=col, method=method)
+
+        # WITH (clave = valor, ...): opciones propias del método (p.ej. variant='rstar', M=16)
+        options = {}
+        if self._accept("KW", "WITH"):
+            self._expect("OP", "(")
+            while True:
+                opt = self._parse_ident().lower()
+                self._expect("OP", "=")
+                options[opt] = self._parse_literal()
+                if not self._accept("OP", ","):
+                    break
+            self._expect("OP", ")")
+        return CreateIndex(if_not_exists=if_not_exists, name=name, table=table, column=col,
+                           method=method, options=options)
 
     def _parse_create_table(self):
         if_not_exists = False
@@ -422,6 +501,8 @@ class _Parser:
         parts = []
         t = self._peek()
         while t and (t.kind in {"IDENT", "KW"} or (t.kind == "OP" and t.value in {"+", "-"})):
+            if t.kind == "KW" and t.value == "WITH":
+                break
             parts.append(t.value)
             self.i += 1
             t = self._peek()
@@ -456,6 +537,27 @@ class _Parser:
         self._expect("OP", ")")
         return {"kind": "point", "x": self._parse_number_like(tx), "y": self._parse_number_like(ty)}
 
+    def _parse_points(self) -> dict:
+        # POINTS(POINT(x,y), ...) | POINTS((x,y), ...)
+        self._expect("KW", "POINTS")
+        self._expect("OP", "(")
+        pts = []
+        while True:
+            if self._peek_is("KW", "POINT"):
+                p = self._parse_point()
+            else:
+                self._expect("OP", "(")
+                tx = self._expect("NUMBER").value
+                self._expect("OP", ",")
+                ty = self._expect("NUMBER").value
+                self._expect("OP", ")")
+                p = {"kind": "point", "x": self._parse_number_like(tx), "y": self._parse_number_like(ty)}
+            pts.append({"x": p["x"], "y": p["y"]})
+            if not self._accept("OP", ","):
+                break
+        self._expect("OP", ")")
+        return {"kind": "points", "points": pts}
+
     # DROP
     def _parse_drop(self):
         self._expect("KW", "DROP")
@@ -480,6 +582,40 @@ class _Parser:
                 return DropIndex(if_exists=if_exists, name=name, table=table)
         raise SyntaxError("DROP debe ser TABLE o INDEX")
 
+    # REORGANIZE TABLE t
+    def _parse_reorganize(self):
+        self._expect("KW", "REORGANIZE")
+        self._expect("KW", "TABLE")
+        return ReorganizeTable(name=self._parse_ident())
+
+    # VACUUM INDEX ON t [(col)] [FULL]
+    def _parse_vacuum(self):
+        self._expect("KW", "VACUUM")
+        self._expect("KW", "INDEX")
+        self._expect("KW", "ON")
+        table = self._parse_ident()
+        column = None
+        if self._accept("OP", "("):
+            column = self._parse_ident()
+            self._expect("OP", ")")
+        t = self._peek()
+        full = bool(t and t.kind == "IDENT" and t.value.upper() == "FULL")
+        if full:
+            self.i += 1
+        return VacuumIndex(table=table, column=column, full=full)
+
+    # ANALYZE t [(col, ...)]
+    def _parse_analyze(self):
+        self._expect("KW", "ANALYZE")
+        table = self._parse_ident()
+        columns = None
+        if self._accept("OP", "("):
+            columns = [self._parse_ident()]
+            while self._accept("OP", ","):
+                columns.append(self._parse_ident())
+            self._expect("OP", ")")
+        return Analyze(table=table, columns=columns)
+
     # INSERT
     def _parse_insert(self):
         self._expect("KW", "INSERT")
@@ -521,20 +657,128 @@ class _Parser:
     def _parse_select(self):
         self._expect("KW", "SELECT")
         cols = None
+        aggregates = []
         if self._accept("OP", "*"):
             cols = None
         else:
-            cols = [self._parse_ident()]
+            cols = [self._parse_select_item(aggregates)]
             while self._accept("OP", ","):
-                cols.append(self._parse_ident())
+                cols.append(self._parse_select_item(aggregates))
 
         self._expect("KW", "FROM")
         table = self._parse_ident()
+        alias = self._parse_alias()
+
+        join = None
+        if self._accept("KW", "JOIN"):
+            jtable = self._parse_ident()
+            join = Join(table=jtable, alias=self._parse_alias())
+            self._expect("KW", "ON")
+            join.on = self._parse_distance_cond() if self._peek_is("KW", "DISTANCE") else self._parse_equi_cond()
 
         where = None
         if self._accept("KW", "WHERE"):
             where = self._parse_expr()
-        return Select(table=table, columns=cols, where=where)
+
+        # GROUP BY col [, ...]
+        group_by = []
+        if self._accept("KW", "GROUP"):
+            self._expect("KW", "BY")
+            group_by.append(self._parse_qualified())
+            while self._accept("OP", ","):
+                group_by.append(self._parse_qualified())
+
+        # ORDER BY col [ASC|DESC] [, ...]  (col puede ser una agregación: ORDER BY count(*) DESC)
+        order_by = []
+        if self._accept("KW", "ORDER"):
+            self._expect("KW", "BY")
+            while True:
+                col = self._parse_agg_call().name if self._peek_agg() else self._parse_qualified()
+                desc = bool(self._accept("KW", "DESC"))
+                if not desc:
+                    self._accept("KW", "ASC")
+                order_by.append(OrderItem(column=col, desc=desc))
+                if not self._accept("OP", ","):
+                    break
+
+        # LIMIT n
+        limit = None
+        if self._accept("KW", "LIMIT"):
+            t = self._expect("NUMBER")
+            if not t.value.isdigit():
+                raise SyntaxError(f"LIMIT debe ser un entero no negativo, no {t.value}")
+            limit = int(t.value)
+        return Select(table=table, columns=cols, where=where, alias=alias, join=join,
+                      order_by=order_by, limit=limit, aggregates=aggregates, group_by=group_by)
+
+    def _peek_agg(self) -> bool:
+        # COUNT( / SUM( / ... : IDENT de agregación seguido de '('
+        t = self._peek()
+        nxt = self.toks[self.i + 1] if self.i + 1 < len(self.toks) else None
+        return (t is not None and t.kind == "IDENT" and t.value.upper() in AGG_FUNCS
+                and nxt is not None and nxt.kind == "OP" and nxt.value == "(")
+
+    def _parse_agg_call(self) -> Aggregate:
+        # COUNT(*) | COUNT(col) | SUM(col) | AVG(col) | MIN(col) | MAX(col)
+        func = self._expect("IDENT").value.upper()
+        self._expect("OP", "(")
+        if self._accept("OP", "*"):
+            if func != "COUNT":
+                raise SyntaxError(f"{func}(*) no es válido; solo COUNT(*)")
+            column = None
+        else:
+            column = self._parse_qualified()
+        self._expect("OP", ")")
+        return Aggregate(func=func, column=column, name=f"{func.lower()}({column or '*'})")
+
+    def _parse_select_item(self, aggregates: List[Aggregate]) -> str:
+        # col | alias.col | AGG(...) [[AS] nombre]
+        if not self._peek_agg():
+            return self._parse_qualified()
+        agg = self._parse_agg_call()
+        agg.name = self._parse_alias() or agg.name
+        aggregates.append(agg)
+        return agg.name
+
+    def _parse_qualified(self) -> str:
+        # col | alias.col
+        name = self._parse_ident()
+        if self._accept("OP", "."):
+            name = f"{name}.{self._parse_ident()}"
+        return name
+
+    def _parse_alias(self) -> Optional[str]:
+        # FROM t [AS] a
+        if self._accept("KW", "AS"):
+            return self._parse_ident()
+        if self._peek_is("IDENT"):
+            return self._parse_ident()
+        return None
+
+    def _parse_distance_cond(self) -> DistanceCond:
+        # DISTANCE(a.p, b.p) <= r
+        self._expect("KW", "DISTANCE")
+        self._expect("OP", "(")
+        left = self._parse_qualified()
+        self._expect("OP", ",")
+        right = self._parse_qualified()
+        self._expect("OP", ")")
+        op_tok = self._expect("OP")
+        if op_tok.value not in {"<=", "<"}:
+            raise SyntaxError(f"JOIN por distancia solo admite <= o <, no {op_tok.value}")
+        radius = self._parse_literal()
+        if not isinstance(radius, (int, float)) or isinstance(radius, bool):
+            raise SyntaxError("El radio de DISTANCE(...) debe ser numérico")
+        return DistanceCond(left=left, right=right, op=op_tok.value, radius=radius)
+
+    def _parse_equi_cond(self) -> EquiCond:
+        # a.x = b.y
+        left = self._parse_qualified()
+        op_tok = self._expect("OP")
+        if op_tok.value not in {"=", "=="}:
+            raise SyntaxError(f"JOIN ... ON solo admite igualdad (a.x = b.y) o DISTANCE(...), no {op_tok.value}")
+        right = self._parse_qualified()
+        return EquiCond(left=left, right=right)
 
     # WHERE expression
     def _parse_expr(self):
@@ -557,11 +801,12 @@ class _Parser:
             self._expect("OP", ")")
             return e
 
-        ident = self._parse_ident()
+        ident = self._parse_qualified()
 
         if self._accept("KW", "KNN"):
             self._expect("OP", "(")
-            center = self._parse_point()  # POINT(x,y)
+            # POINT(x,y) | POINTS(...) (un resultado por punto)
+            center = self._parse_points() if self._peek_is("KW", "POINTS") else self._parse_point()
             self._expect("OP", ",")
             k_lit = self._parse_literal()  # k
             self._expect("OP", ")")
@@ -585,6 +830,12 @@ class _Parser:
             if t and t.kind == "KW" and t.value == "POINT":
                 center = self._parse_point()
                 first_is_point = True
+            elif t and t.kind == "KW" and t.value == "POINTS":
+                center = self._parse_points()
+                self._expect("OP", ",")
+                radius = self._parse_literal()
+                self._expect("OP", ")")
+                return GeoWithin(ident=ident, center=center, radius=radius)
             else:
                 center = self._parse_literal()
 
@@ -626,6 +877,10 @@ class _Parser:
         if t.kind == "KW" and t.value in {"TRUE", "FALSE", "NULL"}:
             self.i += 1
             return True if t.value == "TRUE" else (False if t.value == "FALSE" else None)
+        # POINT(x, y) como valor (columnas POINT)
+        nxt = self.toks[self.i + 1] if self.i + 1 < len(self.toks) else None
+        if t.kind == "KW" and t.value == "POINT" and nxt and nxt.kind == "OP" and nxt.value == "(":
+            return self._parse_point()
         # permitimos identificadores como literales “strings”
         if t.kind in {"IDENT", "KW"}:
             self.i += 1
@@ -1,8 +1,13 @@
-from backend.catalog.catalog import get_json, get_filename
+from backend.catalog.catalog import get_json, get_filename, get_counts, put_counts
 from backend.storage.indexes.heap import HeapFile
 from backend.storage.indexes.sequential import SeqFile
 from backend.storage.indexes.isam import IsamFile
-from backend.storage.indexes.rtree import RTree
+from backend.storage.indexes.rtree import RTree, f32_slack
+from backend.storage.indexes.grid import Grid
+from backend.storage import pointscan
+from backend.storage.ridset import BitmapRids, SortedRids
+from backend.core.predicate import coerce, NO_MATCH
+from backend.core.utils import parse_point
 from backend.storage.indexes.hash import ExtendibleHashingFile
 from backend.storage.indexes.bplus import BPlusFile
 import json as _json
@@ -39,6 +44,8 @@ class File:
         self.last_io = self._new_io()
         self._index_usage = []
         self._cached_rtree = {}  # {field_name: RTree_wrapper} для переиспользования
+        self._rtree_batch = None  # {field_name: [in_rec, ...]} mientras build/import_csv difieren rtree/grid
+        self._counts = get_counts(table)  # {"rows", "indexes"} vivos; None si la tabla no los tiene
 
     # ------------------------------ IO accounting ------------------------------------ #
 
@@ -51,6 +58,7 @@ class File:
             "bplus": dict(zero),
             "hash": dict(zero),
             "rtree": dict(zero),
+            "grid": dict(zero),
             "total": dict(zero),
         }
 
@@ -67,6 +75,11 @@ class File:
         self._io[kind]["write_count"] += wc
         self._io["total"]["read_count"] += rc
         self._io["total"]["write_count"] += wc
+        # índices con caché de nodos (rtree) reportan aparte las lecturas servidas en memoria
+        hits = int(getattr(obj, "cache_hits", 0) or 0)
+        if hits:
+            self._io[kind]["cache_hits"] = self._io[kind].get("cache_hits", 0) + hits
+            self._io["total"]["cache_hits"] = self._io["total"].get("cache_hits", 0) + hits
 
     def io_get(self):
         return copy.deepcopy(self._io)
@@ -107,6 +120,11 @@ class File:
                 out[col] = float(v)
             elif t in ("bool", "boolean"):
                 out[col] = bool(v)
+            elif t == "point":
+                pt = parse_point(v)
+                if pt is None:
+                    raise ValueError(f"Valor POINT inválido en '{col}': {v!r}")
+                out[col] = list(pt)
         return out
 
     def _posify(self, items):
@@ -133,41 +151,58 @@ class File:
             self.table, field, data_dir,
             key=field,
             M=int(idx_meta.get("M", 32)),
-            heap_file=(self.indexes["primary"]["filename"] if heap_ok else None)
+            heap_file=(self.indexes["primary"]["filename"] if heap_ok else None),
+            variant=idx_meta.get("variant", "linear")
         )
         if reuse_cached:
             self._cached_rtree[field] = rt
         return rt
 
+    def _make_grid(self, field: str):
+        """Grid wrapper de 'field' (archivos junto al .dat del índice, como el R-Tree)."""
+        idx_meta = self.indexes[field]
+        data_dir = os.path.dirname(os.path.dirname(idx_meta["filename"]))
+        return Grid(self.table, field, data_dir,
+                    heap=(self.indexes["primary"]["index"] == "heap"),
+                    cell=idx_meta.get("cell"))
+
     def _close_cached_rtrees(self):
         """Cierra todos los RTree cacheados (persist header)."""
         for rt in self._cached_rtree.values():
             rt.close()
         self._cached_rtree.clear()
 
+    def _flush_rtree_batch(self):
+        """
+        Vuelca los puntos diferidos por build/import_csv. Si el lote es grande frente
+        al árbol (>= una entrada por página existente) se reempaca todo con STR
+        (bulk_load); si no, se insertan uno a uno. Las grillas se cargan agrupando por celda.
+        """
+        batch, self._rtree_batch = self._rtree_batch, None
+        is_heap = (self.indexes["primary"]["index"] == "heap")
+        for index, in_recs in (batch or {}).items():
+            if not in_recs: continue
+            if self.indexes[index]["index"] == "grid":
+                g = self._make_grid(index)
+                g.insert_many(in_recs)
+                self.io_merge(g, "grid")
+                self.index_log("secondary", "grid", index, "bulk_load", note=str(len(in_recs)))
+                continue
+            rt = self._make_rtree(index, heap_ok=is_heap, reuse_cached=True)
+            if len(in_recs) >= rt.rt.store.page_count():
+                rt.bulk_load(in_recs)
+                self.index_log("secondary", "rtree", index, "bulk_load", note=str(len(in_recs)))
+            else:
+                for in_rec in in_recs:
+                    rt.insert(in_rec)
+            self.io_merge(rt, "rtree")
+
     def _as_point(self, v):
-        import json
-        if isinstance(v, str):
-            s = v.strip()
-            # JSON list: "[55,3]"
-            if s.startswith("[") and s.endswith("]"):
-                try:
-                    j = json.loads(s)
-                    if isinstance(j, (list, tuple)) and len(j) >= 2:
-                        return True, [float(j[0]), float(j[1])]
-                except Exception:
-                    pass
-            # CSV-like: "55,3"
-            if "," in s:
-                try:
-                    x_str, y_str = s.split(",", 1)
-                    return True, [float(x_str), float(y_str)]
-                except Exception:
-                    pass
-        if isinstance(v, (list, tuple)) and len(v) >= 2 \
-                and isinstance(v[0], (int, float)) and isinstance(v[1], (int, float)):
-            return True, [float(v[0]), float(v[1])]
-        return False, None
+        # columnas POINT ya vienen como [x, y] (dos 'd' en disco): sin parseo
+        if type(v) is list and len(v) == 2 and type(v[0]) is float and type(v[1]) is float:
+            return True, v
+        pt = parse_point(v)
+        return (True, [pt[0], pt[1]]) if pt is not None else (False, None)
 
     def _bridge_from_rtree(self, items):
         if not items: return []
@@ -235,6 +270,16 @@ class File:
             results = tmp
         return results
 
+    def _rows_by_rid(self, rids) -> dict:
+        """rid (pos del heap o PK) -> fila, resolviendo cada rid una sola vez por el índice primario."""
+        uniq = list(dict.fromkeys(rids))
+        if not uniq:
+            return {}
+        rows = self._bridge_from_rtree([{"pos": rid} for rid in uniq])
+        if self.indexes["primary"]["index"] == "heap":
+            return dict(zip(uniq, rows))  # search_by_pos respeta el orden pedido
+        return {row.get(self.primary_key): row for row in rows if isinstance(row, dict)}
+
     def _usable_secondary_kind(self, field: str):
         # Nunca prefieras un "secundario" cuando el campo es la PK.
         if field == self.primary_key:
@@ -243,14 +288,18 @@ class File:
         if not meta:
             return None
         kind = (meta.get("index") or "").lower()
-        return kind if kind in ("hash", "bplus", "rtree") else None
+        return kind if kind in ("hash", "bplus", "rtree", "grid") else None
 
     # ----------------------------------- DDL build ----------------------------------- #
 
     def build(self, params):
         if self.indexes["primary"]["index"] != "isam":
+            self._rtree_batch = {}
             for record in params["records"]:
                 self.insert({"op": "insert", "record": record})
+            self._flush_rtree_batch()
+            self._close_cached_rtrees()
+            self._save_counts()
             self.last_io = self.io_get()
             return
 
@@ -309,20 +358,40 @@ class File:
             elif kind == "rtree":
                 try:
                     rt = self._make_rtree(index, heap_ok=False)
+                    in_recs = []
                     for rec in records:
                         if index not in rec: continue
                         ok, pt = self._as_point(rec[index])
                         if not ok: continue
-                        in_rec = ({"pos": rec.get("pos"), index: pt, "deleted": False}
-                                  if self.indexes["primary"]["index"] == "heap"
-                                  else {"pk": rec[self.primary_key], index: pt, "deleted": False})
-                        rt.insert(in_rec)
+                        in_recs.append({"pos": rec.get("pos"), index: pt, "deleted": False}
+                                       if self.indexes["primary"]["index"] == "heap"
+                                       else {"pk": rec[self.primary_key], index: pt, "deleted": False})
+                    rt.bulk_load(in_recs)
                     rt.close()  # Explicit close for bulk build
                     self.io_merge(rt, "rtree")
                     self.index_log("secondary", "rtree", index, "build")
                 except Exception as e:
                     if DEBUG_IDX: print("[RTREE build secondary] skip:", e)
 
+            elif kind == "grid":
+                try:
+                    g = self._make_grid(index)
+                    in_recs = []
+                    for rec in records:
+                        if index not in rec: continue
+                        ok, pt = self._as_point(rec[index])
+                        if not ok: continue
+                        in_recs.append({"pos": rec.get("pos"), index: pt}
+                                       if self.indexes["primary"]["index"] == "heap"
+                                       else {"pk": rec[self.primary_key], index: pt})
+                    g.insert_many(in_recs)
+                    self.io_merge(g, "grid")
+                    self.index_log("secondary", "grid", index, "build")
+                except Exception as e:
+                    if DEBUG_IDX: print("[GRID build secondary] skip:", e)
+
+        self._counts = self._entries(records)
+        self._save_counts()
         self.last_io = self.io_get()
         return []
 
@@ -464,25 +533,49 @@ class File:
                 elif kind == "rtree":
                     # Access directly from cache to avoid local ref that triggers __del__
                     rt = self._cached_rtree[index]
+                    in_recs = []
                     if is_heap:
                         for row_dict, pos in records:
                             if index not in row_dict: continue
                             ok, pt = self._as_point(row_dict[index])
                             if not ok: continue
-                            in_rec = {"pos": pos, index: pt, "deleted": False}
-                            rt.insert(in_rec)
+                            in_recs.append({"pos": pos, index: pt, "deleted": False})
                     else:
                         for row_dict in records:
                             if index not in row_dict: continue
                             ok, pt = self._as_point(row_dict[index])
                             if not ok: continue
-                            in_rec = {"pk": row_dict[self.primary_key], index: pt, "deleted": False}
+                            in_recs.append({"pk": row_dict[self.primary_key], index: pt, "deleted": False})
+                    if self._rtree_batch is not None:
+                        # build/import_csv: se cargan todos juntos en _flush_rtree_batch
+                        self._rtree_batch.setdefault(index, []).extend(in_recs)
+                    else:
+                        for in_rec in in_recs:
                             rt.insert(in_rec)
                     # DO NOT close here; let import_csv close all at end
                     if DEBUG_IDX: print(f"[RTREE insert secondary] after batch: records={len(records)}")
                     self.io_merge(rt, "rtree")
                     self.index_log("secondary", "rtree", index, "insert")
 
+                elif kind == "grid":
+                    in_recs = []
+                    if is_heap:
+                        for row_dict, pos in records:
+                            ok, pt = self._as_point(row_dict.get(index))
+                            if ok: in_recs.append({"pos": pos, index: pt})
+                    else:
+                        for row_dict in records:
+                            ok, pt = self._as_point(row_dict.get(index))
+                            if ok: in_recs.append({"pk": row_dict[self.primary_key], index: pt})
+                    if self._rtree_batch is not None:
+                        self._rtree_batch.setdefault(index, []).extend(in_recs)
+                    elif in_recs:
+                        g = self._make_grid(index)
+                        g.insert_many(in_recs)
+                        self.io_merge(g, "grid")
+                        self.index_log("secondary", "grid", index, "insert")
+
+        self._note_counts(records, +1)
         self.last_io = self.io_get()
         return records
 
@@ -502,7 +595,8 @@ class File:
                 additional["unique"] = True
 
         same_key = (field == self.primary_key)
-        sec_kind = self._usable_secondary_kind(field)
+        # el planner puede pedir el primario aunque haya secundario (plan["access"], ver cost.py)
+        sec_kind = None if params.get("access") == "primary" else self._usable_secondary_kind(field)
         use_primary = (sec_kind is None)
 
         if use_primary:
@@ -588,6 +682,18 @@ class File:
                     self.last_io = self.io_get()
                     return []
 
+            elif kind == "grid":
+                ok_pt, pt = self._as_point(value)
+                if not ok_pt:
+                    raise ValueError("GRID equality needs a point-like value")
+                g = self._make_grid(field)
+                items = g.search_rect(pt[0], pt[0], pt[1], pt[1])  # float64: igualdad exacta
+                self.io_merge(g, "grid")
+                self.index_log("secondary", "grid", field, "search_rect_eq")
+                out = self._bridge_from_rtree(items)
+                self.last_io = self.io_get()
+                return out
+
             if self.indexes["primary"]["index"] == "heap":
                 hf = HeapFile(mainfilename)
                 out = hf.search_by_pos(self._posify(records))
@@ -624,7 +730,8 @@ class File:
         records = []
 
         same_key = (field == self.primary_key)
-        sec_kind = self._usable_secondary_kind(field)
+        # el planner puede pedir el primario aunque haya secundario (plan["access"], ver cost.py)
+        sec_kind = None if params.get("access") == "primary" else self._usable_secondary_kind(field)
         use_primary = (sec_kind is None)
 
         if use_primary:
@@ -697,6 +804,20 @@ class File:
                     if DEBUG_IDX: print("[RTREE range_search secondary] skip:", e)
                     return []
 
+            elif kind == "grid":
+                rect = params.get("rect") or {
+                    "xmin": params["min"], "xmax": params["max"],
+                    "ymin": params.get("ymin", params["min"]),
+                    "ymax": params.get("ymax", params["max"]),
+                }
+                g = self._make_grid(field)
+                items = g.search_rect(rect["xmin"], rect["xmax"], rect["ymin"], rect["ymax"])
+                self.io_merge(g, "grid")
+                self.index_log("secondary", "grid", field, "range_rect")
+                out = self._bridge_from_rtree(items)
+                self.last_io = self.io_get()
+                return out
+
             if self.indexes["primary"]["index"] == "heap":
                 hf = HeapFile(mainfilename)
                 out = hf.search_by_pos(self._posify(records))
@@ -723,14 +844,54 @@ class File:
 
     # ----------------------------------- DML knn ------------------------------------ #
 
+    def _point_scan(self, field: str, op: str, scan):
+        """
+        Recorrido por fuerza bruta de una columna de puntos sin índice espacial (ver pointscan).
+        scan (KnnScan / WithinScan) consume los bloques; se retornan sus grupos de refs como filas.
+        Con PK heap las filas se leen al final por RID; con otros primarios se recorre iter_all
+        por bloques y solo se guardan las filas que siguen siendo candidatas.
+        """
+        mainidx, mainfile = self._primary()
+        if mainidx == "heap":
+            hf = HeapFile(mainfile)
+            for block in pointscan.heap_blocks(hf, field):
+                scan.add(*block)
+            self.io_merge(hf, "heap")
+            rows = None
+        else:
+            rows, lo = {}, 0
+            for chunk, block in pointscan.row_blocks(self.iter_all(), field):
+                rows.update(enumerate(chunk, lo))
+                lo += len(chunk)
+                scan.add(*block)
+                live = scan.refs()
+                for ref in [ref for ref in rows if ref not in live]:
+                    del rows[ref]
+        self.index_log("primary", mainidx, field, op, note=f"scan {pointscan.engine()}")
+        groups = scan.groups()
+        if rows is None:
+            rows = self._rows_by_rid(ref for refs in groups for ref in refs)
+        return [[rows[ref] for ref in refs if ref in rows] for refs in groups]
+
     def knn(self, params: dict):
         field = params["field"]
-        if field not in self.indexes:
-            self.last_io = self.io_get(); return []
-        if "key" in self.relation.get(field, {}) and self.relation[field]["key"] == "primary":
-            self.last_io = self.io_get(); return []
-        if self.indexes[field]["index"] != "rtree":
+        if field not in self.relation:
             self.last_io = self.io_get(); return []
+        kind = self._usable_secondary_kind(field)
+        if kind not in ("rtree", "grid"):
+            # sin índice espacial: distancias vectorizadas sobre la columna completa
+            x, y = float(params["point"][0]), float(params["point"][1])
+            out = self._point_scan(field, "knn", pointscan.KnnScan([(x, y)], params["k"]))[0]
+            self.last_io = self.io_get()
+            return out
+        if kind == "grid":
+            g = self._make_grid(field)
+            items = g.knn(params["point"][0], params["point"][1], params["k"])
+            self.io_merge(g, "grid")
+            self.index_log("secondary", "grid", field, "knn")
+            out = self._bridge_from_rtree(items)
+            self.last_io = self.io_get()
+            return out
         try:
             is_heap = (self.indexes["primary"]["index"] == "heap")
             rt = self._make_rtree(field, heap_ok=is_heap)
@@ -745,6 +906,167 @@ class File:
             self.last_io = self.io_get()
             return []
 
+    # -------------------------------- DML geo_within -------------------------------- #
+
+    def geo_within(self, params: dict):
+        """
+        Filas con 'field' a distancia <= radius de 'center', por un solo camino de acceso:
+        - access='rtree': el R-Tree poda círculo-vs-MBR y devuelve candidatos
+        - access='grid' : solo las celdas de la grilla que alcanzan el círculo
+        - access='scan' : recorrido por bloques de la columna (pointscan, vectorizado)
+        En todos los casos el filtro final es la distancia exacta sobre el valor de la fila.
+        Sin 'access' (llamadas directas) se elige por el catálogo.
+        """
+        field = params["field"]
+        cx, cy = float(params["center"]["x"]), float(params["center"]["y"])
+        rr = float(params["radius"])
+        sec_kind = self._usable_secondary_kind(field)
+        spatial = sec_kind if sec_kind in ("rtree", "grid") else None
+        access = params.get("access") or spatial or "scan"
+        if access != spatial:
+            access = "scan"  # plan de un lote cuyo índice ya no existe (o cambió de tipo)
+
+        if access == "rtree":
+            is_heap = (self.indexes["primary"]["index"] == "heap")
+            rt = self._make_rtree(field, heap_ok=is_heap)
+            # el índice guarda float32: se pide un radio apenas mayor y se refina abajo
+            items = rt.range(cx, cy, rr + f32_slack(cx, cy, rr))
+            self.io_merge(rt, "rtree")
+            self.index_log("secondary", "rtree", field, "geo_within", note=f"candidates={len(items)}")
+            rows = self._bridge_from_rtree(items)
+        elif access == "grid":
+            g = self._make_grid(field)
+            items = g.range(cx, cy, rr)
+            self.io_merge(g, "grid")
+            self.index_log("secondary", "grid", field, "geo_within", note=f"candidates={len(items)}")
+            rows = self._bridge_from_rtree(items)
+        else:
+            rows = self._point_scan(field, "geo_within", pointscan.WithinScan([(cx, cy)], rr))[0]
+
+        out = []
+        for row in rows:
+            ok, pt = self._as_point(row.get(field)) if isinstance(row, dict) else (False, None)
+            if ok and (pt[0] - cx) ** 2 + (pt[1] - cy) ** 2 <= rr * rr:
+                out.append(row)
+        self.last_io = self.io_get()
+        return out
+
+    # ------------------------------- DML index_merge -------------------------------- #
+
+    def _leaf_rids(self, leaf: dict) -> list:
+        """RIDs de una condición resuelta solo con su índice (sin leer el primario)."""
+        field, op = leaf["field"], leaf["op"]
+        values = leaf.get("items") if op == "search_in" else [leaf.get("value")]
+
+        if field == self.primary_key:
+            # primario no heap: el RID es la PK misma; las que no existan no devuelven fila
+            ctype = str(self.relation[field].get("type") or "").lower()
+            self.index_log("primary", self.indexes["primary"]["index"], field, "rids")
+            return [k for k in (coerce(v, ctype) for v in values or []) if k is not None and k is not NO_MATCH]
+
+        kind = self._usable_secondary_kind(field)
+        filename = (self.indexes.get(field) or {}).get("filename")
+        items = []
+        if kind == "hash" and op in ("search", "search_in"):
+            h = ExtendibleHashingFile(filename)
+            for v in values:
+                items.extend(h.find(v, field, unique=False) or [])
+            self.io_merge(h, "hash")
+        elif kind == "bplus" and op in ("search", "search_in"):
+            bp = BPlusFile(filename)
+            for v in values:
+                items.extend(bp.search({"key": field, "value": v, "unique": False}, same_key=True) or [])
+            self.io_merge(bp, "bplus")
+        elif kind == "bplus" and op == "range_search":
+            bp = BPlusFile(filename)
+            items = bp.range_search({"key": field, "min": leaf["min"], "max": leaf["max"]}, same_key=True) or []
+            self.io_merge(bp, "bplus")
+        elif kind in ("rtree", "grid") and op == "geo_within":
+            cx, cy, rr = float(leaf["center"]["x"]), float(leaf["center"]["y"]), float(leaf["radius"])
+            if kind == "rtree":
+                rt = self._make_rtree(field, heap_ok=self.indexes["primary"]["index"] == "heap")
+                items = rt.range(cx, cy, rr + f32_slack(cx, cy, rr))
+                self.io_merge(rt, "rtree")
+            else:
+                g = self._make_grid(field)
+                items = g.range(cx, cy, rr)
+                self.io_merge(g, "grid")
+        else:
+            raise ValueError(f"'{field}' no tiene índice para {op} en index_merge")
+        self.index_log("secondary", kind, field, "rids", note=f"{op} -> {len(items)}")
+        # hash/B+ guardan 'pos' (heap) o 'pk'; rtree/grid llevan el RID en 'pos'
+        return [it["pk"] if "pk" in it else it["pos"] for it in items if isinstance(it, dict)]
+
+    def _rid_set(self, node: dict):
+        if "items" in node and "field" not in node:
+            sets = [self._rid_set(n) for n in node["items"]]
+            out = sets[0]
+            for s in sets[1:]:
+                out = (out & s) if node.get("op") == "AND" else (out | s)
+            return out
+        rids = self._leaf_rids(node)
+        if self.indexes["primary"]["index"] == "heap":
+            return BitmapRids.from_positions(rids, HeapFile(self.indexes["primary"]["filename"]).REC_SIZE)
+        return SortedRids.from_keys(rids)
+
+    def index_merge(self, params: dict):
+        """
+        Combina varios índices: cada hoja de params['tree'] da sus RIDs (pos del heap o PK) sin
+        tocar el primario; los nodos AND intersecan y los OR unen (bitmap con heap, listas
+        ordenadas con PK). Solo los RIDs que sobreviven se leen del primario, en orden.
+        Las hojas pueden devolver candidatos de más (rangos cerrados, rtree): el executor aplica
+        después el filtro exacto del plan.
+        """
+        rids = self._rid_set(params["tree"])
+        self.index_log("primary", self.indexes["primary"]["index"], self.primary_key, "index_merge",
+                       note=f"rids={len(rids)}")
+        out = self._bridge_from_rtree([{"pos": rid} for rid in rids])
+        self.last_io = self.io_get()
+        return out
+
+    def _rtree_batch_op(self, params: dict, op: str):
+        """
+        KNN / radio para varios puntos en un solo recorrido del R-Tree (con grid, una consulta
+        por punto; sin índice espacial, una sola lectura de la columna para todos los puntos).
+        Las filas de todos los grupos se resuelven en un solo lote;
+        retorna [{"point": [x, y], "rows": [...]}].
+        """
+        field = params["field"]
+        points = [(float(x), float(y)) for x, y in params["points"]]
+        kind = self._usable_secondary_kind(field)
+        if field not in self.relation:
+            raise ValueError(f"{op}: columna '{field}' no existe")
+        if kind not in ("rtree", "grid"):
+            # cada bloque de la columna se compara con todos los puntos antes de leer el siguiente
+            if op == "knn_batch":
+                scan = pointscan.KnnScan(points, params["k"])
+            else:
+                scan = pointscan.WithinScan(points, params["radius"])
+            groups = self._point_scan(field, op, scan)
+            self.last_io = self.io_get()
+            return [{"point": [x, y], "rows": rows} for (x, y), rows in zip(points, groups)]
+        if kind == "grid":
+            idx = self._make_grid(field)
+        else:
+            idx = self._make_rtree(field, heap_ok=(self.indexes["primary"]["index"] == "heap"))
+        if op == "knn_batch":
+            groups = idx.knn_batch(points, params["k"])
+        else:
+            groups = idx.range_batch(points, params["radius"])
+        self.io_merge(idx, kind)
+        self.index_log("secondary", kind, field, op, note=f"points={len(points)}")
+        rows = self._rows_by_rid(it["pos"] for items in groups for it in items)
+        out = [{"point": [x, y], "rows": [rows[it["pos"]] for it in items if it["pos"] in rows]}
+               for (x, y), items in zip(points, groups)]
+        self.last_io = self.io_get()
+        return out
+
+    def knn_batch(self, params: dict):
+        return self._rtree_batch_op(params, "knn_batch")
+
+    def range_batch(self, params: dict):
+        return self._rtree_batch_op(params, "range_batch")
+
     # ----------------------------------- DML remove --------------------------------- #
 
     def remove(self, params):
@@ -765,7 +1087,7 @@ class File:
 
         if mainindx == "heap":
             hf = HeapFile(mainfilename)
-            records = hf.remove(additional)  # [(row_dict, pos), ...]
+            records = hf.remove(additional, True)  # [(row_dict, pos), ...]: pos para limpiar el R-Tree
             self.io_merge(hf, "heap")
             self.index_log("primary", "heap", field, "remove", note="same_key")
 
@@ -802,13 +1124,9 @@ class File:
                 try:
                     h = ExtendibleHashingFile(filename)
                     for rec in (records or []):
-                        if isinstance(rec, tuple) and len(rec) >= 2:
-                            row = rec[0]
-                            if index in row:
-                                try: h.remove(row[index], index)
-                                except Exception: pass
-                        elif isinstance(rec, dict) and index in rec:
-                            try: h.remove(rec[index], index)
+                        row, match = self._secondary_entry(rec)
+                        if row is not None and index in row:
+                            try: h.remove(row[index], index, match=match)
                             except Exception: pass
                     self.io_merge(h, "hash")
                     self.index_log("secondary", "hash", index, "cleanup_after_remove")
@@ -819,13 +1137,9 @@ class File:
                 try:
                     bp = BPlusFile(filename)
                     for rec in (records or []):
-                        if isinstance(rec, tuple) and len(rec) >= 2:
-                            row = rec[0]
-                            if index in row:
-                                try: bp.remove({"key": index, "value": row[index]})
-                                except Exception: pass
-                        elif isinstance(rec, dict) and index in rec:
-                            try: bp.remove({"key": index, "value": rec[index]})
+                        row, match = self._secondary_entry(rec)
+                        if row is not None and index in row:
+                            try: bp.remove({"key": index, "value": row[index], "match": match})
                             except Exception: pass
                     self.io_merge(bp, "bplus")
                     self.index_log("secondary", "bplus", index, "cleanup_after_remove")
@@ -854,10 +1168,43 @@ class File:
                 except Exception as e:
                     if DEBUG_IDX: print("[RTREE remove secondary] skip:", e)
 
+            elif kind == "grid":
+                g = self._make_grid(index)
+                for rec in (records or []):
+                    if isinstance(rec, tuple) and len(rec) >= 2:
+                        row, pos = rec[0], rec[1]
+                    elif isinstance(rec, dict):
+                        row, pos = rec, rec.get("pos", rec.get(self.primary_key))
+                    else:
+                        continue
+                    ok, pt = self._as_point(row.get(index))
+                    if pos is not None and ok:
+                        g.remove({"pos": pos, index: pt})
+                self.io_merge(g, "grid")
+                self.index_log("secondary", "grid", index, "cleanup_after_remove")
+
+        self._note_counts(records, -1)
         self.last_io = self.io_get()
         return records
-    
-    def get_all(self):
+
+    def _secondary_entry(self, rec):
+        """
+        (fila, campos que identifican su entrada en un secundario) para un registro devuelto por el
+        primario al borrar: {"pos": p} con heap, {"pk": v} con el resto. Así la limpieza quita solo
+        esa entrada y no las de otras filas con el mismo valor indexado.
+        """
+        if isinstance(rec, tuple) and len(rec) >= 2 and isinstance(rec[0], dict):
+            row, pos = rec[0], rec[1]
+        elif isinstance(rec, dict):
+            row, pos = rec, rec.get("pos")
+        else:
+            return None, None
+        if self.indexes["primary"]["index"] == "heap":
+            return row, ({"pos": pos} if pos is not None else None)
+        return row, ({"pk": row[self.primary_key]} if self.primary_key in row else None)
+
+    def get_all(self, where=None):
+        """Todas las filas; 'where' (core.predicate.Predicate) se evalúa dentro del recorrido del primario."""
         mainfilename = self.indexes["primary"]["filename"]
         mainindx = self.indexes["primary"]["index"]
 
@@ -865,19 +1212,19 @@ class File:
     
         if mainindx == "heap":
             GetFile = HeapFile(mainfilename)
-            records = GetFile.get_all(True)
+            records = GetFile.get_all(True, where=where)
             self.io_merge(GetFile, "heap")
         elif mainindx == "sequential":
             GetFile = SeqFile(mainfilename)
-            records = GetFile.get_all()
+            records = GetFile.get_all(where=where)
             self.io_merge(GetFile, "sequential")
         elif mainindx == "isam":
             GetFile = IsamFile(mainfilename)
-            records = GetFile.get_all()
+            records = GetFile.get_all(where=where)
             self.io_merge(GetFile, "isam")
         elif mainindx == "bplus":
             GetFile = BPlusFile(mainfilename)
-            records = GetFile.get_all()
+            records = GetFile.get_all(where=where)
             self.io_merge(GetFile, "bplus")
         else:
             records = []
@@ -886,6 +1233,171 @@ class File:
 
         return records
 
+    def iter_all(self, where=None, ordered: bool = False):
+        """
+        Como get_all pero como generador de filas (dict), sin materializar la tabla: el primario
+        se lee a medida que se consume. El IO se suma al cerrar (también si se corta antes).
+        ordered=True garantiza orden por la PK (sequential / isam / bplus; heap no tiene orden).
+        """
+        mainfilename = self.indexes["primary"]["filename"]
+        mainindx = self.indexes["primary"]["index"]
+
+        if ordered and mainindx not in ("sequential", "isam", "bplus"):
+            raise ValueError(f"El primario {mainindx} no entrega las filas en orden de clave")
+
+        if mainindx == "heap":
+            GetFile = HeapFile(mainfilename)
+            rows = (fields for fields, _ in GetFile.iter_all(True, where=where))
+        elif mainindx == "sequential":
+            GetFile = SeqFile(mainfilename)
+            rows = GetFile.iter_sorted(self.primary_key, where=where) if ordered else GetFile.iter_all(where=where)
+        elif mainindx == "isam":
+            GetFile = IsamFile(mainfilename)
+            rows = GetFile.iter_sorted(self.primary_key, where=where) if ordered else GetFile.iter_all(where=where)
+        elif mainindx == "bplus":
+            GetFile = BPlusFile(mainfilename)
+            rows = GetFile.iter_all(where=where)
+        else:
+            return
+
+        try:
+            yield from rows
+        finally:
+            rows.close()
+            self.io_merge(GetFile, mainindx)
+            self.last_io = self.io_get()
+
+    # ------------------------------------- edge ------------------------------------- #
+
+    def edge(self, params: dict):
+        """
+        MIN / MAX de 'field' sin recorrer la tabla: extremo de la PK de un primario ordenado
+        (sequential / isam / bplus) o de un secundario bplus. params: {field, last}.
+        Retorna el valor (None si la tabla está vacía); ValueError si no hay índice ordenado.
+        """
+        field, last = params["field"], bool(params.get("last"))
+        op = "max" if last else "min"
+        mainfilename = self.indexes["primary"]["filename"]
+        mainindx = self.indexes["primary"]["index"]
+
+        if field == self.primary_key and mainindx in ("sequential", "isam", "bplus"):
+            kind, where = mainindx, "primary"
+            EdgeFile = {"sequential": SeqFile, "isam": IsamFile, "bplus": BPlusFile}[mainindx](mainfilename)
+        elif self._usable_secondary_kind(field) == "bplus":
+            kind, where = "bplus", "secondary"
+            EdgeFile = BPlusFile(self.indexes[field]["filename"])
+        else:
+            raise ValueError(f"'{field}' no tiene un índice ordenado para {op.upper()}")
+
+        record = EdgeFile.edge(field, last)
+        self.io_merge(EdgeFile, kind)
+        self.index_log(where, kind, field, op, note="edge")
+        self.last_io = self.io_get()
+        return record.get(field) if record is not None else None
+
+    # ----------------------------------- conteos ------------------------------------ #
+
+    def _entries(self, records) -> dict:
+        """
+        Filas de 'records' (como los devuelve el primario: fila o (fila, pos)) y cuántas entradas
+        tiene cada secundario por ellas; rtree / grid solo indexan puntos válidos.
+        """
+        mainfilename = self.indexes["primary"]["filename"]
+        secondaries = {index: meta["index"] for index, meta in self.indexes.items()
+                       if index != "primary" and meta["filename"] != mainfilename}
+        out = {"rows": 0, "indexes": dict.fromkeys(secondaries, 0)}
+        for rec in records:
+            row = rec[0] if isinstance(rec, tuple) else rec
+            out["rows"] += 1
+            for index, kind in secondaries.items():
+                if kind in ("rtree", "grid"):
+                    out["indexes"][index] += self._as_point(row.get(index))[0]
+                else:
+                    out["indexes"][index] += index in row
+        return out
+
+    def _note_counts(self, records, sign: int):
+        """Suma (o resta) las filas insertadas / borradas a los conteos; en build/import_csv se guardan al final."""
+        if not records or self._counts is None:
+            return
+        delta = self._entries(records)
+        self._counts["rows"] = max(0, self._counts["rows"] + sign * delta["rows"])
+        for index, n in delta["indexes"].items():
+            self._counts["indexes"][index] = max(0, self._counts["indexes"].get(index, 0) + sign * n)
+        if self._rtree_batch is None:
+            self._save_counts()
+
+    def _save_counts(self):
+        if self._counts is not None:
+            put_counts(self.table, self._counts)
+
+    def recount(self):
+        """Recorre el primario y reescribe los conteos (tablas sin <tabla>.cnt o índice recién creado)."""
+        self._counts = self._entries(self.iter_all())
+        self._save_counts()
+        self.index_log("primary", self.indexes["primary"]["index"], self.primary_key, "recount")
+        self.last_io = self.io_get()
+        return dict(self._counts)
+
+    def count(self):
+        """
+        Filas y entradas por secundario desde los conteos del catálogo, sin tocar los datos.
+        Si la tabla no tiene conteos (creada antes) se recuentan una vez con un recorrido.
+        """
+        if self._counts is None:
+            return self.recount()
+        self.index_log("primary", self.indexes["primary"]["index"], self.primary_key, "count", note="catalog")
+        self.last_io = self.io_get()
+        return {"rows": self._counts["rows"], "indexes": dict(self._counts["indexes"])}
+
+    # ----------------------------------- reorganize ---------------------------------- #
+
+    def reorganize(self, params: dict):
+        mainfilename = self.indexes["primary"]["filename"]
+        mainindx = self.indexes["primary"]["index"]
+
+        if mainindx != "isam":
+            raise ValueError(f"REORGANIZE solo aplica a tablas con PK ISAM (índice primario: {mainindx})")
+
+        additional = {"key": None, "unique": []}
+        for index in self.indexes:
+            if self.indexes[index]["filename"] == mainfilename and index != "primary":
+                additional["key"] = index
+                break
+
+        for field in self.relation:
+            if "key" in self.relation[field] and self.relation[field]["key"] in ("primary", "unique"):
+                additional["unique"].append(field)
+
+        isf = IsamFile(mainfilename)
+        if params["op"] == "isam_stats":
+            out = isf.stats()
+        else:
+            out = isf.reorganize(additional)
+        self.io_merge(isf, "isam")
+        self.index_log("primary", "isam", self.primary_key, params["op"])
+        self.last_io = self.io_get()
+        return out
+
+    def vacuum_index(self, params: dict):
+        """VACUUM INDEX: compacta los R-Tree de la tabla (o solo params['field'])."""
+        field = params.get("field")
+        rtrees = [f for f, meta in self.indexes.items() if meta.get("index") == "rtree" and f != "primary"]
+        if field is not None:
+            if field not in rtrees:
+                raise ValueError(f"VACUUM INDEX: '{field}' no tiene índice rtree")
+            rtrees = [field]
+        is_heap = (self.indexes["primary"]["index"] == "heap")
+        out = {}
+        for f in rtrees:
+            rt = self._make_rtree(f, heap_ok=is_heap)
+            out[f] = rt.vacuum(force=bool(params.get("force")))
+            self.io_merge(rt, "rtree")
+            rt.close()
+            self.index_log("secondary", "rtree", f, "vacuum", note="rebuilt" if out[f]["rebuilt"] else "skip")
+        self.last_io = self.io_get()
+        return out
+
     # ----------------------------------- execute ------------------------------------ #
 
     def execute(self, params: dict):
@@ -897,26 +1409,26 @@ class File:
             return self.search(params)
         elif params["op"] == "range_search":
             return self.range_search(params)
+        elif params["op"] == "index_merge":
+            return self.index_merge(params)
         elif params["op"] == "knn":
             return self.knn(params)
+        elif params["op"] == "knn_batch":
+            return self.knn_batch(params)
+        elif params["op"] == "range_batch":
+            return self.range_batch(params)
         elif params["op"] == "remove":
             return self.remove(params)
+        elif params["op"] == "vacuum_index":
+            return self.vacuum_index(params)
+        elif params["op"] == "edge":
+            return self.edge(params)
+        elif params["op"] == "count":
+            return self.count()
+        elif params["op"] == "geo_within":
+            return self.geo_within(params)
         elif params["op"] == "rtree_within_circle":
-            try:
-                field = params["field"]
-                cx, cy = float(params["center"]["x"]), float(params["center"]["y"])
-                rr = float(params["radius"])
-                is_heap = (self.indexes["primary"]["index"] == "heap")
-                rt = self._make_rtree(field, heap_ok=is_heap)
-                items = rt.range(cx, cy, rr)
-                self.io_merge(rt, "rtree")
-                self.index_log("secondary", "rtree", field, "rtree_within_circle")
-                out = self._bridge_from_rtree(items)
-                self.last_io = self.io_get()
-                return out
-            except Exception as e:
-                if DEBUG_IDX: print("[RTREE within_circle] skip:", e)
-                return []
+            return self.geo_within({**params, "access": "rtree"})
 
         elif params["op"] == "rtree_range":
             try:
@@ -956,14 +1468,19 @@ class File:
                             v = float(v)
                         rec[col] = v
                     all_recs.append(rec)
-            # Insert all at once (cached rtrees will accumulate across calls)
+            # Insert all at once; los R-Tree se difieren y se cargan con STR al final
+            self._rtree_batch = {}
             for rec in all_recs:
                 self.insert({"record": rec})
+            self._flush_rtree_batch()
             # Close all cached rtrees to persist headers
             self._close_cached_rtrees()
+            self._save_counts()
             if DEBUG_IDX: print(f"[import_csv] closed cached rtrees after {len(all_recs)} records")
             self.last_io = self.io_get()
             return {"count": len(all_recs)}
         
         elif params["op"] == "get_all":
-            return self.get_all()
+            return self.get_all(params.get("where"))
+        elif params["op"] in ("reorganize", "isam_stats"):
+            return self.reorganize(params)
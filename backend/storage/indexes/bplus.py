@@ -282,7 +282,12 @@ class BPlusFile:
                 old_root = left_node
                 old_root.parent = -1
                 new_left_page = self._append_node(f, schema_size, old_root)
-        
+                # la raíz vieja se mudó: sus hijos deben apuntar a su nueva página
+                for child_page in old_root.children:
+                    child = self._read_node_at(f, schema_size, child_page)
+                    child.parent = new_left_page
+                    self._write_node_at(f, schema_size, child_page, child)
+
                 new_root = Node(is_leaf=False, records=[promote_record], children=[new_left_page, right_page], next_node=-1, parent=-1)
                 left_moved = self._read_node_at(f, schema_size, new_left_page)
                 left_moved.parent = 1
@@ -424,7 +429,17 @@ class BPlusFile:
         with open(self.filename, 'rb') as f:
             total = max(2, self._total_pages(f, self.schema_size))
 
-            leaf_page, _ = self._find_leaf_page(f, self.schema_size, lo, keyname)
+            if same_key:
+                leaf_page, _ = self._find_leaf_page(f, self.schema_size, lo, keyname)
+            else:
+                # columna que no es la clave del árbol: las hojas no están ordenadas por ella,
+                # se recorren todas desde la más a la izquierda
+                leaf_page = self._get_root_page()
+                while True:
+                    node = self._read_node_at(f, self.schema_size, leaf_page)
+                    if node.is_leaf or not node.children:
+                        break
+                    leaf_page = node.children[0]
             curr = leaf_page
             visited = set()
             hops = 0
@@ -444,7 +459,9 @@ class BPlusFile:
                     if k < lo:
                         continue
                     if k > hi:
-                        return out
+                        if same_key:
+                            return out
+                        continue
                     out.append(dict(r.fields))
 
                 curr = leaf.next_node
@@ -454,8 +471,11 @@ class BPlusFile:
         return out
 
     def remove(self, additional: dict, same_key: bool = True):
+        # additional['match'] (opcional): campos que además deben coincidir, p. ej. {'pk': 7} en un
+        # secundario para borrar solo la entrada de esa fila y no las de otras con el mismo valor
         keyname = additional['key']
         val = additional['value']
+        match = additional.get('match') or {}
         removed = []
         with open(self.filename, 'r+b') as f:
             if not same_key:
@@ -474,7 +494,8 @@ class BPlusFile:
                     node = self._read_node_at(f, self.schema_size, page)
                     modified = False
                     for idx, rec in enumerate(node.records):
-                        if rec.fields.get(keyname) == val and not rec.fields.get('deleted'):
+                        if (rec.fields.get(keyname) == val and not rec.fields.get('deleted')
+                                and all(rec.fields.get(k) == v for k, v in match.items())):
                             rec.fields['deleted'] = True
                             node.records[idx] = rec
                             removed.append({k: v for k, v in rec.fields.items() if k != 'deleted'})
@@ -495,7 +516,8 @@ class BPlusFile:
                 node = self._read_node_at(f, self.schema_size, page)
                 modified = False
                 for idx, rec in enumerate(node.records):
-                    if rec.fields.get(keyname) == val and not rec.fields.get('deleted'):
+                    if (rec.fields.get(keyname) == val and not rec.fields.get('deleted')
+                            and all(rec.fields.get(k) == v for k, v in match.items())):
                         rec.fields['deleted'] = True
                         node.records[idx] = rec
                         removed.append({k: v for k, v in rec.fields.items() if k != 'deleted'})
@@ -510,8 +532,32 @@ class BPlusFile:
 
         return removed
     
-    def get_all(self):
-        result = []
+    def edge(self, keyname: str, last: bool = False):
+        """
+        Registro vivo con la menor (o mayor, last=True) clave: baja por el hijo de más a la izquierda
+        (derecha); solo si esa hoja quedó con todo borrado retrocede al hermano. None si está vacío.
+        """
+        with open(self.filename, 'rb') as f:
+            found = self._edge_at(f, self._get_root_page(), last)
+        return {k: v for k, v in found.fields.items() if k != 'deleted'} if found is not None else None
+
+    def _edge_at(self, f, page: int, last: bool):
+        node = self._read_node_at(f, self.schema_size, page)
+        if node.is_leaf or not node.children:
+            live = [rec for rec in node.records if not rec.fields.get('deleted', False)]
+            return (live[-1] if last else live[0]) if live else None
+        for child in (reversed(node.children) if last else node.children):
+            found = self._edge_at(f, child, last)
+            if found is not None:
+                return found
+        return None
+
+    def get_all(self, where=None):
+        """Hojas de izquierda a derecha; 'where' (Predicate) descarta antes de copiar el registro."""
+        return list(self.iter_all(where))
+
+    def iter_all(self, where=None):
+        """Como get_all, pero de a un registro: una hoja en memoria a la vez."""
         with open(self.filename, 'rb') as f:
             root_page = self._get_root_page()
             page = root_page
@@ -527,7 +573,6 @@ class BPlusFile:
             while page != -1:
                 node = self._read_node_at(f, self.schema_size, page)
                 for rec in node.records:
-                    if not rec.fields.get('deleted', False):
-                        result.append(dict(rec.fields))
-                page = node.next_node
-        return result
\ No newline at end of file
+                    if not rec.fields.get('deleted', False) and (where is None or where(rec.fields)):
+                        yield dict(rec.fields)
+                page = node.next_node
\ No newline at end of file
@@ -0,0 +1,535 @@
+"""
+Índice de grilla uniforme para columnas de puntos (CREATE INDEX ... USING grid).
+
+El plano se parte en celdas cuadradas de lado 'cell'; el punto (x, y) cae en la celda
+(floor(x / cell), floor(y / cell)). Archivos (base = <tabla>_grid_<col>):
+- <base>.idx  páginas de PAGE_SIZE bytes: [siguiente+1:u32][n:u16] + n x (x:f64, y:f64, rid:i64).
+              Cada celda es una cadena de páginas; solo la cabeza puede tener espacio libre
+              (los borrados rellenan el hueco con la última entrada de la cabeza).
+- <base>.dir  directorio hash (mmap, direccionamiento abierto): celda -> página cabeza, más el
+              lado de celda, la lista de páginas libres y el rango de celdas ocupadas.
+
+Rectángulo / radio: solo se leen las celdas que tocan la consulta (si el rango tiene más celdas
+que el directorio, se recorren las celdas ocupadas). KNN: anillos de celdas alrededor del punto
+hasta que el k-ésimo candidato está más cerca que el borde del anillo. Las coordenadas se guardan
+en float64, así que los filtros de distancia son exactos.
+"""
+import heapq, json, math, mmap, os, struct
+from pathlib import Path
+
+from backend.storage.indexes.pkmap import open_pkmap
+
+PAGE_SIZE = int(os.getenv("BD2_GRID_PAGE", "4096") or 4096)
+DEFAULT_CELL = float(os.getenv("BD2_GRID_CELL", "1.0") or 1.0)
+
+PAGE_HDR = "<IH"                  # siguiente página + 1 (0 = fin de cadena), cantidad de entradas
+PAGE_HDR_SIZE = struct.calcsize(PAGE_HDR)
+ENTRY = "<ddq"                    # x, y, rid (pos del heap o PK entera / surrogate)
+ENTRY_SIZE = struct.calcsize(ENTRY)
+PAGE_CAP = (PAGE_SIZE - PAGE_HDR_SIZE) // ENTRY_SIZE
+
+DIR_MAGIC = b"GRD1"
+DIR_HDR = "<4sQQQQdqqqq"          # magic, capacidad, celdas, puntos, libre+1, lado, cx_min, cx_max, cy_min, cy_max
+DIR_HDR_SIZE = struct.calcsize(DIR_HDR)
+SLOT = "<qqI"                     # cx, cy, cabeza+1 (0 = vacío)
+SLOT_SIZE = struct.calcsize(SLOT)
+MIN_CAPACITY = 256
+MAX_LOAD = 0.5
+
+_GRIDS = {}  # abspath(base) -> GridFile (una instancia por proceso, como pkmap)
+
+
+def open_grid(base: str, cell: float = None) -> "GridFile":
+    """GridFile compartido para 'base'. Si las páginas fueron borradas (DROP) se reabre limpio."""
+    key = os.path.abspath(base)
+    gf = _GRIDS.get(key)
+    if gf is not None and not gf.alive():
+        gf.close()
+        gf = None
+    if gf is None:
+        gf = _GRIDS[key] = GridFile(key, cell)
+    return gf
+
+
+def remove_grid(base: str):
+    """Borra páginas y directorio de la grilla y la instancia compartida."""
+    gf = _GRIDS.pop(os.path.abspath(base), None)
+    if gf is not None:
+        gf.close()
+    for suffix in (".idx", ".dir"):
+        try:
+            os.remove(base + suffix)
+        except FileNotFoundError:
+            pass
+
+
+class GridFile:
+    def __init__(self, base: str, cell: float = None):
+        self.base = base
+        self.idx_path = base + ".idx"
+        self.dir_path = base + ".dir"
+        os.makedirs(os.path.dirname(self.idx_path) or ".", exist_ok=True)
+        self._fd = os.open(self.idx_path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._ino = os.fstat(self._fd).st_ino
+        self.npages = os.fstat(self._fd).st_size // PAGE_SIZE
+        self.read_count = 0
+        self.write_count = 0
+        self._mm = None
+        self._df = None
+        self._open_dir(float(cell) if cell else DEFAULT_CELL)
+
+    # ---------- ciclo de vida ----------
+    def alive(self) -> bool:
+        try:
+            return os.stat(self.idx_path).st_ino == self._ino
+        except FileNotFoundError:
+            return False
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.flush(); self._mm.close(); self._mm = None
+        if self._df is not None:
+            self._df.close(); self._df = None
+        if self._fd >= 0:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+            self._fd = -1
+
+    def __len__(self):
+        return self.npoints
+
+    # ---------- directorio ----------
+    def _open_dir(self, cell: float):
+        if os.path.exists(self.dir_path) and os.path.getsize(self.dir_path) > DIR_HDR_SIZE:
+            self._df = open(self.dir_path, "r+b")
+            self._mm = mmap.mmap(self._df.fileno(), 0)
+            (magic, cap, self.ncells, self.npoints, self.free, self.cell,
+             self.cxmin, self.cxmax, self.cymin, self.cymax) = struct.unpack_from(DIR_HDR, self._mm, 0)
+            if magic == DIR_MAGIC and len(self._mm) == DIR_HDR_SIZE + cap * SLOT_SIZE:
+                self.capacity = cap
+                return
+        # directorio ausente o corrupto: se reconstruye desde las páginas
+        if cell <= 0:
+            raise ValueError("grid: el lado de celda debe ser > 0")
+        self.cell = cell
+        self._recover()
+
+    def _write_header(self):
+        struct.pack_into(DIR_HDR, self._mm, 0, DIR_MAGIC, self.capacity, self.ncells, self.npoints,
+                         self.free, self.cell, self.cxmin, self.cxmax, self.cymin, self.cymax)
+
+    @staticmethod
+    def _home(cx: int, cy: int, mask: int) -> int:
+        return ((cx * 73856093) ^ (cy * 19349663)) & mask
+
+    def _cells(self):
+        """(cx, cy, cabeza+1) de cada celda ocupada, leyendo el directorio."""
+        for i in range(self.capacity):
+            cx, cy, head = struct.unpack_from(SLOT, self._mm, DIR_HDR_SIZE + i * SLOT_SIZE)
+            if head:
+                yield cx, cy, head
+
+    def _rebuild(self, capacity: int, cells):
+        """Escribe un directorio nuevo de 'capacity' slots con 'cells' y lo reemplaza."""
+        slots = bytearray(capacity * SLOT_SIZE)
+        mask = capacity - 1
+        for cx, cy, head in cells:
+            i = self._home(cx, cy, mask)
+            while struct.unpack_from(SLOT, slots, i * SLOT_SIZE)[2]:
+                i = (i + 1) & mask
+            struct.pack_into(SLOT, slots, i * SLOT_SIZE, cx, cy, head)
+        tmp = self.dir_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(bytes(DIR_HDR_SIZE))
+            f.write(slots)
+        if self._mm is not None:
+            self._mm.close(); self._df.close()
+        os.replace(tmp, self.dir_path)
+        self._df = open(self.dir_path, "r+b")
+        self._mm = mmap.mmap(self._df.fileno(), 0)
+        self.capacity = capacity
+        self._write_header()
+
+    def _recover(self):
+        """Rearma el directorio: las cabezas son las páginas no apuntadas por otra; las vacías van a libres."""
+        pages, pointed = {}, set()
+        for pid in range(self.npages):
+            nxt, ents = self._read_page(pid)
+            pages[pid] = (nxt, ents)
+            if nxt:
+                pointed.add(nxt - 1)
+        cells, free = [], []
+        self.ncells = self.npoints = 0
+        self.cxmin = self.cymin = self.cxmax = self.cymax = 0
+        for pid, (nxt, ents) in pages.items():
+            if not ents:  # solo la lista de libres tiene páginas vacías
+                free.append(pid)
+                continue
+            self.npoints += len(ents)
+            if pid in pointed:
+                continue
+            cx, cy = self.cell_of(ents[0][0], ents[0][1])
+            cells.append((cx, cy, pid + 1))
+            self._extend_bounds(cx, cy)
+            self.ncells += 1
+        self.free = 0
+        for pid in free:  # encadena la lista de libres (cada página libre apunta a la anterior)
+            self._write_page(pid, self.free, [])
+            self.free = pid + 1
+        cap = MIN_CAPACITY
+        while self.ncells + 1 > cap * MAX_LOAD:
+            cap *= 2
+        self._rebuild(cap, cells)
+
+    def _probe(self, cx: int, cy: int):
+        """(cabeza+1, offset) de la celda; si no existe, (0, offset del slot libre)."""
+        mask = self.capacity - 1
+        i = self._home(cx, cy, mask)
+        while True:
+            at = DIR_HDR_SIZE + i * SLOT_SIZE
+            sx, sy, head = struct.unpack_from(SLOT, self._mm, at)
+            if not head or (sx == cx and sy == cy):
+                return head, at
+            i = (i + 1) & mask
+
+    def _extend_bounds(self, cx: int, cy: int):
+        if self.ncells == 0:
+            self.cxmin = self.cxmax = cx
+            self.cymin = self.cymax = cy
+        else:
+            self.cxmin = min(self.cxmin, cx); self.cxmax = max(self.cxmax, cx)
+            self.cymin = min(self.cymin, cy); self.cymax = max(self.cymax, cy)
+
+    def _set_head(self, cx: int, cy: int, head: int, at: int, new: bool):
+        struct.pack_into(SLOT, self._mm, at, cx, cy, head)
+        if new:
+            self._extend_bounds(cx, cy)
+            self.ncells += 1
+            if self.ncells + 1 > self.capacity * MAX_LOAD:
+                self._rebuild(self.capacity * 2, list(self._cells()))
+        self._write_header()
+
+    # ---------- páginas ----------
+    def _read_page(self, pid: int):
+        raw = os.pread(self._fd, PAGE_SIZE, pid * PAGE_SIZE)
+        self.read_count += 1
+        nxt, n = struct.unpack_from(PAGE_HDR, raw, 0)
+        return nxt, list(struct.iter_unpack(ENTRY, raw[PAGE_HDR_SIZE:PAGE_HDR_SIZE + n * ENTRY_SIZE]))
+
+    def _write_page(self, pid: int, nxt: int, ents):
+        buf = bytearray(PAGE_SIZE)
+        struct.pack_into(PAGE_HDR, buf, 0, nxt, len(ents))
+        for i, e in enumerate(ents):
+            struct.pack_into(ENTRY, buf, PAGE_HDR_SIZE + i * ENTRY_SIZE, *e)
+        os.pwrite(self._fd, buf, pid * PAGE_SIZE)
+        self.write_count += 1
+
+    def _alloc_page(self) -> int:
+        if self.free:
+            pid = self.free - 1
+            self.free, _ = self._read_page(pid)
+            return pid
+        pid = self.npages
+        self.npages += 1
+        return pid
+
+    def _chain(self, head: int):
+        """(pid, siguiente+1, entradas) de cada página de la cadena que empieza en 'head' (cabeza+1)."""
+        pid = head - 1
+        while pid >= 0:
+            nxt, ents = self._read_page(pid)
+            yield pid, nxt, ents
+            pid = nxt - 1
+
+    # ---------- escritura ----------
+    def cell_of(self, x: float, y: float):
+        return math.floor(x / self.cell), math.floor(y / self.cell)
+
+    def insert_many(self, entries):
+        """
+        Inserta (x, y, rid) agrupando por celda: la cabeza se completa y el resto va en
+        páginas llenas nuevas, así que una carga masiva escribe ~1 página por PAGE_CAP puntos.
+        """
+        groups = {}
+        for x, y, rid in entries:
+            groups.setdefault(self.cell_of(x, y), []).append((float(x), float(y), int(rid)))
+        for (cx, cy), ents in groups.items():
+            self.npoints += len(ents)
+            head, at = self._probe(cx, cy)
+            if head:
+                nxt, cur = self._read_page(head - 1)
+                room = PAGE_CAP - len(cur)
+                if room > 0:
+                    self._write_page(head - 1, nxt, cur + ents[:room])
+                    ents = ents[room:]
+            # cada página nueva se encadena delante de la anterior: la última (la única
+            # que puede quedar incompleta) termina de cabeza
+            for i in range(0, len(ents), PAGE_CAP):
+                pid = self._alloc_page()
+                self._write_page(pid, head, ents[i:i + PAGE_CAP])
+                new = not head
+                head = pid + 1
+                self._set_head(cx, cy, head, at, new)
+                if new:
+                    _, at = self._probe(cx, cy)  # el directorio pudo crecer
+        self._write_header()
+
+    def insert(self, x: float, y: float, rid: int):
+        self.insert_many([(x, y, rid)])
+
+    def remove(self, x, y, rid: int) -> int:
+        """Borra la entrada 'rid' (en la celda de (x, y), o en cualquiera si no hay coordenadas)."""
+        if x is None or y is None:
+            cells = [(cx, cy) for cx, cy, _ in self._cells()]
+        else:
+            cells = [self.cell_of(float(x), float(y))]
+        for cx, cy in cells:
+            head, at = self._probe(cx, cy)
+            if not head:
+                continue
+            for pid, nxt, ents in self._chain(head):
+                hit = next((i for i, e in enumerate(ents) if e[2] == rid), None)
+                if hit is None:
+                    continue
+                h_nxt, h_ents = (nxt, ents) if pid == head - 1 else self._read_page(head - 1)
+                last = h_ents.pop()
+                if pid != head - 1:
+                    ents[hit] = last  # el hueco se rellena con la última entrada de la cabeza
+                    self._write_page(pid, nxt, ents)
+                elif hit < len(h_ents):
+                    h_ents[hit] = last
+                if h_ents:
+                    self._write_page(head - 1, h_nxt, h_ents)
+                else:
+                    # cabeza vacía: pasa a la lista de libres y la siguiente toma su lugar
+                    self._write_page(head - 1, self.free, [])
+                    self.free = head
+                    if h_nxt:
+                        struct.pack_into(SLOT, self._mm, at, cx, cy, h_nxt)
+                    else:
+                        self._drop_cell(at)
+                self.npoints -= 1
+                self._write_header()
+                return 1
+        return 0
+
+    def _drop_cell(self, at: int):
+        """Vacía el slot y reubica el resto del cluster (borrado en direccionamiento abierto)."""
+        mask = self.capacity - 1
+        struct.pack_into(SLOT, self._mm, at, 0, 0, 0)
+        self.ncells -= 1
+        i = ((at - DIR_HDR_SIZE) // SLOT_SIZE + 1) & mask
+        while True:
+            j = DIR_HDR_SIZE + i * SLOT_SIZE
+            cx, cy, head = struct.unpack_from(SLOT, self._mm, j)
+            if not head:
+                break
+            struct.pack_into(SLOT, self._mm, j, 0, 0, 0)
+            _, free_at = self._probe(cx, cy)
+            struct.pack_into(SLOT, self._mm, free_at, cx, cy, head)
+            i = (i + 1) & mask
+
+    # ---------- lectura ----------
+    def _cells_in(self, cx0: int, cx1: int, cy0: int, cy1: int):
+        """(cx, cy, cabeza+1) de las celdas ocupadas dentro del rango (cotas inclusive)."""
+        cx0, cx1 = max(cx0, self.cxmin), min(cx1, self.cxmax)
+        cy0, cy1 = max(cy0, self.cymin), min(cy1, self.cymax)
+        if not self.ncells or cx0 > cx1 or cy0 > cy1:
+            return
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > 2 * self.ncells:
+            for cx, cy, head in self._cells():
+                if cx0 <= cx <= cx1 and cy0 <= cy <= cy1:
+                    yield cx, cy, head
+            return
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                head, _ = self._probe(cx, cy)
+                if head:
+                    yield cx, cy, head
+
+    def _cell_mindist(self, x: float, y: float, cx: int, cy: int) -> float:
+        """Distancia mínima de (x, y) a la celda, menos un margen por el redondeo de floor(x / cell)."""
+        c = self.cell
+        dx = max(cx * c - x, 0.0, x - (cx + 1) * c)
+        dy = max(cy * c - y, 0.0, y - (cy + 1) * c)
+        return math.hypot(dx, dy) - 1e-9 * (c + abs(x) + abs(y))
+
+    def search_rect(self, xmin: float, xmax: float, ymin: float, ymax: float):
+        """rids con xmin <= x <= xmax e ymin <= y <= ymax."""
+        cx0, cy0 = self.cell_of(xmin, ymin)
+        cx1, cy1 = self.cell_of(xmax, ymax)
+        out = []
+        for _, _, head in self._cells_in(cx0, cx1, cy0, cy1):
+            for _, _, ents in self._chain(head):
+                out.extend(rid for px, py, rid in ents if xmin <= px <= xmax and ymin <= py <= ymax)
+        return out
+
+    def range(self, x: float, y: float, r: float):
+        """rids a distancia <= r de (x, y); las celdas del cuadrado que no alcanzan el círculo no se leen."""
+        cx0, cy0 = self.cell_of(x - r, y - r)
+        cx1, cy1 = self.cell_of(x + r, y + r)
+        r2 = r * r
+        out = []
+        for cx, cy, head in self._cells_in(cx0, cx1, cy0, cy1):
+            if self._cell_mindist(x, y, cx, cy) > r:
+                continue
+            for _, _, ents in self._chain(head):
+                out.extend(rid for px, py, rid in ents if (px - x) ** 2 + (py - y) ** 2 <= r2)
+        return out
+
+    def knn(self, x: float, y: float, k: int):
+        """
+        rids de los k puntos más cercanos, ordenados por distancia. Recorre anillos de celdas
+        alrededor de la celda del punto y corta cuando el k-ésimo está más cerca que el borde
+        del anillo. Si los anillos ya cuestan más que el directorio (zona vacía, punto lejano),
+        termina con best-first sobre las celdas ocupadas restantes.
+        """
+        k = int(k)
+        if k <= 0 or not self.npoints:
+            return []
+        best = []  # max-heap: (-dist2, seq, rid)
+        seq = 0
+
+        def scan(head):
+            nonlocal seq
+            for _, _, ents in self._chain(head):
+                for px, py, rid in ents:
+                    d2 = (px - x) ** 2 + (py - y) ** 2
+                    seq += 1
+                    if len(best) < k:
+                        heapq.heappush(best, (-d2, seq, rid))
+                    elif d2 < -best[0][0]:
+                        heapq.heapreplace(best, (-d2, seq, rid))
+
+        c = self.cell
+        ci, cj = self.cell_of(x, y)
+        # los anillos anteriores a 'd' quedan fuera del rango de celdas ocupadas
+        d = max(0, self.cxmin - ci, ci - self.cxmax, self.cymin - cj, cj - self.cymax)
+        probes = 0
+        while True:
+            if probes > 2 * self.ncells:
+                # best-first sobre las celdas que los anillos 0..d-1 no cubrieron
+                pq = [(self._cell_mindist(x, y, cx, cy), cx, cy, head) for cx, cy, head in self._cells()
+                      if max(abs(cx - ci), abs(cy - cj)) >= d]
+                heapq.heapify(pq)
+                while pq:
+                    md, _, _, head = heapq.heappop(pq)
+                    if len(best) == k and md > math.sqrt(-best[0][0]):
+                        break
+                    scan(head)
+                break
+            for cx in range(max(ci - d, self.cxmin), min(ci + d, self.cxmax) + 1):
+                if abs(cx - ci) == d:
+                    cys = range(max(cj - d, self.cymin), min(cj + d, self.cymax) + 1)
+                else:
+                    cys = (cj - d, cj + d)
+                for cy in cys:
+                    if self.cymin <= cy <= self.cymax:
+                        probes += 1
+                        head, _ = self._probe(cx, cy)
+                        if head:
+                            scan(head)
+            if (ci - d <= self.cxmin and ci + d >= self.cxmax
+                    and cj - d <= self.cymin and cj + d >= self.cymax):
+                break  # el anillo ya cubre todas las celdas ocupadas
+            # todo punto fuera de los anillos 0..d está al menos a 'edge' de (x, y)
+            edge = min(x - (ci - d) * c, (ci + d + 1) * c - x, y - (cj - d) * c, (cj + d + 1) * c - y)
+            if len(best) == k and math.sqrt(-best[0][0]) <= edge - 1e-9 * (c + abs(x) + abs(y)):
+                break
+            d += 1
+        return [rid for _, _, rid in sorted(best, key=lambda t: (-t[0], t[1]))]
+
+    def stats(self) -> dict:
+        return {"cell": self.cell, "cells": self.ncells, "points": self.npoints,
+                "pages": self.npages, "page_capacity": PAGE_CAP,
+                "avg_points_per_cell": round(self.npoints / self.ncells, 3) if self.ncells else 0.0}
+
+
+class Grid:
+    """
+    Envoltorio por tabla/columna, como RTree:
+    - archivos en <data_dir>/<tabla>/<tabla>_grid_<col>.{idx,dir}
+    - PK no enteras vía surrogates (pkmap) con la misma base
+    - read_count / write_count son las páginas de esta instancia (el GridFile es compartido)
+    """
+    def __init__(self, table: str, column: str, data_dir, *, heap: bool = False, cell: float = None):
+        self.table = table
+        self.column = column
+        self.heap = heap
+        idx_dir = Path(data_dir) / table
+        idx_dir.mkdir(parents=True, exist_ok=True)
+        self.base = str(idx_dir / f"{table}_grid_{column}")
+        self.gf = open_grid(self.base, cell)
+        self._r0, self._w0 = self.gf.read_count, self.gf.write_count
+        self.read_count = 0
+        self.write_count = 0
+        self.pkmap = None if heap else open_pkmap(self.base)
+
+    def _sync_io_counts(self):
+        self.read_count = self.gf.read_count - self._r0
+        self.write_count = self.gf.write_count - self._w0
+
+    # ---------- rid <-> pos / PK ----------
+    def _rid(self, record: dict) -> int:
+        pk = record.get("pos") if self.heap else record.get("pk", record.get("pos"))
+        if isinstance(pk, int) and not isinstance(pk, bool):
+            return pk
+        return self.pkmap.get_or_add(json.dumps(pk, ensure_ascii=False, sort_keys=True))
+
+    def _pos(self, rid: int):
+        if self.heap:
+            return rid
+        v = self.pkmap.key_of(rid)
+        return rid if v is None else json.loads(v)
+
+    # ---------- escritura ----------
+    def insert_many(self, records):
+        """records: {'pos'|'pk', <col>: [x, y]}."""
+        self.gf.insert_many([(rec[self.column][0], rec[self.column][1], self._rid(rec)) for rec in records])
+        self._sync_io_counts()
+
+    def insert(self, record: dict):
+        self.insert_many([record])
+
+    def remove(self, record: dict) -> int:
+        """Borra la entrada de record['pos'] (pos del heap o PK); record[<col>] ubica la celda."""
+        pt = record.get(self.column)
+        x, y = (pt[0], pt[1]) if pt is not None else (None, None)
+        pk = record.get("pos")
+        if isinstance(pk, int) and not isinstance(pk, bool):
+            rid = pk
+        else:
+            rid = self.pkmap.lookup(json.dumps(pk, ensure_ascii=False, sort_keys=True)) if self.pkmap else 0
+            if not rid:
+                return 0
+        res = self.gf.remove(x, y, rid)
+        self._sync_io_counts()
+        return res
+
+    # ---------- lecturas: [{'pos': pos del heap o PK}] ----------
+    def _items(self, rids):
+        self._sync_io_counts()
+        return [{"pos": self._pos(rid)} for rid in rids]
+
+    def search_rect(self, xmin: float, xmax: float, ymin: float, ymax: float):
+        return self._items(self.gf.search_rect(xmin, xmax, ymin, ymax))
+
+    def range(self, x: float, y: float, r: float):
+        return self._items(self.gf.range(x, y, r))
+
+    def range_rids(self, x: float, y: float, r: float):
+        return [it["pos"] for it in self.range(x, y, r)]
+
+    def knn(self, x: float, y: float, k: int):
+        return self._items(self.gf.knn(x, y, k))
+
+    def knn_batch(self, points, k: int):
+        return [self.knn(x, y, k) for x, y in points]
+
+    def range_batch(self, points, r: float):
+        return [self.range(x, y, r) for x, y in points]
+
+    def stats(self) -> dict:
+        return self.gf.stats()
@@ -32,11 +32,12 @@ class Bucket:
     def find(self, key_value, key_name):
         return [rec for rec in self.records if rec.fields[key_name] == key_value]
 
-    def remove(self, key_value, key_name):
+    def remove(self, key_value, key_name, match=None):
         removed = []
         i = 0
         while i < len(self.records):
-            if self.records[i].fields[key_name] == key_value:
+            fields = self.records[i].fields
+            if fields[key_name] == key_value and all(fields.get(k) == v for k, v in (match or {}).items()):
                 removed.append(self.records.pop(i))
             else:
                 i += 1
@@ -418,10 +419,11 @@ class ExtendibleHashingFile:
         for rec in old_records:
             self.insert(rec.fields, self.key_name)
 
-    def remove(self, key_value, key_name="id", unique=False):
+    def remove(self, key_value, key_name="id", unique=False, match=None):
         """
         Remueve registros que coincidan con key_value.
         Si unique=True, corta en cuanto remueva el primero.
+        match: campos extra que también deben coincidir (p. ej. {"pk": 7}: solo la entrada de esa fila).
         """
         if self.key_name is None:
             self.key_name = key_name
@@ -433,7 +435,7 @@ class ExtendibleHashingFile:
         cur = page_idx
         while cur != -1:
             bucket = self._read_bucket(cur)
-            rem = bucket.remove(key_value, key_name)
+            rem = bucket.remove(key_value, key_name, match)
             if rem:
                 self._write_bucket(cur, bucket)
                 removed.extend([r.fields for r in rem])
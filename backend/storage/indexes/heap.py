@@ -1,6 +1,7 @@
 from backend.catalog.catalog import get_json
 from backend.core.utils import build_format
 from backend.core.record import Record
+from backend.core.predicate import raw_index
 import struct
 
 
@@ -99,7 +100,7 @@ class HeapFile:
 
         return records
 
-    def remove(self, additional: dict):
+    def remove(self, additional: dict, get_pos = False):
         with open(self.filename, "r+b") as heapfile:
             schema_size = struct.unpack("I", heapfile.read(4))[0]
             self.read_count += 1
@@ -124,7 +125,10 @@ class HeapFile:
                     self.write_count += 1
 
                     del record.fields["deleted"]
-                    records.append(record.fields)
+                    if get_pos:
+                        records.append((record.fields, pos))
+                    else:
+                        records.append(record.fields)
 
                     if (additional["unique"]):
                         break
@@ -166,7 +170,17 @@ class HeapFile:
 
         return ret_records
     
-    def get_all(self, get_pos = False):
+    def get_all(self, get_pos = False, where=None):
+        """
+        Registros vivos. 'where' (core.predicate.Predicate) se evalúa sobre la tupla cruda:
+        las filas que no cumplen se descartan sin armar el Record.
+        """
+        return list(self.iter_all(get_pos, where))
+
+    def iter_all(self, get_pos = False, where=None):
+        """Como get_all, pero de a un registro: el archivo se lee a medida que se consume."""
+        raw = where.raw(self.schema) if where is not None else None
+        deleted_at = raw_index(self.schema, "deleted") if raw is not None else None
         with open(self.filename, "rb") as heapfile:
             schema_size = struct.unpack("I", heapfile.read(4))[0]
             self.read_count += 1
@@ -175,20 +189,50 @@ class HeapFile:
             end = heapfile.tell()
             heapfile.seek(4 + schema_size)
 
-            records = []
-
             while (heapfile.tell() != end):
                 pos = heapfile.tell()
                 data = heapfile.read(self.REC_SIZE)
                 self.read_count += 1
 
+                if raw is not None:
+                    values = struct.unpack(self.format, data)
+                    if values[deleted_at] or not raw(values):
+                        continue
+
                 record = Record.unpack(data, self.format, self.schema)
                 if not record.fields["deleted"]:
                     del record.fields["deleted"]
 
                     if get_pos:
-                        records.append((record.fields, pos))
+                        yield (record.fields, pos)
                     else:
-                        records.append(record)
-
-        return records
\ No newline at end of file
+                        yield record
+
+    def field_layout(self, name: str):
+        """(offset, formato struct) de 'name' dentro del registro empaquetado (alineación nativa)."""
+        prefix = ""
+        for field in self.schema:
+            code = build_format([field])
+            if field["name"] == name:
+                return struct.calcsize(prefix + code) - struct.calcsize(code), code
+            prefix += code
+        raise KeyError(name)
+
+    def scan_blocks(self, block_rows: int):
+        """
+        Recorre el archivo en bloques de 'block_rows' registros crudos (una lectura por bloque).
+        Devuelve (pos del primer registro, bytes, cantidad); el llamador decodifica solo lo que usa.
+        """
+        with open(self.filename, "rb") as heapfile:
+            schema_size = struct.unpack("I", heapfile.read(4))[0]
+            self.read_count += 1
+            pos = 4 + schema_size
+            heapfile.seek(pos)
+            while True:
+                data = heapfile.read(block_rows * self.REC_SIZE)
+                n = len(data) // self.REC_SIZE
+                if n == 0:
+                    break
+                self.read_count += 1
+                yield pos, data, n
+                pos += n * self.REC_SIZE
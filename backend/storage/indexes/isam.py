@@ -1,26 +1,59 @@
 from backend.catalog.catalog import get_json
 from backend.core.utils import build_format
 from backend.core.record import Record
+from bisect import bisect_left, bisect_right
+import functools
+import threading
 import struct
 import os
 
-INDEX_FACTOR = 2
-PAGE_FACTOR = 4
+# Tamaño de página lógico: de él se derivan el fanout del índice y los registros por página de datos.
+DEFAULT_PAGE_SIZE = int(os.getenv("BD2_ISAM_PAGE_SIZE", "4096") or 4096)
+
+# Header del archivo índice: page_size, levels, root_page, data_pages (páginas estáticas)
+INDEX_HEADER_FORMAT = "<iiii"
+INDEX_HEADER_SIZE = struct.calcsize(INDEX_HEADER_FORMAT)
+
+# Un lock por archivo de datos: REORGANIZE reemplaza los archivos y el resto
+# de operaciones no debe ver un índice y unas páginas de datos de versiones distintas.
+_LOCKS = {}
+_LOCKS_GUARD = threading.Lock()
+
+
+def table_lock(filename: str):
+    with _LOCKS_GUARD:
+        return _LOCKS.setdefault(os.path.abspath(filename), threading.RLock())
+
+
+def _locked(method):
+    """Ejecuta el método bajo el lock del archivo y con el header recién leído."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            self._read_header()
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 class Index:
 
-    def __init__(self, key: int, page: int):
+    def __init__(self, key, page: int):
         self.key = key
         self.page = page
 
     def pack(self, formato) -> bytes:
-        return struct.pack(formato, self.key, self.page)
+        key = self.key
+        if isinstance(key, str):
+            key = key.encode("utf-8")
+        return struct.pack(formato, key, self.page)
 
     @staticmethod
     def unpack(data: bytes, formato):
         if len(data) < struct.calcsize(formato):
             raise ValueError(f"Insufficient data: expected {struct.calcsize(formato)} bytes, got {len(data)} bytes")
         key, page = struct.unpack(formato, data)
+        if isinstance(key, bytes):
+            key = key.decode("utf-8").rstrip("\x00 ")
         return Index(key, page)
 
 
@@ -28,18 +61,13 @@ class IndexPage:
     HEADER_FORMAT = 'i'
     HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
 
-    def __init__(self, indexes=[]):
-        self.indexes = indexes
+    def __init__(self, indexes=None):
+        self.indexes = indexes if indexes is not None else []
 
-    def pack(self, formato, indexSize):
-        header_data = struct.pack("i", len(self.indexes))
-        record_data = b''
-        for index in self.indexes:
-            record_data += index.pack(formato)
-        i = len(self.indexes)
-        while i < INDEX_FACTOR:
-            record_data += b'\x00' * indexSize
-            i += 1
+    def pack(self, formato, indexSize, fanout):
+        header_data = struct.pack(self.HEADER_FORMAT, len(self.indexes))
+        record_data = b''.join(index.pack(formato) for index in self.indexes)
+        record_data += b'\x00' * (indexSize * (fanout - len(self.indexes)))
         return header_data + record_data
 
     @staticmethod
@@ -48,24 +76,22 @@ class IndexPage:
         offset = IndexPage.HEADER_SIZE
         indexes = []
         for _ in range(size):
-            index_data = data[offset: offset + indexSize]
-            # Skip if we encounter null padding
-            if index_data == b'\x00' * indexSize:
-                break
-            indexes.append(Index.unpack(index_data, formato))
+            indexes.append(Index.unpack(data[offset: offset + indexSize], formato))
             offset += indexSize
         return IndexPage(indexes)
 
     @staticmethod
-    def getPage(file, page: int, formato, indexSize):
-        file.seek((page - 1) * (IndexPage.HEADER_SIZE + (indexSize * INDEX_FACTOR)))
-        data = file.read(IndexPage.HEADER_SIZE + (indexSize * INDEX_FACTOR))
-        return IndexPage.unpack(data, formato, indexSize)
+    def page_size(indexSize, fanout):
+        return IndexPage.HEADER_SIZE + (indexSize * fanout)
 
     @staticmethod
-    def getTotalPages(file, page_size):
-        file.seek(0, 2)
-        return file.tell() // page_size
+    def getPage(file, page: int, formato, indexSize, fanout):
+        size = IndexPage.page_size(indexSize, fanout)
+        file.seek(INDEX_HEADER_SIZE + (page - 1) * size)
+        return IndexPage.unpack(file.read(size), formato, indexSize)
+
+    def keys(self):
+        return [index.key for index in self.indexes]
 
     def __str__(self):
         result = ""
@@ -78,19 +104,14 @@ class DataPage:
     HEADER_FORMAT = 'ii'
     HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
 
-    def __init__(self, records=[], next_page=-1):
-        self.records = records
+    def __init__(self, records=None, next_page=-1):
+        self.records = records if records is not None else []
         self.next_page = next_page
 
-    def pack(self, recordSize):
+    def pack(self, recordSize, page_factor):
         header_data = struct.pack(self.HEADER_FORMAT, len(self.records), self.next_page)
-        record_data = b''
-        for record in self.records:
-            record_data += record.pack()
-        i = len(self.records)
-        while i < PAGE_FACTOR:
-            record_data += b'\x00' * recordSize
-            i += 1
+        record_data = b''.join(record.pack() for record in self.records)
+        record_data += b'\x00' * (recordSize * (page_factor - len(self.records)))
         return header_data + record_data
 
     @staticmethod
@@ -105,11 +126,14 @@ class DataPage:
         return DataPage(records, next_page)
 
     @staticmethod
-    def getPage(file, page: int, formato, recordSize, schema, schema_size):
-        page_size = DataPage.HEADER_SIZE + (recordSize * PAGE_FACTOR)
-        file.seek(4 + schema_size + (page - 1) * page_size)
-        data = file.read(page_size)
-        return DataPage.unpack(data, recordSize, formato, schema)
+    def page_size(recordSize, page_factor):
+        return DataPage.HEADER_SIZE + (recordSize * page_factor)
+
+    @staticmethod
+    def getPage(file, page: int, formato, recordSize, schema, schema_size, page_factor):
+        size = DataPage.page_size(recordSize, page_factor)
+        file.seek(4 + schema_size + (page - 1) * size)
+        return DataPage.unpack(file.read(size), recordSize, formato, schema)
 
     @staticmethod
     def getTotalPages(file, page_size, schema_size):
@@ -126,6 +150,20 @@ class DataPage:
 
 
 class IsamFile:
+    """
+    ISAM estático multinivel.
+
+    - Páginas de datos: 1..data_pages se escriben llenas y ordenadas en build();
+      nunca se reubican. Las inserciones posteriores van a la propia página si
+      tiene hueco o a su cadena de overflow (DataPage.next_page).
+    - Índice: tantos niveles como hagan falta; cada entrada es (primera clave
+      del hijo, página del hijo). El nivel 0 apunta a páginas de datos y sus
+      páginas son las primeras del archivo índice, en orden.
+    - Fanout y registros por página se derivan de page_size, que queda
+      persistido en el header del archivo índice.
+    - stats() mide las cadenas de overflow; reorganize() reconstruye el layout
+      estático desde los registros vivos y reemplaza los archivos con os.replace.
+    """
 
     def create_files(self):
         if not os.path.exists(self.delete_filename):
@@ -136,7 +174,7 @@ class IsamFile:
             with open(self.index_filename, 'w') as _:
                 pass
 
-    def __init__(self, filename: str):
+    def __init__(self, filename: str, page_size: int | None = None):
         self.filename = filename
         self.schema = get_json(self.filename)[0]
         self.format = build_format(self.schema)
@@ -149,13 +187,39 @@ class IsamFile:
 
         self.read_count=0
         self.write_count=0
+        self.lock = table_lock(self.filename)
+
+        # geometría: la del header si el índice ya fue construido
+        self.page_size = int(page_size or DEFAULT_PAGE_SIZE)
+        self.levels = 0
+        self.root_page = 0
+        self.data_pages = 0
+        self._read_header()
+
+        self.PAGE_FACTOR = max(1, (self.page_size - DataPage.HEADER_SIZE) // self.REC_SIZE)
+
+    # ------------------------------ header / geometría ------------------------------ #
+
+    def _read_header(self):
+        if os.path.getsize(self.index_filename) < INDEX_HEADER_SIZE:
+            # índice vacío (nunca construido, o REORGANIZE sin registros vivos): sin páginas
+            self.levels, self.root_page, self.data_pages = 0, 0, 0
+            return False
+        with open(self.index_filename, "rb") as indexfile:
+            page_size, levels, root_page, data_pages = struct.unpack(
+                INDEX_HEADER_FORMAT, indexfile.read(INDEX_HEADER_SIZE))
+        self.page_size, self.levels, self.root_page, self.data_pages = page_size, levels, root_page, data_pages
+        return True
+
+    def is_built(self):
+        return self.levels > 0
 
     def get_metrics(self, additional):
         """
         Construye el formato de struct para entradas del índice: [key][page_ptr]
-        - key: codificada según tipo (i, f, Ns, ?)
+        - key: codificada según tipo (i, q, f, d, Ns, ?)
         - page_ptr: int ('i')
-        Devuelve: (indexformat, indexsize, index_page_size, data_page_size)
+        Devuelve: (indexformat, indexsize, fanout, data_page_size)
         """
         # 1) localizar columna clave
         key_name = additional.get("key")
@@ -170,10 +234,14 @@ class IsamFile:
         # 2) mapear tipo humano -> código struct
         t = str(key_field.get("type") or "").lower()
         indexformat = ""
-        if t in ("i", "int", "integer", "smallint", "bigint", "serial"):
+        if t in ("i", "int", "integer", "smallint", "serial"):
             indexformat = "i"
-        elif t in ("f", "float", "real", "double", "double precision"):
+        elif t in ("q", "bigint"):
+            indexformat = "q"
+        elif t in ("f", "float", "real"):
             indexformat = "f"
+        elif t in ("d", "double", "double precision"):
+            indexformat = "d"
         elif t in ("s", "char", "varchar", "string"):
             ln = int(key_field.get("length", 32))
             indexformat = f"{ln}s"
@@ -185,12 +253,97 @@ class IsamFile:
         # 3) agregar puntero a página (entero)
         indexformat += "i"
 
-        # 4) tamaños
+        # 4) tamaños derivados de page_size
         indexsize = struct.calcsize(indexformat)
-        index_page_size = IndexPage.HEADER_SIZE + (indexsize * INDEX_FACTOR)
-        data_page_size = DataPage.HEADER_SIZE + (self.REC_SIZE * PAGE_FACTOR)
+        fanout = max(2, (self.page_size - IndexPage.HEADER_SIZE) // indexsize)
+        data_page_size = DataPage.page_size(self.REC_SIZE, self.PAGE_FACTOR)
 
-        return indexformat, indexsize, index_page_size, data_page_size
+        return indexformat, indexsize, fanout, data_page_size
+
+    def _write_header(self, indexfile):
+        indexfile.seek(0)
+        indexfile.write(struct.pack(INDEX_HEADER_FORMAT, self.page_size, self.levels,
+                                    self.root_page, self.data_pages))
+        self.write_count += 1
+
+    # ------------------------------ páginas de datos ------------------------------ #
+
+    def _schema_size(self, mainfile):
+        mainfile.seek(0)
+        return struct.unpack("I", mainfile.read(4))[0]
+
+    def _read_data_page(self, mainfile, page_number, schema_size):
+        page = DataPage.getPage(mainfile, page_number, self.format, self.REC_SIZE, self.schema, schema_size,
+                                self.PAGE_FACTOR)
+        self.read_count += 1
+        return page
+
+    def _write_data_page(self, mainfile, page_number, page, schema_size):
+        data_page_size = DataPage.page_size(self.REC_SIZE, self.PAGE_FACTOR)
+        mainfile.seek(4 + schema_size + (page_number - 1) * data_page_size)
+        mainfile.write(page.pack(self.REC_SIZE, self.PAGE_FACTOR))
+        self.write_count += 1
+
+    def _append_data_page(self, mainfile, page, schema_size):
+        data_page_size = DataPage.page_size(self.REC_SIZE, self.PAGE_FACTOR)
+        page_number = DataPage.getTotalPages(mainfile, data_page_size, schema_size) + 1
+        self._write_data_page(mainfile, page_number, page, schema_size)
+        return page_number
+
+    def _chain(self, mainfile, page_number, schema_size):
+        """Genera (page_number, page) para la página estática y su cadena de overflow."""
+        while page_number != -1:
+            page = self._read_data_page(mainfile, page_number, schema_size)
+            yield page_number, page
+            page_number = page.next_page
+
+    # ------------------------------ navegación del índice ------------------------------ #
+
+    def _descend(self, indexfile, value, additional, right=True):
+        """
+        Baja desde la raíz hasta la página de datos estática que cubre 'value'.
+        right=True: última entrada con key <= value (inserción / claves únicas).
+        right=False: última entrada con key < value (primer candidato con duplicados).
+        """
+        indexformat, indexsize, fanout, _ = self.get_metrics(additional)
+        page = self.root_page
+        for _ in range(self.levels):
+            node = IndexPage.getPage(indexfile, page, indexformat, indexsize, fanout)
+            self.read_count += 1
+            keys = node.keys()
+            pos = (bisect_right(keys, value) if right else bisect_left(keys, value)) - 1
+            page = node.indexes[max(pos, 0)].page
+        return page
+
+    def _separator(self, indexfile, data_page, additional, cache):
+        """Primera clave (separador) de la página estática 'data_page', leída del nivel 0."""
+        indexformat, indexsize, fanout, _ = self.get_metrics(additional)
+        leaf_number = (data_page - 1) // fanout + 1
+        if cache.get("page") != leaf_number:
+            cache["node"] = IndexPage.getPage(indexfile, leaf_number, indexformat, indexsize, fanout)
+            cache["page"] = leaf_number
+            self.read_count += 1
+        return cache["node"].indexes[(data_page - 1) % fanout].key
+
+    def _key_pages(self, indexfile, low, high, additional, unique):
+        """
+        Genera las páginas estáticas que pueden contener claves en [low, high].
+        Con clave única y low == high basta una página.
+        """
+        if not self.is_built():
+            return
+        if unique and low == high:
+            yield self._descend(indexfile, low, additional, right=True)
+            return
+        page = self._descend(indexfile, low, additional, right=False)
+        cache = {}
+        while True:
+            yield page
+            page += 1
+            if page > self.data_pages or self._separator(indexfile, page, additional, cache) > high:
+                return
+
+    # ------------------------------ build ------------------------------ #
 
     def remove_duplicates(self, records: list, uniques: list):
         if len(uniques) == 0:
@@ -208,6 +361,75 @@ class IsamFile:
 
         return un_records
 
+    @_locked
+    def build(self, records: list, additional: dict):
+        """
+        Bulk build: ordena la entrada, escribe páginas de datos llenas en forma
+        secuencial y levanta el índice nivel por nivel hasta una sola raíz.
+        """
+        records = self.remove_duplicates(records, additional["unique"])
+
+        if len(records) == 0 or os.path.getsize(self.index_filename) > 0:
+            return []
+
+        key = additional["key"]
+        records.sort(key=lambda x: x.get(key, 0))
+        indexformat, indexsize, fanout, _ = self.get_metrics(additional)
+
+        # 1) páginas de datos estáticas
+        out_records = []
+        entries = []
+        buf = []
+        for start in range(0, len(records), self.PAGE_FACTOR):
+            chunk = records[start: start + self.PAGE_FACTOR]
+            page_records = []
+            for record in chunk:
+                record = dict(record)
+                record.pop("delete", None)
+                record["deleted"] = False
+                page_records.append(Record(self.schema, self.format, record))
+                out_records.append(record)
+            buf.append(DataPage(page_records).pack(self.REC_SIZE, self.PAGE_FACTOR))
+            entries.append(Index(chunk[0].get(key, 0), len(buf)))
+
+        with open(self.filename, "r+b") as datafile:
+            schema_size = self._schema_size(datafile)
+            self.read_count += 1
+            datafile.seek(4 + schema_size)
+            datafile.truncate()
+            datafile.write(b"".join(buf))
+            self.write_count += len(buf)
+
+        self.data_pages = len(buf)
+
+        # 2) índice multinivel: nivel 0 primero, raíz al final
+        pages = []
+        levels = 0
+        while True:
+            next_entries = []
+            for start in range(0, len(entries), fanout):
+                group = entries[start: start + fanout]
+                pages.append(IndexPage(group).pack(indexformat, indexsize, fanout))
+                next_entries.append(Index(group[0].key, len(pages)))
+            levels += 1
+            if len(next_entries) == 1:
+                break
+            entries = next_entries
+
+        self.levels = levels
+        self.root_page = len(pages)
+
+        with open(self.index_filename, "r+b") as indexfile:
+            self._write_header(indexfile)
+            indexfile.write(b"".join(pages))
+            self.write_count += len(pages)
+
+        for record in out_records:
+            del record["deleted"]
+        return out_records
+
+    # ------------------------------ insert ------------------------------ #
+
     def check_duplicates(self, records, record, additional):
         if len(additional["unique"]) == 0:
             return False
@@ -222,365 +444,112 @@ class IsamFile:
         return False
 
     def additional_check(self, record, additional):
-        if len(additional["unique"]) == 1:
+        if len(additional["unique"]) <= 1:
             return False
 
-        with open(self.filename, "r+b") as mainfile:
-            mainfile.seek(0, 2)
-            end = mainfile.tell()
-
-            mainfile.seek(0)
-            schema_size = struct.unpack("I", mainfile.read(4))[0]
+        with open(self.filename, "rb") as mainfile:
+            schema_size = self._schema_size(mainfile)
             self.read_count+=1
 
-            mainfile.seek(4 + schema_size)
+            data_page_size = DataPage.page_size(self.REC_SIZE, self.PAGE_FACTOR)
+            total = DataPage.getTotalPages(mainfile, data_page_size, schema_size)
 
-            i = 1
-            while (end != mainfile.tell()):
-                page = DataPage.getPage(mainfile, i, self.format, self.REC_SIZE, self.schema, schema_size)
-                self.read_count+=1
+            for i in range(1, total + 1):
+                page = self._read_data_page(mainfile, i, schema_size)
 
                 for temp_record in page.records:
 
                     for key in additional["unique"]:
 
-                        if record[key] == temp_record.fields[key]:
+                        if record.get(key) == temp_record.fields[key]:
                             return True
 
-                i += 1
-
             return False
 
-    def insert_on_page(self, record, additional, mainfile, indexfile, leaf, root, leaf_number, page_number, indexformat,
-                       indexsize, index_page_size, data_page_size):
-
-        mainfile.seek(0)
-        schema_size = struct.unpack("I", mainfile.read(4))[0]
-        self.read_count+=1
-
-        page = DataPage.getPage(mainfile, page_number, self.format, self.REC_SIZE, self.schema, schema_size)
-        self.read_count+=1
-
-        if len(page.records) < PAGE_FACTOR:
-
-            if self.check_duplicates(page.records, Record(self.schema, self.format, record), additional):
-                return []
-
-            page.records.append(Record(self.schema, self.format, record))
-            page.records.sort(key=lambda x: x.fields[additional["key"]])
-            mainfile.seek(4 + schema_size + (page_number - 1) * data_page_size)
-            mainfile.write(page.pack(self.REC_SIZE))
-            self.write_count+=1
-
-        else:
-
-            if self.check_duplicates(page.records, Record(self.schema, self.format, record), additional):
-                return []
-
-            if not (len(leaf.indexes) == INDEX_FACTOR and len(root.indexes) == INDEX_FACTOR):
-                page.records.append(Record(self.schema, self.format, record))
-                page.records.sort(key=lambda x: x.fields[additional["key"]])
-
-                middle = len(page.records) // 2
-                left_records = page.records[:middle]
-                right_records = page.records[middle:]
-
-                page.records = right_records
-                mainfile.seek(4 + schema_size + (page_number - 1) * data_page_size)
-                mainfile.write(page.pack(self.REC_SIZE))
-                self.write_count+=1
-
-                new_page = DataPage(left_records)
-                mainfile.seek(0, 2)
-                mainfile.write(new_page.pack(self.REC_SIZE))
-                self.write_count+=1
-
-                new_key = left_records[-1].fields[additional["key"]]
-                new_index = Index(new_key, DataPage.getTotalPages(mainfile, data_page_size, schema_size))
-
-                leaf.indexes.append(new_index)
-                leaf.indexes.sort(key=lambda x: x.key)
-
-                indexfile.seek((leaf_number - 1) * index_page_size)
-                indexfile.write(leaf.pack(indexformat, indexsize))
-
-                self.write_count+=1
-
-                if (len(leaf.indexes) > INDEX_FACTOR):
-                    middle = len(leaf.indexes) // 2
-                    left_indexes = leaf.indexes[:middle]
-                    right_indexes = leaf.indexes[middle:]
-
-                    leaf.indexes = right_indexes
-                    indexfile.seek((leaf_number - 1) * index_page_size)
-                    indexfile.write(leaf.pack(indexformat, indexsize))
-                    self.write_count+=1
-
-                    new_index_page = IndexPage(left_indexes)
-                    indexfile.seek(0, 2)
-                    new_page_number = IndexPage.getTotalPages(indexfile, index_page_size) + 1
-                    indexfile.write(new_index_page.pack(indexformat, indexsize))
-                    self.write_count+=1
-
-                    new_key = left_indexes[-1].key
-                    new_index = Index(new_key, new_page_number)
-
-                    root.indexes.append(new_index)
-                    root.indexes.sort(key=lambda x: x.key)
-
-                    indexfile.seek(0)
-                    indexfile.write(root.pack(indexformat, indexsize))
-                    self.write_count+=1
-
-            else:
-
-                record = Record(self.schema, self.format, record)
-
-                while True:
-
-                    if self.check_duplicates(page.records, record, additional):
-                        return []
-
-                    page.records.append(Record(self.schema, self.format, record.fields))
-                    page.records.sort(key=lambda x: x.fields[additional["key"]])
-
-                    if (len(page.records) > PAGE_FACTOR):
-                        record = page.records.pop()
-
-                        mainfile.seek(4 + schema_size + (page_number - 1) * data_page_size)
-                        mainfile.write(page.pack(self.REC_SIZE))
-                        self.write_count+=1
-
-                        if (page.next_page != -1):
-                            page_number = page.next_page
-                            page = DataPage.getPage(mainfile, page_number, self.format, self.REC_SIZE, self.schema,
-                                                    schema_size)
-                            self.read_count+=1
-
-                        else:
-
-                            new_page = DataPage([Record(self.schema, self.format, record.fields)])
-                            page.next_page = DataPage.getTotalPages(mainfile, data_page_size, schema_size) + 1
-
-                            mainfile.seek(0, 2)
-                            mainfile.write(new_page.pack(self.REC_SIZE))
-                            self.write_count+=1
-
-                            mainfile.seek(4 + schema_size + (page_number - 1) * data_page_size)
-                            mainfile.write(page.pack(self.REC_SIZE))
-                            self.write_count+=1
-
-                            break
-
-                    else:
-                        mainfile.seek(4 + schema_size + (page_number - 1) * data_page_size)
-                        mainfile.write(page.pack(self.REC_SIZE))
-                        self.write_count+=1
-                        break
-
-        return [record]
-
+    @_locked
     def insert(self, record: dict, additional: dict):
+        if not self.is_built():
+            return self.build([record], additional)
+
         if self.additional_check(record, additional):
             return []
 
-        indexformat, indexsize, index_page_size, data_page_size = self.get_metrics(additional)
-
         if "delete" in record:
             del record["delete"]
 
-        with open(self.index_filename, "r+b") as indexfile:
-
-            root = IndexPage.getPage(indexfile, 1, indexformat, indexsize)
-            self.read_count+=1
-
-            leaf_page = 0
-
-            for i in range(len(root.indexes)):
-
-                if record[additional["key"]] <= root.indexes[i].key:
-                    leaf_page = root.indexes[i].page
-                    break
-
-            if (leaf_page == 0):
-                leaf_page = root.indexes[len(root.indexes) - 1].page
-                root.indexes[len(root.indexes) - 1].key = record[additional["key"]]
-                indexfile.seek(0)
-                indexfile.write(root.pack(indexformat, indexsize))
-                self.write_count+=1
-
-            leaf = IndexPage.getPage(indexfile, leaf_page, indexformat, indexsize)
-            self.read_count+=1
-
-            data_page = 0
-
-            for i in range(len(leaf.indexes)):
-                if record[additional["key"]] <= leaf.indexes[i].key:
-                    data_page = leaf.indexes[i].page
-
-            if (data_page == 0):
-                data_page = leaf.indexes[len(leaf.indexes) - 1].page
-                leaf.indexes[len(leaf.indexes) - 1].key = record[additional["key"]]
-                indexfile.seek((leaf_page - 1) * index_page_size)
-                indexfile.write(leaf.pack(indexformat, indexsize))
-                self.write_count+=1
+        key = additional["key"]
+        new_record = Record(self.schema, self.format, record)
+        new_record.fields["deleted"] = False
 
-            with open(self.filename, "r+b") as mainfile:
-                return self.insert_on_page(record, additional, mainfile, indexfile, leaf, root, leaf_page, data_page,
-                                           indexformat, indexsize, index_page_size, data_page_size)
-
-    def build(self, records: list, additional: dict):
-        records = self.remove_duplicates(records, additional["unique"])
-
-        if len(records) == 0 or os.path.getsize(self.index_filename) > 0:
-            return []
-
-        records.sort(key=lambda x: x.get(additional["key"], 0))
-
-        all_keys = [record.get(additional["key"], 0) for record in records]
-
-        middle_idx = len(all_keys) // 2
-        root = all_keys[middle_idx]
-
-        indexformat, indexsize, _, _ = self.get_metrics(additional)
-
-        root_index = IndexPage([Index(root, 2), Index(all_keys[len(all_keys) - 1], 3)])
-        left_index = IndexPage([Index(root, 1)])
-        right_index = IndexPage([Index(all_keys[len(all_keys) - 1], 2)])
-
-        with open(self.index_filename, "r+b") as indexfile:
-            indexfile.write(root_index.pack(indexformat, indexsize))
-            indexfile.write(left_index.pack(indexformat, indexsize))
-            indexfile.write(right_index.pack(indexformat, indexsize))
-
-            self.write_count+=3
-
-        with open(self.filename, "r+b") as datafile:
-            schema_size = struct.unpack("I", datafile.read(4))[0]
-            self.read_count+=1
-
-            datafile.seek(4 + schema_size)
-
-            Page = DataPage([])
-
-            datafile.write(Page.pack(self.REC_SIZE))
-            datafile.write(Page.pack(self.REC_SIZE))
-
-            self.write_count+=2
-
-        ret_records = []
-
-        for record in records:
-            ret_records.extend(self.insert(record, additional))
-
-        return ret_records
-
-    def search_on_page(self, additional, mainfile, page_number):
-        mainfile.seek(0)
-        schema_size = struct.unpack("I", mainfile.read(4))[0]
-        self.read_count+=1
-
-        page = DataPage.getPage(mainfile, page_number, self.format, self.REC_SIZE, self.schema, schema_size)
-        self.read_count+=1
-
-        records = []
-
-        while True:
-
-            if len(page.records) == 0:
-                break
-
-            for record in page.records:
+        with open(self.index_filename, "rb") as indexfile:
+            page_number = self._descend(indexfile, record[key], additional, right=True)
 
-                if record.fields[additional["key"]] > additional["value"]:
-                    return records
-
-                if record.fields[additional["key"]] == additional["value"]:
-                    del record.fields["deleted"]
-                    records.append(record.fields)
-
-                    if additional["unique"]:
-                        return records
-
-            if (page.next_page != -1):
-                page = DataPage.getPage(mainfile, page.next_page, self.format, self.REC_SIZE, self.schema, schema_size)
-                self.read_count+=1
+        with open(self.filename, "r+b") as mainfile:
+            schema_size = self._schema_size(mainfile)
+            self.read_count += 1
 
+            # recorre la página estática y su cadena: duplicados + primer hueco
+            target = None
+            last_number, last_page = None, None
+            for number, page in self._chain(mainfile, page_number, schema_size):
+                if self.check_duplicates(page.records, new_record, additional):
+                    return []
+                if target is None and len(page.records) < self.PAGE_FACTOR:
+                    target = (number, page)
+                last_number, last_page = number, page
+
+            if target is not None:
+                number, page = target
+                page.records.append(new_record)
+                page.records.sort(key=lambda x: x.fields[key])
+                self._write_data_page(mainfile, number, page, schema_size)
             else:
-                break
+                # página de overflow nueva al final del archivo, enlazada a la cadena
+                new_number = self._append_data_page(mainfile, DataPage([new_record]), schema_size)
+                last_page.next_page = new_number
+                self._write_data_page(mainfile, last_number, last_page, schema_size)
 
-        return records
+        out = dict(new_record.fields)
+        del out["deleted"]
+        return [out]
+
+    # ------------------------------ search ------------------------------ #
 
     def search_by_index(self, additional: dict):
-        indexformat, indexsize, _, _ = self.get_metrics(additional)
+        key, value, unique = additional["key"], additional["value"], additional["unique"]
+        records = []
 
-        with open(self.index_filename, "r+b") as indexfile:
-            root = IndexPage.getPage(indexfile, 1, indexformat, indexsize)
+        with open(self.index_filename, "rb") as indexfile, open(self.filename, "rb") as mainfile:
+            schema_size = self._schema_size(mainfile)
             self.read_count += 1
 
-            # localizar leaf
-            leaf_page = 0
-            for i in range(len(root.indexes)):
-                if additional["value"] <= root.indexes[i].key:
-                    leaf_page = root.indexes[i].page
-                    break
-            if leaf_page == 0:
-                leaf_page = root.indexes[-1].page
+            for static_page in self._key_pages(indexfile, value, value, additional, unique):
+                for _, page in self._chain(mainfile, static_page, schema_size):
+                    for record in page.records:
+                        if record.fields[key] == value:
+                            del record.fields["deleted"]
+                            records.append(record.fields)
+                            if unique:
+                                return records
 
-            leaf = IndexPage.getPage(indexfile, leaf_page, indexformat, indexsize)
-            self.read_count += 1
+        return records
 
-            # localizar data_page candidata dentro del leaf y recordar índice
-            data_page = 0
-            leaf_idx = -1
-            for i in range(len(leaf.indexes)):
-                if additional["value"] <= leaf.indexes[i].key:
-                    data_page = leaf.indexes[i].page
-                    leaf_idx = i
-                    break
-            if data_page == 0:
-                data_page = leaf.indexes[-1].page
-                leaf_idx = len(leaf.indexes) - 1
-
-            # intento normal
-            with open(self.filename, "r+b") as mainfile:
-                out = self.search_on_page(additional, mainfile, data_page)
-                if out:
-                    return out
-
-                # 🔁 Fallback robusto: busca en páginas vecinas del MISMO leaf
-                # (hacia atrás y hacia adelante). Corrige desalineaciones límite.
-                # hacia atrás
-                for j in range(leaf_idx - 1, -1, -1):
-                    out = self.search_on_page(additional, mainfile, leaf.indexes[j].page)
-                    if out:
-                        return out
-                # hacia adelante
-                for j in range(leaf_idx + 1, len(leaf.indexes)):
-                    out = self.search_on_page(additional, mainfile, leaf.indexes[j].page)
-                    if out:
-                        return out
-
-        return []
+    def _scan(self, mainfile, schema_size):
+        """Recorre todas las páginas (estáticas y overflow) en orden físico."""
+        data_page_size = DataPage.page_size(self.REC_SIZE, self.PAGE_FACTOR)
+        total = DataPage.getTotalPages(mainfile, data_page_size, schema_size)
+        for i in range(1, total + 1):
+            yield i, self._read_data_page(mainfile, i, schema_size)
 
     def search_seq(self, additional: dict):
 
-        with open(self.filename, "r+b") as mainfile:
-            mainfile.seek(0, 2)
-            end = mainfile.tell()
-
-            mainfile.seek(0)
-            schema_size = struct.unpack("I", mainfile.read(4))[0]
+        with open(self.filename, "rb") as mainfile:
+            schema_size = self._schema_size(mainfile)
             self.read_count+=1
 
-            mainfile.seek(4 + schema_size)
-
             records = []
 
-            i = 1
-            while (end != mainfile.tell()):
-                page = DataPage.getPage(mainfile, i, self.format, self.REC_SIZE, self.schema, schema_size)
-                self.read_count+=1
+            for _, page in self._scan(mainfile, schema_size):
 
                 for record in page.records:
 
@@ -591,104 +560,43 @@ class IsamFile:
 
                         if additional["unique"]:
                             return records
-                i += 1
 
             return records
 
+    @_locked
     def search(self, additional: dict, same_key: bool):
         if (same_key):
             return self.search_by_index(additional)
         else:
             return self.search_seq(additional)
 
-    def search_on_page_range(self, additional, mainfile, page_number):
-        mainfile.seek(0)
-        schema_size = struct.unpack("I", mainfile.read(4))[0]
-        self.read_count+=1
-
-        page = DataPage.getPage(mainfile, page_number, self.format, self.REC_SIZE, self.schema, schema_size)
-        self.read_count+=1
-
-        records = []
-
-        while True:
-
-            if len(page.records) == 0:
-                break
-
-            for record in page.records:
-
-                if additional["min"] <= record.fields[additional["key"]] <= additional["max"]:
-                    del record.fields["deleted"]
-                    records.append(record.fields)
-
-                if record.fields[additional["key"]] >= additional["max"]:
-                    return records
-
-            if (page.next_page != -1):
-                page = DataPage.getPage(mainfile, page.next_page, self.format, self.REC_SIZE, self.schema, schema_size)
-                self.read_count+=1
-
-            else:
-                break
-
-        return records
-
     def search_range_by_index(self, additional):
-
-        indexformat, indexsize, _, _ = self.get_metrics(additional)
-
+        key, lo, hi = additional["key"], additional["min"], additional["max"]
         records = []
 
-        with open(self.index_filename, "r+b") as indexfile:
-
-            with open(self.filename, "r+b") as mainfile:
-
-                root = IndexPage.getPage(indexfile, 1, indexformat, indexsize)
-                self.read_count+=1
-
-                for i in range(len(root.indexes)):
-
-                    if additional["min"] <= root.indexes[i].key or additional["max"] <= root.indexes[i].key:
-
-                        leaf_page = root.indexes[i].page
-
-                        leaf = IndexPage.getPage(indexfile, leaf_page, indexformat, indexsize)
-                        self.read_count+=1
-
-                        for j in range(len(leaf.indexes)):
-
-                            if additional["min"] <= leaf.indexes[j].key or additional["max"] <= leaf.indexes[j].key:
-                                data_page = leaf.indexes[j].page
-
-                                records.extend(self.search_on_page_range(additional, mainfile, data_page))
-
-                            if additional["min"] <= leaf.indexes[j].key and additional["max"] <= leaf.indexes[j].key:
-                                break
+        with open(self.index_filename, "rb") as indexfile, open(self.filename, "rb") as mainfile:
+            schema_size = self._schema_size(mainfile)
+            self.read_count += 1
 
-                    if additional["min"] <= root.indexes[i].key and additional["max"] <= root.indexes[i].key:
-                        break
+            for static_page in self._key_pages(indexfile, lo, hi, additional, False):
+                for _, page in self._chain(mainfile, static_page, schema_size):
+                    for record in page.records:
+                        if lo <= record.fields[key] <= hi:
+                            del record.fields["deleted"]
+                            records.append(record.fields)
 
+        records.sort(key=lambda r: r[key])
         return records
 
     def search_range_seq(self, additional):
 
-        with open(self.filename, "r+b") as mainfile:
-            mainfile.seek(0, 2)
-            end = mainfile.tell()
-
-            mainfile.seek(0)
-            schema_size = struct.unpack("I", mainfile.read(4))[0]
+        with open(self.filename, "rb") as mainfile:
+            schema_size = self._schema_size(mainfile)
             self.read_count+=1
 
-            mainfile.seek(4 + schema_size)
-
             records = []
 
-            i = 1
-            while (end != mainfile.tell()):
-                page = DataPage.getPage(mainfile, i, self.format, self.REC_SIZE, self.schema, schema_size)
-                self.read_count+=1
+            for _, page in self._scan(mainfile, schema_size):
 
                 for record in page.records:
 
@@ -696,10 +604,9 @@ class IsamFile:
                         del record.fields["deleted"]
                         records.append(record.fields)
 
-                i += 1
-
             return records
 
+    @_locked
     def range_search(self, additional: dict, same_key: bool):
 
         if (same_key):
@@ -707,205 +614,209 @@ class IsamFile:
         else:
             return self.search_range_seq(additional)
 
-    def rest_list(self, additional, mainfile, page: DataPage, page_number, data_page_size, schema_size):
-
-        repeat = False
-
-        while True:
-
-            if (page.next_page == -1):
-                mainfile.seek(4 + schema_size + (page_number - 1) * data_page_size)
-                mainfile.write(page.pack(self.REC_SIZE))
-                self.write_count+=1
-                break
+    # ------------------------------ remove ------------------------------ #
 
-            next_page = DataPage.getPage(mainfile, page.next_page, self.format, self.REC_SIZE, self.schema, schema_size)
-            self.read_count+=1
-
-            if len(next_page.records) == 0:
-                mainfile.seek(4 + schema_size + (page_number - 1) * data_page_size)
-                mainfile.write(page.pack(self.REC_SIZE))
-                self.write_count+=1
-                break
-
-            if next_page.records[0].fields[additional["key"]] == additional["value"]:
-                repeat = True
-
-            temp_record = next_page.records.pop(0)
-
-            page.records.append(temp_record)
-
-            mainfile.seek(4 + schema_size + (page_number - 1) * data_page_size)
-            mainfile.write(page.pack(self.REC_SIZE))
-            self.write_count+=1
-
-            page_number = page.next_page
-            page = next_page
-
-        return repeat
+    def _remove_from_pages(self, mainfile, schema_size, pages, additional):
+        records = []
+        for number, page in pages:
+            kept = []
+            for record in page.records:
+                if record.fields[additional["key"]] == additional["value"] and \
+                        not (additional["unique"] and records):
+                    del record.fields["deleted"]
+                    records.append(record.fields)
+                else:
+                    kept.append(record)
+            if len(kept) != len(page.records):
+                page.records = kept
+                self._write_data_page(mainfile, number, page, schema_size)
+                if additional["unique"]:
+                    break
+        return records
 
     def remove_seq(self, additional: dict):
 
-        _, _, _, data_page_size = self.get_metrics(additional)
-
         with open(self.filename, "r+b") as mainfile:
-            mainfile.seek(0, 2)
-            end = mainfile.tell()
-
-            mainfile.seek(0)
-            schema_size = struct.unpack("I", mainfile.read(4))[0]
+            schema_size = self._schema_size(mainfile)
             self.read_count+=1
 
-            mainfile.seek(4 + schema_size)
-
-            records = []
-
-            i = 1
-            while (end != mainfile.tell()):
-                repeat = False
-
-                page = DataPage.getPage(mainfile, i, self.format, self.REC_SIZE, self.schema, schema_size)
-                self.read_count+=1
-
-                for j in range(len(page.records)):
-
-                    if page.records[j].fields[additional["key"]] == additional["value"]:
-                        temp_record = page.records.pop(j)
-                        records.append(temp_record.fields)
-                        repeat = self.rest_list(additional, mainfile, page, i, data_page_size, schema_size)
-                        break
-
-                if not repeat:
-                    i += 1
-
-                if additional["unique"]:
-                    break
-
-            return records
+            return self._remove_from_pages(mainfile, schema_size, self._scan(mainfile, schema_size), additional)
 
     def remove_index(self, additional: dict):
-        indexformat, indexsize, _, data_page_size = self.get_metrics(additional)
+        value = additional["value"]
         records = []
 
-        with open(self.index_filename, "r+b") as indexfile:
-
-            root = IndexPage.getPage(indexfile, 1, indexformat, indexsize)
-            self.read_count+=1
-
-            leaf_page = 0
-
-            for i in range(len(root.indexes)):
-
-                if additional["value"] <= root.indexes[i].key:
-                    leaf_page = root.indexes[i].page
-                    break
-
-            if (leaf_page == 0):
-                return records
-
-            leaf = IndexPage.getPage(indexfile, leaf_page, indexformat, indexsize)
-            self.read_count+=1
-
-            data_page = 0
+        with open(self.index_filename, "rb") as indexfile, open(self.filename, "r+b") as mainfile:
+            schema_size = self._schema_size(mainfile)
+            self.read_count += 1
 
-            for i in range(len(leaf.indexes)):
-                if additional["value"] <= leaf.indexes[i].key:
-                    data_page = leaf.indexes[i].page
+            for static_page in self._key_pages(indexfile, value, value, additional, additional["unique"]):
+                records.extend(self._remove_from_pages(
+                    mainfile, schema_size, list(self._chain(mainfile, static_page, schema_size)), additional))
+                if records and additional["unique"]:
                     break
 
-            if (data_page == 0):
-                return records
-
-            with open(self.filename, "r+b") as mainfile:
-
-                mainfile.seek(0)
-                schema_size = struct.unpack("I", mainfile.read(4))[0]
-
-                page = DataPage.getPage(mainfile, data_page, self.format, self.REC_SIZE, self.schema, schema_size)
-                self.read_count+=1
-
-                page_number = data_page
-
-                while True:
-
-                    found = False
-
-                    if len(page.records) == 0:
-                        break
-
-                    for j in range(len(page.records)):
-
-                        if page.records[j].fields[additional["key"]] == additional["value"]:
-                            found = True
-                            temp_record = page.records.pop(j)
-                            records.append(temp_record.fields)
-                            self.rest_list(additional, mainfile, page, page_number, data_page_size, schema_size)
-                            break
-
-                    if found:
-                        break
-
-                    if page.next_page == -1:
-                        break
-
-                    page_number = page.next_page
-                    page = DataPage.getPage(mainfile, page_number, self.format, self.REC_SIZE, self.schema, schema_size)
-                    self.read_count+=1
-
         return records
 
+    @_locked
     def remove(self, additional: dict, same_key: bool):
         if (same_key):
             return self.remove_index(additional)
         else:
             return self.remove_seq(additional)
-    
-
-    def get_all_on_page(self, mainfile, page_number):
-        mainfile.seek(0)
-        schema_size = struct.unpack("I", mainfile.read(4))[0]
-        self.read_count+=1
-
-        page = DataPage.getPage(mainfile, page_number, self.format, self.REC_SIZE, self.schema, schema_size)
-        self.read_count+=1
 
-        records = []
+    # ------------------------------ get_all ------------------------------ #
 
-        while True:
+    @_locked
+    def get_all(self, where=None):
+        """Registros en orden de clave; 'where' (Predicate) filtra sobre los registros de cada página."""
+        with open(self.filename, "rb") as mainfile:
+            return list(self._iter_pages(mainfile, self.data_pages, where))
 
-            if len(page.records) == 0:
-                break
+    def _snapshot(self):
+        """
+        Header y archivo de datos de la misma versión, tomados juntos bajo el lock. Los
+        recorridos siguen sin el lock sobre ese descriptor: si un REORGANIZE concurrente
+        reemplaza los archivos (os.replace), el descriptor abierto sigue apuntando a los
+        viejos, así que el recorrido ve la tabla tal como estaba al empezar.
+        """
+        with self.lock:
+            self._read_header()
+            return open(self.filename, "rb"), self.data_pages
 
-            for record in page.records:
+    def iter_all(self, where=None):
+        """Como get_all, pero de a un registro, sobre la versión de la tabla al empezar (_snapshot)."""
+        mainfile, data_pages = self._snapshot()
+        with mainfile:
+            yield from self._iter_pages(mainfile, data_pages, where)
 
-                del record.fields["deleted"]
-                records.append(record.fields)
+    def iter_sorted(self, key: str, where=None):
+        """
+        Como iter_all, pero estrictamente ordenado por 'key' (la clave del ISAM): cada página
+        estática cubre un rango de claves disjunto, así que basta ordenar en memoria su cadena
+        de overflow (una cadena a la vez). Igual que iter_all, recorre la versión al empezar.
+        """
+        mainfile, data_pages = self._snapshot()
+        with mainfile:
+            schema_size = self._schema_size(mainfile)
+            self.read_count += 1
 
-            if (page.next_page != -1):
-                page = DataPage.getPage(mainfile, page.next_page, self.format, self.REC_SIZE, self.schema, schema_size)
-                self.read_count+=1
+            for static_page in range(1, data_pages + 1):
+                chain = []
+                for _, page in self._chain(mainfile, static_page, schema_size):
+                    for record in page.records:
+                        if where is None or where(record.fields):
+                            del record.fields["deleted"]
+                            chain.append(record.fields)
+                chain.sort(key=lambda fields: fields[key])
+                yield from chain
+
+    @_locked
+    def edge(self, key: str, last: bool = False):
+        """
+        Registro con la menor (o mayor) clave: la primera (última) página estática con registros y
+        su cadena de overflow; las cadenas cubren rangos disjuntos. None si está vacío.
+        """
+        with open(self.filename, "rb") as mainfile:
+            schema_size = self._schema_size(mainfile)
+            self.read_count += 1
 
-            else:
-                break
+            order = range(self.data_pages, 0, -1) if last else range(1, self.data_pages + 1)
+            for static_page in order:
+                chain = [record.fields for _, page in self._chain(mainfile, static_page, schema_size)
+                         for record in page.records]
+                if chain:
+                    fields = (max if last else min)(chain, key=lambda f: f[key])
+                    del fields["deleted"]
+                    return fields
+        return None
+
+    def _iter_pages(self, mainfile, data_pages, where=None):
+        schema_size = self._schema_size(mainfile)
+        self.read_count+=1
 
-        return records
+        # páginas estáticas en orden de clave, cada una seguida de su cadena de overflow
+        for static_page in range(1, data_pages + 1):
+            for _, page in self._chain(mainfile, static_page, schema_size):
+                for record in page.records:
+                    if where is not None and not where(record.fields):
+                        continue
+                    del record.fields["deleted"]
+                    yield record.fields
 
+    # ------------------------------ stats / reorganize ------------------------------ #
 
-    def get_all(self):
+    @_locked
+    def stats(self):
+        """
+        Estado de las cadenas de overflow: largo de cada cadena = páginas
+        enlazadas detrás de su página estática.
+        """
+        chains = []
+        records = 0
 
-        records = []
+        with open(self.filename, "rb") as mainfile:
+            schema_size = self._schema_size(mainfile)
+            self.read_count += 1
 
-        with open(self.filename, "r+b") as mainfile:
+            data_page_size = DataPage.page_size(self.REC_SIZE, self.PAGE_FACTOR)
+            total = DataPage.getTotalPages(mainfile, data_page_size, schema_size)
+
+            for static_page in range(1, self.data_pages + 1):
+                length = -1
+                for _, page in self._chain(mainfile, static_page, schema_size):
+                    length += 1
+                    records += len(page.records)
+                chains.append(length)
+
+        overflow = total - self.data_pages
+        return {
+            "page_size": self.page_size,
+            "page_factor": self.PAGE_FACTOR,
+            "levels": self.levels,
+            "records": records,
+            "static_pages": self.data_pages,
+            "overflow_pages": overflow,
+            "overflow_pct": round(100.0 * overflow / total, 2) if total else 0.0,
+            "avg_chain": round(sum(chains) / len(chains), 3) if chains else 0.0,
+            "max_chain": max(chains) if chains else 0,
+            "fill": round(records / (total * self.PAGE_FACTOR), 3) if total else 0.0,
+        }
+
+    @_locked
+    def reorganize(self, additional: dict):
+        """
+        Reconstruye el ISAM desde sus registros vivos en archivos temporales
+        (build() sobre un IsamFile nuevo con el mismo page_size) y los pone en
+        lugar de los actuales con os.replace. Todo ocurre bajo el lock del
+        archivo, así que lecturas y escrituras concurrentes esperan al swap.
+        """
+        before = self.stats()
+        records = self.get_all()
 
+        tmp_filename = self.filename.replace(".dat", "_reorg.dat")
+        with open(self.filename, "rb") as mainfile:
+            schema_size = self._schema_size(mainfile)
             mainfile.seek(0)
-            schema_size = struct.unpack("I", mainfile.read(4))[0]
-            self.read_count+=1
-            
-            page_size = DataPage.HEADER_SIZE + (self.REC_SIZE * PAGE_FACTOR)
-
-            number_pages = DataPage.getTotalPages(mainfile,page_size,schema_size)
+            header = mainfile.read(4 + schema_size)
+            self.read_count += 1
 
-            for page_number in range(1, number_pages+1):
-                records.extend(self.get_all_on_page(mainfile, page_number))
-        
-        return records
\ No newline at end of file
+        with open(tmp_filename, "wb") as tmpfile:
+            tmpfile.write(header)
+        tmp_index = tmp_filename.replace(".dat", "_index.dat")
+        if os.path.exists(tmp_index):
+            os.remove(tmp_index)
+
+        TmpFile = IsamFile(tmp_filename, page_size=self.page_size)
+        TmpFile.build(records, additional)
+        self.read_count += TmpFile.read_count
+        self.write_count += TmpFile.write_count
+
+        # cada os.replace es atómico; el lock evita que otro hilo vea el par a medias
+        os.replace(TmpFile.index_filename, self.index_filename)
+        os.replace(tmp_filename, self.filename)
+        if os.path.exists(TmpFile.delete_filename):
+            os.remove(TmpFile.delete_filename)
+
+        self._read_header()
+        return {"before": before, "after": self.stats()}
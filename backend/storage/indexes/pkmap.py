@@ -0,0 +1,204 @@
+"""
+Mapa de surrogates PK <-> int para índices que solo guardan enteros (R-Tree con PK no entera).
+
+Archivos (base = <tabla>_rtree_<col>):
+- <base>.map       log append-only de claves: [len:u16][clave utf-8]...; el surrogate es la posición (1..n)
+- <base>.map.off   offset (u64) de cada clave en el log: sid -> clave en O(1) sin cargar nada
+- <base>.map.hash  tabla hash con direccionamiento abierto (mmap): clave -> sid en O(1) esperado
+
+Agregar una clave cuesta un append al log, uno al .off y un slot en el hash; el hash se
+duplica al pasar la mitad de ocupación (amortizado O(1)). El formato JSON anterior
+(<base>.map.json) se migra la primera vez que se abre el mapa.
+"""
+import hashlib, json, mmap, os, struct
+
+HASH_MAGIC = b"PKH1"
+HASH_HDR = "<4sQQ"                # magic, capacidad (potencia de 2), cantidad
+HASH_HDR_SIZE = struct.calcsize(HASH_HDR)
+SLOT = "<Q"                       # (huella:u32 << 32) | sid:u32 ; 0 = vacío
+SLOT_SIZE = struct.calcsize(SLOT)
+MIN_CAPACITY = 1024
+MAX_LOAD = 0.5
+
+_MAPS = {}  # abspath(base) -> PkMap (una instancia por proceso: un solo dueño del hash)
+
+
+def _hash(key: bytes) -> int:
+    h = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+    return (h >> 32) or 1         # huella no nula: 0 marca slot vacío
+
+
+def open_pkmap(base: str) -> "PkMap":
+    """PkMap compartido para 'base'. Si el log fue borrado (DROP / backfill) se reabre limpio."""
+    key = os.path.abspath(base)
+    pm = _MAPS.get(key)
+    if pm is not None and not pm.alive():
+        pm.close()
+        pm = None
+    if pm is None:
+        pm = _MAPS[key] = PkMap(key)
+    return pm
+
+
+def remove_pkmap(base: str):
+    """Borra los archivos del mapa (incluido el JSON antiguo) y la instancia compartida."""
+    pm = _MAPS.pop(os.path.abspath(base), None)
+    if pm is not None:
+        pm.close()
+    for suffix in (".map", ".map.off", ".map.hash", ".map.json"):
+        try:
+            os.remove(base + suffix)
+        except FileNotFoundError:
+            pass
+
+
+class PkMap:
+    def __init__(self, base: str):
+        self.base = base
+        self.log_path = base + ".map"
+        self.off_path = base + ".map.off"
+        self.hash_path = base + ".map.hash"
+        self.json_path = base + ".map.json"
+
+        legacy = os.path.exists(self.json_path) and not os.path.exists(self.log_path)
+        os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+        self._log = os.open(self.log_path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._off = os.open(self.off_path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._ino = os.fstat(self._log).st_ino
+        self.count = os.fstat(self._off).st_size // 8
+        self._mm = None
+        self._hf = None
+        self._open_hash()
+        if legacy:
+            self._migrate_json()
+
+    # ---------- ciclo de vida ----------
+    def alive(self) -> bool:
+        try:
+            return os.stat(self.log_path).st_ino == self._ino
+        except FileNotFoundError:
+            return False
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.flush(); self._mm.close(); self._mm = None
+        if self._hf is not None:
+            self._hf.close(); self._hf = None
+        for fd in (self._log, self._off):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._log = self._off = -1
+
+    def __len__(self):
+        return self.count
+
+    # ---------- hash ----------
+    def _open_hash(self):
+        ok = False
+        if os.path.exists(self.hash_path) and os.path.getsize(self.hash_path) > HASH_HDR_SIZE:
+            self._hf = open(self.hash_path, "r+b")
+            self._mm = mmap.mmap(self._hf.fileno(), 0)
+            magic, cap, n = struct.unpack_from(HASH_HDR, self._mm, 0)
+            ok = (magic == HASH_MAGIC and n == self.count
+                  and len(self._mm) == HASH_HDR_SIZE + cap * SLOT_SIZE)
+            if ok:
+                self.capacity = cap
+        if not ok:
+            # hash ausente o desfasado del log (p. ej. corte a medio append): se reconstruye
+            self._rebuild(max(MIN_CAPACITY, self._capacity_for(self.count)))
+
+    @staticmethod
+    def _capacity_for(n: int) -> int:
+        cap = MIN_CAPACITY
+        while n + 1 > cap * MAX_LOAD:
+            cap *= 2
+        return cap
+
+    def _rebuild(self, capacity: int):
+        """Escribe un hash nuevo de 'capacity' slots con todas las claves del log y lo reemplaza."""
+        slots = bytearray(capacity * SLOT_SIZE)
+        mask = capacity - 1
+        for sid in range(1, self.count + 1):
+            h = _hash(self._key_bytes(sid))
+            i = h & mask
+            while struct.unpack_from(SLOT, slots, i * SLOT_SIZE)[0]:
+                i = (i + 1) & mask
+            struct.pack_into(SLOT, slots, i * SLOT_SIZE, (h << 32) | sid)
+        tmp = self.hash_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(struct.pack(HASH_HDR, HASH_MAGIC, capacity, self.count))
+            f.write(slots)
+        if self._mm is not None:
+            self._mm.close(); self._hf.close()
+        os.replace(tmp, self.hash_path)
+        self._hf = open(self.hash_path, "r+b")
+        self._mm = mmap.mmap(self._hf.fileno(), 0)
+        self.capacity = capacity
+
+    def _probe(self, key: bytes):
+        """(sid, None) si la clave existe; (0, slot_libre) si no."""
+        h = _hash(key)
+        mask = self.capacity - 1
+        i = h & mask
+        while True:
+            at = HASH_HDR_SIZE + i * SLOT_SIZE
+            v, = struct.unpack_from(SLOT, self._mm, at)
+            if not v:
+                return 0, at
+            if v >> 32 == h:
+                sid = v & 0xFFFFFFFF
+                if self._key_bytes(sid) == key:
+                    return sid, None
+            i = (i + 1) & mask
+
+    # ---------- log ----------
+    def _key_bytes(self, sid: int) -> bytes:
+        off, = struct.unpack("<Q", os.pread(self._off, 8, (sid - 1) * 8))
+        n, = struct.unpack("<H", os.pread(self._log, 2, off))
+        return os.pread(self._log, n, off + 2)
+
+    def _append(self, key: bytes) -> int:
+        if len(key) > 0xFFFF:
+            raise ValueError("PkMap: clave demasiado larga (> 65535 bytes)")
+        if self.count + 1 > self.capacity * MAX_LOAD:
+            self._rebuild(self.capacity * 2)
+        off = os.lseek(self._log, 0, os.SEEK_END)
+        os.write(self._log, struct.pack("<H", len(key)) + key)
+        os.pwrite(self._off, struct.pack("<Q", off), self.count * 8)
+        self.count += 1
+        _, slot = self._probe(key)
+        if slot is not None:  # None solo para huecos repetidos de la migración
+            struct.pack_into(SLOT, self._mm, slot, (_hash(key) << 32) | self.count)
+        struct.pack_into(HASH_HDR, self._mm, 0, HASH_MAGIC, self.capacity, self.count)
+        return self.count
+
+    def _migrate_json(self):
+        """Carga <base>.map.json (formato anterior) conservando los sids y lo elimina."""
+        try:
+            with open(self.json_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            i2p = {int(k): v for k, v in (data.get("i2p") or {}).items()}
+        except Exception:
+            i2p = {}  # mapa corrupto: se empieza de cero (no afecta PKs numéricas)
+        for sid in range(1, max(i2p, default=0) + 1):
+            # huecos (no deberían existir) quedan como clave vacía: nunca coincide con json.dumps
+            self._append(i2p.get(sid, "").encode("utf-8"))
+        os.remove(self.json_path)
+
+    # ---------- API ----------
+    def lookup(self, key: str) -> int:
+        """sid de 'key' o 0 si no está."""
+        return self._probe(key.encode("utf-8"))[0]
+
+    def get_or_add(self, key: str) -> int:
+        b = key.encode("utf-8")
+        sid, _ = self._probe(b)
+        return sid or self._append(b)
+
+    def key_of(self, sid: int):
+        """Clave de 'sid' o None si el sid no es un surrogate de este mapa."""
+        if 1 <= sid <= self.count:
+            return self._key_bytes(sid).decode("utf-8")
+        return None
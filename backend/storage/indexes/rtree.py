@@ -1,9 +1,13 @@
 from backend.storage.indexes.heap import HeapFile
+from backend.storage.indexes.pkmap import open_pkmap
 from dataclasses import dataclass, field
 from typing import List, Optional, Tuple
-import os, struct, io
+import os, struct, io, math
+from collections import OrderedDict
 
 DEBUG_IDX = os.getenv("BD2_DEBUG_INDEX", "0").lower() in ("1", "true", "yes")
+# Ocupación de nodos en bulk_load (STR): deja hueco para inserts posteriores sin split inmediato.
+DEFAULT_FILL = float(os.getenv("BD2_RTREE_FILL", "0.9") or 0.9)
 
 MBR = Tuple[float, float, float, float]
 RID = Tuple[int, int]
@@ -31,10 +35,23 @@ class Node:
         return len(self.entries) >= self.M
 
 
+# VACUUM INDEX reconstruye si la fracción de páginas muertas o la ocupación cruzan estos umbrales.
+VACUUM_DEAD = float(os.getenv("BD2_RTREE_VACUUM_DEAD", "0.3") or 0.3)
+VACUUM_FILL = float(os.getenv("BD2_RTREE_VACUUM_FILL", "0.4") or 0.4)
+
+# Variantes de inserción: 'linear' (split lineal + mínima ampliación) o 'rstar' (R*-tree).
+VARIANTS = ("linear", "rstar")
+# R*: fracción de entradas reinsertadas al desbordar un nivel por primera vez en un insert.
+RSTAR_REINSERT = 0.3
+
+
 class RTreeFile:
-    def __init__(self, filename: str, M: int = 32):
+    def __init__(self, filename: str, M: int = 32, variant: str = "linear"):
         self.store = Storage(filename, M=M)
         self.opened = False
+        self.variant = (variant or "linear").lower()
+        if self.variant not in VARIANTS:
+            raise ValueError(f"RTreeFile: variante desconocida {variant!r} (usa {', '.join(VARIANTS)})")
 
     # ---------- lifecycle ----------
     def open(self):
@@ -86,15 +103,13 @@ class RTreeFile:
         ys = [(e.mbr[2], e.mbr[3]) for e in entries]
         span_x = (max(b for _, b in xs) - min(a for a, _ in xs))
         span_y = (max(b for _, b in ys) - min(a for a, _ in ys))
-        if span_x >= span_y:
-            left = min(entries, key=lambda e: e.mbr[0])
-            right = max(entries, key=lambda e: e.mbr[1])
-        else:
-            left = min(entries, key=lambda e: e.mbr[2])
-            right = max(entries, key=lambda e: e.mbr[3])
-        g1 = [left]; g2 = [right] if right is not left else []
+        lo, hi = (0, 1) if span_x >= span_y else (2, 3)
+        left = min(entries, key=lambda e: e.mbr[lo])
+        # la semilla derecha debe ser otra entrada (un MBR puede ser a la vez el mínimo y el máximo)
+        right = max((e for e in entries if e is not left), key=lambda e: e.mbr[hi])
+        g1 = [left]; g2 = [right]
         for e in entries:
-            if e in (left, right): continue
+            if e is left or e is right: continue
             enl1 = enlargement(self._cover(g1), e.mbr)
             enl2 = enlargement(self._cover(g2), e.mbr)
             if enl1 <= enl2: g1.append(e)
@@ -133,21 +148,20 @@ class RTreeFile:
             self._adjust_tree_after_split(path, parent, new_parent)
         else:
             self.store.write_node(old); self.store.write_node(new); self.store.write_node(parent)
+            # el padre absorbió el split: ampliar MBRs del resto del camino
+            node = parent
+            while path:
+                pid, anc = path.pop()
+                for i, pe in enumerate(anc.entries):
+                    if pe.child == node.page_id:
+                        anc.entries[i].mbr = node.mbr_cover()
+                        break
+                self.store.write_node(anc)
+                node = anc
 
-    # ---------- public ops ----------
-    def insert(self, record: dict, additional: dict) -> List[dict]:
-        """Inserta una entrada en el R-Tree.
-
-        Soporta dos modalidades de identificador en hojas:
-        - Primario HEAP: record['pos'] (y opcional record['slot'])
-        - Primario NO-HEAP: record['pk'] (slot=0)
-
-        La columna espacial debe venir en additional['key'].
-        """
-        self.open()
-        key = additional["key"]        # ej. "ubicacion"
+    def _leaf_entry(self, record: dict, key: str) -> Entry:
+        """Entrada de hoja para 'record': MBR desde record[key] y RID desde 'pos' (heap) o 'pk'."""
         val = record[key]
-        if DEBUG_IDX: print(f"[RTREE insert] key={key} val={val} record={record}")
         if isinstance(val, (list, tuple)) and len(val) == 2:
             m = from_point(float(val[0]), float(val[1]))
         elif isinstance(val, (list, tuple)) and len(val) == 4:
@@ -155,17 +169,6 @@ class RTreeFile:
         else:
             raise ValueError("Valor espacial inválido; esperado [x,y] o [xmin,xmax,ymin,ymax].")
 
-        # bajar hasta hoja guardando el path
-        path = []
-        cur = self.store.root
-        while True:
-            node = self.store.read_node(cur)
-            if node.is_leaf: break
-            best = min(node.entries, key=lambda e: enlargement(e.mbr, m))
-            path.append((cur, node))
-            cur = best.child
-
-        # insertar en hoja
         # Determinar identificador: posición de heap o pk (no-heap)
         if "pos" in record and record["pos"] is not None:
             pos = int(record["pos"])  # posición en heap
@@ -180,7 +183,233 @@ class RTreeFile:
         else:
             raise KeyError("pos")  # mantener compat con manejo actual en capas superiores
 
-        node.entries.append(Entry(mbr=m, rid=(pos, slot)))
+        return Entry(mbr=m, rid=(pos, slot))
+
+    def leaf_entries(self) -> List[Entry]:
+        """Todas las entradas de hoja del árbol (recorrido DFS)."""
+        self.open()
+        out: List[Entry] = []
+        stack = [self.store.root]
+        while stack:
+            node = self.store.read_node(stack.pop())
+            if node.is_leaf:
+                out.extend(node.entries)
+            else:
+                stack.extend(e.child for e in node.entries)
+        return out
+
+    # ---------- bulk load (Sort-Tile-Recursive) ----------
+    def _str_level(self, entries: List[Entry], cap: int) -> List[List[Entry]]:
+        """
+        Agrupa un nivel con STR: ordena por centro en x, corta en S = ceil(sqrt(P))
+        franjas verticales, ordena cada franja por centro en y y la parte en nodos de 'cap'.
+        """
+        pages = math.ceil(len(entries) / cap)
+        slices = math.ceil(math.sqrt(pages))
+        per_slice = slices * cap
+
+        entries = sorted(entries, key=lambda e: e.mbr[0] + e.mbr[1])
+        groups = []
+        for i in range(0, len(entries), per_slice):
+            band = sorted(entries[i: i + per_slice], key=lambda e: e.mbr[2] + e.mbr[3])
+            for j in range(0, len(band), cap):
+                groups.append(band[j: j + cap])
+        return groups
+
+    def bulk_load(self, records: List[dict], additional: dict) -> int:
+        """
+        Carga masiva STR. Las entradas ya presentes en el árbol se conservan: se
+        reempacan junto con 'records'. Hojas primero y cada nivel superior después,
+        escritos en una sola pasada secuencial (Storage.rewrite); la raíz queda al final.
+        additional: {'key': columna espacial, 'fill': ocupación opcional (0..1]}.
+        Devuelve el número de entradas cargadas.
+        """
+        self.open()
+        key = additional["key"]
+        entries = self.leaf_entries()
+        entries.extend(self._leaf_entry(rec, key) for rec in records)
+        return self._pack(entries, additional.get("fill"))
+
+    def _pack(self, entries: List[Entry], fill: float = None) -> int:
+        """Reescribe el archivo completo con un árbol STR sobre 'entries' (solo hojas)."""
+        fill = float(fill or DEFAULT_FILL)
+        cap = max(2, min(self.store.M, int(self.store.M * fill)))
+
+        nodes: List[Node] = []
+        level = entries
+        is_leaf = True
+        height = 0
+        while True:
+            groups = self._str_level(level, cap) if level else [[]]
+            parents = []
+            for group in groups:
+                node = Node(page_id=len(nodes), is_leaf=is_leaf, entries=group, M=self.store.M)
+                nodes.append(node)
+                if group:
+                    parents.append(Entry(mbr=node.mbr_cover(), child=node.page_id))
+            height += 1
+            if len(groups) == 1:
+                break
+            level = parents
+            is_leaf = False
+
+        self.store.rewrite(nodes, root=nodes[-1].page_id, height=height)
+        return len(entries)
+
+    # ---------- R*-tree ----------
+    def _choose_subtree_rstar(self, node: Node, obj_mbr: MBR, children_are_leaves: bool) -> int:
+        """
+        Hijos hoja: mínima ampliación de solapamiento con los hermanos (desempate:
+        ampliación de área, área). Niveles superiores: mínima ampliación de área.
+        """
+        best = None; best_key = None
+        for i, e in enumerate(node.entries):
+            grown = expand(e.mbr, obj_mbr)
+            enl = area(grown) - area(e.mbr)
+            if children_are_leaves:
+                ov = 0.0
+                for j, o in enumerate(node.entries):
+                    if j != i:
+                        ov += overlap(grown, o.mbr) - overlap(e.mbr, o.mbr)
+                key = (ov, enl, area(e.mbr))
+            else:
+                key = (enl, area(e.mbr))
+            if best is None or key < best_key:
+                best, best_key = i, key
+        return best
+
+    def _split_rstar(self, entries: List[Entry]):
+        """
+        Split R*: eje con menor suma de márgenes sobre todas las distribuciones
+        (ordenando por lado inferior y superior); en ese eje, la distribución con
+        menor solapamiento entre grupos (desempate: área total).
+        """
+        m = max(2, int(len(entries) * 0.4))
+        best_margin = None; best_cands = None
+        for lo, hi in ((0, 1), (2, 3)):
+            margin_sum = 0.0
+            cands = []
+            for ordered in (sorted(entries, key=lambda e: (e.mbr[lo], e.mbr[hi])),
+                            sorted(entries, key=lambda e: (e.mbr[hi], e.mbr[lo]))):
+                # covers acumulados de prefijos y sufijos
+                pre = [ordered[0].mbr]
+                for e in ordered[1:]:
+                    pre.append(expand(pre[-1], e.mbr))
+                suf = [ordered[-1].mbr]
+                for e in reversed(ordered[:-1]):
+                    suf.append(expand(suf[-1], e.mbr))
+                suf.reverse()
+                for k in range(m, len(ordered) - m + 1):
+                    b1, b2 = pre[k - 1], suf[k]
+                    margin_sum += margin(b1) + margin(b2)
+                    cands.append((overlap(b1, b2), area(b1) + area(b2), ordered, k))
+            if best_margin is None or margin_sum < best_margin:
+                best_margin, best_cands = margin_sum, cands
+        _, _, ordered, k = min(best_cands, key=lambda c: (c[0], c[1]))
+        return ordered[:k], ordered[k:]
+
+    def _rstar_insert(self, entry: Entry, level: int, reinserted: set):
+        """Inserta 'entry' en un nodo del nivel 'level' (0 = hojas) con ChooseSubtree R*."""
+        path = []  # [(parent, idx_entrada_hacia_hijo)]
+        node = self.store.read_node(self.store.root)
+        node_level = self.store.height - 1
+        while node_level > level:
+            i = self._choose_subtree_rstar(node, entry.mbr, node_level - 1 == 0)
+            path.append((node, i))
+            node = self.store.read_node(node.entries[i].child)
+            node_level -= 1
+        node.entries.append(entry)
+        self._rstar_overflow(node, node_level, path, reinserted)
+
+    def _rstar_write_up(self, node: Node, path: list):
+        self.store.write_node(node)
+        while path:
+            parent, i = path.pop()
+            parent.entries[i].mbr = node.mbr_cover()
+            self.store.write_node(parent)
+            node = parent
+
+    def _rstar_overflow(self, node: Node, level: int, path: list, reinserted: set):
+        """
+        OverflowTreatment: la primera vez que se desborda un nivel (no raíz) durante
+        un insert se reinsertan las entradas más lejanas al centro del nodo; si no, split.
+        """
+        M = self.store.M
+        while len(node.entries) > M:
+            if path and level not in reinserted:
+                reinserted.add(level)
+                c = node.mbr_cover()
+                cx, cy = (c[0] + c[1]) / 2.0, (c[2] + c[3]) / 2.0
+                node.entries.sort(key=lambda e: ((e.mbr[0] + e.mbr[1]) / 2.0 - cx) ** 2 +
+                                                ((e.mbr[2] + e.mbr[3]) / 2.0 - cy) ** 2,
+                                  reverse=True)
+                p = max(1, int(M * RSTAR_REINSERT))
+                removed, node.entries = node.entries[:p], node.entries[p:]
+                self._rstar_write_up(node, path)
+                # close reinsert: primero las más cercanas
+                for e in reversed(removed):
+                    self._rstar_insert(e, level, reinserted)
+                return
+
+            g1, g2 = self._split_rstar(node.entries)
+            node.entries = g1
+            new = Node(page_id=self.store.alloc_page(), is_leaf=node.is_leaf, entries=g2, M=M)
+            if not path:
+                root = Node(page_id=self.store.alloc_page(), is_leaf=False, M=M)
+                root.entries = [Entry(mbr=node.mbr_cover(), child=node.page_id),
+                                Entry(mbr=new.mbr_cover(), child=new.page_id)]
+                self.store.root = root.page_id
+                self.store.height += 1
+                self.store.write_node(node); self.store.write_node(new); self.store.write_node(root)
+                return
+            parent, i = path.pop()
+            parent.entries[i].mbr = node.mbr_cover()
+            parent.entries.append(Entry(mbr=new.mbr_cover(), child=new.page_id))
+            self.store.write_node(node); self.store.write_node(new)
+            node, level = parent, level + 1
+
+        self._rstar_write_up(node, path)
+
+    # ---------- public ops ----------
+    def insert(self, record: dict, additional: dict) -> List[dict]:
+        """Inserta una entrada en el R-Tree.
+
+        Soporta dos modalidades de identificador en hojas:
+        - Primario HEAP: record['pos'] (y opcional record['slot'])
+        - Primario NO-HEAP: record['pk'] (slot=0)
+
+        La columna espacial debe venir en additional['key'].
+        """
+        self.open()
+        key = additional["key"]        # ej. "ubicacion"
+        if DEBUG_IDX: print(f"[RTREE insert] key={key} val={record[key]} record={record}")
+        entry = self._leaf_entry(record, key)
+        self._insert_entry(entry, 0)
+        return [record]
+
+    def _insert_entry(self, entry: Entry, level: int):
+        """Inserta 'entry' en un nodo del nivel 'level' (0 = hojas) según la variante."""
+        if self.variant == "rstar":
+            self._rstar_insert(entry, level, set())
+        else:
+            self._linear_insert(entry, level)
+
+    def _linear_insert(self, entry: Entry, level: int):
+        m = entry.mbr
+        # bajar hasta el nivel pedido guardando el path
+        path = []
+        cur = self.store.root
+        node_level = self.store.height - 1
+        while True:
+            node = self.store.read_node(cur)
+            if node.is_leaf or node_level <= level: break
+            best = min(node.entries, key=lambda e: enlargement(e.mbr, m))
+            path.append((cur, node))
+            cur = best.child
+            node_level -= 1
+
+        # insertar en el nodo
+        node.entries.append(entry)
         if len(node.entries) <= self.store.M:
             self.store.write_node(node)
             # actualizar MBRs hacia arriba
@@ -192,17 +421,16 @@ class RTreeFile:
                         break
                 self.store.write_node(parent)
                 node = parent
-            return [record]
+            return
 
-        # split hoja
+        # split
         e_all = node.entries[:]
         g1, g2 = self._split_linear(e_all)
         node.entries = g1
         new_id = self.store.alloc_page()
-        new_node = Node(page_id=new_id, is_leaf=True, M=self.store.M)
+        new_node = Node(page_id=new_id, is_leaf=node.is_leaf, M=self.store.M)
         new_node.entries = g2
         self._adjust_tree_after_split(path, node, new_node)
-        return [record]
 
     # --- util para leer del heap si está disponible ---
     def _maybe_heap(self, additional):
@@ -230,8 +458,7 @@ class RTreeFile:
                     if intersects(e.mbr, rect):
                         pos, slot = e.rid
                         if heap and hasattr(heap, "search_by_pos"):
-                            rec = heap.search_by_pos(pos)
-                            if rec: out.append(rec)
+                            out.extend(heap.search_by_pos([{"pos": pos}]))
                         else:
                             out.append({"pos": pos, "slot": slot, "mbr": e.mbr})
             else:
@@ -241,11 +468,13 @@ class RTreeFile:
         return out
 
     def range_search(self, additional: dict) -> List[dict]:
-        """point + radio: intersecta con rect circunscrito y filtra por distancia real."""
+        """
+        point + radio: baja solo por los nodos cuyo MBR alcanza el círculo (MINDIST <= r)
+        y filtra las hojas por distancia real del centro.
+        """
         self.open()
-        x, y = additional["point"]
+        x, y = map(float, additional["point"])
         r = float(additional.get("r", additional.get("radio")))
-        rect = rect_from_point_radius(float(x), float(y), r)
         r2 = r * r
         heap = self._maybe_heap(additional)
         out: List[dict] = []
@@ -255,52 +484,123 @@ class RTreeFile:
             node = self.store.read_node(pid)
             if node.is_leaf:
                 for e in node.entries:
-                    if intersects(e.mbr, rect):
-                        cx = (e.mbr[0] + e.mbr[1]) / 2.0
-                        cy = (e.mbr[2] + e.mbr[3]) / 2.0
-                        if (cx - x)**2 + (cy - y)**2 <= r2:
-                            pos, slot = e.rid
-                            if heap and hasattr(heap, "search_by_pos"):
-                                rec = heap.search_by_pos(pos)
-                                if rec: out.append(rec)
-                            else:
-                                out.append({"pos": pos, "slot": slot, "mbr": e.mbr})
+                    cx = (e.mbr[0] + e.mbr[1]) / 2.0
+                    cy = (e.mbr[2] + e.mbr[3]) / 2.0
+                    if (cx - x)**2 + (cy - y)**2 <= r2:
+                        pos, slot = e.rid
+                        if heap and hasattr(heap, "search_by_pos"):
+                            out.extend(heap.search_by_pos([{"pos": pos}]))
+                        else:
+                            out.append({"pos": pos, "slot": slot, "mbr": e.mbr})
             else:
                 for e in node.entries:
-                    if intersects(e.mbr, rect):
+                    if mindist_point_mbr(x, y, e.mbr) <= r2:
                         stack.append(e.child)
         return out
 
     def knn(self, additional: dict) -> List[dict]:
-        """k vecinos más cercanos usando best-first con MINDIST."""
+        """
+        k vecinos más cercanos usando best-first con MINDIST.
+        Nodos y entradas de hoja comparten la cola: una entrada sale de la cola solo
+        cuando ningún nodo pendiente puede tener algo más cerca, así que el resultado
+        no depende de cómo quedaron agrupadas las hojas.
+        """
         import heapq
         self.open()
         x, y = map(float, additional["point"]); k = int(additional["k"])
         heap_in = self._maybe_heap(additional)
-        pq = []  # Cola de prioridad
-        # Inicializamos con el nodo raíz (distancia = 0)
-        heapq.heappush(pq, (0.0, False, self.store.root, -1))
-        results: List[Tuple[float, dict]] = []
+        pq = []  # Cola de prioridad: (dist2, orden, es_entrada, payload)
+        seq = 0
+        heapq.heappush(pq, (0.0, seq, False, self.store.root))
+        results: List[dict] = []
         while pq and len(results) < k:
-            dist2, is_leaf, pid, _ = heapq.heappop(pq)
+            dist2, _, is_entry, payload = heapq.heappop(pq)
+            if is_entry:
+                e = payload
+                if heap_in and hasattr(heap_in, "search_by_pos"):
+                    results.extend(heap_in.search_by_pos([{"pos": e.rid[0]}]))
+                else:
+                    results.append({"pos": e.rid[0], "slot": e.rid[1], "mbr": e.mbr})
+                continue
+            node = self.store.read_node(payload)
+            for e in node.entries:
+                seq += 1
+                if node.is_leaf:
+                    cx = (e.mbr[0] + e.mbr[1]) / 2.0
+                    cy = (e.mbr[2] + e.mbr[3]) / 2.0
+                    heapq.heappush(pq, ((cx - x)**2 + (cy - y)**2, seq, True, e))
+                else:
+                    heapq.heappush(pq, (mindist_point_mbr(x, y, e.mbr), seq, False, e.child))
+        return results
+
+    def knn_batch(self, points, k: int) -> List[List[dict]]:
+        """
+        KNN de varios puntos en un solo recorrido: una cola común ordenada por
+        (dist2, consulta) y cada nodo se lee una sola vez por lote aunque lo visiten
+        varias consultas. Devuelve una lista de resultados por punto, en el orden dado.
+        """
+        import heapq
+        self.open()
+        pts = [(float(x), float(y)) for x, y in points]
+        k = int(k)
+        results: List[List[dict]] = [[] for _ in pts]
+        if k <= 0:
+            return results
+        nodes = {}  # page_id -> Node leído en este lote
+        pq = [(0.0, qi, qi, False, self.store.root) for qi in range(len(pts))]
+        heapq.heapify(pq)
+        seq = len(pts)
+        pending = len(pts)
+        while pq and pending:
+            dist2, qi, _, is_entry, payload = heapq.heappop(pq)
+            res = results[qi]
+            if len(res) >= k:
+                continue
+            if is_entry:
+                res.append({"pos": payload.rid[0], "slot": payload.rid[1], "mbr": payload.mbr})
+                if len(res) == k:
+                    pending -= 1
+                continue
+            node = nodes.get(payload)
+            if node is None:
+                node = nodes[payload] = self.store.read_node(payload)
+            x, y = pts[qi]
+            for e in node.entries:
+                seq += 1
+                if node.is_leaf:
+                    cx = (e.mbr[0] + e.mbr[1]) / 2.0
+                    cy = (e.mbr[2] + e.mbr[3]) / 2.0
+                    heapq.heappush(pq, ((cx - x)**2 + (cy - y)**2, qi, seq, True, e))
+                else:
+                    heapq.heappush(pq, (mindist_point_mbr(x, y, e.mbr), qi, seq, False, e.child))
+        return results
+
+    def range_batch(self, points, r: float) -> List[List[dict]]:
+        """
+        Radio r alrededor de varios puntos en un solo recorrido DFS: cada nodo se baja
+        una vez con el subconjunto de consultas cuyo círculo alcanza su MBR.
+        """
+        self.open()
+        pts = [(float(x), float(y)) for x, y in points]
+        r2 = float(r) ** 2
+        results: List[List[dict]] = [[] for _ in pts]
+        stack = [(self.store.root, list(range(len(pts))))]
+        while stack:
+            pid, active = stack.pop()
             node = self.store.read_node(pid)
-            if node.is_leaf:
-                for e in node.entries:
+            for e in node.entries:
+                if node.is_leaf:
                     cx = (e.mbr[0] + e.mbr[1]) / 2.0
                     cy = (e.mbr[2] + e.mbr[3]) / 2.0
-                    d2 = (cx - x)**2 + (cy - y)**2
-                    if heap_in and hasattr(heap_in, "search_by_pos"):
-                        rec = heap_in.search_by_pos(e.rid[0])
-                        if rec: results.append((d2, rec))
-                    else:
-                        results.append((d2, {"pos": e.rid[0], "slot": e.rid[1], "mbr": e.mbr}))
-                results.sort(key=lambda t: t[0])
-                results = results[:k]
-            else:
-                for e in node.entries:
-                    d2 = mindist_point_mbr(x, y, e.mbr)
-                    heapq.heappush(pq, (d2, False, e.child, -1))
-        return [rec for _, rec in results]  # Retorna solo los registros
+                    for qi in active:
+                        x, y = pts[qi]
+                        if (cx - x)**2 + (cy - y)**2 <= r2:
+                            results[qi].append({"pos": e.rid[0], "slot": e.rid[1], "mbr": e.mbr})
+                else:
+                    sub = [qi for qi in active if mindist_point_mbr(*pts[qi], e.mbr) <= r2]
+                    if sub:
+                        stack.append((e.child, sub))
+        return results
 
     # ---------- helpers para delete ----------
     def _eq_mbr(self, a: MBR, b: MBR, eps: float = 1e-9) -> bool:
@@ -335,9 +635,9 @@ class RTreeFile:
     def remove(self, additional: dict):
         """
         Elimina una entrada por rid=(pos,slot) y opcionalmente verificando MBR ('mbr').
-        Ajusta MBRs hacia arriba. Caso simple:
-          - Si hoja queda vacía: se borra la referencia en el padre.
-          - Si la raíz (no hoja) queda con un solo hijo: se "comprime" promoviendo al hijo.
+        CondenseTree (Guttman): todo nodo no raíz que queda con menos de m entradas se
+        desengancha y sus entradas se reinsertan en su mismo nivel; los MBR se ajustan
+        hasta la raíz y la raíz interna con un solo hijo se comprime.
         Retorna 1 si borró, 0 si no encontró.
         """
         self.open()
@@ -345,65 +645,185 @@ class RTreeFile:
         if not rid or rid[0] is None:
             raise ValueError("RTreeFile.remove: falta 'rid' (pos,slot)")
         target_mbr: Optional[MBR] = additional.get("mbr")
+        if target_mbr is not None:
+            target_mbr = as_f32(target_mbr)  # en disco los MBR son float32
 
         # 1) localizar hoja y posición
         leaf, idx, path = self._find_leaf_with(self.store.root, rid, target_mbr, [])
         if leaf is None:
             return 0  # no encontrado
 
-        # 2) borrar en la hoja
+        # 2) borrar en la hoja y condensar
         del leaf.entries[idx]
-        self.store.write_node(leaf)
+        self._condense(leaf, path)
+        return 1
 
-        # 3) actualizar hacia arriba (y remover hijos vacíos)
-        child = leaf
+    def _condense(self, node: Node, path: list):
+        """'path' = [(pid, nodo), ...] desde la raíz hasta el padre de 'node' (nivel 0)."""
+        orphans = []  # [(nivel, entradas)] de nodos eliminados
+        level = 0
         while path:
-            pid, parent = path.pop()
-            # refrescar el parent desde disco por si ya cambió antes:
-            parent = self.store.read_node(pid)
-
-            # localizar entrada que apunta al 'child'
-            pos = None
-            for i, e in enumerate(parent.entries):
-                if e.child == child.page_id:
-                    pos = i; break
-
-            if pos is None:
-                # nada que actualizar (inconsistencia rara); continuar
-                child = parent
-                continue
-
-            if child.entries:
-                # actualizar MBR del hijo
-                parent.entries[pos].mbr = child.mbr_cover()
-            else:
-                # hijo quedó vacío: quitar la entrada que lo referencia
+            _, parent = path.pop()
+            pos = next((i for i, e in enumerate(parent.entries) if e.child == node.page_id), None)
+            if pos is not None and len(node.entries) < self.store.m:
+                # la página queda sin referencias (se recupera con VACUUM INDEX)
                 parent.entries.pop(pos)
+                if node.entries:
+                    orphans.append((level, node.entries))
+            else:
+                self.store.write_node(node)
+                if pos is not None:
+                    parent.entries[pos].mbr = node.mbr_cover()
+            node, level = parent, level + 1
+        self.store.write_node(node)  # raíz
+
+        # comprimir raíz interna con un solo hijo; si quedó vacía vuelve a ser hoja
+        root = node
+        while not root.is_leaf and len(root.entries) == 1:
+            self.store.root = root.entries[0].child
+            self.store.height = max(1, self.store.height - 1)
+            root = self.store.read_node(self.store.root)
+        if not root.is_leaf and not root.entries:
+            root.is_leaf = True
+            self.store.height = 1
+            self.store.write_node(root)
+
+        # reinsertar: niveles altos primero; si el árbol ya no tiene ese nivel, se bajan las hojas
+        for lvl, entries in sorted(orphans, key=lambda o: -o[0]):
+            if lvl > 0 and lvl > self.store.height - 1:
+                entries = self._subtree_leaves(entries)
+                lvl = 0
+            for e in entries:
+                self._insert_entry(e, lvl)
+
+    def _subtree_leaves(self, entries: List[Entry]) -> List[Entry]:
+        out: List[Entry] = []
+        stack = [e.child for e in entries]
+        while stack:
+            node = self.store.read_node(stack.pop())
+            if node.is_leaf:
+                out.extend(node.entries)
+            else:
+                stack.extend(e.child for e in node.entries)
+        return out
 
-            self.store.write_node(parent)
-            child = parent  # seguir subiendo
-
-        # 4) comprimir raíz si es interno con un solo hijo
-        root = self.store.read_node(self.store.root)
-        if not root.is_leaf:
-            if len(root.entries) == 0:
-                # árbol vacío ⇒ raíz pasa a ser hoja vacía
-                # (dejamos root como está pero sin entradas)
-                pass
-            elif len(root.entries) == 1:
-                only_child = root.entries[0].child
-                # promover hijo como nueva raíz
-                self.store.root = only_child
-                self.store.height = max(1, self.store.height - 1)
-                # no es necesario escribir el nodo antiguo de raíz; el header se persiste en close()
+    # ---------- join espacial ----------
+    def distance_join(self, other: "RTreeFile", r: float):
+        """
+        Genera pares (rid_self, rid_other) cuyos centros están a distancia <= r, recorriendo
+        ambos árboles en sincronía: un par de nodos solo se expande si sus MBR están a <= r
+        y los pares de entradas se filtran con un barrido en x. Si un lado llega a hoja
+        antes, solo se baja por el otro.
+        Los MBR en disco son float32, así que r se ensancha con el error de redondeo de
+        las coordenadas: el resultado es un superconjunto y el filtro exacto queda al llamador.
+        """
+        self.open(); other.open()
+        extent = 0.0
+        for t in (self, other):
+            root = t.store.read_node(t.store.root)
+            if root.entries:
+                extent = max(extent, max(abs(c) for c in root.mbr_cover()))
+        r = r + f32_slack(extent, r)
+        r2 = r * r
+        stack = [(self.store.root, other.store.root)]
+        while stack:
+            pa, pb = stack.pop()
+            na = self.store.read_node(pa)
+            nb = other.store.read_node(pb)
+            if not na.entries or not nb.entries:
+                continue
+            if na.is_leaf and nb.is_leaf:
+                for ea, eb in sweep_pairs(na.entries, nb.entries, r):
+                    dx = (ea.mbr[0] + ea.mbr[1]) / 2.0 - (eb.mbr[0] + eb.mbr[1]) / 2.0
+                    dy = (ea.mbr[2] + ea.mbr[3]) / 2.0 - (eb.mbr[2] + eb.mbr[3]) / 2.0
+                    if dx * dx + dy * dy <= r2:
+                        yield ea.rid, eb.rid
+            elif na.is_leaf:
+                cover = na.mbr_cover()
+                stack.extend((pa, e.child) for e in nb.entries if mindist_mbr(cover, e.mbr) <= r2)
+            elif nb.is_leaf:
+                cover = nb.mbr_cover()
+                stack.extend((e.child, pb) for e in na.entries if mindist_mbr(e.mbr, cover) <= r2)
+            else:
+                stack.extend((ea.child, eb.child) for ea, eb in sweep_pairs(na.entries, nb.entries, r))
 
-        return 1
+    # ---------- fragmentación / vacuum ----------
+    def fragmentation(self) -> dict:
+        """Páginas vivas vs. totales y ocupación media de los nodos alcanzables."""
+        self.open()
+        live = entries = 0
+        stack = [self.store.root]
+        while stack:
+            node = self.store.read_node(stack.pop())
+            live += 1
+            entries += len(node.entries)
+            if not node.is_leaf:
+                stack.extend(e.child for e in node.entries)
+        pages = max(self.store.page_count(), live)
+        return {
+            "height": self.store.height,
+            "pages": pages,
+            "live_pages": live,
+            "dead_pages": pages - live,
+            "dead_ratio": round((pages - live) / pages, 3),
+            "avg_fill": round(entries / (live * self.store.M), 3),
+        }
+
+    def vacuum(self, fill: float = None) -> int:
+        """Reconstruye el árbol con STR sobre sus hojas vivas: compacta páginas y ajusta MBRs."""
+        self.open()
+        return self._pack(self.leaf_entries(), fill)
 
     def stats(self) -> dict:
         return basic_stats(self.store.height, -1, self.store.read_count, self.store.write_count, 0.0)
 
 
 
+# Caché de nodos por archivo, compartida por todos los Storage del proceso: los internos
+# (raíz y niveles superiores) quedan residentes hasta BD2_RTREE_RESIDENT páginas; las hojas
+# pasan por un LRU de BD2_RTREE_CACHE páginas.
+CACHE_NODES = int(os.getenv("BD2_RTREE_CACHE", "256") or 256)
+RESIDENT_NODES = int(os.getenv("BD2_RTREE_RESIDENT", "512") or 512)
+
+
+class NodeCache:
+    """
+    Nodos decodificados de un archivo R-Tree. Write-through: cada write_node reemplaza
+    la versión cacheada. 'sig' = (ino, size, mtime) tras la última escritura propia;
+    si al abrir el archivo no coincide, alguien lo cambió por fuera y se vacía.
+    """
+    def __init__(self):
+        self.resident = {}          # page_id -> Node interno
+        self.lru = OrderedDict()    # page_id -> Node (hojas y desborde de internos)
+        self.sig = None
+
+    def clear(self):
+        self.resident.clear()
+        self.lru.clear()
+        self.sig = None
+
+    def get(self, page_id: int) -> Optional[Node]:
+        node = self.resident.get(page_id)
+        if node is None:
+            node = self.lru.get(page_id)
+            if node is not None:
+                self.lru.move_to_end(page_id)
+        return node
+
+    def put(self, node: Node):
+        pid = node.page_id
+        self.lru.pop(pid, None)
+        was_resident = self.resident.pop(pid, None) is not None
+        if not node.is_leaf and (was_resident or len(self.resident) < RESIDENT_NODES):
+            self.resident[pid] = node
+            return
+        self.lru[pid] = node
+        while len(self.lru) > CACHE_NODES:
+            self.lru.popitem(last=False)
+
+
+_CACHES = {}  # abspath -> NodeCache
+
 # Header binario del archivo R-Tree
 HEADER_FMT = "<4sBHHIHIQQ"  # magic,ver,M,m,root,height,page_size,read_count,write_count
 MAGIC = b"RTRE"
@@ -424,6 +844,12 @@ class Storage:
         self._w_total = 0
         self._r_reported = 0
         self._w_reported = 0
+        self._h_total = 0
+        self._h_reported = 0
+
+        # handle único (se abre en el primer acceso) + caché compartida del archivo
+        self._fh = None
+        self.cache = _CACHES.setdefault(os.path.abspath(filename), NodeCache())
 
     # --- propiedades: exponen DELTA y permiten setear TOTALES al cargar ---
     @property
@@ -448,9 +874,45 @@ class Storage:
         self._w_total = int(v or 0)
         self._w_reported = self._w_total
 
+    @property
+    def cache_hits(self) -> int:
+        """Lecturas de nodo servidas desde la caché (delta); read_count cuenta solo lecturas de disco."""
+        delta = self._h_total - self._h_reported
+        self._h_reported = self._h_total
+        return delta
+
+    # ---- handle + caché
+    def _file(self):
+        if self._fh is None:
+            self._fh = open(self.filename, "r+b")
+        return self._fh
+
+    def _release(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def _stamp(self):
+        """Firma del archivo tras una escritura propia (ver NodeCache.sig)."""
+        st = os.fstat(self._file().fileno())
+        self.cache.sig = (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _validate_cache(self):
+        st = os.stat(self.filename)
+        if self.cache.sig != (st.st_ino, st.st_size, st.st_mtime_ns):
+            self.cache.clear()
+
+    @staticmethod
+    def _clone(node: Node) -> Node:
+        # los llamadores mutan entries/mbr antes de write_node: la caché nunca entrega su copia
+        return Node(page_id=node.page_id, is_leaf=node.is_leaf, M=node.M,
+                    entries=[Entry(mbr=e.mbr, child=e.child, rid=e.rid) for e in node.entries])
+
     def open(self):
         os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        self._release()
         if not os.path.exists(self.filename):
+            self.cache.clear()
             with open(self.filename, "wb") as f:
                 # archivo nuevo: persiste totales 0
                 f.write(struct.pack(
@@ -471,6 +933,7 @@ class Storage:
                     magic, ver = b"????", -1  # archivo sucio
             # si el archivo estaba sucio (por ej., JSON), recrear
             if magic != MAGIC or ver != VERSION:
+                self.cache.clear()
                 with open(self.filename, "wb") as f:
                     self.root = 0
                     self.height = 1
@@ -489,34 +952,45 @@ class Storage:
                 # inicializa TOTALES (+ baseline) desde header
                 self.read_count = r
                 self.write_count = w
+                self._validate_cache()
 
     def close(self):
         if DEBUG_IDX:
             print(f"[Storage.close] root={self.root} height={self.height} filename={self.filename}")
-        with open(self.filename, "r+b") as f:
-            f.seek(0)
-            # persiste TOTALES (no el delta)
-            f.write(struct.pack(
-                HEADER_FMT, MAGIC, VERSION, self.M, self.m,
-                self.root, self.height, self.page_size,
-                self._r_total, self._w_total
-            ))
+        f = self._file()
+        f.seek(0)
+        # persiste TOTALES (no el delta)
+        f.write(struct.pack(
+            HEADER_FMT, MAGIC, VERSION, self.M, self.m,
+            self.root, self.height, self.page_size,
+            self._r_total, self._w_total
+        ))
+        f.flush()
+        self._stamp()
+        self._release()
         if DEBUG_IDX:
             print(f"[Storage.close] wrote header with root={self.root} height={self.height}")
 
     # ---- páginas
+    def page_count(self) -> int:
+        if not os.path.exists(self.filename):
+            return 0
+        return (os.path.getsize(self.filename) - struct.calcsize(HEADER_FMT)) // self.page_size
+
     def alloc_page(self) -> int:
-        size = os.path.getsize(self.filename)
+        f = self._file()
+        size = f.seek(0, os.SEEK_END)
         header = struct.calcsize(HEADER_FMT)
         used_pages = (size - header) // self.page_size
-        with open(self.filename, "ab") as f:
-            f.write(b"\x00" * self.page_size)
+        f.write(b"\x00" * self.page_size)
+        f.flush()
+        self._stamp()
         # cuenta la escritura de la nueva página
         self._w_total += 1
         return used_pages
 
     # ---- nodos
-    def write_node(self, node: Node):
+    def _encode(self, node: Node) -> bytes:
         buf = io.BytesIO()
         buf.write(struct.pack("<B H", 1 if node.is_leaf else 0, len(node.entries)))
         for e in node.entries:
@@ -529,23 +1003,45 @@ class Storage:
         data = buf.getvalue()
         if len(data) > self.page_size:
             raise ValueError("Node overflow page_size (reduce M).")
-        data += b"\x00" * (self.page_size - len(data))
-        with open(self.filename, "r+b") as f:
-            f.seek(struct.calcsize(HEADER_FMT) + node.page_id * self.page_size)
-            f.write(data)
+        return data + b"\x00" * (self.page_size - len(data))
+
+    def rewrite(self, nodes: List[Node], root: int, height: int):
+        """
+        Reescribe el archivo completo con 'nodes' (page_id == posición en la lista):
+        header + páginas en orden, una sola pasada y un solo fsync.
+        """
+        self.root, self.height = root, height
+        self._w_total += len(nodes)
+        self._release()
+        self.cache.clear()
+        with open(self.filename, "wb") as f:
+            f.write(struct.pack(
+                HEADER_FMT, MAGIC, VERSION, self.M, self.m,
+                self.root, self.height, self.page_size,
+                self._r_total, self._w_total
+            ))
+            for node in nodes:
+                f.write(self._encode(node))
             f.flush()
-            os.fsync(f.fileno())  # Force OS to write to disk
+            os.fsync(f.fileno())
+        self._stamp()
+
+    def write_node(self, node: Node):
+        data = self._encode(node)
+        f = self._file()
+        f.seek(struct.calcsize(HEADER_FMT) + node.page_id * self.page_size)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())  # Force OS to write to disk
         # contar escritura de página de nodo
         self._w_total += 1
+        self._stamp()
+        # write-through: se cachea lo que quedó en disco (MBR en float32), no el nodo en memoria
+        self.cache.put(self._decode(node.page_id, data))
         if DEBUG_IDX and node.is_leaf:
             print(f"[write_node] wrote leaf page_id={node.page_id} entries={len(node.entries)}")
 
-    def read_node(self, page_id: int) -> Node:
-        with open(self.filename, "rb") as f:
-            f.seek(struct.calcsize(HEADER_FMT) + page_id * self.page_size)
-            raw = f.read(self.page_size)
-        # contar lectura de página de nodo
-        self._r_total += 1
+    def _decode(self, page_id: int, raw: bytes) -> Node:
         is_leaf, count = struct.unpack_from("<B H", raw, 0)
         off = 3
         entries: List[Entry] = []
@@ -559,6 +1055,20 @@ class Storage:
                 entries.append(Entry(mbr=(xmin, xmax, ymin, ymax), child=child))
         return Node(page_id=page_id, is_leaf=bool(is_leaf), entries=entries, M=self.M)
 
+    def read_node(self, page_id: int) -> Node:
+        cached = self.cache.get(page_id)
+        if cached is not None:
+            self._h_total += 1
+            return self._clone(cached)
+        f = self._file()
+        f.seek(struct.calcsize(HEADER_FMT) + page_id * self.page_size)
+        raw = f.read(self.page_size)
+        # contar lectura de página de nodo (solo disco)
+        self._r_total += 1
+        node = self._decode(page_id, raw)
+        self.cache.put(node)
+        return self._clone(node)
+
 
 def from_point(x: float, y: float) -> MBR:
     return (x, x, y, y)
@@ -580,6 +1090,20 @@ def expand(a: MBR, b: MBR) -> MBR:
     bx1, bx2, by1, by2 = b
     return (min(ax1, bx1), max(ax2, bx2), min(ay1, by1), max(ay2, by2))
 
+def as_f32(m: MBR) -> MBR:
+    """MBR redondeado a float32, como queda al escribirse en la página."""
+    return struct.unpack("<ffff", struct.pack("<ffff", *m))
+
+def margin(m: MBR) -> float:
+    x1, x2, y1, y2 = m
+    return (x2 - x1) + (y2 - y1)
+
+def overlap(a: MBR, b: MBR) -> float:
+    """Área de la intersección de dos MBR (0 si no se tocan)."""
+    w = min(a[1], b[1]) - max(a[0], b[0])
+    h = min(a[3], b[3]) - max(a[2], b[2])
+    return w * h if w > 0 and h > 0 else 0.0
+
 def enlargement(a: MBR, b: MBR) -> float:
     return area(expand(a, b)) - area(a)
 
@@ -589,6 +1113,47 @@ def mindist_point_mbr(px: float, py: float, m: MBR) -> float:
     dy = (y1 - py) if py < y1 else (py - y2) if py > y2 else 0.0
     return dx * dx + dy * dy  # distancia^2 (evitamos sqrt)
 
+def f32_slack(*magnitudes: float) -> float:
+    """
+    Holgura para radios consultados sobre MBR float32: cubre el redondeo de coordenadas
+    y radio de esas magnitudes. Quien la usa obtiene un superconjunto y refina exacto.
+    """
+    return 2.0 ** -22 * (sum(abs(m) for m in magnitudes) + 1.0)
+
+def mindist_mbr(a: MBR, b: MBR) -> float:
+    """Distancia^2 mínima entre dos MBR (0 si se tocan)."""
+    dx = max(0.0, a[0] - b[1], b[0] - a[1])
+    dy = max(0.0, a[2] - b[3], b[2] - a[3])
+    return dx * dx + dy * dy
+
+def sweep_pairs(A: List[Entry], B: List[Entry], r: float):
+    """
+    Plane sweep en x: pares (a, b) con mindist(a.mbr, b.mbr) <= r, cada uno una sola vez.
+    Se avanza por el menor xmin de ambas listas y se compara solo contra las entradas
+    del otro lado cuyo xmin cae dentro de [xmin, xmax + r].
+    """
+    r2 = r * r
+    A = sorted(A, key=lambda e: e.mbr[0])
+    B = sorted(B, key=lambda e: e.mbr[0])
+    i = j = 0
+    while i < len(A) and j < len(B):
+        if A[i].mbr[0] <= B[j].mbr[0]:
+            a = A[i]; lim = a.mbr[1] + r
+            k = j
+            while k < len(B) and B[k].mbr[0] <= lim:
+                if mindist_mbr(a.mbr, B[k].mbr) <= r2:
+                    yield a, B[k]
+                k += 1
+            i += 1
+        else:
+            b = B[j]; lim = b.mbr[1] + r
+            k = i
+            while k < len(A) and A[k].mbr[0] <= lim:
+                if mindist_mbr(A[k].mbr, b.mbr) <= r2:
+                    yield A[k], b
+                k += 1
+            j += 1
+
 def avg_fill(nodes_count: int, total_entries: int, M: int) -> float:
     if nodes_count == 0: return 0.0
     return total_entries / (nodes_count * M)
@@ -613,7 +1178,7 @@ class RTree:
     - Expone métodos estándar: insert, search_rect, range, knn
     """
     def __init__(self, table: str, column: str, data_dir, *,
-                 key: str = None, M: int = 32, heap_file: str = None):
+                 key: str = None, M: int = 32, heap_file: str = None, variant: str = "linear"):
         self.table = table
         self.column = column
         self.key = key or column
@@ -621,51 +1186,25 @@ class RTree:
         idx_dir = Path(data_dir) / table
         idx_dir.mkdir(parents=True, exist_ok=True)
         self.filename = str(idx_dir / f"{table}_rtree_{column}.idx")
-        self.rt = RTreeFile(self.filename, M=M)
+        self.rt = RTreeFile(self.filename, M=M, variant=variant)
 
         # contadores como atributos (se actualizarán con _sync_io_counts)
         self.read_count = self.rt.store.read_count
         self.write_count = self.rt.store.write_count
+        self.cache_hits = self.rt.store.cache_hits
 
-        # Sidecar mapping for non-integer PK support: pk <-> int surrogate
-        self.mapfile = str(idx_dir / f"{table}_rtree_{column}.map.json")
-        self._p2i = {}
-        self._i2p = {}
-        self._next_id = 1
-        self._load_map()
+        # Sidecar mapping for non-integer PK support: pk <-> int surrogate (ver pkmap.py)
+        self.mapfile = str(idx_dir / f"{table}_rtree_{column}")
+        self.pkmap = open_pkmap(self.mapfile)
 
     # ---------- helpers ----------
     def _sync_io_counts(self):
-        """Sincroniza los atributos públicos con los contadores del Storage."""
+        """Sincroniza los atributos públicos con los contadores del Storage (read_count = disco)."""
         self.read_count = self.rt.store.read_count
         self.write_count = self.rt.store.write_count
+        self.cache_hits = self.rt.store.cache_hits
 
     # ---------- mapping helpers (non-int PK support) ----------
-    def _load_map(self):
-        import json
-        try:
-            if os.path.exists(self.mapfile):
-                with open(self.mapfile, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                self._p2i = data.get("p2i", {}) or {}
-                self._i2p = data.get("i2p", {}) or {}
-                self._next_id = int(data.get("next_id", 1) or 1)
-        except Exception:
-            # tolerate corrupt map; start fresh (won't affect numeric PKs)
-            self._p2i, self._i2p, self._next_id = {}, {}, 1
-
-    def _save_map(self):
-        import json
-        try:
-            with open(self.mapfile, "w", encoding="utf-8") as f:
-                json.dump({
-                    "next_id": self._next_id,
-                    "p2i": self._p2i,
-                    "i2p": self._i2p,
-                }, f, ensure_ascii=False)
-        except Exception:
-            pass
-
     def _pk_key(self, pk):
         # Stable JSON string key for dicts; for scalars, str() is fine but we use json to handle types
         import json
@@ -684,23 +1223,14 @@ class RTree:
                 return int(pk)
         except Exception:
             pass
-        k = self._pk_key(pk)
-        if k in self._p2i:
-            return int(self._p2i[k])
-        # assign new surrogate id
-        sid = int(self._next_id)
-        self._next_id = sid + 1
-        self._p2i[k] = sid
-        self._i2p[str(sid)] = k
-        self._save_map()
-        return sid
+        # lookup en el hash del sidecar; si no está, se agrega al log (O(1) amortizado)
+        return self.pkmap.get_or_add(self._pk_key(pk))
 
     def _int_to_pk(self, sid):
         # If mapping exists, return original PK (deserialize JSON); else assume sid is the real PK (numeric)
         import json
-        sk = str(int(sid))
-        if sk in self._i2p:
-            v = self._i2p[sk]
+        v = self.pkmap.key_of(int(sid))
+        if v is not None:
             try:
                 return json.loads(v)
             except Exception:
@@ -737,6 +1267,18 @@ class RTree:
         self._sync_io_counts()
         return res
 
+    def bulk_load(self, records: List[dict], fill: float = None):
+        """Carga masiva STR (ver RTreeFile.bulk_load)."""
+        rows = []
+        for record in records:
+            rec = dict(record)
+            if "pk" in rec and rec["pk"] is not None and not isinstance(rec["pk"], int):
+                rec["pk"] = self._pk_to_int(rec["pk"])
+            rows.append(rec)
+        n = self.rt.bulk_load(rows, {"key": self.key, "fill": fill})
+        self._sync_io_counts()
+        return n
+
     def remove(self, record: dict):
         """
         Borra una entrada del R-Tree.
@@ -769,9 +1311,24 @@ class RTree:
         self._sync_io_counts()
         return res
 
+    def vacuum(self, force: bool = False) -> dict:
+        """
+        VACUUM INDEX: si el árbol está fragmentado (páginas muertas >= VACUUM_DEAD o
+        ocupación < VACUUM_FILL) o 'force', lo reconstruye con STR. Devuelve antes/después.
+        """
+        before = self.rt.fragmentation()
+        rebuilt = force or before["dead_ratio"] >= VACUUM_DEAD or (
+            before["live_pages"] > 1 and before["avg_fill"] < VACUUM_FILL)
+        after = before
+        if rebuilt:
+            self.rt.vacuum()
+            after = self.rt.fragmentation()
+        self._sync_io_counts()
+        return {"rebuilt": rebuilt, "before": before, "after": after}
+
     # --- lecturas ---
     def search_rect(self, xmin: float, xmax: float, ymin: float, ymax: float):
-        items = self.rt.search({"rect": (xmin, xmax, ymin, ymax), "heap": self.heap_file})
+        items = self.rt.search({"rect": (xmin, xmax, ymin, ymax)})
         # Map back surrogate ids to original PKs when not using heap
         if not self.heap_file:
             out = []
@@ -786,7 +1343,7 @@ class RTree:
         return items
 
     def range(self, x: float, y: float, r: float):
-        items = self.rt.range_search({"point": (x, y), "r": r, "heap": self.heap_file})
+        items = self.rt.range_search({"point": (x, y), "r": r})
         if not self.heap_file:
             out = []
             for it in (items or []):
@@ -799,8 +1356,45 @@ class RTree:
         self._sync_io_counts()
         return items
 
+    def range_rids(self, x: float, y: float, r: float):
+        """Como range() pero solo identificadores (pos del heap o PK), sin leer los registros."""
+        items = self.rt.range_search({"point": (x, y), "r": r})
+        self._sync_io_counts()
+        if self.heap_file:
+            return [it["pos"] for it in items]
+        return [self._int_to_pk(it["pos"]) for it in items]
+
+    def _map_groups(self, groups):
+        if not self.heap_file:
+            for items in groups:
+                for it in items:
+                    it["pos"] = self._int_to_pk(it["pos"])  # reverse map
+        self._sync_io_counts()
+        return groups
+
+    def knn_batch(self, points, k: int):
+        """Una lista de vecinos por punto (ver RTreeFile.knn_batch)."""
+        return self._map_groups(self.rt.knn_batch(points, k))
+
+    def range_batch(self, points, r: float):
+        """Una lista de entradas a distancia <= r por punto (ver RTreeFile.range_batch)."""
+        return self._map_groups(self.rt.range_batch(points, r))
+
+    def distance_join(self, other: "RTree", r: float):
+        """
+        Pares (pos_self, pos_other) a distancia <= r (ver RTreeFile.distance_join).
+        'pos' es la posición en el heap o la PK original (surrogate revertido) de cada lado.
+        """
+        out = []
+        for (pa, _), (pb, _) in self.rt.distance_join(other.rt, r):
+            out.append((pa if self.heap_file else self._int_to_pk(pa),
+                        pb if other.heap_file else other._int_to_pk(pb)))
+        self._sync_io_counts()
+        other._sync_io_counts()
+        return out
+
     def knn(self, x: float, y: float, k: int):
-        items = self.rt.knn({"point": (x, y), "k": int(k), "heap": self.heap_file})
+        items = self.rt.knn({"point": (x, y), "k": int(k)})
         if not self.heap_file:
             out = []
             for it in (items or []):
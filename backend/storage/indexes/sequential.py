@@ -1,8 +1,23 @@
-from backend.catalog.catalog import get_json
+from backend.catalog.catalog import get_json, put_json
 from backend.core.utils import build_format
 from backend.core.record import Record
+from backend.core.predicate import raw_index
+from bisect import bisect_left
 import struct
+import heapq
 import math
+import os
+
+# Disparo del merge del área auxiliar (0 = desactivado -> se usa log2(main_elements)).
+MERGE_RATIO = float(os.getenv("BD2_SEQ_MERGE_RATIO", "0") or 0)
+MERGE_MAX_AUX = int(os.getenv("BD2_SEQ_MERGE_MAX_AUX", "0") or 0)
+# Bytes por lectura/escritura durante sort_and_merge.
+MERGE_BUFFER = int(os.getenv("BD2_SEQ_MERGE_BUFFER", str(1 << 20)) or (1 << 20))
+# Tamaño de bloque del área principal para el fence index (primera clave de cada bloque).
+BLOCK_SIZE = int(os.getenv("BD2_SEQ_BLOCK_SIZE", "4096") or 4096)
+
+# Fence index por archivo, cargado una vez por proceso: {filename: (st_ino, fence | None)}
+_FENCES = {}
 
 
 class SeqFile:
@@ -13,26 +28,17 @@ class SeqFile:
         self.REC_SIZE = struct.calcsize(self.format)
         self.read_count = 0
         self.write_count = 0
+        self.merge_ratio = MERGE_RATIO
+        self.merge_max_aux = MERGE_MAX_AUX
+        self.merge_buffer = max(self.REC_SIZE, MERGE_BUFFER)
+        self.fence_filename = self.filename.replace(".dat", "_fence.dat")
+        self.BLOCK_RECORDS = max(1, BLOCK_SIZE // self.REC_SIZE)
 
     def binary_repeated(self, seqfile, value, additional, schema_size, begin, end):
-        while begin <= end:
-            mid = (begin + end) // 2
-            seqfile.seek(4 + schema_size + 4 + (mid * self.REC_SIZE))
-
-            data = seqfile.read(self.REC_SIZE)
-            self.read_count += 1
-
-            temp_record = Record.unpack(data, self.format, self.schema)
-
-            if value == temp_record.fields[additional["key"]]:
-                if temp_record.fields["deleted"]:
-                    return False
-                return True
+        _, temp_record = self.locate(seqfile, additional["key"], value, end + 1, 4 + schema_size + 4)
 
-            elif temp_record.fields[additional["key"]] < value:
-                begin = mid + 1
-            else:
-                end = mid - 1
+        if temp_record is not None and temp_record.fields[additional["key"]] == value:
+            return not temp_record.fields["deleted"]
 
         return False
 
@@ -49,98 +55,125 @@ class SeqFile:
 
         return False
 
-    def sort_and_merge(self, seqfile, additional):
-        seqfile.seek(0)
-
-        schema_size = struct.unpack("I", seqfile.read(4))[0]
-        self.read_count += 1
-
-        seqfile.seek(0)
-        schema_header = seqfile.read(4)
+    def max_aux_size(self, main_elements):
+        """
+        Tamaño del área auxiliar que dispara sort_and_merge.
+        Prioridad: absoluto (BD2_SEQ_MERGE_MAX_AUX) > ratio sobre main (BD2_SEQ_MERGE_RATIO) > log2(main).
+        """
+        if self.merge_max_aux > 0:
+            return self.merge_max_aux
+        if self.merge_ratio > 0:
+            return max(1, int(main_elements * self.merge_ratio))
+        return int(math.log2(main_elements)) if main_elements > 0 else 1
+
+    def _read_aux_sorted(self, seqfile, key, offset):
+        seqfile.seek(offset)
+        aux_elements = struct.unpack("i", seqfile.read(4))[0]
         self.read_count += 1
 
-        schema_data = seqfile.read(schema_size)
-
-        main_elements = struct.unpack("i", seqfile.read(4))[0]
-        self.read_count += 1
-
-        main_records = []
-        for _ in range(main_elements):
-            data = seqfile.read(self.REC_SIZE)
-            self.read_count += 1
-
-            temp_record = Record.unpack(data, self.format, self.schema)
-
-            if not temp_record.fields["deleted"]:
-                main_records.append(temp_record)
-
-        aux_elements = struct.unpack("i", seqfile.read(4))[0]
+        data = seqfile.read(aux_elements * self.REC_SIZE)
         self.read_count += 1
 
         aux_records = []
-        for _ in range(aux_elements):
-            data = seqfile.read(self.REC_SIZE)
-            self.read_count += 1
-
-            temp_record = Record.unpack(data, self.format, self.schema)
+        for k in range(aux_elements):
+            temp_record = Record.unpack(data[k * self.REC_SIZE: (k + 1) * self.REC_SIZE], self.format, self.schema)
             if not temp_record.fields["deleted"]:
                 aux_records.append(temp_record)
 
-        aux_records.sort(key=lambda record: record.fields[additional["key"]])
-
-        merged_records = []
-        i, j = 0, 0
-
-        while i < len(main_records) and j < len(aux_records):
-            if i < len(main_records) and j < len(aux_records):
-                if main_records[i].fields[additional["key"]] < aux_records[j].fields[additional["key"]]:
-                    merged_records.append(main_records[i])
-                    i += 1
-                elif main_records[i].fields[additional["key"]] > aux_records[j].fields[additional["key"]]:
-                    merged_records.append(aux_records[j])
-                    j += 1
-                else:
-                    merged_records.append(aux_records[j])
-                    i += 1
-                    j += 1
-
-        while i < len(main_records):
-            merged_records.append(main_records[i])
-            i += 1
-
-        while j < len(aux_records):
-            merged_records.append(aux_records[j])
-            j += 1
+        aux_records.sort(key=lambda record: record.fields[key])
+        return aux_records
+
+    def sort_and_merge(self, additional):
+        """
+        Merge en streaming: el área auxiliar (acotada por max_aux_size) se ordena
+        en memoria; el área principal se lee por bloques de merge_buffer bytes y
+        la salida se escribe con el mismo buffer a <archivo>_merge.dat, que luego
+        reemplaza al original con os.replace. La memoria no depende del tamaño de la tabla.
+        De paso se arma el fence index (primera clave de cada bloque).
+        """
+        key = additional["key"]
+        tmp_filename = self.filename.replace(".dat", "_merge.dat")
+        chunk = max(1, self.merge_buffer // self.REC_SIZE)
+
+        with open(self.filename, "rb") as seqfile, open(tmp_filename, "wb") as outfile:
+            schema_size = struct.unpack("I", seqfile.read(4))[0]
+            self.read_count += 1
 
-        seqfile.seek(0)
+            seqfile.seek(0)
+            header = seqfile.read(4 + schema_size)
 
-        seqfile.truncate()
-        self.write_count += 1
+            main_elements = struct.unpack("i", seqfile.read(4))[0]
+            self.read_count += 1
 
-        seqfile.write(schema_header)
-        seqfile.write(schema_data)
+            main_offset = 4 + schema_size + 4
+            aux_records = self._read_aux_sorted(seqfile, key, main_offset + main_elements * self.REC_SIZE)
 
-        self.write_count += 2
+            outfile.write(header)
+            outfile.write(struct.pack("i", 0))      # se corrige al final
+            self.write_count += 1
 
-        seqfile.write(struct.pack("i", len(merged_records)))
+            out = bytearray()
+            merged = 0
+            j = 0
 
-        self.write_count += 1
+            fence_keys = []
 
-        result_list = []
-        for record in merged_records:
-            pos = seqfile.tell()
-            seqfile.write(record.pack())
+            def emit(record):
+                nonlocal merged
+                if merged % self.BLOCK_RECORDS == 0:
+                    fence_keys.append(record.fields[key])
+                out.extend(record.pack())
+                merged += 1
+                if len(out) >= self.merge_buffer:
+                    outfile.write(out)
+                    self.write_count += 1
+                    out.clear()
 
+            seqfile.seek(main_offset)
+            remaining = main_elements
+            while remaining > 0:
+                n = min(chunk, remaining)
+                data = seqfile.read(n * self.REC_SIZE)
+                self.read_count += 1
+                remaining -= n
+
+                for k in range(n):
+                    temp_record = Record.unpack(data[k * self.REC_SIZE: (k + 1) * self.REC_SIZE],
+                                                self.format, self.schema)
+                    if temp_record.fields["deleted"]:
+                        continue
+
+                    value = temp_record.fields[key]
+                    while j < len(aux_records) and aux_records[j].fields[key] < value:
+                        emit(aux_records[j])
+                        j += 1
+
+                    if j < len(aux_records) and aux_records[j].fields[key] == value:
+                        # misma clave: prevalece la versión del área auxiliar
+                        emit(aux_records[j])
+                        j += 1
+                    else:
+                        emit(temp_record)
+
+            while j < len(aux_records):
+                emit(aux_records[j])
+                j += 1
+
+            out.extend(struct.pack("i", 0))         # área auxiliar vacía
+            outfile.write(out)
             self.write_count += 1
 
-            result_list.append((record.fields, pos))
+            outfile.seek(4 + schema_size)
+            outfile.write(struct.pack("i", merged))
+            self.write_count += 1
 
-        seqfile.write(struct.pack("i", 0))
-        self.write_count += 1
+        os.replace(tmp_filename, self.filename)
+        self.write_fence(fence_keys, merged)
 
     def insert(self, record: dict, additional: dict):
 
         form_record = Record(self.schema, self.format, record)
+        merge = False
 
         with open(self.filename, "r+b") as seqfile:
 
@@ -200,7 +233,7 @@ class SeqFile:
 
 
                 else:
-                    inserted = False
+                    reuse = None
 
                     for _ in range(aux_elements):
 
@@ -213,12 +246,8 @@ class SeqFile:
 
                         if temp_record.fields["deleted"] and len(additional["unique"]) <= 1:
 
-                            if temp_record.fields[additional["key"]] >= form_record.fields[additional["key"]]:
-                                inserted = True
-                                seqfile.seek(pos)
-                                seqfile.write(form_record.pack())
-
-                                self.write_count += 1
+                            if reuse is None and temp_record.fields[additional["key"]] >= form_record.fields[additional["key"]]:
+                                reuse = pos
 
                         else:
 
@@ -227,7 +256,13 @@ class SeqFile:
                                 if temp_record.fields[field] == form_record.fields[field]:
                                     return []
 
-                    if not inserted:
+                    # se reutiliza un solo hueco, y solo tras revisar todo el aux por duplicados
+                    if reuse is not None:
+                        seqfile.seek(reuse)
+                        seqfile.write(form_record.pack())
+                        self.write_count += 1
+
+                    else:
                         seqfile.seek(0, 2)
                         seqfile.write(form_record.pack())
                         self.write_count += 1
@@ -236,36 +271,109 @@ class SeqFile:
                         seqfile.write(struct.pack("i", aux_elements + 1))
                         self.write_count += 1
 
-                    max_aux_size = int(math.log2(main_elements)) if main_elements > 0 else 1
-                    if aux_elements + 1 > max_aux_size:
-                        self.sort_and_merge(seqfile, additional)
+                    merge = aux_elements + 1 > self.max_aux_size(main_elements)
 
-                    return [form_record.fields]
+        # fuera del with: el merge reemplaza el archivo
+        if merge:
+            self.sort_and_merge(additional)
 
-    def binary_search(self, seqfile, additional, begin, end, offset):
-        while begin <= end:
-            mid = (begin + end) // 2
-            pos = offset + (mid * self.REC_SIZE)
-            seqfile.seek(pos)
-            data = seqfile.read(self.REC_SIZE)
+        return [form_record.fields]
 
+    # ------------------------------ fence index ------------------------------ #
+
+    def load_fence(self, main_elements):
+        """
+        Fence index del área principal: primera clave de cada bloque de BLOCK_RECORDS
+        registros. Se escribe en sort_and_merge junto al st_ino del archivo nuevo; solo
+        es válido para ese archivo y ese main_elements (los borrados lógicos no mueven claves).
+        """
+        try:
+            ino = os.stat(self.filename).st_ino
+        except OSError:
+            return None
+
+        cached = _FENCES.get(self.filename)
+        if cached is None or cached[0] != ino:
+            fence = None
+            if os.path.exists(self.fence_filename):
+                fence = get_json(self.fence_filename)[0]
+                self.read_count += 1
+                if fence.get("ino") != ino:
+                    fence = None
+            cached = (ino, fence)
+            _FENCES[self.filename] = cached
+
+        fence = cached[1]
+        if fence is None or fence["main"] != main_elements or fence["block"] != self.BLOCK_RECORDS:
+            return None
+        return fence
+
+    def write_fence(self, keys, main_elements):
+        ino = os.stat(self.filename).st_ino
+        fence = {"ino": ino, "main": main_elements, "block": self.BLOCK_RECORDS, "keys": keys}
+        put_json(self.fence_filename, fence)
+        self.write_count += 1
+        _FENCES[self.filename] = (ino, fence)
+
+    def locate(self, seqfile, key, value, main_elements, offset):
+        """
+        (pos, record) del primer registro del área principal con clave >= value;
+        record es None si pos == main_elements.
+        Con fence: búsqueda en memoria + lectura de un bloque. Sin fence: búsqueda binaria.
+        """
+        fence = self.load_fence(main_elements)
+
+        if fence is not None:
+            block = max(bisect_left(fence["keys"], value) - 1, 0)
+            first = block * self.BLOCK_RECORDS
+            n = min(self.BLOCK_RECORDS, main_elements - first)
+
+            seqfile.seek(offset + (first * self.REC_SIZE))
+            data = seqfile.read(n * self.REC_SIZE)
             self.read_count += 1
 
-            temp_record = Record.unpack(data, self.format, self.schema)
+            for k in range(n):
+                temp_record = Record.unpack(data[k * self.REC_SIZE: (k + 1) * self.REC_SIZE], self.format, self.schema)
+                if temp_record.fields[key] >= value:
+                    return first + k, temp_record
+            begin = first + n
+
+        else:
+            begin, end = 0, main_elements
+            while begin < end:
+                mid = (begin + end) // 2
+                seqfile.seek(offset + (mid * self.REC_SIZE))
+                data = seqfile.read(self.REC_SIZE)
+                self.read_count += 1
 
-            if additional["value"] == temp_record.fields[additional["key"]]:
-                if temp_record.fields["deleted"]:
-                    return []
+                temp_record = Record.unpack(data, self.format, self.schema)
+                if temp_record.fields[key] < value:
+                    begin = mid + 1
+                else:
+                    end = mid
 
-                del temp_record.fields["deleted"]
-                return [temp_record.fields]
+        if begin >= main_elements:
+            return main_elements, None
 
-            elif temp_record.fields[additional["key"]] < additional["value"]:
-                begin = mid + 1
-            else:
-                end = mid - 1
+        seqfile.seek(offset + (begin * self.REC_SIZE))
+        data = seqfile.read(self.REC_SIZE)
+        self.read_count += 1
+        return begin, Record.unpack(data, self.format, self.schema)
+
+    def lower_bound(self, seqfile, key, value, main_elements, offset):
+        """Primera posición del área principal con clave >= value."""
+        return self.locate(seqfile, key, value, main_elements, offset)[0]
 
-        return []
+    def binary_search(self, seqfile, additional, begin, end, offset):
+        _, temp_record = self.locate(seqfile, additional["key"], additional["value"], end + 1, offset)
+
+        if temp_record is None or temp_record.fields[additional["key"]] != additional["value"]:
+            return []
+        if temp_record.fields["deleted"]:
+            return []
+
+        del temp_record.fields["deleted"]
+        return [temp_record.fields]
 
     def linear_search(self, seqfile, additional, elems, param=False, same_key=False):
 
@@ -318,6 +426,17 @@ class SeqFile:
 
                     records.extend(self.linear_search(seqfile, additional, aux_elements))
 
+            elif same_key:
+                offset = 4 + schema_size + 4
+                start = self.lower_bound(seqfile, additional["key"], additional["value"], main_elements, offset)
+                seqfile.seek(offset + (start * self.REC_SIZE))
+                records = self.linear_search(seqfile, additional, main_elements - start, True, same_key)
+
+                for record in self._read_aux_sorted(seqfile, additional["key"], offset + (self.REC_SIZE * main_elements)):
+                    if record.fields[additional["key"]] == additional["value"]:
+                        del record.fields["deleted"]
+                        records.append(record.fields)
+
             else:
                 records = self.linear_search(seqfile, additional, main_elements, True, same_key)
                 seqfile.seek(4 + schema_size + 4 + (self.REC_SIZE * main_elements))
@@ -365,6 +484,23 @@ class SeqFile:
             main_elements = struct.unpack("I", seqfile.read(4))[0]
             self.read_count += 1
 
+            if same_key:
+                # lower bound en el área principal + aux ordenado: O(log n + k) lecturas
+                key, min_val, max_val = additional["key"], additional["min"], additional["max"]
+                offset = 4 + schema_size + 4
+                start = self.lower_bound(seqfile, key, min_val, main_elements, offset)
+                seqfile.seek(offset + (start * self.REC_SIZE))
+                main_records = self.linear_search_by_range(seqfile, main_elements - start, additional,
+                                                           min_val, max_val, same_key)
+
+                aux_records = []
+                for record in self._read_aux_sorted(seqfile, key, offset + (self.REC_SIZE * main_elements)):
+                    if min_val <= record.fields[key] <= max_val:
+                        del record.fields["deleted"]
+                        aux_records.append(record.fields)
+
+                return list(heapq.merge(main_records, aux_records, key=lambda r: r[key]))
+
             records.extend(
                 self.linear_search_by_range(seqfile, main_elements, additional, additional["min"], additional["max"],
                                             same_key))
@@ -381,33 +517,20 @@ class SeqFile:
         return records
 
     def binary_delete(self, seqfile, additional, begin, end, offset):
-        while begin <= end:
-            mid = (begin + end) // 2
-            pos = offset + (mid * self.REC_SIZE)
-            seqfile.seek(pos)
-            data = seqfile.read(self.REC_SIZE)
-            self.read_count += 1
-
-            temp_record = Record.unpack(data, self.format, self.schema)
-
-            if additional["value"] == temp_record.fields[additional["key"]]:
-                if temp_record.fields["deleted"]:
-                    return []
-
-                seqfile.seek(pos)
-                temp_record.fields["deleted"] = True
-                seqfile.write(temp_record.pack())
-                self.write_count += 1
+        pos, temp_record = self.locate(seqfile, additional["key"], additional["value"], end + 1, offset)
 
-                del temp_record.fields["deleted"]
-                return [temp_record.fields]
+        if temp_record is None or temp_record.fields[additional["key"]] != additional["value"]:
+            return []
+        if temp_record.fields["deleted"]:
+            return []
 
-            elif temp_record.fields[additional["key"]] < additional["value"]:
-                begin = mid + 1
-            else:
-                end = mid - 1
+        seqfile.seek(offset + (pos * self.REC_SIZE))
+        temp_record.fields["deleted"] = True
+        seqfile.write(temp_record.pack())
+        self.write_count += 1
 
-        return []
+        del temp_record.fields["deleted"]
+        return [temp_record.fields]
 
     def linear_delete(self, seqfile, additional, elems, param=False, same_key=False):
 
@@ -477,8 +600,14 @@ class SeqFile:
         return records
     
 
-    def get_all(self):
-        records = []
+    def get_all(self, where=None):
+        """Registros vivos (main + aux). 'where' descarta filas sobre la tupla cruda, sin armar el Record."""
+        return list(self.iter_all(where))
+
+    def iter_all(self, where=None):
+        """Como get_all, pero de a un registro (main y después aux)."""
+        raw = where.raw(self.schema) if where is not None else None
+        deleted_at = raw_index(self.schema, "deleted") if raw is not None else None
 
         with open(self.filename, "r+b") as seqfile:
 
@@ -489,42 +618,105 @@ class SeqFile:
             end = seqfile.tell()
 
             if (end == 4 + schema_size):
-                return []
+                return
 
             seqfile.seek(4 + schema_size)
             main_elements = struct.unpack("I", seqfile.read(4))[0]
             self.read_count += 1
 
-            for _ in range(main_elements):
-                data = seqfile.read(self.REC_SIZE)
-                self.read_count += 1
-
-                record = Record.unpack(data, self.format, self.schema)
+            yield from self._iter_area(seqfile, main_elements, raw, deleted_at)
 
-                if not record.fields["deleted"]:
-                    del record.fields["deleted"]
-                    records.append(record.fields)
-            
             seqfile.seek(4 + schema_size + 4 + (self.REC_SIZE * main_elements))
             aux_elements = struct.unpack("I", seqfile.read(4))[0]
             self.read_count += 1
 
-            for _ in range(aux_elements):
-                data = seqfile.read(self.REC_SIZE)
-                self.read_count += 1
+            yield from self._iter_area(seqfile, aux_elements, raw, deleted_at)
 
-                record = Record.unpack(data, self.format, self.schema)
+    def iter_sorted(self, key: str, where=None):
+        """
+        Como iter_all, pero ordenado por 'key' (la clave del archivo): el área principal ya está
+        ordenada y se mezcla con el aux ordenado en memoria (acotado por max_aux_size).
+        """
+        raw = where.raw(self.schema) if where is not None else None
+        deleted_at = raw_index(self.schema, "deleted") if raw is not None else None
 
-                if not record.fields["deleted"]:
-                    del record.fields["deleted"]
-                    records.append(record.fields)
+        with open(self.filename, "r+b") as seqfile:
 
-        return records
+            schema_size = struct.unpack("I", seqfile.read(4))[0]
+            self.read_count += 1
+
+            seqfile.seek(0, 2)
+            end = seqfile.tell()
+
+            if (end == 4 + schema_size):
+                return
+
+            seqfile.seek(4 + schema_size)
+            main_elements = struct.unpack("I", seqfile.read(4))[0]
+            self.read_count += 1
+
+            aux = []
+            for record in self._read_aux_sorted(seqfile, key, 4 + schema_size + 4 + (self.REC_SIZE * main_elements)):
+                del record.fields["deleted"]
+                if where is None or where(record.fields):
+                    aux.append(record.fields)
+
+            seqfile.seek(4 + schema_size + 4)
+            main = self._iter_area(seqfile, main_elements, raw, deleted_at)
+            yield from heapq.merge(main, aux, key=lambda fields: fields[key])
+
+    def edge(self, key: str, last: bool = False):
+        """
+        Registro vivo con la menor (o mayor) clave: el primero (último) vivo del área principal
+        contra el extremo del aux ordenado. Sin recorrer el main salvo por registros borrados.
+        """
+        with open(self.filename, "rb") as seqfile:
+
+            schema_size = struct.unpack("I", seqfile.read(4))[0]
+            self.read_count += 1
 
+            seqfile.seek(0, 2)
+            if seqfile.tell() == 4 + schema_size:
+                return None
 
+            seqfile.seek(4 + schema_size)
+            main_elements = struct.unpack("I", seqfile.read(4))[0]
+            self.read_count += 1
 
+            candidates = []
+            order = range(main_elements - 1, -1, -1) if last else range(main_elements)
+            for i in order:
+                seqfile.seek(4 + schema_size + 4 + i * self.REC_SIZE)
+                record = Record.unpack(seqfile.read(self.REC_SIZE), self.format, self.schema)
+                self.read_count += 1
+                if not record.fields["deleted"]:
+                    candidates.append(record)
+                    break
+
+            aux = self._read_aux_sorted(seqfile, key, 4 + schema_size + 4 + (self.REC_SIZE * main_elements))
+            if aux:
+                candidates.append(aux[-1] if last else aux[0])
 
-            
+        if not candidates:
+            return None
+        pick = max if last else min
+        record = pick(candidates, key=lambda r: r.fields[key])
+        del record.fields["deleted"]
+        return record.fields
 
+    def _iter_area(self, seqfile, elements, raw, deleted_at):
+        """Registros vivos de un área (main o aux) desde la posición actual del archivo."""
+        for _ in range(elements):
+            data = seqfile.read(self.REC_SIZE)
+            self.read_count += 1
 
+            if raw is not None:
+                values = struct.unpack(self.format, data)
+                if values[deleted_at] or not raw(values):
+                    continue
 
+            record = Record.unpack(data, self.format, self.schema)
+
+            if not record.fields["deleted"]:
+                del record.fields["deleted"]
+                yield record.fields
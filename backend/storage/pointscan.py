@@ -0,0 +1,227 @@
+"""
+KNN y radio por fuerza bruta para columnas de puntos sin índice espacial.
+
+La columna se lee por bloques de BD2_SCAN_BLOCK registros: con PK heap directo de los bytes
+del archivo (una lectura por bloque, sin decodificar el resto del registro); con otros
+primarios, en tramos de iter_all (la tabla no se materializa). Cada bloque se convierte a
+arreglos (x, y) y las distancias se calculan vectorizadas; el top-k se mantiene con
+argpartition. NumPy es opcional: sin él se hace el mismo recorrido en Python puro (más lento,
+mismo resultado).
+
+Las columnas POINT (dos 'd') se leen sin parseo; las varchar ('[x, y]' o 'x,y') se parsean
+por bloque. Un bloque es (refs, xs, ys): refs identifica la fila (pos del heap u ordinal en
+iter_all). KnnScan / WithinScan consumen los bloques de a uno para todos los puntos de la
+consulta y exponen las refs aún candidatas, así quien lee filas completas puede soltar el resto.
+"""
+import heapq, itertools, os, struct
+
+try:
+    import numpy as np
+except ImportError:  # dependencia opcional
+    np = None
+
+BLOCK_ROWS = int(os.getenv("BD2_SCAN_BLOCK", "4096") or 4096)
+_DD = struct.Struct("dd")
+
+
+def engine() -> str:
+    return "numpy" if np is not None else "python"
+
+
+# ---------- parseo de valores ----------
+def _py_point(v):
+    """(x, y) de un valor de columna ('x,y', '[x, y]', lista) o None."""
+    if isinstance(v, (list, tuple)):
+        parts = v
+    else:
+        if isinstance(v, bytes):
+            v = v.decode("utf-8", "ignore")
+        parts = str(v or "").strip("[] \x00").split(",")
+    if len(parts) < 2:
+        return None
+    try:
+        return float(parts[0]), float(str(parts[1]).strip("[] "))
+    except (TypeError, ValueError):
+        return None
+
+
+def _py_block(refs, values):
+    out_r, xs, ys = [], [], []
+    for ref, v in zip(refs, values):
+        pt = _py_point(v)
+        if pt is not None:
+            out_r.append(ref); xs.append(pt[0]); ys.append(pt[1])
+    return out_r, xs, ys
+
+
+def _np_block(refs, col):
+    """refs (ndarray) + columna como arreglo de bytes/str -> (refs, xs, ys) válidos."""
+    strip, sep = (b"[] \x00", b",") if col.dtype.kind == "S" else ("[] \x00", ",")
+    parts = np.char.partition(np.char.strip(col, strip), sep)
+    ok = parts[:, 1] == sep
+    try:
+        xs = parts[ok, 0].astype(np.float64)
+        ys = np.char.strip(parts[ok, 2], strip).astype(np.float64)
+        return refs[ok], xs, ys
+    except ValueError:
+        # algún valor raro ('[x, y, z]', texto): este bloque se parsea fila por fila
+        r, xs, ys = _py_block(refs.tolist(), col.tolist())
+        return np.asarray(r, dtype=np.int64), np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+
+
+# ---------- fuentes de bloques ----------
+def heap_blocks(hf, field: str, block_rows: int | None = None):
+    """Bloques de la columna 'field' leídos crudos del HeapFile (refs = pos de cada registro)."""
+    block_rows = block_rows or BLOCK_ROWS
+    off, code = hf.field_layout(field)
+    if code == "dd":
+        yield from _heap_point_blocks(hf, off, block_rows)
+        return
+    if not code.endswith("s"):
+        return  # columna numérica: no guarda puntos
+    width = int(code[:-1] or 1)
+    del_off, _ = hf.field_layout("deleted")
+    size = hf.REC_SIZE
+    for start, data, n in hf.scan_blocks(block_rows):
+        if np is not None:
+            rows = np.frombuffer(data, dtype=np.uint8, count=n * size).reshape(n, size)
+            alive = rows[:, del_off] == 0
+            col = np.ascontiguousarray(rows[alive, off:off + width]).view(f"S{width}").ravel()
+            refs = start + np.flatnonzero(alive).astype(np.int64) * size
+            yield _np_block(refs, col)
+            continue
+        refs, values = [], []
+        for base in range(0, n * size, size):
+            if not data[base + del_off]:
+                refs.append(start + base)
+                values.append(data[base + off: base + off + width].rstrip(b"\x00"))
+        yield _py_block(refs, values)
+
+
+def _heap_point_blocks(hf, off: int, block_rows: int):
+    """Columna POINT (dos 'd' nativos): los dobles se leen tal cual, sin parseo; NULL es nan."""
+    del_off, _ = hf.field_layout("deleted")
+    size = hf.REC_SIZE
+    for start, data, n in hf.scan_blocks(block_rows):
+        if np is not None:
+            rows = np.frombuffer(data, dtype=np.uint8, count=n * size).reshape(n, size)
+            xy = np.ascontiguousarray(rows[:, off:off + 16]).view(np.float64)
+            ok = (rows[:, del_off] == 0) & ~np.isnan(xy).any(axis=1)
+            refs = start + np.flatnonzero(ok).astype(np.int64) * size
+            yield refs, xy[ok, 0], xy[ok, 1]
+            continue
+        refs, xs, ys = [], [], []
+        for base in range(0, n * size, size):
+            if not data[base + del_off]:
+                x, y = _DD.unpack_from(data, base + off)
+                if x == x and y == y:
+                    refs.append(start + base); xs.append(x); ys.append(y)
+        yield refs, xs, ys
+
+
+def row_blocks(rows, field: str, block_rows: int | None = None):
+    """
+    Bloques de 'field' sobre un iterable de filas ya decodificadas, consumido de a block_rows
+    (refs = ordinal de la fila). Genera (filas del bloque, (refs, xs, ys)).
+    """
+    block_rows = block_rows or BLOCK_ROWS
+    rows = iter(rows)
+    for lo in itertools.count(0, block_rows):
+        chunk = list(itertools.islice(rows, block_rows))
+        if not chunk:
+            return
+        values = [r.get(field) for r in chunk]
+        if np is not None and all(type(v) is list for v in values):
+            # columna POINT: ya son [x, y] en float
+            xy = np.asarray(values, dtype=np.float64)
+            yield chunk, (np.arange(lo, lo + len(chunk), dtype=np.int64), xy[:, 0], xy[:, 1])
+        elif np is not None and all(isinstance(v, str) for v in values):
+            yield chunk, _np_block(np.arange(lo, lo + len(chunk), dtype=np.int64), np.asarray(values, dtype=str))
+        else:
+            r, xs, ys = _py_block(range(lo, lo + len(chunk)), values)
+            yield chunk, ((np.asarray(r, dtype=np.int64), np.asarray(xs, dtype=np.float64),
+                           np.asarray(ys, dtype=np.float64)) if np is not None else (r, xs, ys))
+
+
+# ---------- consultas ----------
+class KnnScan:
+    """Top-k de cada punto, acumulado bloque a bloque (un solo recorrido para todos los puntos)."""
+
+    def __init__(self, points, k: int):
+        self.points = [(float(x), float(y)) for x, y in points]
+        self.k = max(0, int(k))
+        if np is None:
+            self.best = [[] for _ in self.points]  # heaps de (-d2, ref) con los k mejores
+        else:
+            self.best = [(np.empty(0, dtype=np.float64), np.empty(0, dtype=np.int64)) for _ in self.points]
+
+    def add(self, refs, xs, ys):
+        if self.k == 0:
+            return
+        if np is None:
+            for (x, y), best in zip(self.points, self.best):
+                for ref, px, py in zip(refs, xs, ys):
+                    item = (-((px - x) ** 2 + (py - y) ** 2), ref)
+                    if len(best) < self.k:
+                        heapq.heappush(best, item)
+                    elif item[0] > best[0][0]:
+                        heapq.heapreplace(best, item)
+            return
+        for i, (x, y) in enumerate(self.points):
+            best_d, best_r = self.best[i]
+            cand_d = np.concatenate((best_d, (xs - x) ** 2 + (ys - y) ** 2))
+            cand_r = np.concatenate((best_r, refs))
+            if len(cand_d) > self.k:
+                keep = np.argpartition(cand_d, self.k - 1)[:self.k]
+                cand_d, cand_r = cand_d[keep], cand_r[keep]
+            self.best[i] = (cand_d, cand_r)
+
+    def refs(self) -> set:
+        """Refs que todavía están en algún top-k."""
+        if np is None:
+            return {ref for best in self.best for _, ref in best}
+        return {ref for _, best_r in self.best for ref in best_r.tolist()}
+
+    def groups(self) -> list:
+        """Por punto, las refs de sus k vecinos ordenadas por distancia."""
+        if np is None:
+            return [[ref for _, ref in sorted((-d, ref) for d, ref in best)] for best in self.best]
+        return [best_r[np.argsort(best_d, kind="stable")].tolist() for best_d, best_r in self.best]
+
+
+class WithinScan:
+    """Refs a distancia <= r de cada punto, acumuladas bloque a bloque."""
+
+    def __init__(self, points, r: float):
+        self.points = [(float(x), float(y)) for x, y in points]
+        self.r2 = float(r) * float(r)
+        self.out = [[] for _ in self.points]
+
+    def add(self, refs, xs, ys):
+        for (x, y), out in zip(self.points, self.out):
+            if np is None:
+                out.extend(ref for ref, px, py in zip(refs, xs, ys) if (px - x) ** 2 + (py - y) ** 2 <= self.r2)
+            else:
+                out.extend(refs[(xs - x) ** 2 + (ys - y) ** 2 <= self.r2].tolist())
+
+    def refs(self) -> set:
+        return {ref for out in self.out for ref in out}
+
+    def groups(self) -> list:
+        return self.out
+
+
+def knn(blocks, x: float, y: float, k: int):
+    """refs de los k puntos más cercanos a (x, y), ordenados por distancia."""
+    scan = KnnScan([(x, y)], k)
+    for block in blocks:
+        scan.add(*block)
+    return scan.groups()[0]
+
+
+def within(blocks, x: float, y: float, r: float):
+    """refs de los puntos a distancia <= r de (x, y)."""
+    scan = WithinScan([(x, y)], r)
+    for block in blocks:
+        scan.add(*block)
+    return scan.groups()[0]
@@ -0,0 +1,110 @@
+"""
+Conjuntos de RIDs para combinar índices secundarios (index merge: AND -> intersección, OR -> unión).
+
+- PK heap: el RID es la posición del registro. Todas las posiciones son base + k * REC_SIZE,
+  así que el conjunto es un bitmap (int de Python) indexado por k: AND/OR son & y | y los
+  bits salen en orden de archivo.
+- Otros primarios: el RID es la PK. El conjunto es una lista ordenada sin repetidos; AND/OR
+  se hacen mezclando las dos listas.
+
+En ambos casos el primario se lee después, una vez por RID sobreviviente y en orden.
+"""
+
+
+class BitmapRids:
+    """Posiciones del heap como bitmap; 'off' es base % REC_SIZE (igual para todos los registros)."""
+
+    def __init__(self, rec_size: int, bits: int = 0, off: int | None = None):
+        self.rec_size = rec_size
+        self.bits = bits
+        self.off = off
+
+    @classmethod
+    def from_positions(cls, positions, rec_size: int) -> "BitmapRids":
+        ks, off = [], None
+        for pos in positions:
+            k, r = divmod(int(pos), rec_size)
+            off = r if off is None else off
+            ks.append(k)
+        if not ks:
+            return cls(rec_size)
+        buf = bytearray(max(ks) // 8 + 1)
+        for k in ks:
+            buf[k >> 3] |= 1 << (k & 7)
+        return cls(rec_size, int.from_bytes(buf, "little"), off)
+
+    def _same(self, other: "BitmapRids") -> int | None:
+        return self.off if self.off is not None else other.off
+
+    def __and__(self, other: "BitmapRids") -> "BitmapRids":
+        return BitmapRids(self.rec_size, self.bits & other.bits, self._same(other))
+
+    def __or__(self, other: "BitmapRids") -> "BitmapRids":
+        return BitmapRids(self.rec_size, self.bits | other.bits, self._same(other))
+
+    def __len__(self) -> int:
+        return self.bits.bit_count()
+
+    def __iter__(self):
+        """Posiciones en orden creciente (recorre los bytes del bitmap, lineal en su tamaño)."""
+        if not self.bits:
+            return
+        data = self.bits.to_bytes((self.bits.bit_length() + 7) // 8, "little")
+        for i, byte in enumerate(data):
+            while byte:
+                low = byte & -byte
+                yield ((i << 3) + low.bit_length() - 1) * self.rec_size + self.off
+                byte ^= low
+
+
+class SortedRids:
+    """PKs ordenadas y sin repetidos."""
+
+    def __init__(self, keys: list):
+        self.keys = keys
+
+    @classmethod
+    def from_keys(cls, keys) -> "SortedRids":
+        uniq = set(keys)
+        try:
+            return cls(sorted(uniq))
+        except TypeError:   # PKs de tipos mezclados: orden estable por representación
+            return cls(sorted(uniq, key=repr))
+
+    def __and__(self, other: "SortedRids") -> "SortedRids":
+        a, b, out = self.keys, other.keys, []
+        i = j = 0
+        try:
+            while i < len(a) and j < len(b):
+                if a[i] == b[j]:
+                    out.append(a[i]); i += 1; j += 1
+                elif a[i] < b[j]:
+                    i += 1
+                else:
+                    j += 1
+        except TypeError:
+            s = set(b)
+            out = [k for k in a if k in s]
+        return SortedRids(out)
+
+    def __or__(self, other: "SortedRids") -> "SortedRids":
+        a, b, out = self.keys, other.keys, []
+        i = j = 0
+        try:
+            while i < len(a) and j < len(b):
+                if a[i] == b[j]:
+                    out.append(a[i]); i += 1; j += 1
+                elif a[i] < b[j]:
+                    out.append(a[i]); i += 1
+                else:
+                    out.append(b[j]); j += 1
+        except TypeError:
+            return SortedRids.from_keys(a + b)
+        out.extend(a[i:]); out.extend(b[j:])
+        return SortedRids(out)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __iter__(self):
+        return iter(self.keys)
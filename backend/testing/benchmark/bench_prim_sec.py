@@ -97,7 +97,7 @@ TABLE="bench_products"; PK="product_id"
 CSV_PATH="/home/bianca/Documentos/bd2/testeo/backend/testing/benchmark/bd2_bench_products_1k.csv"  # <— CAMBIA
 
 PRIMARY_METHODS=["heap","sequential","isam","bplus"]
-SECONDARIES=[("name",["hash","bplus"]),("price",["bplus"]),("coords",["rtree"])]
+SECONDARIES=[("name",["hash","bplus"]),("price",["bplus"]),("coords",["rtree","grid"])]
 
 N_LOOKUPS_EQ=100; N_LOOKUPS_RANGE=20
 PK_RANGE_SPAN=150; PRICE_RANGE_PCT=0.05
@@ -136,6 +136,7 @@ def coords_bounds(path, col="coords"):
 def drop_table():                return run_sql(f"drop table {TABLE}")
 def create_from_file(primary):   return run_sql(f"create table {TABLE} from file '{CSV_PATH}' using index {primary}({PK})")
 def create_secondary(col, meth): return run_sql(f"create index idx_{TABLE}_{col}_{meth} on {TABLE}({col}) using {meth}")
+def drop_secondary(col):         return run_sql(f"drop index on {TABLE} ({col})")
 def select_pk_eq(k):             return run_sql(f"select * from {TABLE} where {PK} = {int(k)}")
 def select_pk_range(lo,hi):      return run_sql(f"select * from {TABLE} where {PK} between {int(lo)} and {int(hi)}")
 def select_name_eq(val):
@@ -143,6 +144,9 @@ def select_name_eq(val):
     return run_sql(f"select * from {TABLE} where name = '{safe}'")
 def select_price_range(lo,hi):   return run_sql(f"select * from {TABLE} where price between {float(lo)} and {float(hi)}")
 def select_knn_coords(x,y,k):    return run_sql(f"knn {TABLE} on coords point ({x},{y}) k {k}")
+def select_knn_batch(pts,k):
+    pts_sql=", ".join(f"({x},{y})" for x,y in pts)
+    return run_sql(f"select * from {TABLE} where coords knn (points({pts_sql}), {k})")
 
 # ========= Preload =========
 print("Preparando bounds...")
@@ -196,13 +200,24 @@ for primary in PRIMARY_METHODS:
                         "primary":primary,"target":col,"secondary":meth,"op":"search_range"
                     }))
 
-            elif col=="coords" and meth=="rtree":
+            elif col=="coords":
+                knn_pts=[]
                 for _ in range(KNN_QUERIES):
                     x = random.uniform(XMIN,XMAX); y = random.uniform(YMIN,YMAX)
+                    knn_pts.append((x,y))
                     env = select_knn_coords(x,y,KNN_K)
                     results.append(take_stats(env,"search/knn",primary,{
-                        "primary":primary,"target":"coords","secondary":"rtree","op":"knn","k":KNN_K
+                        "primary":primary,"target":"coords","secondary":meth,"op":"knn","k":KNN_K
                     }))
+                # mismos puntos en una sola sentencia (rtree: un recorrido del árbol)
+                env = select_knn_batch(knn_pts,KNN_K)
+                results.append(take_stats(env,"search/knn_batch",primary,{
+                    "primary":primary,"target":"coords","secondary":meth,"op":"knn_batch",
+                    "k":KNN_K,"points":len(knn_pts)
+                }))
+
+            # una columna admite un solo índice secundario: se quita antes del siguiente método
+            drop_secondary(col)
 
     drop_table()
 
@@ -0,0 +1,83 @@
+# bench_rtree_variants.py
+# Compara las variantes de inserción del R-Tree (split lineal vs R*-tree) sobre places.csv:
+# consultas por rectángulo, radio y KNN. Mide nodos leídos y tiempo por consulta.
+# Uso: PYTHONPATH=. python backend/testing/benchmark/bench_rtree_variants.py
+import csv, random, pathlib, tempfile, time, datetime as dt
+
+from backend.storage.indexes.rtree import RTreeFile, VARIANTS
+
+PLACES_CSV = pathlib.Path(__file__).resolve().parents[1] / "_testdata" / "csv" / "places.csv"
+REPLICAS   = 40      # copias con jitter de places.csv (100 puntos) para tener varios niveles
+JITTER     = 3.0
+M          = 16
+N_QUERIES  = 200
+RECT_SIDE  = 6.0
+RADIUS     = 4.0
+KNN_K      = 10
+SEED       = 7
+
+random.seed(SEED)
+
+def load_points():
+    base = []
+    with open(PLACES_CSV, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            x, y = (float(v) for v in row["coords"].split(","))
+            base.append((x, y))
+    pts = list(base)
+    for _ in range(REPLICAS - 1):
+        pts.extend((x + random.uniform(-JITTER, JITTER), y + random.uniform(-JITTER, JITTER)) for x, y in base)
+    return pts
+
+points = load_points()
+xmin = min(x for x, _ in points); xmax = max(x for x, _ in points)
+ymin = min(y for _, y in points); ymax = max(y for _, y in points)
+
+# Mismas consultas para ambas variantes
+queries = [(random.uniform(xmin, xmax), random.uniform(ymin, ymax)) for _ in range(N_QUERIES)]
+
+def bench_queries(rt, label, fn):
+    rt.store.read_count; rt.store.cache_hits  # descarta el delta acumulado por el build
+    t0 = time.perf_counter(); n = 0
+    for x, y in queries:
+        n += len(fn(x, y))
+    ms = (time.perf_counter() - t0) * 1000
+    # nodos visitados = lecturas de disco + aciertos de la caché de nodos
+    reads = rt.store.read_count + rt.store.cache_hits
+    return {"op": label, "avg_reads": reads / N_QUERIES, "avg_ms": ms / N_QUERIES, "avg_hits": n / N_QUERIES}
+
+results = []
+tmpdir = pathlib.Path(tempfile.mkdtemp(prefix="bench_rtree_"))
+for variant in VARIANTS:
+    rt = RTreeFile(str(tmpdir / f"places_{variant}.idx"), M=M, variant=variant)
+    t0 = time.perf_counter()
+    for i, (x, y) in enumerate(points):
+        rt.insert({"pk": i, "coords": [x, y]}, {"key": "coords"})
+    build_ms = (time.perf_counter() - t0) * 1000
+    build_w = rt.store.write_count
+    base = {"variant": variant, "points": len(points), "M": M, "height": rt.store.height,
+            "pages": rt.store.page_count(), "build_ms": build_ms, "build_writes": build_w}
+
+    half = RECT_SIDE / 2
+    for row in (
+        bench_queries(rt, "rect", lambda x, y: rt.search({"rect": (x - half, x + half, y - half, y + half)})),
+        bench_queries(rt, "radius", lambda x, y: rt.range_search({"point": (x, y), "r": RADIUS})),
+        bench_queries(rt, "knn", lambda x, y: rt.knn({"point": (x, y), "k": KNN_K})),
+    ):
+        results.append({**base, **row})
+    rt.close()
+
+# Resumen en consola
+print(f"{'variant':<8} {'op':<7} {'height':>6} {'pages':>6} {'reads/q':>8} {'ms/q':>7} {'hits/q':>7}")
+for r in results:
+    print(f"{r['variant']:<8} {r['op']:<7} {r['height']:>6} {r['pages']:>6} "
+          f"{r['avg_reads']:>8.2f} {r['avg_ms']:>7.3f} {r['avg_hits']:>7.1f}")
+
+# Guardar
+ts = dt.datetime.now().strftime("%Y%m%d_%H%M%S")
+outdir = pathlib.Path("bench_out"); outdir.mkdir(exist_ok=True)
+csv_path = outdir / f"bench_rtree_variants_{ts}.csv"
+with open(csv_path, "w", newline="", encoding="utf-8") as f:
+    w = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+    w.writeheader(); w.writerows(results)
+print(f"Saved => {csv_path} (rows={len(results)})")
@@ -0,0 +1,149 @@
+"""
+Agregaciones y GROUP BY
+- Misma tabla con cada organización del primario (heap, sequential, isam, bplus), insertada en
+  orden aleatorio y con borrados en los extremos de la PK
+- COUNT / SUM / AVG / MIN / MAX con y sin GROUP BY, con WHERE, ORDER BY y LIMIT, contra Python
+- MIN / MAX sobre la PK de un primario ordenado o un secundario B+: plan index_aggregate, sin recorrido
+- Hash aggregation: con un buffer chico los grupos van a disco y el resultado es el mismo
+"""
+import os, sys, json, random
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+if HERE not in sys.path:
+    sys.path.insert(0, HERE)
+
+try:
+    from backend.engine.engine import Engine
+except Exception:
+    from backend.engine import Engine  # type: ignore
+from backend.engine.operators import HashAggregate
+ENGINE = Engine()
+
+def run_sql(sql: str, show: bool = True) -> dict:
+    env = ENGINE.run(sql)
+    if show:
+        print(json.dumps(env, indent=2, ensure_ascii=False, default=str))
+    return env
+
+def print_section(title: str):
+    print("\n" + "="*len(title))
+    print(title)
+    print("="*len(title))
+
+def check(cond: bool, msg: str):
+    if not cond:
+        raise AssertionError(msg)
+
+COLS = ["id", "age", "city", "score"]
+random.seed(4)
+ROWS = [(i, random.randint(1, 60), f"c{i % 6}", round(random.random() * 10, 2)) for i in range(150)]
+ORDER = list(range(150))
+random.shuffle(ORDER)
+DELETED = (0, 1, 149)
+DATA = [dict(zip(COLS, r)) for r in ROWS if r[0] not in DELETED]
+
+def group(keep, by, fn):
+    groups = {}
+    for d in DATA:
+        if keep(d):
+            groups.setdefault(tuple(d[c] for c in by), []).append(d)
+    return {k: fn(v) for k, v in groups.items()}
+
+def close(a, b):
+    # FLOAT se guarda en float32
+    return a == b or (a is not None and b is not None and abs(a - b) <= 1e-5 * max(1.0, abs(b)))
+
+# (SQL, filtro, GROUP BY, {columna de salida: fn(filas del grupo)})
+QUERIES = [
+    ("SELECT COUNT(*), SUM(age), AVG(score), MIN(city), MAX(score) FROM {t};", lambda d: True, [],
+     {"count(*)": len, "sum(age)": lambda g: sum(d["age"] for d in g),
+      "avg(score)": lambda g: sum(d["score"] for d in g) / len(g),
+      "min(city)": lambda g: min(d["city"] for d in g), "max(score)": lambda g: max(d["score"] for d in g)}),
+    ("SELECT city, COUNT(*) AS n, AVG(age) FROM {t} GROUP BY city;", lambda d: True, ["city"],
+     {"n": len, "avg(age)": lambda g: sum(d["age"] for d in g) / len(g)}),
+    ("SELECT city, MIN(id), MAX(id), SUM(score) FROM {t} WHERE age BETWEEN 10 AND 40 GROUP BY city;",
+     lambda d: 10 <= d["age"] <= 40, ["city"],
+     {"min(id)": lambda g: min(d["id"] for d in g), "max(id)": lambda g: max(d["id"] for d in g),
+      "sum(score)": lambda g: sum(d["score"] for d in g)}),
+    ("SELECT age, COUNT(id) FROM {t} WHERE city = 'c2' GROUP BY age;", lambda d: d["city"] == "c2", ["age"],
+     {"count(id)": len}),
+]
+
+try:
+    for prim in ("heap", "sequential", "isam", "bplus"):
+        tbl = f"agg_{prim}"
+        print_section(f"{prim}: create + insert")
+        run_sql(f"DROP TABLE IF EXISTS {tbl};")
+        run_sql(f"""
+            CREATE TABLE {tbl} (
+                id INT PRIMARY KEY USING {prim},
+                age INT INDEX USING bplus,
+                city VARCHAR(16) INDEX USING hash,
+                score FLOAT
+            );
+        """)
+        for i in ORDER:
+            r = ROWS[i]
+            run_sql(f"INSERT INTO {tbl} VALUES ({r[0]}, {r[1]}, '{r[2]}', {r[3]});", show=False)
+        for i in DELETED:
+            run_sql(f"DELETE FROM {tbl} WHERE id = {i};", show=False)
+
+        print_section(f"{prim}: agregaciones")
+        for sql, keep, by, fns in QUERIES:
+            res = run_sql(sql.format(t=tbl), show=False)["results"][0]
+            check(res["ok"], f"{prim}: {sql} -> {res.get('error')}")
+            exp = group(keep, by, lambda g: {c: fn(g) for c, fn in fns.items()})
+            got = {tuple(r[c] for c in by): r for r in res["data"]}
+            check(set(got) == set(exp), f"{prim}: {sql} grupos {sorted(got)} != {sorted(exp)}")
+            for k, e in exp.items():
+                check(all(close(got[k][c], v) for c, v in e.items()), f"{prim}: {sql} grupo {k}: {got[k]} != {e}")
+                check(list(got[k]) == list(by) + list(fns), f"{prim}: columnas de salida {list(got[k])}")
+            print(f"[OK] {prim:10s} {len(got):3d} grupos  {res['meta']['pipeline'][-3:]}")
+
+        res = run_sql(f"SELECT city, COUNT(*) AS n FROM {tbl} GROUP BY city ORDER BY count(*) DESC, city LIMIT 2;",
+                      show=False)["results"][0]
+        counts = group(lambda d: True, ["city"], len)
+        exp = sorted(((k[0], n) for k, n in counts.items()), key=lambda x: (-x[1], x[0]))[:2]
+        check([(r["city"], r["n"]) for r in res["data"]] == exp, f"{prim}: ORDER BY agregación {res['data']}")
+
+        empty = run_sql(f"SELECT COUNT(*), MAX(score) FROM {tbl} WHERE age > 1000;", show=False)["results"][0]
+        check(empty["data"] == [{"count(*)": 0, "max(score)": None}], f"{prim}: agregado sin filas {empty['data']}")
+
+        print_section(f"{prim}: MIN / MAX por índice")
+        full = run_sql(f"SELECT * FROM {tbl};", show=False)["results"][0]
+        res = run_sql(f"SELECT MIN(id), MAX(id), MIN(age) AS lo, MAX(age) FROM {tbl};", show=False)["results"][0]
+        ids, ages = [d["id"] for d in DATA], [d["age"] for d in DATA]
+        check(res["data"] == [{"min(id)": min(ids), "max(id)": max(ids), "lo": min(ages), "max(age)": max(ages)}],
+              f"{prim}: MIN/MAX {res['data']}")
+        reads = lambda r: r["meta"]["io"]["total"]["read_count"]
+        if prim == "heap":
+            check(res["plan"]["action"] == "select", "heap: la PK no está ordenada, se recorre")
+        else:
+            check(res["plan"]["action"] == "index_aggregate", f"{prim}: plan {res['plan']['action']}")
+            check(not any(op.startswith("scan") for op in res["meta"]["pipeline"]), f"{prim}: {res['meta']['pipeline']}")
+            if prim != "isam":  # el recorrido del ISAM cuenta una lectura por archivo, no por página
+                check(reads(res) < reads(full), f"{prim}: MIN/MAX leyó {reads(res)} (recorrido: {reads(full)})")
+        print(f"[OK] {prim:10s} {res['plan']['action']:16s} lecturas {reads(res)} / recorrido {reads(full)}")
+
+    print_section("Hash aggregation con spill")
+    rows = [{"g": i % 97, "h": i % 3, "v": i} for i in range(2000)] + [{"g": None, "h": 0, "v": None}]
+    aggs = [{"func": "COUNT", "column": None, "name": "n"}, {"func": "SUM", "column": "v", "name": "s"},
+            {"func": "AVG", "column": "v", "name": "a"}, {"func": "MIN", "column": "v", "name": "lo"}]
+    op = HashAggregate(rows, ["g", "h"], aggs, buffer=20, partitions=4)
+    got = sorted(op, key=lambda r: (r["g"] is None, r["g"] or 0, r["h"]))
+    mem = sorted(HashAggregate(rows, ["g", "h"], aggs), key=lambda r: (r["g"] is None, r["g"] or 0, r["h"]))
+    check(op.spilled > 0, "con buffer 20 debe bajar grupos a disco")
+    check(got == mem and len(got) == 97 * 3 + 1, "hash aggregation con spill = en memoria")
+    check(got[-1] == {"g": None, "h": 0, "n": 1, "s": None, "a": None, "lo": None}, f"grupo NULL {got[-1]}")
+
+    print_section("Errores")
+    check(not run_sql("SELECT SUM(city) FROM agg_heap;", show=False)["ok"], "SUM de texto")
+    check(not run_sql("SELECT id, COUNT(*) FROM agg_heap;", show=False)["ok"], "columna fuera de GROUP BY")
+    check(not run_sql("SELECT * FROM agg_heap GROUP BY city;", show=False)["ok"], "SELECT * con GROUP BY")
+    check(not run_sql("SELECT city, COUNT(*) FROM agg_heap GROUP BY city ORDER BY age;", show=False)["ok"],
+          "ORDER BY fuera de la salida")
+
+    print("\n✅ AGGREGATE OK.")
+except AssertionError as e:
+    print(f"\n❌ TEST FAILED: {e}")
+    sys.exit(1)
@@ -0,0 +1,123 @@
+"""
+ANALYZE + elección por costo
+- Crea una tabla con B+ primario, B+ sobre 'age' y hash sobre 'city'
+- ANALYZE: filas, nulos, min/max, histograma equi-depth y distintos (HyperLogLog)
+- Con estadísticas: rango angosto usa el índice, rango casi completo recorre el primario
+- ANALYZE t (col) solo recalcula esa columna
+- Los cambios desde el último ANALYZE ajustan 'rows'; pasado el umbral las estadísticas quedan
+  viejas y el planner re-analiza al estimar (no la escritura que cruzó el umbral)
+- La muestra del histograma es por columna: nulos al principio no la dejan vacía
+"""
+import os, sys, json, random
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+if HERE not in sys.path:
+    sys.path.insert(0, HERE)
+
+try:
+    from backend.engine.engine import Engine
+except Exception:
+    from backend.engine import Engine  # type: ignore
+from backend.catalog.stats import current_stats, AUTO_BASE, AUTO_SCALE
+import backend.catalog.stats as stats_mod
+from backend.storage.file import File
+ENGINE = Engine()
+
+def run_sql(sql: str, show: bool = True) -> dict:
+    env = ENGINE.run(sql)
+    if show:
+        print(json.dumps(env, indent=2, ensure_ascii=False, default=str))
+    return env
+
+def print_section(title: str):
+    print("\n" + "="*len(title))
+    print(title)
+    print("="*len(title))
+
+def check(cond: bool, msg: str):
+    if not cond:
+        raise AssertionError(msg)
+
+tbl = "analyze_people"
+N = 300
+random.seed(7)
+ages = [random.randint(18, 77) for _ in range(N)]
+
+print_section("1. Create + insert")
+run_sql(f"DROP TABLE IF EXISTS {tbl};")
+run_sql(f"""
+    CREATE TABLE {tbl} (
+        id INT PRIMARY KEY USING bplus,
+        age INT INDEX USING bplus,
+        city VARCHAR(16) INDEX USING hash,
+        nick VARCHAR(16)
+    );
+""")
+for i, a in enumerate(ages):
+    nick = "NULL" if i % 4 == 0 else f"'n{i}'"
+    run_sql(f"INSERT INTO {tbl} VALUES ({i}, {a}, 'c{i % 12}', {nick});", show=False)
+
+try:
+    print_section("2. ANALYZE")
+    env = run_sql(f"ANALYZE {tbl};")
+    res = env["results"][0]
+    check(res["ok"] and res["meta"]["rows"] == N, "ANALYZE debe contar todas las filas")
+    cols = {c["column"]: c for c in res["data"]}
+    check(cols["age"]["min"] == min(ages) and cols["age"]["max"] == max(ages), "min/max de age")
+    check(abs(cols["age"]["ndv"] - len(set(ages))) <= 2, f"ndv de age: {cols['age']['ndv']}")
+    check(cols["city"]["ndv"] == 12, f"ndv de city: {cols['city']['ndv']}")
+    check(abs(cols["nick"]["nulls"] - 0.25) < 1e-6, "fracción de nulos de nick")
+    hist = current_stats(tbl)["columns"]["age"]["hist"]
+    check(hist == sorted(hist) and hist[0] == min(ages) and hist[-1] == max(ages), "histograma equi-depth")
+
+    print_section("3. Planner con estadísticas")
+    env = run_sql(f"SELECT * FROM {tbl} WHERE age BETWEEN 18 AND 76;")
+    res = env["results"][0]
+    check(res["plan"].get("access") == "primary", "rango casi completo debe recorrer el primario")
+    check(len(res["data"]) == sum(1 for a in ages if a <= 76), "filas del rango (primario)")
+    env = run_sql(f"SELECT * FROM {tbl} WHERE age BETWEEN 30 AND 31;")
+    res = env["results"][0]
+    check(res["plan"].get("access") != "primary", "rango angosto debe usar el índice")
+    check(len(res["data"]) == sum(1 for a in ages if 30 <= a <= 31), "filas del rango (índice)")
+    est = res["plan"]["estimate"]
+    check(est["stats"] == "analyze" and est["table_rows"] == N, "estimado con stats de ANALYZE")
+
+    print_section("4. ANALYZE de una columna")
+    env = run_sql(f"ANALYZE {tbl} (age);")
+    check([c["column"] for c in env["results"][0]["data"]] == ["age"], "solo la columna pedida")
+    check(set(current_stats(tbl)["columns"]) == {"id", "age", "city", "nick"}, "conserva las demás columnas")
+
+    print_section("5. Refresco incremental")
+    for i in range(N, N + 20):
+        run_sql(f"INSERT INTO {tbl} VALUES ({i}, 20, 'c0', 'x');", show=False)
+    run_sql(f"DELETE FROM {tbl} WHERE id = 1;", show=False)
+    st = current_stats(tbl)
+    check(st["rows"] == N + 19 and st["modified"] == 21, f"rows ajustado: {st.get('rows')}")
+    extra = int(AUTO_BASE + AUTO_SCALE * N) - 20
+    for i in range(N + 20, N + 20 + extra):
+        res = run_sql(f"INSERT INTO {tbl} VALUES ({i}, 20, 'c0', 'x');", show=False)["results"][0]
+    st = current_stats(tbl)
+    check(st["stale"] and st["modified"] == 21 + extra, "pasado el umbral quedan viejas, sin re-analizar")
+    check(res["meta"]["io"]["total"]["read_count"] < N, "el INSERT que cruza el umbral no recorre la tabla")
+    run_sql(f"SELECT * FROM {tbl} WHERE age = 20;", show=False)
+    st = current_stats(tbl)
+    check(not st["stale"] and st["modified"] == 0 and st["rows"] == N + 19 + extra, "el planner re-analiza")
+    check(st["columns"]["age"]["hist"][0] == min(ages + [20]), "histograma re-calculado")
+
+    print_section("6. Muestra con nulos al principio")
+    run_sql("DROP TABLE IF EXISTS an_nulls;", show=False)
+    run_sql("CREATE TABLE an_nulls (id INT PRIMARY KEY USING isam, tag VARCHAR(8));", show=False)
+    File("an_nulls").execute({"op": "build", "records": [
+        {"id": i, "tag": "" if i < 50 else f"t{i % 300:03d}"} for i in range(2050)]})
+    sample_rows, stats_mod.SAMPLE_ROWS = stats_mod.SAMPLE_ROWS, 50   # BD2_ANALYZE_SAMPLE=50
+    try:
+        col = stats_mod.analyze("an_nulls")["columns"]["tag"]
+    finally:
+        stats_mod.SAMPLE_ROWS = sample_rows
+    check(len(col.get("hist") or []) == stats_mod.HIST_BUCKETS + 1, f"histograma con prefijo nulo: {col}")
+    check(abs(col["nulls"] - 50 / 2050) < 1e-6, "fracción de nulos")
+
+    print("\n✅ ANALYZE OK.")
+except AssertionError as e:
+    print(f"\n❌ TEST FAILED: {e}")
+    sys.exit(1)
@@ -0,0 +1,131 @@
+"""
+Conteos vivos y COUNT(*) sin recorrido
+- Cada primario (heap, sequential, isam, bplus) con secundarios hash y bplus: insert, insert
+  duplicado (rechazado) y delete mantienen <tabla>.cnt (filas y entradas por secundario)
+- SELECT COUNT(*) FROM t: plan index_aggregate, cero lecturas, mismo valor que un recorrido
+- El planner estima con el conteo (estimate.table_rows) aunque no haya ANALYZE
+- CREATE INDEX / DROP INDEX, CREATE TABLE ... FROM FILE (build ISAM e import) y tablas sin
+  conteos (se recuentan una vez)
+"""
+import os, sys, json, csv, random, tempfile
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+if HERE not in sys.path:
+    sys.path.insert(0, HERE)
+
+try:
+    from backend.engine.engine import Engine
+except Exception:
+    from backend.engine import Engine  # type: ignore
+from backend.catalog.catalog import get_counts, table_counts_path
+from backend.storage.file import File
+ENGINE = Engine()
+
+def run_sql(sql: str, show: bool = True) -> dict:
+    env = ENGINE.run(sql)
+    if show:
+        print(json.dumps(env, indent=2, ensure_ascii=False, default=str))
+    return env
+
+def print_section(title: str):
+    print("\n" + "="*len(title))
+    print(title)
+    print("="*len(title))
+
+def check(cond: bool, msg: str):
+    if not cond:
+        raise AssertionError(msg)
+
+random.seed(5)
+N = 120
+ROWS = [(i, random.randint(1, 40), f"c{i % 5}") for i in range(N)]
+ORDER = list(range(N))
+random.shuffle(ORDER)
+DELETED = (0, 7, 63, 119)
+LIVE = N - len(DELETED)
+
+reads = lambda r: r["meta"]["io"]["total"]["read_count"]
+
+def count_star(tbl: str) -> dict:
+    res = run_sql(f"SELECT COUNT(*) FROM {tbl};", show=False)["results"][0]
+    check(res["ok"], f"{tbl}: COUNT(*) -> {res.get('error')}")
+    return res
+
+try:
+    for prim in ("heap", "sequential", "isam", "bplus"):
+        tbl = f"cnt_{prim}"
+        print_section(f"{prim}: insert / delete")
+        run_sql(f"DROP TABLE IF EXISTS {tbl};", show=False)
+        run_sql(f"CREATE TABLE {tbl} (id INT PRIMARY KEY USING {prim}, age INT INDEX USING bplus, "
+                f"city VARCHAR(8) INDEX USING hash);")
+        check(get_counts(tbl) == {"rows": 0, "indexes": {"age": 0, "city": 0}}, f"{prim}: conteos al crear")
+        for i in ORDER:
+            r = ROWS[i]
+            run_sql(f"INSERT INTO {tbl} VALUES ({r[0]}, {r[1]}, '{r[2]}');", show=False)
+        dup = run_sql(f"INSERT INTO {tbl} VALUES (5, 1, 'c0');", show=False)
+        check(not dup["ok"], f"{prim}: PK duplicada")
+        for i in DELETED:
+            run_sql(f"DELETE FROM {tbl} WHERE id = {i};", show=False)
+        run_sql(f"DELETE FROM {tbl} WHERE id = 1000;", show=False)
+
+        check(get_counts(tbl) == {"rows": LIVE, "indexes": {"age": LIVE, "city": LIVE}},
+              f"{prim}: conteos {get_counts(tbl)}")
+
+        res = count_star(tbl)
+        full = run_sql(f"SELECT * FROM {tbl};", show=False)["results"][0]
+        check(res["plan"]["action"] == "index_aggregate", f"{prim}: plan {res['plan']['action']}")
+        check(res["data"] == [{"count(*)": LIVE}] and len(full["data"]) == LIVE, f"{prim}: COUNT(*) {res['data']}")
+        check(reads(res) == 0, f"{prim}: COUNT(*) leyó {reads(res)}")
+
+        res = run_sql(f"SELECT COUNT(*) AS n, MIN(age), MAX(age) FROM {tbl};", show=False)["results"][0]
+        ages = [r[1] for r in ROWS if r[0] not in DELETED]
+        check(res["plan"]["action"] == "index_aggregate", f"{prim}: COUNT(*) + MIN/MAX por índice")
+        check(res["data"] == [{"n": LIVE, "min(age)": min(ages), "max(age)": max(ages)}], f"{prim}: {res['data']}")
+
+        res = run_sql(f"SELECT COUNT(*) FROM {tbl} WHERE age > 20;", show=False)["results"][0]
+        check(res["plan"]["action"] != "index_aggregate", f"{prim}: COUNT(*) con WHERE recorre")
+        check(res["data"] == [{"count(*)": sum(1 for a in ages if a > 20)}], f"{prim}: COUNT(*) con WHERE")
+
+        est = run_sql(f"SELECT * FROM {tbl} WHERE age = 3;", show=False)["results"][0]["plan"]["estimate"]
+        check(est["table_rows"] == LIVE and est["stats"] == "count", f"{prim}: estimado {est}")
+        print(f"[OK] {prim:10s} COUNT(*) = {LIVE}, 0 lecturas (recorrido: {reads(full)})")
+
+    print_section("CREATE INDEX / DROP INDEX")
+    run_sql("DROP TABLE IF EXISTS cnt_idx;", show=False)
+    run_sql("CREATE TABLE cnt_idx (id INT PRIMARY KEY USING sequential, v INT);", show=False)
+    for i in range(30):
+        run_sql(f"INSERT INTO cnt_idx VALUES ({i}, {i % 4});", show=False)
+    run_sql("CREATE INDEX ON cnt_idx (v) USING bplus;", show=False)
+    check(get_counts("cnt_idx") == {"rows": 30, "indexes": {"v": 30}}, f"CREATE INDEX {get_counts('cnt_idx')}")
+    run_sql("DELETE FROM cnt_idx WHERE v = 2;", show=False)
+    check(get_counts("cnt_idx") == {"rows": 23, "indexes": {"v": 23}}, f"DELETE por secundario {get_counts('cnt_idx')}")
+    run_sql("DROP INDEX ON cnt_idx (v);", show=False)
+    check(get_counts("cnt_idx") == {"rows": 23, "indexes": {}}, f"DROP INDEX {get_counts('cnt_idx')}")
+
+    print_section("CREATE TABLE ... FROM FILE")
+    path = os.path.join(tempfile.mkdtemp(), "cnt.csv")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["id", "age", "city"])
+        w.writerows(ROWS)
+    for prim in ("isam", "heap"):
+        tbl = f"cnt_csv_{prim}"
+        run_sql(f"DROP TABLE IF EXISTS {tbl};", show=False)
+        env = run_sql(f"CREATE TABLE {tbl} FROM FILE '{path}' USING INDEX {prim}(id);", show=False)
+        check(env["ok"], f"FROM FILE {prim}: {env['results'][0].get('error')}")
+        check(get_counts(tbl)["rows"] == N, f"FROM FILE {prim}: {get_counts(tbl)}")
+        check(count_star(tbl)["data"] == [{"count(*)": N}], f"FROM FILE {prim}: COUNT(*)")
+        run_sql(f"INSERT INTO {tbl} VALUES ({N}, 1, 'c9');", show=False)
+        check(count_star(tbl)["data"] == [{"count(*)": N + 1}], f"FROM FILE {prim}: insert posterior")
+
+    print_section("Tabla sin conteos")
+    table_counts_path("cnt_heap").unlink()
+    check(File("cnt_heap").count()["rows"] == LIVE, "recuento")
+    check(get_counts("cnt_heap") == {"rows": LIVE, "indexes": {"age": LIVE, "city": LIVE}}, "recuento persistido")
+    res = count_star("cnt_heap")
+    check(res["data"] == [{"count(*)": LIVE}] and reads(res) == 0, "COUNT(*) después del recuento")
+
+    print("\n✅ COUNT OK.")
+except AssertionError as e:
+    print(f"\n❌ TEST FAILED: {e}")
+    sys.exit(1)
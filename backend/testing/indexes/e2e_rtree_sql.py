@@ -5,9 +5,15 @@ E2E RTREE:
 - Consulta por radio: coords IN (POINT(x,y), r)
 - DELETE/REINSERT y re-evaluación
 - Idempotencia en creación de índice
+- JOIN espacial: DISTANCE(a.p, b.p) <= r con ambos, uno o ningún lado indexado
+- Mismos escenarios con USING grid + KNN contra fuerza bruta
+- KNN sin índice espacial (recorrido vectorizado) contra fuerza bruta
+- KNN / radio sin índice espacial con PK sequential, isam y bplus, en bloques chicos
+- Columna de tipo POINT (dos double) con rtree
 """
-import os, sys, csv
-from test_utils import run_sql, assert_env_ok, get_rows, ok, bad
+import os, sys, csv, json, math, random
+from test_utils import run_sql, assert_env_ok, expect_error, get_rows, ok, bad
+from backend.storage import pointscan
 
 HERE = os.path.abspath(os.path.dirname(__file__))
 CSV = os.path.join(HERE, "_testdata", "csv", "places_e2e.csv")
@@ -27,19 +33,24 @@ def ensure_places_csv(path: str):
             [7,"G","[-1.0, -1.0]"],
         ])
 
-def scenario(tbl: str, create_index_before_load: bool):
+def as_point(v):
+    # columnas POINT vuelven como [x, y]; las VARCHAR como texto JSON
+    return v if isinstance(v, list) else json.loads(v)
+
+def scenario(tbl: str, create_index_before_load: bool, method: str = "rtree", coltype: str = "VARCHAR(64)"):
     # Limpieza + tabla
     run_sql(f"DROP TABLE IF EXISTS {tbl};")
     assert_env_ok(run_sql(f"""
         CREATE TABLE {tbl} (
             id INT PRIMARY KEY,
             name VARCHAR(32),
-            coords VARCHAR(64)
+            coords {coltype}
         );
     """), msg="create table")
 
     if create_index_before_load:
-        assert_env_ok(run_sql(f"CREATE INDEX ON {tbl} (coords) USING rtree;"), msg="create index (pre)")
+        opts = " WITH (cell = 0.5)" if method == "grid" else ""
+        assert_env_ok(run_sql(f"CREATE INDEX ON {tbl} (coords) USING {method}{opts};"), msg="create index (pre)")
         ok("Índice espacial creado ANTES del load")
     else:
         ok("Índice espacial se creará DESPUÉS del load")
@@ -50,7 +61,7 @@ def scenario(tbl: str, create_index_before_load: bool):
 
     # Si no existía índice aún, créalo ahora
     if not create_index_before_load:
-        assert_env_ok(run_sql(f"CREATE INDEX IF NOT EXISTS ON {tbl} (coords) USING rtree;"), msg="create index (post)")
+        assert_env_ok(run_sql(f"CREATE INDEX IF NOT EXISTS ON {tbl} (coords) USING {method};"), msg="create index (post)")
         ok("Índice espacial creado DESPUÉS del load")
 
     # Consulta por radio (centro 0,0, r=1.1) -> {1,2,3}
@@ -60,6 +71,13 @@ def scenario(tbl: str, create_index_before_load: bool):
         bad(f"Geo radius ids esperados [1,2,3], got {ids}")
     ok("Geo radius inicial OK")
 
+    # Sin resultados: un solo camino de acceso (el índice), sin scans de respaldo
+    r = assert_env_ok(run_sql(f"SELECT * FROM {tbl} WHERE coords IN (POINT(50.0, 50.0), 1.0);"), msg="geo radius vacío")
+    usage = [(u["index"], u["op"]) for u in r["meta"]["index_usage"]]
+    if get_rows(r) or r["plan"].get("access") != method or usage != [(method, "geo_within")]:
+        bad(f"Geo radius vacío debería usar solo el índice {method}, got plan={r['plan']} usage={usage}")
+    ok("Geo radius vacío con un solo acceso OK")
+
     # DELETE uno (id=2) y verificar que cambia el resultado
     assert_env_ok(run_sql(f"DELETE FROM {tbl} WHERE id = 2;"), msg="delete id=2")
     r = assert_env_ok(run_sql(f"SELECT * FROM {tbl} WHERE coords IN (POINT(0.0, 0.0), 1.1);"), msg="geo radius post-delete")
@@ -69,13 +87,117 @@ def scenario(tbl: str, create_index_before_load: bool):
     ok("Geo radius tras delete OK")
 
     # REINSERT id=2 y confirmar vuelve al set original
-    assert_env_ok(run_sql(f"INSERT INTO {tbl} VALUES (2, 'B', '[1.0, 0.0]');"), msg="reinsert 2")
+    value = "POINT(1.0, 0.0)" if coltype == "POINT" else "'[1.0, 0.0]'"
+    assert_env_ok(run_sql(f"INSERT INTO {tbl} VALUES (2, 'B', {value});"), msg="reinsert 2")
     r = assert_env_ok(run_sql(f"SELECT * FROM {tbl} WHERE coords IN (POINT(0.0, 0.0), 1.1);"), msg="geo radius post-reinsert")
     ids = sorted([int(x["id"]) for x in get_rows(r)])
     if ids != [1, 2, 3]:
         bad(f"Geo radius tras reinsert -> [1,2,3], got {ids}")
     ok("Geo radius tras reinsert OK")
 
+def join_scenario():
+    # Tabla sin índice espacial para forzar index_nl / nested_loop
+    noidx = "e2e_places_noidx"
+    run_sql(f"DROP TABLE IF EXISTS {noidx};")
+    clean = CSV.replace("\\", "/")
+    assert_env_ok(run_sql(f"CREATE TABLE {noidx} FROM FILE '{clean}';"), msg="import noidx")
+
+    with open(CSV, newline="", encoding="utf-8") as f:
+        pts = {int(r["id"]): json.loads(r["coords"]) for r in csv.DictReader(f)}
+    for op, radius in (("<=", 1.0), ("<", 1.0), ("<=", 1.5)):
+        near = lambda d: d <= radius if op == "<=" else d < radius
+        expected = sorted((i, j) for i in pts for j in pts
+                          if near(math.dist(pts[i], pts[j])))
+        for left, right, strategy in (("e2e_places_preidx", "e2e_places_postidx", "rtree_sync"),
+                                      ("e2e_places_preidx", noidx, "index_nl"),
+                                      (noidx, "e2e_places_postidx", "index_nl"),
+                                      (noidx, noidx, "nested_loop")):
+            r = assert_env_ok(run_sql(
+                f"SELECT a.id, b.id FROM {left} a JOIN {right} AS b "
+                f"ON DISTANCE(a.coords, b.coords) {op} {radius};"), msg=f"join {strategy}")
+            got = sorted((int(x["a.id"]), int(x["b.id"])) for x in get_rows(r))
+            if r["meta"]["join"]["strategy"] != strategy:
+                bad(f"JOIN {left}/{right}: estrategia {r['meta']['join']['strategy']} != {strategy}")
+            if got != expected:
+                bad(f"JOIN {strategy} {op} {radius}: esperado {expected}, got {got}")
+        ok(f"JOIN espacial {op} {radius} OK ({len(expected)} pares, 3 estrategias)")
+
+    # columna sin calificar ambigua -> error
+    expect_error(f"SELECT id FROM e2e_places_preidx a JOIN {noidx} b ON DISTANCE(a.coords, b.coords) <= 1;")
+    ok("JOIN con columna ambigua rechazado")
+
+def knn_scenario(tbl: str, index: str):
+    # KNN (uno y por lote) contra fuerza bruta; en la grilla el anillo tiene que crecer
+    with open(CSV, newline="", encoding="utf-8") as f:
+        pts = {int(r["id"]): json.loads(r["coords"]) for r in csv.DictReader(f)}
+    queries = [(0.2, 0.1), (4.0, 4.0), (30.0, 20.0)]
+    for x, y in queries:
+        for k in (1, 3, 7):
+            r = assert_env_ok(run_sql(f"SELECT * FROM {tbl} WHERE coords KNN (POINT({x}, {y}), {k});"),
+                              msg=f"{index} knn")
+            got = sorted(math.dist(as_point(row["coords"]), (x, y)) for row in get_rows(r))
+            exp = sorted(math.dist(p, (x, y)) for p in pts.values())[:k]
+            if got != exp:
+                bad(f"KNN {index} ({x},{y}) k={k}: esperado {exp}, got {got}")
+            if [u["index"] for u in r["meta"]["index_usage"]][:1] != [index]:
+                bad(f"KNN debería usar {index}, got {r['meta']['index_usage']}")
+    pts_sql = ", ".join(f"({x}, {y})" for x, y in queries)
+    r = assert_env_ok(run_sql(f"SELECT * FROM {tbl} WHERE coords KNN (POINTS({pts_sql}), 2);"),
+                      msg=f"{index} knn batch")
+    if [g["count"] for g in get_rows(r)] != [2] * len(queries):
+        bad(f"KNN {index} por lote: {get_rows(r)}")
+    ok(f"KNN {index} (simple y por lote) OK")
+
+def scan_scenario():
+    # sin índice espacial con PK no heap: iter_all por bloques de 16 filas (varios bloques)
+    rnd = random.Random(40)
+    pts = {i: (round(rnd.uniform(0, 50), 3), round(rnd.uniform(0, 50), 3)) for i in range(1, 151)}
+    queries = [(10.0, 10.0), (25.5, 40.0), (49.0, 1.0)]
+    block_rows = pointscan.BLOCK_ROWS
+    pointscan.BLOCK_ROWS = 16
+    try:
+        for prim in ("sequential", "isam", "bplus"):
+            for coltype in ("VARCHAR(64)", "POINT"):
+                tbl = f"e2e_scan_{prim}_{'pt' if coltype == 'POINT' else 'vc'}"
+                run_sql(f"DROP TABLE IF EXISTS {tbl};")
+                assert_env_ok(run_sql(f"CREATE TABLE {tbl} (id INT PRIMARY KEY USING {prim}, coords {coltype});"),
+                              msg=f"create {tbl}")
+                lit = (lambda p: f"POINT({p[0]}, {p[1]})") if coltype == "POINT" else (lambda p: f"'[{p[0]}, {p[1]}]'")
+                values = ", ".join(f"({i}, {lit(p)})" for i, p in pts.items())
+                assert_env_ok(run_sql(f"INSERT INTO {tbl} VALUES {values};"), msg=f"load {tbl}")
+
+                for x, y in queries:
+                    exp = sorted(math.dist(p, (x, y)) for p in pts.values())[:7]
+                    r = assert_env_ok(run_sql(f"SELECT * FROM {tbl} WHERE coords KNN (POINT({x}, {y}), 7);"),
+                                      msg=f"{tbl} knn")
+                    got = [math.dist(as_point(row["coords"]), (x, y)) for row in get_rows(r)]
+                    if got != exp:
+                        bad(f"KNN {tbl} ({x},{y}): esperado {exp}, got {got}")
+                    if [u.get("note") for u in r["meta"]["index_usage"]][:1] != [f"scan {pointscan.engine()}"]:
+                        bad(f"KNN {tbl} debería recorrer la columna: {r['meta']['index_usage']}")
+                    r = assert_env_ok(run_sql(f"SELECT * FROM {tbl} WHERE coords IN (POINT({x}, {y}), 12.5);"),
+                                      msg=f"{tbl} radio")
+                    got = sorted(int(row["id"]) for row in get_rows(r))
+                    if got != sorted(i for i, p in pts.items() if math.dist(p, (x, y)) <= 12.5):
+                        bad(f"Radio {tbl} ({x},{y}): {got}")
+
+                pts_sql = ", ".join(f"({x}, {y})" for x, y in queries)
+                r = assert_env_ok(run_sql(f"SELECT * FROM {tbl} WHERE coords KNN (POINTS({pts_sql}), 5);"),
+                                  msg=f"{tbl} knn batch")
+                for (x, y), g in zip(queries, get_rows(r)):
+                    got = [math.dist(as_point(row["coords"]), (x, y)) for row in g["rows"]]
+                    if got != sorted(math.dist(p, (x, y)) for p in pts.values())[:5]:
+                        bad(f"KNN por lote {tbl} ({x},{y}): {got}")
+                r = assert_env_ok(run_sql(f"SELECT * FROM {tbl} WHERE coords IN (POINTS({pts_sql}), 8.0);"),
+                                  msg=f"{tbl} radio batch")
+                for (x, y), g in zip(queries, get_rows(r)):
+                    got = sorted(int(row["id"]) for row in g["rows"])
+                    if got != sorted(i for i, p in pts.items() if math.dist(p, (x, y)) <= 8.0):
+                        bad(f"Radio por lote {tbl} ({x},{y}): {got}")
+            ok(f"KNN / radio sin índice con PK {prim} (bloques de 16) OK")
+    finally:
+        pointscan.BLOCK_ROWS = block_rows
+
 def main():
     ensure_places_csv(CSV)
     print("\n" + "="*70)
@@ -84,6 +206,14 @@ def main():
 
     scenario("e2e_places_preidx", create_index_before_load=True)
     scenario("e2e_places_postidx", create_index_before_load=False)
+    join_scenario()
+    scenario("e2e_places_grid_pre", create_index_before_load=True, method="grid")
+    scenario("e2e_places_grid_post", create_index_before_load=False, method="grid")
+    knn_scenario("e2e_places_grid_pre", "grid")
+    knn_scenario("e2e_places_noidx", "heap")
+    scenario("e2e_places_point", create_index_before_load=False, coltype="POINT")
+    knn_scenario("e2e_places_point", "rtree")
+    scan_scenario()
 
     print("\n✅ E2E RTREE OK.")
 
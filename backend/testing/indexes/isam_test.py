@@ -3,8 +3,16 @@ ISAM • CSV + SQL smoke test
 - Crea tabla con PRIMARY KEY USING isam
 - Importa CSV (o fallback a INSERT por fila)
 - Consulta igualdad y rango sobre la PK
+- Con páginas de 128 bytes: índice de varios niveles, header y páginas estáticas
+  intactos tras inserts, búsquedas y rangos contra Python tras inserts/deletes
+- REORGANIZE: cadenas de overflow antes, ninguna después, mismas filas; tabla con todas
+  sus filas borradas (VARCHAR y POINT)
+- Recorridos (iter_all / ordenado) con un REORGANIZE concurrente: ven la tabla tal como
+  estaba al empezar
 """
-import os, sys, csv, json
+import os, sys, csv, json, random, struct, tempfile, threading
+# páginas chicas: pocos cientos de filas ya dan un índice de varios niveles
+os.environ["BD2_ISAM_PAGE_SIZE"] = "128"
 HERE = os.path.abspath(os.path.dirname(__file__))
 if HERE not in sys.path:
     sys.path.insert(0, HERE)
@@ -14,13 +22,20 @@ try:
     from backend.engine.engine import Engine
 except Exception:
     from backend.engine import Engine  # type: ignore
+from backend.storage.file import File
+from backend.storage.indexes.isam import IsamFile, IndexPage, INDEX_HEADER_FORMAT, INDEX_HEADER_SIZE
 ENGINE = Engine()
 
-def run_sql(sql: str) -> dict:
+def run_sql(sql: str, show: bool = True) -> dict:
     env = ENGINE.run(sql)
-    print(json.dumps(env, indent=2, ensure_ascii=False))
+    if show:
+        print(json.dumps(env, indent=2, ensure_ascii=False))
     return env
 
+def check(cond: bool, msg: str):
+    if not cond:
+        raise AssertionError(msg)
+
 def print_section(title: str):
     print("\n" + "="*len(title))
     print(title)
@@ -82,7 +97,221 @@ def main():
     print_section("ISAM: consultas en PK")
     run_sql(f"SELECT * FROM {tbl} WHERE product_id = 4;")
     run_sql(f"SELECT * FROM {tbl} WHERE product_id BETWEEN 1 AND 4;")
+
+    print_section("ISAM: inserts post-build (overflow) + consultas")
+    run_sql(f"INSERT INTO {tbl} VALUES (0, 'Zero', 1.0, 1), (7, 'Golf', 7.5, 7), (6, 'Foxtrot', 6.5, 6);")
+    run_sql(f"SELECT * FROM {tbl} WHERE product_id = 6;")
+    run_sql(f"SELECT * FROM {tbl} WHERE product_id BETWEEN 0 AND 7;")
+    run_sql(f"DELETE FROM {tbl} WHERE product_id = 6;")
+    run_sql(f"SELECT * FROM {tbl};")
+
+    print_section("ISAM: REORGANIZE TABLE (cadenas de overflow -> layout estático)")
+    run_sql(f"REORGANIZE TABLE {tbl};")
+    run_sql(f"SELECT * FROM {tbl} WHERE product_id = 7;")
+    run_sql(f"SELECT * FROM {tbl} WHERE product_id BETWEEN 0 AND 7;")
     print("\n✅ ISAM test completed.")
 
+def select(sql: str) -> list:
+    res = run_sql(sql, show=False)["results"][0]
+    check(res["ok"], f"{sql} -> {res.get('error')}")
+    return sorted((r["id"], r["name"]) for r in res["data"])
+
+def static_pages(isf: IsamFile) -> list:
+    """Claves de cada página estática (sin seguir las cadenas de overflow)."""
+    with open(isf.filename, "rb") as mainfile:
+        schema_size = isf._schema_size(mainfile)
+        return [[r.fields["id"] for r in isf._read_data_page(mainfile, n, schema_size).records]
+                for n in range(1, isf.data_pages + 1)]
+
+def geometry():
+    tbl = "isam_geom"
+    n = 300
+    rows = {i: f"n{i}" for i in range(100, 100 + 2 * n, 2)}
+    csv_path = os.path.join(tempfile.mkdtemp(), "isam_geom.csv")
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["id", "name"])
+        w.writerows(rows.items())
+
+    print_section("ISAM: build con páginas de 128 bytes")
+    run_sql(f"DROP TABLE IF EXISTS {tbl};", show=False)
+    clean = csv_path.replace('\\', '/')
+    env = run_sql(f"CREATE TABLE {tbl} FROM FILE '{clean}' USING INDEX isam(id);", show=False)
+    check(env["ok"], f"build: {env['results'][0].get('error')}")
+
+    filename = File(tbl).indexes["primary"]["filename"]
+    isf = IsamFile(filename)
+    st = File(tbl).execute({"op": "isam_stats"})
+    print(json.dumps(st, indent=2))
+    check(st["page_size"] == 128 and st["levels"] > 1, f"niveles: {st}")
+    check(st["records"] == n and st["overflow_pages"] == 0, f"build: {st}")
+    check(st["static_pages"] == -(-n // st["page_factor"]), f"páginas estáticas: {st}")
+
+    with open(isf.index_filename, "rb") as f:
+        index_bytes = f.read()
+    header = struct.unpack(INDEX_HEADER_FORMAT, index_bytes[:INDEX_HEADER_SIZE])
+    _, indexsize, fanout, _ = isf.get_metrics({"key": "id"})
+    check(header == (128, st["levels"], isf.root_page, st["static_pages"]), f"header: {header}")
+    # la raíz es la última página del índice
+    check(len(index_bytes) - INDEX_HEADER_SIZE == isf.root_page * IndexPage.page_size(indexsize, fanout),
+          f"raíz {isf.root_page} no es la última página del índice")
+    statics = static_pages(isf)
+    check([k for page in statics for k in page] == sorted(rows), "páginas estáticas ordenadas")
+
+    print_section("ISAM: inserts / deletes mezclados vs Python")
+    rnd = random.Random(26)
+    fresh = [i for i in range(80, 140 + 2 * n) if i not in rows]
+    rnd.shuffle(fresh)
+    for k, i in enumerate(fresh[:200]):
+        check(run_sql(f"INSERT INTO {tbl} VALUES ({i}, 'm{i}');", show=False)["ok"], f"insert {i}")
+        rows[i] = f"m{i}"
+        if k % 3 == 0:
+            victim = rnd.choice(sorted(rows))
+            check(run_sql(f"DELETE FROM {tbl} WHERE id = {victim};", show=False)["ok"], f"delete {victim}")
+            del rows[victim]
+    dup = run_sql(f"INSERT INTO {tbl} VALUES ({next(iter(rows))}, 'dup');", show=False)
+    check(not dup["ok"], "PK duplicada")
+
+    isf = IsamFile(filename)
+    with open(isf.index_filename, "rb") as f:
+        check(f.read() == index_bytes, "el archivo índice cambió tras los inserts")
+    check((isf.page_size, isf.levels, isf.root_page, isf.data_pages) == header, "el header cambió")
+    live_static = static_pages(isf)
+    check(len(live_static) == len(statics), "cambió el número de páginas estáticas")
+    # los deletes liberan huecos que los inserts reutilizan, pero cada página
+    # estática sigue cubriendo el rango de claves que le dio el build
+    # (la primera también recibe las claves menores al mínimo del build)
+    seps = [float("-inf")] + [page[0] for page in statics[1:]] + [float("inf")]
+    for k, page in enumerate(live_static):
+        check(all(seps[k] <= key < seps[k + 1] for key in page), f"página estática {k + 1} fuera de rango: {page}")
+    st = File(tbl).execute({"op": "isam_stats"})
+    check(st["overflow_pages"] > 0 and st["records"] == len(rows), f"overflow: {st}")
+
+    for i in list(range(75, 145 + 2 * n, 7)) + rnd.sample(sorted(rows), 20):
+        got = select(f"SELECT * FROM {tbl} WHERE id = {i};")
+        check(got == ([(i, rows[i])] if i in rows else []), f"id = {i}: {got}")
+    for lo, hi in [(0, 105), (200, 280), (433, 433), (650, 800), (701, 750), (95, 150 + 2 * n)]:
+        got = select(f"SELECT * FROM {tbl} WHERE id BETWEEN {lo} AND {hi};")
+        check(got == sorted((i, v) for i, v in rows.items() if lo <= i <= hi), f"BETWEEN {lo} AND {hi}")
+    check(select(f"SELECT * FROM {tbl};") == sorted(rows.items()), "SELECT *")
+    print(f"[OK] {len(rows)} filas, {st['levels']} niveles, {st['overflow_pages']} páginas de overflow")
+    return tbl, rows
+
+def reorganize(tbl: str, rows: dict):
+    print_section("ISAM: REORGANIZE con cadenas de overflow")
+    before = File(tbl).execute({"op": "isam_stats"})
+    check(before["overflow_pages"] > 0 and before["overflow_pct"] > 0, f"sin overflow: {before}")
+    check(before["avg_chain"] > 0 and before["max_chain"] >= 1, f"sin cadenas: {before}")
+    snapshot = select(f"SELECT * FROM {tbl};")
+
+    env = run_sql(f"REORGANIZE TABLE {tbl};", show=False)
+    check(env["ok"], f"REORGANIZE: {env['results'][0].get('error')}")
+    meta = env["results"][0]["meta"]["isam"]
+    print(json.dumps(meta, indent=2))
+    check(meta["before"] == before, f"meta.isam.before: {meta['before']}")
+
+    after = File(tbl).execute({"op": "isam_stats"})
+    check(meta["after"] == after, f"meta.isam.after: {meta['after']}")
+    check(after["overflow_pages"] == 0 and after["overflow_pct"] == 0.0, f"overflow tras REORGANIZE: {after}")
+    check(after["avg_chain"] == 0.0 and after["max_chain"] == 0, f"cadenas tras REORGANIZE: {after}")
+    check(after["records"] == before["records"] == len(rows), f"registros: {before} -> {after}")
+    check(after["page_size"] == before["page_size"] and after["levels"] > 1, f"geometría: {after}")
+
+    check(select(f"SELECT * FROM {tbl};") == snapshot == sorted(rows.items()), "filas distintas tras REORGANIZE")
+    for i in list(range(75, 745, 11)):
+        got = select(f"SELECT * FROM {tbl} WHERE id = {i};")
+        check(got == ([(i, rows[i])] if i in rows else []), f"id = {i} tras REORGANIZE: {got}")
+    got = select(f"SELECT * FROM {tbl} WHERE id BETWEEN 300 AND 420;")
+    check(got == sorted((i, v) for i, v in rows.items() if 300 <= i <= 420), "BETWEEN tras REORGANIZE")
+    print(f"[OK] overflow {before['overflow_pages']} -> 0, max_chain {before['max_chain']} -> 0")
+
+def reorganize_empty():
+    print_section("ISAM: REORGANIZE sin filas vivas")
+    for coltype, lit in (("VARCHAR(16)", lambda i: f"'v{i}'"), ("POINT", lambda i: f"POINT({i}, {i + 1})")):
+        tbl = f"isam_empty_{'pt' if coltype == 'POINT' else 'vc'}"
+        run_sql(f"DROP TABLE IF EXISTS {tbl};", show=False)
+        check(run_sql(f"CREATE TABLE {tbl} (id INT PRIMARY KEY USING isam, v {coltype});", show=False)["ok"],
+              f"create {tbl}")
+        # el primer insert construye el índice; el resto cae en la cadena de overflow
+        for i in range(1, 41):
+            check(run_sql(f"INSERT INTO {tbl} VALUES ({i}, {lit(i)});", show=False)["ok"], f"insert {i}")
+        for i in range(1, 41):
+            check(run_sql(f"DELETE FROM {tbl} WHERE id = {i};", show=False)["ok"], f"delete {i}")
+
+        env = run_sql(f"REORGANIZE TABLE {tbl};", show=False)
+        check(env["ok"], f"REORGANIZE {tbl} vacía: {env['results'][0].get('error')}")
+        after = env["results"][0]["meta"]["isam"]["after"]
+        check(after["records"] == 0 and after["levels"] == 0 and after["static_pages"] == 0
+              and after["overflow_pages"] == 0, f"{tbl}: {after}")
+        check(run_sql(f"SELECT * FROM {tbl};", show=False)["results"][0]["data"] == [], f"{tbl}: SELECT *")
+        check(run_sql(f"SELECT * FROM {tbl} WHERE id = 5;", show=False)["results"][0]["data"] == [], f"{tbl}: id = 5")
+        check(run_sql(f"REORGANIZE TABLE {tbl};", show=False)["ok"], f"{tbl}: segundo REORGANIZE vacío")
+
+        # la tabla vuelve a construirse con el siguiente insert
+        check(run_sql(f"INSERT INTO {tbl} VALUES (7, {lit(7)});", show=False)["ok"], f"{tbl}: insert tras vaciar")
+        got = run_sql(f"SELECT * FROM {tbl} WHERE id BETWEEN 1 AND 10;", show=False)["results"][0]["data"]
+        check([r["id"] for r in got] == [7], f"{tbl}: tras reinsertar {got}")
+        st = File(tbl).execute({"op": "isam_stats"})
+        check(st["records"] == 1 and st["levels"] == 1, f"{tbl}: {st}")
+    print("[OK] REORGANIZE con todas las filas borradas (VARCHAR y POINT)")
+
+def scan_snapshot():
+    print_section("ISAM: recorrido con REORGANIZE concurrente")
+    tbl = "isam_scan"
+    run_sql(f"DROP TABLE IF EXISTS {tbl};", show=False)
+    check(run_sql(f"CREATE TABLE {tbl} (id INT PRIMARY KEY USING isam, name VARCHAR(16));", show=False)["ok"],
+          f"create {tbl}")
+    # el primer insert construye el índice; el resto cae en cadenas de overflow
+    live = set()
+    for i in random.Random(26).sample(range(1000), 150):
+        check(run_sql(f"INSERT INTO {tbl} VALUES ({i}, 'n{i}');", show=False)["ok"], f"insert {i}")
+        live.add(i)
+    next_id = 1000
+
+    for ordered in (False, True):
+        for i in sorted(live)[::7]:
+            check(run_sql(f"DELETE FROM {tbl} WHERE id = {i};", show=False)["ok"], f"delete {i}")
+            live.discard(i)
+        before = set(live)
+        isf = IsamFile(File(tbl).indexes["primary"]["filename"])
+        ino = os.stat(isf.filename).st_ino
+
+        rows = File(tbl).iter_all(ordered=ordered)
+        seen = [next(rows)["id"] for _ in range(10)]
+
+        # REORGANIZE desde otro hilo: no espera al recorrido y reemplaza los archivos
+        out = []
+        worker = threading.Thread(target=lambda: out.append(run_sql(f"REORGANIZE TABLE {tbl};", show=False)))
+        worker.start()
+        worker.join(30)
+        check(not worker.is_alive() and out and out[0]["ok"], "REORGANIZE termina con un recorrido abierto")
+        check(os.stat(isf.filename).st_ino != ino, "REORGANIZE reemplazó el archivo de datos")
+
+        # cambios posteriores van a los archivos nuevos: el recorrido abierto no los ve
+        for i in range(next_id, next_id + 20):
+            check(run_sql(f"INSERT INTO {tbl} VALUES ({i}, 'n{i}');", show=False)["ok"], f"insert {i}")
+            live.add(i)
+        next_id += 20
+        for i in sorted(before)[1::9]:
+            check(run_sql(f"DELETE FROM {tbl} WHERE id = {i};", show=False)["ok"], f"delete {i}")
+            live.discard(i)
+
+        seen += [r["id"] for r in rows]
+        label = "ordenado" if ordered else "iter_all"
+        check(sorted(seen) == sorted(before), f"{label}: {len(seen)} filas, esperadas las {len(before)} del inicio")
+        if ordered:
+            check(seen == sorted(before), "ordenado: filas en orden de clave")
+        got = {r["id"] for r in run_sql(f"SELECT * FROM {tbl};", show=False)["results"][0]["data"]}
+        check(got == live, f"{label}: un recorrido nuevo ve los cambios posteriores")
+        print(f"[OK] {label}: snapshot de {len(before)} filas con REORGANIZE a mitad del recorrido")
+
 if __name__ == "__main__":
     main()
+    try:
+        reorganize(*geometry())
+        reorganize_empty()
+        scan_snapshot()
+        print("\n✅ ISAM OK.")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}")
+        sys.exit(1)
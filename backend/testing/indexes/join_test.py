@@ -0,0 +1,160 @@
+"""
+JOIN por igualdad (hash join / index nested-loop)
+- clientes (PK bplus, hash sobre city) y pedidos (PK heap, sin índice en cid)
+- Cada consulta se compara contra el join hecho en Python sobre los datos insertados
+- Sin filtro, ambos lados completos: hash join; con un WHERE selectivo sobre el lado externo
+  e índice en la columna del interno: index_nl
+- WHERE: los conjuntos de un solo lado se empujan al recorrido; un OR entre lados queda residual
+- Grace hash join: con buffer chico las particiones van a disco y el resultado es el mismo
+- POST /query/stream: las filas del join salen de a una (Engine.stream)
+- INT = VARCHAR: se compara como número con cualquier estrategia (hash, index_nl, sin estimar)
+"""
+import os, sys, json, random
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+if HERE not in sys.path:
+    sys.path.insert(0, HERE)
+
+try:
+    from backend.engine.engine import Engine
+except Exception:
+    from backend.engine import Engine  # type: ignore
+from backend.engine.joins import HashJoin
+ENGINE = Engine()
+
+def run_sql(sql: str, show: bool = True) -> dict:
+    env = ENGINE.run(sql)
+    if show:
+        print(json.dumps(env, indent=2, ensure_ascii=False, default=str))
+    return env
+
+def print_section(title: str):
+    print("\n" + "="*len(title))
+    print(title)
+    print("="*len(title))
+
+def check(cond: bool, msg: str):
+    if not cond:
+        raise AssertionError(msg)
+
+random.seed(3)
+CUST = [{"id": i, "name": f"c{i}", "city": f"x{i % 4}"} for i in range(40)]
+ORDS = [{"oid": i, "cid": random.randint(0, 49), "amount": round(random.random() * 100, 2), "city": f"x{i % 5}"}
+        for i in range(120)]
+
+def pairs(on, keep=lambda o, c: True):
+    return sorted((o["oid"], c["id"]) for o in ORDS for c in CUST if o[on[0]] == c[on[1]] and keep(o, c))
+
+# (SQL, join esperado, estrategia esperada o None)
+QUERIES = [
+    ("SELECT o.oid, c.id FROM jn_ord o JOIN jn_cust c ON o.cid = c.id;", pairs(("cid", "id")), "hash"),
+    ("SELECT o.oid, c.id FROM jn_ord o JOIN jn_cust c ON o.cid = c.id WHERE o.oid = 18;",
+     pairs(("cid", "id"), lambda o, c: o["oid"] == 18), "index_nl"),
+    ("SELECT o.oid, c.id FROM jn_cust c JOIN jn_ord o ON c.id = o.cid WHERE o.oid IN (4, 90);",
+     pairs(("cid", "id"), lambda o, c: o["oid"] in (4, 90)), "index_nl"),
+    ("SELECT o.oid, c.id FROM jn_ord o JOIN jn_cust c ON o.city = c.city WHERE c.id < 6 AND amount >= 50;",
+     pairs(("city", "city"), lambda o, c: c["id"] < 6 and o["amount"] >= 50), None),
+    ("SELECT o.oid, c.id FROM jn_ord o JOIN jn_cust c ON o.cid = c.id WHERE o.amount > 90 OR c.city = 'x1';",
+     pairs(("cid", "id"), lambda o, c: o["amount"] > 90 or c["city"] == "x1"), None),
+]
+
+try:
+    print_section("1. Create + insert")
+    run_sql("DROP TABLE IF EXISTS jn_cust;", show=False)
+    run_sql("DROP TABLE IF EXISTS jn_ord;", show=False)
+    run_sql("CREATE TABLE jn_cust (id INT PRIMARY KEY USING bplus, name VARCHAR(8), city VARCHAR(8) INDEX USING hash);")
+    run_sql("CREATE TABLE jn_ord (oid INT PRIMARY KEY USING heap, cid INT, amount FLOAT, city VARCHAR(8));")
+    for c in CUST:
+        run_sql(f"INSERT INTO jn_cust VALUES ({c['id']}, '{c['name']}', '{c['city']}');", show=False)
+    for o in ORDS:
+        run_sql(f"INSERT INTO jn_ord VALUES ({o['oid']}, {o['cid']}, {o['amount']}, '{o['city']}');", show=False)
+
+    print_section("2. Consultas")
+    for sql, exp, strategy in QUERIES:
+        res = run_sql(sql, show=False)["results"][0]
+        check(res["ok"], f"{sql} -> {res.get('error')}")
+        got = sorted((r["o.oid"], r["c.id"]) for r in res["data"])
+        check(got == exp, f"{sql}: {len(got)} pares, se esperaban {len(exp)}")
+        check(res["meta"]["join"]["strategy"] == res["plan"]["strategy"], "el executor sigue al planner")
+        if strategy:
+            check(res["plan"]["strategy"] == strategy, f"{sql}: estrategia {res['plan']['strategy']}")
+        print(f"[OK] {res['plan']['strategy']:8s} {len(got):4d} pares  {res['plan'].get('estimate', {}).get('alternatives')}")
+
+    res = run_sql("SELECT o.oid, c.id FROM jn_ord o JOIN jn_cust c ON o.cid = c.id WHERE o.oid = 18;",
+                  show=False)["results"][0]
+    check(res["plan"]["left"]["where"] is not None and res["plan"]["filter"] is None, "WHERE de un lado empujado")
+    check(any(u["table"] == "jn_cust" and u["field"] == "id" for u in res["meta"]["index_usage"]), "index_nl usa la PK")
+
+    print_section("3. ORDER BY / LIMIT y columnas sin calificar")
+    res = run_sql("SELECT oid, name FROM jn_ord JOIN jn_cust ON cid = id ORDER BY amount DESC, oid LIMIT 5;",
+                  show=False)["results"][0]
+    exp = sorted((o for o in ORDS if o["cid"] < 40), key=lambda o: (-o["amount"], o["oid"]))[:5]
+    check([r["oid"] for r in res["data"]] == [o["oid"] for o in exp], "ORDER BY / LIMIT sobre el join")
+    check(all(r["name"] == f"c{o['cid']}" for r, o in zip(res["data"], exp)), "columnas del otro lado")
+
+    sql = "SELECT o.oid, c.name FROM jn_ord o JOIN jn_cust c ON o.cid = c.id;"
+    events = ENGINE.stream(sql)
+    head = next(events)["result"]
+    check(head["ok"] and head["action"] == "equi_join", f"cabecera del stream: {head}")
+    first = next(events)
+    check("row" in first and set(first["row"]) == {"o.oid", "c.name"}, f"primera fila del stream: {first}")
+    rest = list(events)
+    streamed = [first["row"]] + [e["row"] for e in rest if "row" in e]
+    end = rest[-1]["end"]
+    check(sorted(r["o.oid"] for r in streamed) == [o for o, _ in pairs(("cid", "id"))], "filas del join en stream")
+    check(end["ok"] and end["count"] == len(streamed) == end["meta"]["join"]["pairs"], f"cierre del stream: {end}")
+
+    print_section("4. Grace hash join")
+    build = [{"k": i % 37, "b": i} for i in range(500)] + [{"k": None, "b": -1}]
+    probe = [{"k": i % 41, "p": i} for i in range(300)]
+    hj = HashJoin(build, probe, "k", "k", buffer=50, partitions=4)
+    got = sorted((b["b"], p["p"]) for b, p in hj)
+    check(hj.spilled > 0, "con buffer 50 debe particionar en disco")
+    check(got == sorted((b["b"], p["p"]) for b in build for p in probe if b["k"] is not None and b["k"] == p["k"]),
+          "grace hash join = join en memoria")
+
+    print_section("5. INT = VARCHAR")
+    REFS = ["5", "05", "5.0", "abc", "12", "", "39", "7.5", "40"]
+    run_sql("DROP TABLE IF EXISTS jn_ref;", show=False)
+    run_sql("CREATE TABLE jn_ref (rid INT PRIMARY KEY USING bplus, cref VARCHAR(8) INDEX USING hash);", show=False)
+    for i, v in enumerate(REFS):
+        run_sql(f"INSERT INTO jn_ref VALUES ({i}, '{v}');", show=False)
+
+    def num(v):
+        try:
+            return float(v)
+        except ValueError:
+            return None
+
+    def ref_pairs(keep=lambda r, c: True):
+        return sorted((i, c["id"]) for i, v in enumerate(REFS) for c in CUST if num(v) == c["id"] and keep(i, c))
+
+    cross = [("SELECT r.rid, c.id FROM jn_ref r JOIN jn_cust c ON r.cref = c.id;", ref_pairs()),
+             ("SELECT r.rid, c.id FROM jn_ref r JOIN jn_cust c ON r.cref = c.id WHERE r.rid = 1;",
+              ref_pairs(lambda i, c: i == 1)),
+             ("SELECT r.rid, c.id FROM jn_cust c JOIN jn_ref r ON c.id = r.cref WHERE c.id = 5;",
+              ref_pairs(lambda i, c: c["id"] == 5))]
+    strategies = set()
+    for sql, exp in cross:
+        # solo, y en un lote donde la tabla cambió antes (sin estimar)
+        for batch in (sql, f"INSERT INTO jn_ref VALUES (100, 'zz'); {sql} DELETE FROM jn_ref WHERE rid = 100;"):
+            env = run_sql(batch, show=False)
+            res = next(r for r in env["results"] if r["action"] == "equi_join")
+            check(res["ok"], f"{sql} -> {res.get('error')}")
+            got = sorted((r["r.rid"], r["c.id"]) for r in res["data"])
+            check(got == exp, f"{sql} [{res['plan']['strategy']}]: {got} != {exp}")
+            check(not (res["plan"]["strategy"] == "index_nl" and res["plan"]["inner"] == "right"
+                       and res["plan"]["right"]["table"] == "jn_ref"), "el índice de texto no es interno")
+            strategies.add(res["plan"]["strategy"])
+    check({"hash", "index_nl"} <= strategies, f"estrategias probadas: {strategies}")
+    print(f"[OK] INT = VARCHAR con {sorted(strategies)}")
+
+    print_section("6. Errores")
+    check(not run_sql("SELECT * FROM jn_ord JOIN jn_cust ON city = city;", show=False)["ok"], "columna ambigua")
+    check(not run_sql("SELECT * FROM jn_ord o JOIN jn_cust c ON o.cid = c.nope;", show=False)["ok"],
+          "columna inexistente")
+
+    print("\n✅ JOIN OK.")
+except AssertionError as e:
+    print(f"\n❌ TEST FAILED: {e}")
+    sys.exit(1)
@@ -61,3 +61,6 @@ WHERE coords KNN (POINT(55, 3), 3);
 
     '''
 )
+
+# varios puntos en un solo recorrido: un grupo de vecinos por punto
+run_sql("SELECT id, name FROM pk_switch_rtree WHERE coords KNN (POINTS((55, 3), (200, 199), (0, 1)), 3);")
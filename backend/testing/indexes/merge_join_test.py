@@ -0,0 +1,115 @@
+"""
+Sort-merge join
+- Misma relación con PK sequential, isam, bplus y heap, insertada en orden aleatorio
+  (área auxiliar en sequential, overflow en isam)
+- PK contra PK de primarios ordenados: merge sin ordenar ningún lado
+- Un lado ordenado y el otro no: el no ordenado pasa por el sort externo (buffers chicos => runs
+  a disco) y el merge le gana al hash join que tendría que particionar ambos lados
+- ORDER BY de la columna de join sobre un merge: sin sort, LIMIT corta los recorridos
+- File.iter_all(ordered=True) entrega las filas en orden de PK aunque haya aux / overflow
+"""
+import os, sys, json, random
+
+# buffers chicos: el hash join y el sort externo van a disco con pocas filas
+os.environ.setdefault("BD2_JOIN_BUFFER", "64")
+os.environ.setdefault("BD2_SORT_BUFFER", "64")
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+if HERE not in sys.path:
+    sys.path.insert(0, HERE)
+
+try:
+    from backend.engine.engine import Engine
+except Exception:
+    from backend.engine import Engine  # type: ignore
+from backend.engine.joins import MergeJoin
+from backend.storage.file import File
+ENGINE = Engine()
+
+def run_sql(sql: str, show: bool = True) -> dict:
+    env = ENGINE.run(sql)
+    if show:
+        print(json.dumps(env, indent=2, ensure_ascii=False, default=str))
+    return env
+
+def print_section(title: str):
+    print("\n" + "="*len(title))
+    print(title)
+    print("="*len(title))
+
+def check(cond: bool, msg: str):
+    if not cond:
+        raise AssertionError(msg)
+
+PRIMS = ("sequential", "isam", "bplus", "heap")
+random.seed(8)
+DATA = [{"id": i, "fk": random.randint(0, 199), "v": f"v{i % 7}"} for i in range(200)]
+ORDER = list(range(200))
+random.shuffle(ORDER)
+
+def pairs(lcol, rcol, keep=lambda a, b: True):
+    return sorted((a["id"], b["id"]) for a in DATA for b in DATA if a[lcol] == b[rcol] and keep(a, b))
+
+# (SQL, join esperado, estrategia, lados que se ordenan)
+QUERIES = [
+    ("SELECT a.id, b.id FROM mj_bplus a JOIN mj_isam b ON a.id = b.id;", pairs("id", "id"), "merge", []),
+    ("SELECT a.id, b.id FROM mj_sequential a JOIN mj_bplus b ON a.id = b.id;", pairs("id", "id"), "merge", []),
+    ("SELECT a.id, b.id FROM mj_sequential a JOIN mj_heap b ON a.id = b.fk;", pairs("id", "fk"), "merge", ["right"]),
+    ("SELECT a.id, b.id FROM mj_heap a JOIN mj_isam b ON a.fk = b.id WHERE a.v <> 'v0';",
+     pairs("fk", "id", lambda a, b: a["v"] != "v0"), "merge", ["left"]),
+    ("SELECT a.id, b.id FROM mj_heap a JOIN mj_heap b ON a.fk = b.fk;", pairs("fk", "fk"), None, None),
+]
+
+try:
+    print_section("1. Create + insert")
+    for prim in PRIMS:
+        tbl = f"mj_{prim}"
+        run_sql(f"DROP TABLE IF EXISTS {tbl};", show=False)
+        run_sql(f"CREATE TABLE {tbl} (id INT PRIMARY KEY USING {prim}, fk INT, v VARCHAR(8));")
+        for i in ORDER:
+            d = DATA[i]
+            run_sql(f"INSERT INTO {tbl} VALUES ({d['id']}, {d['fk']}, '{d['v']}');", show=False)
+
+    print_section("2. Recorrido ordenado del primario")
+    for prim in PRIMS[:3]:
+        got = [r["id"] for r in File(f"mj_{prim}").iter_all(ordered=True)]
+        check(got == list(range(200)), f"{prim}: iter_all(ordered=True) fuera de orden")
+
+    print_section("3. Consultas")
+    for sql, exp, strategy, to_sort in QUERIES:
+        res = run_sql(sql, show=False)["results"][0]
+        check(res["ok"], f"{sql} -> {res.get('error')}")
+        got = sorted((r["a.id"], r["b.id"]) for r in res["data"])
+        check(got == exp, f"{sql}: {len(got)} pares, se esperaban {len(exp)}")
+        alts = res["plan"]["estimate"]["alternatives"]
+        if strategy:
+            check(res["plan"]["strategy"] == strategy, f"{sql}: estrategia {res['plan']['strategy']} {alts}")
+            check(alts["merge"] <= alts["hash"], f"{sql}: merge debe costar menos que hash {alts}")
+            check(res["meta"]["join"]["sorted"] == to_sort, f"{sql}: lados ordenados {res['meta']['join']}")
+            if to_sort:
+                check(res["meta"]["join"]["sort_runs"] > 0, f"{sql}: el sort externo debe bajar runs a disco")
+        print(f"[OK] {res['plan']['strategy']:8s} {len(got):4d} pares  {alts}")
+
+    print_section("4. ORDER BY de la columna de join")
+    full = run_sql("SELECT a.id, b.id FROM mj_sequential a JOIN mj_bplus b ON a.id = b.id;", show=False)["results"][0]
+    res = run_sql("SELECT a.id, b.v FROM mj_sequential a JOIN mj_bplus b ON a.id = b.id ORDER BY b.id LIMIT 4;",
+                  show=False)["results"][0]
+    check(res["plan"]["strategy"] == "merge", "ORDER BY sobre merge")
+    check([r["a.id"] for r in res["data"]] == [0, 1, 2, 3], f"orden del merge: {res['data']}")
+    check(all(r["b.v"] == DATA[r["a.id"]]["v"] for r in res["data"]), "columnas del lado derecho")
+    reads = lambda r: r["meta"]["io"]["total"]["read_count"]
+    check(reads(res) < reads(full), f"LIMIT sobre merge leyó {reads(res)} de {reads(full)}")
+
+    print_section("5. MergeJoin con duplicados y NULL")
+    left = sorted([{"k": i // 3, "l": i} for i in range(30)], key=lambda r: r["k"]) + [{"k": None, "l": -1}]
+    right = sorted([{"k": i // 2, "r": i} for i in range(5, 40)], key=lambda r: r["k"]) + [{"k": None, "r": -1}]
+    mj = MergeJoin(left, right, "k", "k")
+    got = sorted((a["l"], b["r"]) for a, b in mj)
+    check(got == sorted((a["l"], b["r"]) for a in left for b in right if a["k"] is not None and a["k"] == b["k"]),
+          "merge join = join en memoria")
+    check(mj.max_group == 2, f"grupo de duplicados {mj.max_group}")
+
+    print("\n✅ MERGE JOIN OK.")
+except AssertionError as e:
+    print(f"\n❌ TEST FAILED: {e}")
+    sys.exit(1)
@@ -0,0 +1,120 @@
+"""
+Ejecución por iteradores (ORDER BY / LIMIT / streaming)
+- Misma tabla con cada organización del primario (heap, sequential, isam, bplus)
+- ORDER BY de varias columnas (ASC/DESC) con y sin LIMIT, contra el orden hecho en Python
+- LIMIT sin ORDER BY corta el recorrido: lee menos páginas que el SELECT completo
+- Sort externo: con un buffer chico los runs van a disco y el resultado es el mismo
+- Engine.stream: cabecera, una fila por evento y cierre con count
+"""
+import os, sys, json, random
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+if HERE not in sys.path:
+    sys.path.insert(0, HERE)
+
+try:
+    from backend.engine.engine import Engine
+except Exception:
+    from backend.engine import Engine  # type: ignore
+from backend.engine.operators import Sort, sort_key
+ENGINE = Engine()
+
+def run_sql(sql: str, show: bool = True) -> dict:
+    env = ENGINE.run(sql)
+    if show:
+        print(json.dumps(env, indent=2, ensure_ascii=False, default=str))
+    return env
+
+def print_section(title: str):
+    print("\n" + "="*len(title))
+    print(title)
+    print("="*len(title))
+
+def check(cond: bool, msg: str):
+    if not cond:
+        raise AssertionError(msg)
+
+COLS = ["id", "age", "city", "score"]
+random.seed(5)
+ROWS = [(i, random.randint(1, 20), f"c{i % 6}", round(random.random() * 10, 2)) for i in range(120)]
+random.shuffle(ROWS)
+DATA = [dict(zip(COLS, r)) for r in ROWS]
+
+def expected(keep, keys, limit=None):
+    rows = sorted((d for d in DATA if keep(d)), key=lambda d: d["id"])
+    for col, desc in reversed(keys):
+        rows.sort(key=lambda d: d[col], reverse=desc)
+    return [d["id"] for d in rows][:limit]
+
+# (WHERE, filtro, [(col, desc)], LIMIT)
+QUERIES = [
+    (None, lambda d: True, [("age", False), ("id", False)], None),
+    (None, lambda d: True, [("score", True), ("id", False)], 7),
+    ("age BETWEEN 5 AND 9", lambda d: 5 <= d["age"] <= 9, [("city", True), ("id", True)], None),
+    ("city = 'c2'", lambda d: d["city"] == "c2", [("score", False), ("id", True)], 3),
+    ("age > 15 AND score < 5", lambda d: d["age"] > 15 and d["score"] < 5, [("id", True)], 4),
+    ("city IN ('c1', 'c4')", lambda d: d["city"] in ("c1", "c4"), [("age", True), ("id", False)], None),
+]
+
+try:
+    for prim in ("heap", "sequential", "isam", "bplus"):
+        tbl = f"pipe_{prim}"
+        print_section(f"{prim}: create + insert")
+        run_sql(f"DROP TABLE IF EXISTS {tbl};")
+        run_sql(f"""
+            CREATE TABLE {tbl} (
+                id INT PRIMARY KEY USING {prim},
+                age INT INDEX USING bplus,
+                city VARCHAR(16) INDEX USING hash,
+                score FLOAT
+            );
+        """)
+        for r in ROWS:
+            run_sql(f"INSERT INTO {tbl} VALUES ({r[0]}, {r[1]}, '{r[2]}', {r[3]});", show=False)
+
+        print_section(f"{prim}: ORDER BY / LIMIT")
+        for where, keep, keys, limit in QUERIES:
+            order = ", ".join(f"{c} DESC" if d else c for c, d in keys)
+            sql = f"SELECT id, age FROM {tbl}" + (f" WHERE {where}" if where else "") + f" ORDER BY {order}"
+            sql += f" LIMIT {limit};" if limit is not None else ";"
+            res = run_sql(sql, show=False)["results"][0]
+            check(res["ok"], f"{prim}: {sql} -> {res.get('error')}")
+            got = [r["id"] for r in res["data"]]
+            exp = expected(keep, keys, limit)
+            check(got == exp, f"{prim}: {sql}\n  got {got}\n  exp {exp}")
+            check(all(set(r) == {"id", "age"} for r in res["data"]), f"{prim}: proyección de {sql}")
+            print(f"[OK] {prim:10s} {len(got):3d} filas  {res['meta']['pipeline']}")
+
+        print_section(f"{prim}: LIMIT corta el recorrido")
+        full = run_sql(f"SELECT * FROM {tbl};", show=False)["results"][0]
+        head = run_sql(f"SELECT * FROM {tbl} LIMIT 5;", show=False)["results"][0]
+        check(head["data"] == full["data"][:5], f"{prim}: LIMIT debe devolver el prefijo del recorrido")
+        reads = lambda r: r["meta"]["io"]["total"]["read_count"]
+        # heap/sequential cuentan lecturas por registro; isam/bplus por página (120 filas caben en pocas)
+        if prim in ("heap", "sequential"):
+            check(reads(head) < reads(full) // 4, f"{prim}: LIMIT leyó {reads(head)} de {reads(full)}")
+        check(reads(head) <= reads(full), f"{prim}: LIMIT leyó {reads(head)} > {reads(full)}")
+        print(f"[OK] {prim:10s} lecturas LIMIT 5: {reads(head)} / completo: {reads(full)}")
+
+    print_section("Sort externo")
+    rows = [{"k": random.randint(0, 50), "i": i} for i in range(1000)] + [{"k": None, "i": -1}]
+    op = Sort(rows, [("k", True), ("i", False)], buffer=64)
+    got = list(op)
+    check(op.spilled >= 10, f"con buffer 64 debe bajar runs a disco ({op.spilled})")
+    check(got == sorted(rows, key=sort_key([("k", True), ("i", False)])), "sort externo = sort en memoria")
+    check(got[0]["k"] is None, "NULL primero en DESC")
+
+    print_section("Streaming")
+    events = list(ENGINE.stream("SELECT id FROM pipe_bplus WHERE age < 4 ORDER BY id LIMIT 6; "
+                                "SELECT id FROM pipe_heap ORDER BY missing;"))
+    check("result" in events[0] and events[0]["result"]["ok"], "cabecera del primer SELECT")
+    streamed = [e["row"]["id"] for e in events if "row" in e]
+    check(streamed == expected(lambda d: d["age"] < 4, [("id", False)], 6), f"filas en stream: {streamed}")
+    end = next(e["end"] for e in events if "end" in e)
+    check(end["ok"] and end["count"] == len(streamed), "cierre con count")
+    check(not events[-1]["result"]["ok"], "ORDER BY columna inexistente debe fallar")
+
+    print("\n✅ PIPELINE OK.")
+except AssertionError as e:
+    print(f"\n❌ TEST FAILED: {e}")
+    sys.exit(1)
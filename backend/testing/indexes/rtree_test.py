@@ -4,8 +4,18 @@ RTREE • CSV + SQL smoke test (índice antes del import, sintaxis parser-correc
 - Crea índice espacial USING rtree en (coords)
 - Importa CSV (o fallback a INSERT por fila)
 - Consulta geo: coords IN (POINT(x,y), r) y valida ids {1,2,3}
+- Repite con la variante R*-tree: USING rtree WITH (variant='rstar', M=4)
+- DELETE (CondenseTree) + VACUUM INDEX y vuelve a validar
+- Carga masiva STR (CREATE INDEX sobre datos ya cargados): búsqueda por rectángulo,
+  radio y KNN de cada punto, ocupación de hojas según BD2_RTREE_FILL y segunda carga
+  masiva (import CSV) que conserva las entradas previas
+- Caché de nodos: una consulta repetida sale de caché (cache_hits) y la caché se
+  invalida cuando el .idx se reescribe (VACUUM INDEX FULL o reemplazo externo)
 """
-import os, sys, csv, json
+import os, sys, csv, json, math, random, shutil
+
+# ocupación de las hojas en la carga masiva: con M = 8 quedan 4 entradas por nodo
+os.environ["BD2_RTREE_FILL"] = "0.5"
 
 HERE = os.path.abspath(os.path.dirname(__file__))
 if HERE not in sys.path:
@@ -17,11 +27,17 @@ except Exception:
     from backend.engine import Engine  # type: ignore
 ENGINE = Engine()
 
-def run_sql(sql: str) -> dict:
+def run_sql(sql: str, show: bool = True) -> dict:
     env = ENGINE.run(sql)
-    print(json.dumps(env, indent=2, ensure_ascii=False))
+    if show:
+        print(json.dumps(env, indent=2, ensure_ascii=False))
     return env
 
+def check(cond: bool, msg: str):
+    if not cond:
+        raise AssertionError(msg)
+    print(f"[OK] {msg}")
+
 def print_section(title: str):
     print("\n" + "="*len(title))
     print(title)
@@ -95,7 +111,237 @@ def main():
     print_section("RTREE: consultas geoespaciales")
     env = run_sql(f"SELECT * FROM {tbl} WHERE coords IN (POINT(0.0, 0.0), 1.1);")
     expect_ids(env, {1, 2, 3})
+
+    print_section("RTREE: KNN / radio por lote (POINTS)")
+    env = run_sql(f"SELECT * FROM {tbl} WHERE coords KNN (POINTS((0.0, 0.0), (5.0, 5.0), POINT(2.0, 2.1)), 2);")
+    groups = env["results"][0]["data"] if env.get("ok") else []
+    got = [sorted(int(r["id"]) for r in g["rows"]) for g in groups]
+    # (0,0) empata B y C a distancia 1: basta con que el primero sea A
+    if len(got) != 3 or 1 not in got[0] or got[1] != [5, 6] or got[2] != [4, 5]:
+        raise AssertionError(f"KNN por lote: grupos inesperados {got}")
+    env = run_sql(f"SELECT * FROM {tbl} WHERE coords IN (POINTS((0.0, 0.0), (5.0, 5.0)), 1.1);")
+    got = [sorted(int(r["id"]) for r in g["rows"]) for g in env["results"][0]["data"]] if env.get("ok") else []
+    if got != [[1, 2, 3], [6]]:
+        raise AssertionError(f"Radio por lote: grupos inesperados {got}")
+    print("  ✓ Grupos por punto OK")
+
+    print_section("RTREE: variante R*-tree (WITH variant='rstar')")
+    tbl_rs = tbl + "_rstar"
+    run_sql(f"DROP TABLE IF EXISTS {tbl_rs};")
+    run_sql(f"""
+        CREATE TABLE {tbl_rs} (
+            id INT PRIMARY KEY,
+            name VARCHAR(32),
+            coords VARCHAR(64),
+            INDEX (id) using sequential
+        );
+    """)
+    env = run_sql(f"CREATE INDEX ON {tbl_rs} (coords) USING rtree WITH (variant = 'rstar', M = 4);")
+    if not env.get("ok", False):
+        raise AssertionError("CREATE INDEX ... WITH (variant='rstar') falló")
+    import_csv_fallback_inserts(tbl_rs, csv_path)
+    env = run_sql(f"SELECT * FROM {tbl_rs} WHERE coords IN (POINT(0.0, 0.0), 1.1);")
+    expect_ids(env, {1, 2, 3})
+
+    print_section("RTREE: DELETE + VACUUM INDEX")
+    for i in (2, 4, 5, 6):
+        run_sql(f"DELETE FROM {tbl_rs} WHERE id = {i};")
+    env = run_sql(f"VACUUM INDEX ON {tbl_rs} (coords) FULL;")
+    if not env.get("ok", False) or not env["results"][0]["meta"]["rtree"]["coords"]["rebuilt"]:
+        raise AssertionError("VACUUM INDEX ... FULL no reconstruyó el índice")
+    env = run_sql(f"SELECT * FROM {tbl_rs} WHERE coords IN (POINT(0.0, 0.0), 1.1);")
+    expect_ids(env, {1, 3})
+    run_sql(f"DROP TABLE IF EXISTS {tbl_rs};")
     print("\n✅ RTREE test completed.")
 
+def select_ids(sql: str) -> set:
+    env = run_sql(sql, show=False)
+    res = env["results"][0]
+    if not res.get("ok", False):
+        raise AssertionError(f"{sql} -> {res.get('error')}")
+    return {int(r["id"]) for r in res.get("data", [])}
+
+def random_points(rnd: random.Random, n: int, taken: set) -> list:
+    """n puntos distintos (coordenadas no negativas: el parser no acepta literales negativos)."""
+    out = []
+    while len(out) < n:
+        p = (round(rnd.uniform(0, 100), 2), round(rnd.uniform(0, 100), 2))
+        if p not in taken:
+            taken.add(p)
+            out.append(p)
+    return out
+
+def leaf_sizes(tbl: str) -> list:
+    """Cantidad de entradas de cada hoja del R-Tree de (coords), leyendo el archivo .idx."""
+    from backend.storage.file import File
+    rt = File(tbl)._make_rtree("coords", heap_ok=False)
+    try:
+        store = rt.rt.store
+        rt.rt.open()
+        sizes, stack = [], [store.root]
+        while stack:
+            node = store.read_node(stack.pop())
+            if node.is_leaf:
+                sizes.append(len(node.entries))
+            else:
+                stack.extend(e.child for e in node.entries)
+        return sizes
+    finally:
+        rt.close()
+
+def search_rect(tbl: str, x: float, y: float, eps: float = 1e-3) -> list:
+    from backend.storage.file import File
+    rt = File(tbl)._make_rtree("coords", heap_ok=False)
+    try:
+        return rt.search_rect(x - eps, x + eps, y - eps, y + eps)
+    finally:
+        rt.close()
+
+def check_all_found(tbl: str, points: dict):
+    """Cada punto se encuentra por rectángulo, por radio y por KNN (k = 1)."""
+    missing_rect, missing_radius, missing_knn = [], [], []
+    for pid, (x, y) in points.items():
+        hits = search_rect(tbl, x, y)
+        if not any(abs(h["mbr"][0] - x) < 1e-3 and abs(h["mbr"][2] - y) < 1e-3 for h in hits):
+            missing_rect.append(pid)
+        if pid not in select_ids(f"SELECT * FROM {tbl} WHERE coords IN (POINT({x}, {y}), 0.001);"):
+            missing_radius.append(pid)
+        if select_ids(f"SELECT * FROM {tbl} WHERE coords KNN (POINT({x}, {y}), 1);") != {pid}:
+            missing_knn.append(pid)
+    check(not missing_rect, f"rectángulo: los {len(points)} puntos encontrados (faltan {missing_rect[:5]})")
+    check(not missing_radius, f"radio: los {len(points)} puntos encontrados (faltan {missing_radius[:5]})")
+    check(not missing_knn, f"KNN: cada punto es su propio vecino más cercano (fallan {missing_knn[:5]})")
+
+    # además, consultas de radio amplio contra fuerza bruta
+    rnd = random.Random(7)
+    for _ in range(10):
+        cx, cy, r = round(rnd.uniform(0, 100), 1), round(rnd.uniform(0, 100), 1), round(rnd.uniform(2, 15), 1)
+        expected = {pid for pid, (x, y) in points.items() if math.hypot(x - cx, y - cy) <= r}
+        got = select_ids(f"SELECT * FROM {tbl} WHERE coords IN (POINT({cx}, {cy}), {r});")
+        if got != expected:
+            raise AssertionError(f"radio ({cx}, {cy}, {r}): esperado {sorted(expected)}, obtenido {sorted(got)}")
+    check(True, "10 consultas de radio coinciden con fuerza bruta")
+
+def check_fill(tbl: str, n: int, cap: int):
+    sizes = leaf_sizes(tbl)
+    check(sum(sizes) == n, f"las hojas guardan las {n} entradas ({sum(sizes)})")
+    check(max(sizes) == cap, f"hojas llenas hasta M * BD2_RTREE_FILL = {cap} entradas (máx {max(sizes)})")
+    check(len(sizes) == math.ceil(n / cap), f"STR: {len(sizes)} hojas = ceil({n} / {cap})")
+
+def bulk_str():
+    print_section("RTREE: carga masiva STR (CREATE INDEX sobre datos existentes)")
+    from backend.storage.indexes import rtree
+    tbl, M, n = "rtree_bulk", 8, 300
+    cap = int(M * float(os.environ["BD2_RTREE_FILL"]))
+    check(rtree.DEFAULT_FILL == 0.5, "BD2_RTREE_FILL = 0.5 leído por rtree")
+
+    run_sql(f"DROP TABLE IF EXISTS {tbl};", show=False)
+    run_sql(f"CREATE TABLE {tbl} (id INT PRIMARY KEY USING bplus, coords VARCHAR(64));", show=False)
+    rnd, taken = random.Random(31), set()
+    points = dict(enumerate(random_points(rnd, n, taken)))
+    values = ", ".join(f"({pid}, '[{x}, {y}]')" for pid, (x, y) in points.items())
+    check(run_sql(f"INSERT INTO {tbl} VALUES {values};", show=False)["ok"], f"{n} puntos insertados sin índice")
+
+    env = run_sql(f"CREATE INDEX ON {tbl} (coords) USING rtree WITH (M = {M});", show=False)
+    check(env["ok"], "CREATE INDEX ... USING rtree WITH (M = 8) (carga masiva)")
+    check_fill(tbl, n, cap)
+    check_all_found(tbl, points)
+
+    print_section("RTREE: segunda carga masiva sobre un árbol con entradas")
+    more = {n + i: p for i, p in enumerate(random_points(rnd, 200, taken))}
+    csv_path = os.path.join(HERE, "_testdata", "csv", "rtree_bulk.csv")
+    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["id", "coords"])
+        w.writerows([pid, f"[{x}, {y}]"] for pid, (x, y) in more.items())
+    env = run_sql(f"CREATE TABLE {tbl} FROM FILE '{csv_path.replace(chr(92), '/')}';", show=False)
+    usage = env["results"][0]["meta"].get("index_usage", [])
+    check(env["ok"] and any(u.get("index") == "rtree" and u.get("op") == "bulk_load" and u.get("note") == "200"
+                            for u in usage), "import CSV de 200 puntos cargado con bulk_load")
+    points.update(more)
+    check_fill(tbl, len(points), cap)
+    check_all_found(tbl, points)
+    run_sql(f"DROP TABLE IF EXISTS {tbl};", show=False)
+
+def rtree_io(sql: str):
+    """(ids, lecturas de disco, aciertos de caché) del R-Tree para una consulta."""
+    env = run_sql(sql, show=False)
+    res = env["results"][0]
+    if not res.get("ok", False):
+        raise AssertionError(f"{sql} -> {res.get('error')}")
+    io = res["meta"]["io"].get("rtree", {})
+    return {int(r["id"]) for r in res.get("data", [])}, io.get("read_count", 0), io.get("cache_hits", 0)
+
+def node_cache():
+    print_section("RTREE: caché de nodos (aciertos e invalidación)")
+    from backend.storage.file import File
+    from backend.storage.indexes import rtree
+    tbl = "rtree_cache"
+    run_sql(f"DROP TABLE IF EXISTS {tbl};", show=False)
+    run_sql(f"CREATE TABLE {tbl} (id INT PRIMARY KEY USING bplus, coords VARCHAR(64));", show=False)
+    points = dict(enumerate(random_points(random.Random(33), 300, set())))
+    values = ", ".join(f"({pid}, '[{x}, {y}]')" for pid, (x, y) in points.items())
+    run_sql(f"INSERT INTO {tbl} VALUES {values};", show=False)
+    check(run_sql(f"CREATE INDEX ON {tbl} (coords) USING rtree WITH (M = 8);", show=False)["ok"],
+          "índice rtree creado (la carga masiva deja la caché vacía)")
+
+    query = f"SELECT * FROM {tbl} WHERE coords IN (POINT(50, 50), 20);"
+    expected = {pid for pid, (x, y) in points.items() if math.hypot(x - 50, y - 50) <= 20}
+    ids1, reads1, hits1 = rtree_io(query)
+    ids2, reads2, hits2 = rtree_io(query)
+    check(ids1 == ids2 == expected, f"consulta repetida: {len(expected)} ids correctos")
+    check(reads1 > 0, f"primera consulta lee de disco ({reads1} nodos)")
+    check(hits2 > 0 and reads2 < reads1, f"repetida: cache_hits = {hits2}, lecturas {reads1} -> {reads2}")
+
+    # VACUUM FULL reescribe el archivo: ningún nodo cacheado antes sobrevive
+    # (fragmentation() posterior vuelve a poblar la caché con el árbol nuevo)
+    rt = File(tbl)._make_rtree("coords", heap_ok=False)
+    idx = rt.filename
+    rt.close()
+    cache = rtree._CACHES[os.path.abspath(idx)]
+    cached = list(cache.resident.values()) + list(cache.lru.values())
+    check(len(cached) > 0, f"caché poblada antes de VACUUM ({len(cached)} nodos)")
+    env = run_sql(f"VACUUM INDEX ON {tbl} (coords) FULL;", show=False)
+    check(env["ok"] and env["results"][0]["meta"]["rtree"]["coords"]["rebuilt"], "VACUUM INDEX ... FULL reescribe el índice")
+    now = list(cache.resident.values()) + list(cache.lru.values())
+    check(not any(n is o for n in now for o in cached), "tras VACUUM FULL no queda ningún nodo previo en caché")
+    ids3, _, _ = rtree_io(query)
+    check(ids3 == expected, "tras VACUUM FULL la consulta devuelve los mismos ids")
+
+    # reemplazo externo del .idx: la caché del proceso no debe servir nodos viejos
+    snap_old = idx + ".old"
+    shutil.copyfile(idx, snap_old)
+
+    far = {1000 + i: (200 + i * 0.5, 200.0) for i in range(20)}
+    for pid, (x, y) in far.items():
+        run_sql(f"INSERT INTO {tbl} VALUES ({pid}, '[{x}, {y}]');", show=False)
+    far_query = f"SELECT * FROM {tbl} WHERE coords IN (POINT(205, 200), 10);"
+    got, _, _ = rtree_io(far_query)
+    check(got == set(far), "20 puntos nuevos encontrados con la caché caliente")
+    snap_new = idx + ".new"
+    shutil.copyfile(idx, snap_new)
+
+    # os.replace: otro inode, como REORGANIZE/rebuild hechos por otro proceso
+    os.replace(snap_old, idx)
+    got, reads, _ = rtree_io(far_query)
+    check(got == set(), f"reemplazo externo (otro inode): la caché se invalida, sin nodos viejos ({reads} lecturas)")
+    got, _, _ = rtree_io(query)
+    check(got == expected, "el índice restaurado responde igual que antes de los INSERT")
+
+    # sobrescritura en el lugar: mismo inode, cambian tamaño/mtime
+    shutil.copyfile(snap_new, idx)
+    os.remove(snap_new)
+    got, reads, _ = rtree_io(far_query)
+    check(got == set(far), f"sobrescritura externa (mismo inode): se relee de disco ({reads} lecturas)")
+    run_sql(f"DROP TABLE IF EXISTS {tbl};", show=False)
+
 if __name__ == "__main__":
     main()
+    try:
+        bulk_str()
+        node_cache()
+        print("\n✅ RTREE STR + caché OK.")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}")
+        sys.exit(1)
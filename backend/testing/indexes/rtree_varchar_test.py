@@ -4,6 +4,7 @@ RTREE with non-integer PK (VARCHAR) + sequential primary
 - Insert data without rtree
 - Add rtree index and backfill
 - Run geo query expecting correct ids
+- Insert after the index exists (new surrogate appended to the binary sidecar)
 """
 import os, sys, json
 
@@ -57,3 +58,18 @@ if ids == {"a1", "b2"}:
     print("✅ RTREE VARCHAR PK test passed!")
 else:
     print("❌ Expected {'a1','b2'}, got:", ids)
+
+print_section("5. Insert after index + binary surrogate sidecar")
+run_sql(f"INSERT INTO {tbl} VALUES ('d4', 'D', '[0.5, 0.5]');")
+env = run_sql(f"SELECT * FROM {tbl} WHERE coords IN (POINT(0.0, 0.0), 1.5);")
+rows = env.get("results", [{}])[0].get("data", [])
+ids = {r.get("id") for r in rows}
+print("Got ids:", ids)
+
+from backend.catalog.settings import DATA_DIR
+base = os.path.join(str(DATA_DIR), tbl, f"{tbl}_rtree_coords")
+sidecar = [os.path.exists(base + s) for s in (".map", ".map.off", ".map.hash")]
+if ids == {"a1", "b2", "d4"} and all(sidecar) and not os.path.exists(base + ".map.json"):
+    print("✅ RTREE VARCHAR PK sidecar test passed!")
+else:
+    print("❌ Expected {'a1','b2','d4'} + .map/.map.off/.map.hash, got:", ids, sidecar)
@@ -3,8 +3,19 @@ SEQUENTIAL • CSV + SQL smoke test
 - Crea tabla con PRIMARY KEY USING sequential
 - Importa CSV (o fallback a INSERT por fila)
 - Consulta igualdad y rango sobre la PK
+- Merge en streaming con umbral y buffer chicos: orden del área principal, conteo de filas,
+  sin <archivo>_merge.dat; umbral por BD2_SEQ_MERGE_MAX_AUX, ratio y log2
+- BETWEEN (lower bound en el área principal + aux) contra Python: cotas antes, entre y después
+  de las claves, rangos vacíos; búsqueda y rango con clave no única
+- Fence index con bloques de 64 bytes: un bloque por búsqueda tras el merge, respaldo a búsqueda
+  binaria sin fence o con fence vencido, claves vecinas y duplicadas entre bloques
 """
-import os, sys, csv, json
+import os, sys, csv, json, random, shutil, struct
+# umbral y buffer chicos: el merge ocurre cada pocos inserts y lee el área principal en varios tramos
+os.environ["BD2_SEQ_MERGE_MAX_AUX"] = "4"
+os.environ["BD2_SEQ_MERGE_BUFFER"] = "64"
+# bloques de 3 registros: muchas fronteras de bloque en el fence index
+os.environ["BD2_SEQ_BLOCK_SIZE"] = "64"
 HERE = os.path.abspath(os.path.dirname(__file__))
 if HERE not in sys.path:
     sys.path.insert(0, HERE)
@@ -14,13 +25,21 @@ try:
     from backend.engine.engine import Engine
 except Exception:
     from backend.engine import Engine  # type: ignore
+from backend.storage.file import File
+from backend.storage.indexes import sequential
+from backend.storage.indexes.sequential import SeqFile
 ENGINE = Engine()
 
-def run_sql(sql: str) -> dict:
+def run_sql(sql: str, show: bool = True) -> dict:
     env = ENGINE.run(sql)
-    print(json.dumps(env, indent=2, ensure_ascii=False))
+    if show:
+        print(json.dumps(env, indent=2, ensure_ascii=False))
     return env
 
+def check(cond: bool, msg: str):
+    if not cond:
+        raise AssertionError(msg)
+
 def print_section(title: str):
     print("\n" + "="*len(title))
     print(title)
@@ -81,7 +100,291 @@ def main():
     print_section("SEQUENTIAL: consultas en PK")
     run_sql(f"SELECT * FROM {tbl} WHERE product_id = 2;")
     run_sql(f"SELECT * FROM {tbl} WHERE product_id BETWEEN 2 AND 5;")
+
+    print_section("SEQUENTIAL: inserts desordenados (aux -> sort_and_merge)")
+    filename = seq_filename(tbl)
+    run_sql(f"INSERT INTO {tbl} VALUES (9, 'India', 9.5, 9), (0, 'Zero', 1.0, 1), (7, 'Golf', 7.5, 7), (6, 'Foxtrot', 6.5, 6);")
+    run_sql(f"DELETE FROM {tbl} WHERE product_id = 3;")
+    run_sql(f"INSERT INTO {tbl} VALUES (8, 'Hotel', 8.5, 8), (3, 'Charlie2', 15.0, 30);")
+    got = run_sql(f"SELECT * FROM {tbl} WHERE product_id = 6;")["results"][0]["data"]
+    check([r["name"] for r in got] == ["Foxtrot"], f"product_id = 6: {got}")
+    got = run_sql(f"SELECT * FROM {tbl};")["results"][0]["data"]
+    check(sorted(r["product_id"] for r in got) == list(range(10)), f"SELECT *: {got}")
+    check([r["name"] for r in got if r["product_id"] == 3] == ["Charlie2"], "reinsert de 3")
+    main_n, aux_n, live = areas(filename)
+    check(aux_n <= 4 and main_n > 5 and live == sorted(live), f"merge: main={main_n} aux={aux_n} {live}")
+    check(not os.path.exists(filename.replace(".dat", "_merge.dat")), "quedó _merge.dat")
     print("\n✅ SEQUENTIAL test completed.")
 
+def seq_filename(tbl: str) -> str:
+    return File(tbl).indexes["primary"]["filename"]
+
+def areas(filename: str):
+    """(registros del área principal, registros del aux, claves vivas del área principal en orden físico)."""
+    sf = SeqFile(filename)
+    with open(filename, "rb") as f:
+        schema_size = struct.unpack("I", f.read(4))[0]
+        f.seek(4 + schema_size)
+        main_n = struct.unpack("i", f.read(4))[0]
+        f.seek(4 + schema_size + 4 + main_n * sf.REC_SIZE)
+        aux_n = struct.unpack("i", f.read(4))[0]
+        f.seek(4 + schema_size + 4)
+        live = [r[sf.schema[0]["name"]] for r in sf._iter_area(f, main_n, None, None)]
+    return main_n, aux_n, live
+
+def select(sql: str) -> list:
+    res = run_sql(sql, show=False)["results"][0]
+    check(res["ok"], f"{sql} -> {res.get('error')}")
+    return [(r["id"], r["name"]) for r in res["data"]]
+
+def create(tbl: str) -> str:
+    run_sql(f"DROP TABLE IF EXISTS {tbl};", show=False)
+    check(run_sql(f"CREATE TABLE {tbl} (id INT PRIMARY KEY USING sequential, name VARCHAR(12));",
+                  show=False)["ok"], f"create {tbl}")
+    return seq_filename(tbl)
+
+def merge():
+    print_section("SEQUENTIAL: merge en streaming (umbral 4, buffer de 64 bytes)")
+    tbl = "seq_merge"
+    filename = create(tbl)
+    merge_file = filename.replace(".dat", "_merge.dat")
+    sf = SeqFile(filename)
+    check(sf.merge_max_aux == 4 and sf.merge_buffer == 64, f"variables BD2_SEQ_MERGE_*: {sf.merge_max_aux}, {sf.merge_buffer}")
+
+    rnd = random.Random(28)
+    keys = list(range(0, 300, 3))
+    rnd.shuffle(keys)
+    rows, merges, last_main = {}, 0, 0
+    for k, i in enumerate(keys):
+        check(run_sql(f"INSERT INTO {tbl} VALUES ({i}, 'r{i}');", show=False)["ok"], f"insert {i}")
+        rows[i] = f"r{i}"
+        main_n, aux_n, live = areas(filename)
+        check(aux_n <= 4, f"aux con {aux_n} registros (umbral 4)")
+        check(live == sorted(set(live)), f"área principal desordenada: {live}")
+        check(not os.path.exists(merge_file), "quedó _merge.dat tras el merge")
+        if main_n != last_main:
+            # recién mezclado: todo en el área principal, sin borrados ni aux
+            merges += 1
+            last_main = main_n
+            check(aux_n == 0 and live == sorted(rows), f"tras el merge: main={main_n} aux={aux_n}")
+        if k % 4 == 3:
+            victim = rnd.choice(sorted(rows))
+            check(run_sql(f"DELETE FROM {tbl} WHERE id = {victim};", show=False)["ok"], f"delete {victim}")
+            del rows[victim]
+    check(merges > 10, f"solo {merges} merges")
+    check(sorted(select(f"SELECT * FROM {tbl};")) == sorted(rows.items()), "SELECT * tras los merges")
+
+    # el buffer fija cuántas lecturas hace el merge sobre el área principal
+    reads = {}
+    for buffer in (sf.REC_SIZE, 64, 1 << 20):
+        mf = SeqFile(filename)
+        mf.merge_buffer = buffer
+        mf.sort_and_merge({"key": "id"})
+        reads[buffer] = mf.read_count
+        main_n, aux_n, live = areas(filename)
+        check(aux_n == 0 and main_n == len(rows) and live == sorted(rows), f"merge con buffer {buffer}")
+        check(not os.path.exists(merge_file), f"quedó _merge.dat (buffer {buffer})")
+    check(reads[sf.REC_SIZE] > len(rows) and reads[sf.REC_SIZE] > reads[64] > reads[1 << 20], f"lecturas por buffer: {reads}")
+    print(f"[OK] {merges} merges, {len(rows)} filas; lecturas por buffer {reads}")
+
+    print_section("SEQUENTIAL: umbral por ratio y por log2")
+    saved = sequential.MERGE_MAX_AUX, sequential.MERGE_RATIO
+    try:
+        sequential.MERGE_MAX_AUX, sequential.MERGE_RATIO = 0, 0.1
+        check(SeqFile(filename).max_aux_size(200) == 20, "BD2_SEQ_MERGE_RATIO")
+        merges = 0
+        for i in range(1, 300, 12):
+            check(run_sql(f"INSERT INTO {tbl} VALUES ({i}, 'q{i}');", show=False)["ok"], f"insert {i}")
+            rows[i] = f"q{i}"
+            main_n, aux_n, live = areas(filename)
+            check(aux_n <= max(1, int(main_n * 0.1)), f"aux {aux_n} > 10% de {main_n}")
+            merges += aux_n == 0
+        check(merges >= 2, f"ratio: {merges} merges")
+
+        sequential.MERGE_RATIO = 0
+        sf = SeqFile(filename)
+        check(sf.max_aux_size(256) == 8 and sf.max_aux_size(0) == 1, "umbral log2(main)")
+    finally:
+        sequential.MERGE_MAX_AUX, sequential.MERGE_RATIO = saved
+    check(sorted(select(f"SELECT * FROM {tbl};")) == sorted(rows.items()), "SELECT * tras los merges por ratio")
+    print(f"[OK] umbral por ratio ({merges} merges) y por log2")
+
+def ranges():
+    print_section("SEQUENTIAL: BETWEEN con lower bound (área principal + aux)")
+    tbl = "seq_range"
+    filename = create(tbl)
+    rows = {}
+    for i in range(100, 500, 4):
+        check(run_sql(f"INSERT INTO {tbl} VALUES ({i}, 'm{i}');", show=False)["ok"], f"insert {i}")
+        rows[i] = f"m{i}"
+
+    saved = sequential.MERGE_MAX_AUX
+    try:
+        # sin merges: estas filas quedan en el aux y el rango las mezcla con el área principal
+        sequential.MERGE_MAX_AUX = 10 ** 6
+        for i in (2, 6, 98, 101, 103, 250, 251, 333, 499, 502, 600, 777):
+            check(run_sql(f"INSERT INTO {tbl} VALUES ({i}, 'a{i}');", show=False)["ok"], f"insert {i}")
+            rows[i] = f"a{i}"
+        for i in (100, 104, 300, 496, 251):
+            check(run_sql(f"DELETE FROM {tbl} WHERE id = {i};", show=False)["ok"], f"delete {i}")
+            del rows[i]
+        main_n, aux_n, _ = areas(filename)
+        check(main_n >= 90 and aux_n >= 12, f"main={main_n} aux={aux_n}")
+
+        cases = [(0, 1), (0, 50), (0, 100), (98, 104), (101, 103), (102, 103), (150, 150), (151, 153),
+                 (250, 251), (299, 301), (490, 520), (497, 499), (700, 800), (801, 900), (300, 200), (0, 1000)]
+        for lo, hi in cases:
+            got = select(f"SELECT * FROM {tbl} WHERE id BETWEEN {lo} AND {hi};")
+            exp = sorted((i, v) for i, v in rows.items() if lo <= i <= hi)
+            check(got == exp, f"BETWEEN {lo} AND {hi}: esperado {exp}, got {got}")
+    finally:
+        sequential.MERGE_MAX_AUX = saved
+    print(f"[OK] {len(cases)} rangos sobre {main_n} registros en el área principal y {aux_n} en el aux")
+
+    print_section("SEQUENTIAL: clave no única (search y rango)")
+    filename = create("seq_dups")
+    sf = SeqFile(filename)
+    non_unique = {"key": "id", "unique": []}
+    rows = []
+
+    def put(keys):
+        for i in keys:
+            name = f"d{len(rows)}"
+            sf.insert({"id": i, "name": name}, non_unique)
+            rows.append((i, name))
+
+    # el primer insert abre el área principal; el resto va al aux hasta el merge
+    put([0] + [5] * 4 + [7] * 3 + [8, 9] + [10] * 5 + [12, 13, 13, 20])
+    sf.sort_and_merge({"key": "id"})
+    put([5, 10, 10, 11, 13, 25])
+    main_n, aux_n, live = areas(filename)
+    check(main_n == 19 and aux_n == 6 and live == sorted(live), f"main={main_n} aux={aux_n}")
+
+    for v in (0, 1, 5, 6, 7, 10, 11, 13, 20, 25, 30):
+        got = SeqFile(filename).search({"key": "id", "value": v, "unique": False}, True)
+        check(sorted((r["id"], r["name"]) for r in got) == sorted(r for r in rows if r[0] == v), f"id = {v}: {got}")
+    for lo, hi in ((0, 4), (5, 5), (6, 9), (10, 11), (14, 19), (13, 25), (26, 40), (0, 100)):
+        got = SeqFile(filename).range_search({"key": "id", "min": lo, "max": hi, "unique": False}, True)
+        check([r["id"] for r in got] == sorted(r[0] for r in rows if lo <= r[0] <= hi), f"rango {lo}..{hi}: {got}")
+        check(sorted((r["id"], r["name"]) for r in got) == sorted(r for r in rows if lo <= r[0] <= hi), f"rango {lo}..{hi}")
+    print("[OK] clave no única en el área principal y en el aux")
+
+def locate(filename: str, value):
+    """(clave encontrada o None, lecturas) de SeqFile.locate sobre el área principal."""
+    sf = SeqFile(filename)
+    with open(filename, "rb") as f:
+        schema_size = struct.unpack("I", f.read(4))[0]
+        f.seek(4 + schema_size)
+        main_n = struct.unpack("i", f.read(4))[0]
+        _, record = sf.locate(f, "id", value, main_n, 4 + schema_size + 4)
+    return (record.fields["id"] if record is not None else None), sf.read_count
+
+def main_count(filename: str) -> int:
+    return areas(filename)[0]
+
+def check_lookups(tbl: str, rows: dict, note: str):
+    """=, BETWEEN entre claves vecinas e insert duplicado para cada clave viva."""
+    keys = sorted(rows)
+    for i in keys:
+        check(select(f"SELECT * FROM {tbl} WHERE id = {i};") == [(i, rows[i])], f"{note}: id = {i}")
+        check(not run_sql(f"INSERT INTO {tbl} VALUES ({i}, 'dup');", show=False)["ok"], f"{note}: duplicado {i}")
+    for a, b in zip(keys, keys[1:]):
+        got = select(f"SELECT * FROM {tbl} WHERE id BETWEEN {a} AND {b};")
+        check(got == [(a, rows[a]), (b, rows[b])], f"{note}: BETWEEN {a} AND {b}: {got}")
+
+def fence():
+    print_section("SEQUENTIAL: fence index (bloques de 64 bytes)")
+    tbl = "seq_fence"
+    filename = create(tbl)
+    fence_file = filename.replace(".dat", "_fence.dat")
+    rows = {}
+
+    # antes del primer merge no hay fence: búsqueda binaria
+    for i in (40, 10, 70):
+        check(run_sql(f"INSERT INTO {tbl} VALUES ({i}, 'f{i}');", show=False)["ok"], f"insert {i}")
+        rows[i] = f"f{i}"
+    check(not os.path.exists(fence_file), "fence antes del primer merge")
+    check(SeqFile(filename).load_fence(main_count(filename)) is None, "load_fence sin merge")
+    check_lookups(tbl, rows, "sin merge")
+
+    keys = [i for i in range(150) if i not in rows]
+    random.Random(30).shuffle(keys)
+    for i in keys:
+        check(run_sql(f"INSERT INTO {tbl} VALUES ({i}, 'f{i}');", show=False)["ok"], f"insert {i}")
+        rows[i] = f"f{i}"
+    SeqFile(filename).sort_and_merge({"key": "id"})
+
+    sf = SeqFile(filename)
+    main_n, aux_n, live = areas(filename)
+    fence_idx = sf.load_fence(main_n)
+    check(sf.BLOCK_RECORDS == 3 and main_n == 150 and aux_n == 0, f"bloque {sf.BLOCK_RECORDS}, main={main_n}")
+    check(fence_idx is not None and fence_idx["keys"] == live[::3], f"fence: {fence_idx}")
+
+    # con fence: cada búsqueda lee un solo bloque (el fence ya está en memoria); la clave que abre
+    # un bloque se busca en el anterior (una corrida de duplicados puede empezar ahí) y suma
+    # la lectura de ese único registro
+    for i in list(range(150)) + [150, 999]:
+        found, reads = locate(filename, i)
+        expected = 2 if i in fence_idx["keys"][1:] else 1
+        check(found == (i if i < 150 else None) and reads == expected, f"locate({i}) con fence: {found}, {reads} lecturas")
+    sequential._FENCES.clear()
+    check(locate(filename, 76)[1] == 2, "la primera búsqueda del proceso lee el fence y un bloque")
+    check_lookups(tbl, rows, "con fence")
+
+    # un borrado en la primera posición de un bloque y su reinserción en el aux
+    for i in (30, 31):
+        check(run_sql(f"DELETE FROM {tbl} WHERE id = {i};", show=False)["ok"], f"delete {i}")
+        check(select(f"SELECT * FROM {tbl} WHERE id = {i};") == [], f"id = {i} borrado")
+    for i in (30, 31):
+        check(run_sql(f"INSERT INTO {tbl} VALUES ({i}, 'g{i}');", show=False)["ok"], f"reinsert {i}")
+        rows[i] = f"g{i}"
+    check_lookups(tbl, rows, "tras borrar y reinsertar")
+
+    # archivo reemplazado por fuera (otro inode): el fence queda vencido y se usa búsqueda binaria
+    shutil.copyfile(filename, filename + ".copy")
+    os.replace(filename + ".copy", filename)
+    check(SeqFile(filename).load_fence(main_count(filename)) is None, "fence de otro inode")
+    found, reads = locate(filename, 76)
+    check(found == 76 and reads > 2, f"búsqueda binaria: {found}, {reads} lecturas")
+    check_lookups(tbl, rows, "fence vencido")
+    SeqFile(filename).sort_and_merge({"key": "id"})
+    check(SeqFile(filename).load_fence(main_count(filename)) is not None, "fence tras el merge")
+    check(locate(filename, 76) == (76, 1), "un bloque tras el nuevo merge")
+    print(f"[OK] {len(rows)} claves, {len(fence_idx['keys'])} bloques de {sf.BLOCK_RECORDS}")
+
+    print_section("SEQUENTIAL: duplicados que cruzan fronteras de bloque")
+    filename = create("seq_fence_dups")
+    sf = SeqFile(filename)
+    rows = []
+    for i in [0] + [4] * 5 + [5] + [6] * 4 + [9, 11, 11, 11, 11, 12]:
+        sf.insert({"id": i, "name": f"d{len(rows)}"}, {"key": "id", "unique": []})
+        rows.append((i, f"d{len(rows)}"))
+    sf.sort_and_merge({"key": "id"})
+    main_n, _, live = areas(filename)
+    fence_idx = SeqFile(filename).load_fence(main_n)
+    check(fence_idx is not None, "fence del archivo con duplicados")
+    firsts = fence_idx["keys"]
+    check(any(live[b * 3 - 1] == firsts[b] for b in range(1, len(firsts))), f"ninguna corrida cruza un bloque: {live}")
+
+    for v in sorted({i for i, _ in rows}) + [3, 7, 13]:
+        got = SeqFile(filename).search({"key": "id", "value": v, "unique": False}, True)
+        check(sorted((r["id"], r["name"]) for r in got) == sorted(r for r in rows if r[0] == v), f"id = {v}: {got}")
+        dup = SeqFile(filename).insert({"id": v, "name": "x"}, {"key": "id", "unique": ["id"]})
+        check((dup == []) == any(r[0] == v for r in rows), f"chequeo de duplicado para {v}: {dup}")
+        if dup:
+            rows.append((v, "x"))
+    for lo, hi in ((4, 4), (4, 5), (5, 6), (6, 9), (10, 11), (11, 12)):
+        got = SeqFile(filename).range_search({"key": "id", "min": lo, "max": hi, "unique": False}, True)
+        check(sorted((r["id"], r["name"]) for r in got) == sorted(r for r in rows if lo <= r[0] <= hi), f"rango {lo}..{hi}")
+    print(f"[OK] fence {firsts} sobre {live}")
+
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+        merge()
+        ranges()
+        fence()
+        print("\n✅ SEQUENTIAL OK.")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}")
+        sys.exit(1)
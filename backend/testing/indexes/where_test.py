@@ -0,0 +1,97 @@
+"""
+WHERE general (AND / OR / comparaciones / IN)
+- Misma tabla con cada organización del primario (heap, sequential, isam, bplus)
+- Cada consulta se compara contra el filtro hecho en Python sobre los datos insertados
+- Un conjunto indexable guía el acceso (plan search / range_search + 'filter' residual);
+  con varios, index_merge (intersección de RIDs para AND, unión para OR);
+  sin candidato, 'select' con el predicado empujado al recorrido
+"""
+import os, sys, json, random
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+if HERE not in sys.path:
+    sys.path.insert(0, HERE)
+
+try:
+    from backend.engine.engine import Engine
+except Exception:
+    from backend.engine import Engine  # type: ignore
+ENGINE = Engine()
+
+def run_sql(sql: str, show: bool = True) -> dict:
+    env = ENGINE.run(sql)
+    if show:
+        print(json.dumps(env, indent=2, ensure_ascii=False, default=str))
+    return env
+
+def print_section(title: str):
+    print("\n" + "="*len(title))
+    print(title)
+    print("="*len(title))
+
+def check(cond: bool, msg: str):
+    if not cond:
+        raise AssertionError(msg)
+
+COLS = ["id", "age", "city", "score", "nick"]
+random.seed(11)
+ROWS = [(i, random.randint(1, 50), f"c{i % 7}", round(random.random() * 10, 2), f"n{i % 5}") for i in range(150)]
+DATA = [dict(zip(COLS, r)) for r in ROWS]
+
+# (WHERE, filtro esperado, acción esperada del plan sin ANALYZE)
+QUERIES = [
+    ("age > 40", lambda d: d["age"] > 40, "range_search"),
+    ("age > 10 AND age <= 20 AND nick = 'n1'", lambda d: 10 < d["age"] <= 20 and d["nick"] == "n1", "range_search"),
+    ("city = 'c3' AND score < 5", lambda d: d["city"] == "c3" and d["score"] < 5, "search"),
+    ("score < 2 AND (nick = 'n2' OR nick = 'n4')", lambda d: d["score"] < 2 and d["nick"] in ("n2", "n4"), "select"),
+    ("nick = 'n2' OR score >= 9.5", lambda d: d["nick"] == "n2" or d["score"] >= 9.5, "select"),
+    ("id < 10 OR (age BETWEEN 5 AND 7 AND city != 'c1')",
+     lambda d: d["id"] < 10 or (5 <= d["age"] <= 7 and d["city"] != "c1"), "select"),
+    ("age BETWEEN 10 AND 30 AND city = 'c2'", lambda d: 10 <= d["age"] <= 30 and d["city"] == "c2", "index_merge"),
+    ("nick <> 'n0' AND score > 9", lambda d: d["nick"] != "n0" and d["score"] > 9, "select"),
+    ("city IN ('c1', 'c2') AND age < 25", lambda d: d["city"] in ("c1", "c2") and d["age"] < 25, "index_merge"),
+    ("city = 'c3' OR age BETWEEN 10 AND 12", lambda d: d["city"] == "c3" or 10 <= d["age"] <= 12, "index_merge"),
+    ("(city = 'c1' AND age >= 45) OR age < 3", lambda d: (d["city"] == "c1" and d["age"] >= 45) or d["age"] < 3,
+     "index_merge"),
+    ("city = 'c5' OR nick = 'n1'", lambda d: d["city"] == "c5" or d["nick"] == "n1", "select"),
+]
+
+try:
+    for prim in ("heap", "sequential", "isam", "bplus"):
+        tbl = f"where_{prim}"
+        print_section(f"{prim}: create + insert")
+        run_sql(f"DROP TABLE IF EXISTS {tbl};")
+        run_sql(f"""
+            CREATE TABLE {tbl} (
+                id INT PRIMARY KEY USING {prim},
+                age INT INDEX USING bplus,
+                city VARCHAR(16) INDEX USING hash,
+                score FLOAT,
+                nick VARCHAR(8)
+            );
+        """)
+        for r in ROWS:
+            run_sql(f"INSERT INTO {tbl} VALUES ({r[0]}, {r[1]}, '{r[2]}', {r[3]}, '{r[4]}');", show=False)
+
+        print_section(f"{prim}: consultas")
+        for where, keep, action in QUERIES:
+            env = run_sql(f"SELECT id, nick FROM {tbl} WHERE {where};", show=False)
+            res = env["results"][0]
+            check(res["ok"], f"{prim}: {where} -> {res.get('error')}")
+            got = sorted(r["id"] for r in res["data"])
+            exp = sorted(d["id"] for d in DATA if keep(d))
+            check(got == exp, f"{prim}: {where} devolvió {len(got)} filas, se esperaban {len(exp)}")
+            check(all(set(r) == {"id", "nick"} for r in res["data"]), f"{prim}: proyección de {where}")
+            check(res["plan"]["action"] in (action, "search_in"), f"{prim}: {where} plan {res['plan']['action']}")
+            if action == "index_merge":
+                check(any(u["op"] == "index_merge" for u in res["meta"]["index_usage"]), f"{prim}: {where} sin index_merge")
+            print(f"[OK] {prim:10s} {res['plan']['action']:12s} {len(got):3d} filas  {where}")
+
+    print_section("Errores")
+    env = run_sql("SELECT * FROM where_heap WHERE missing > 3;", show=False)
+    check(not env["results"][0]["ok"], "columna inexistente debe fallar")
+
+    print("\n✅ WHERE OK.")
+except AssertionError as e:
+    print(f"\n❌ TEST FAILED: {e}")
+    sys.exit(1)